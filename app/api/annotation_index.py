@@ -0,0 +1,134 @@
+from google.cloud import vision
+
+try:
+    from app.api.vision_rules import MATCHER, LABEL_GROUP_INDEX, TEXT_GROUP_INDEX, groups_of
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from api.vision_rules import MATCHER, LABEL_GROUP_INDEX, TEXT_GROUP_INDEX, groups_of
+
+
+class AnnotationIndex:
+    """
+    Resumen compacto de una respuesta de Vision API que se construye una sola
+    vez por respuesta: descripciones en minúsculas, palabras clave y grupos
+    de cada etiqueta, mapas de puntuación, objetos, texto OCR y colores.
+    Las palabras clave se buscan con el buscador compilado de vision_rules,
+    recorriendo todas las etiquetas (y todos los objetos) en una sola pasada.
+    """
+
+    __slots__ = (
+        'labels', 'label_set', 'label_scores', 'label_keywords', 'label_groups',
+        'objects', 'object_set', 'object_scores', 'object_keywords',
+        'has_text', 'raw_text', 'text', 'text_keywords', 'text_groups',
+        'has_image_properties', 'colors',
+    )
+
+    def __init__(self, response, matcher=MATCHER):
+        # Leer el protobuf subyacente: el acceso a campos a través de proto-plus
+        # convierte cada valor y domina el tiempo de clasificación
+        response = vision.AnnotateImageResponse.pb(response)
+
+        # Etiquetas: (descripción original, descripción en minúsculas, puntuación)
+        self.labels = tuple(
+            (label.description, label.description.lower(), label.score)
+            for label in response.label_annotations
+        )
+        self.label_set = frozenset(lower for _, lower, _ in self.labels)
+        self.label_scores = {}
+        for _, lower, score in self.labels:
+            self.label_scores[lower] = max(score, self.label_scores.get(lower, score))
+        self.label_keywords = tuple(matcher.find_each([lower for _, lower, _ in self.labels]))
+        self.label_groups = tuple(groups_of(keywords, LABEL_GROUP_INDEX) for keywords in self.label_keywords)
+
+        # Objetos: (nombre original, nombre en minúsculas, puntuación)
+        self.objects = tuple(
+            (obj.name, obj.name.lower(), obj.score)
+            for obj in response.localized_object_annotations
+        )
+        self.object_set = frozenset(lower for _, lower, _ in self.objects)
+        self.object_scores = {}
+        for _, lower, score in self.objects:
+            self.object_scores[lower] = max(score, self.object_scores.get(lower, score))
+        self.object_keywords = tuple(matcher.find_each([lower for _, lower, _ in self.objects]))
+
+        # Texto OCR completo (la primera anotación contiene todo el texto)
+        self.has_text = len(response.text_annotations) > 0
+        self.raw_text = response.text_annotations[0].description if self.has_text else ''
+        self.text = self.raw_text.lower()
+        self.text_keywords = frozenset(matcher.find(self.text))
+        self.text_groups = groups_of(self.text_keywords, TEXT_GROUP_INDEX)
+
+        # Colores dominantes: (rojo, verde, azul, puntuación)
+        # (ImageProperties solo tiene dominant_colors, así que equivale a que haya colores)
+        dominant_colors = response.image_properties_annotation.dominant_colors.colors
+        self.has_image_properties = len(dominant_colors) > 0
+        self.colors = tuple(
+            (color.color.red, color.color.green, color.color.blue, color.score)
+            for color in dominant_colors
+        )
+
+    def labels_in(self, group):
+        """
+        Devuelve las etiquetas que contienen alguna palabra clave del grupo
+
+        Args:
+            group (str): Nombre del grupo de palabras clave
+
+        Returns:
+            list: Tuplas (descripción, puntuación) en el orden de la respuesta
+        """
+        return [
+            (description, score)
+            for (description, _, score), groups in zip(self.labels, self.label_groups)
+            if group in groups
+        ]
+
+    def has_label(self, group):
+        """Indica si alguna etiqueta pertenece al grupo"""
+        return any(group in groups for groups in self.label_groups)
+
+    def count_objects(self, names):
+        """Cuenta los objetos cuyo nombre coincide exactamente con alguno de los dados"""
+        return sum(1 for _, lower, _ in self.objects if lower in names)
+
+    def has_object(self, names):
+        """Indica si hay algún objeto cuyo nombre coincide exactamente con alguno de los dados"""
+        return not self.object_set.isdisjoint(names)
+
+    def first_object(self, names):
+        """Devuelve la puntuación del primer objeto con alguno de los nombres dados, o None"""
+        return next((score for _, lower, score in self.objects if lower in names), None)
+
+    def last_object(self, names):
+        """Devuelve la puntuación del último objeto con alguno de los nombres dados, o None"""
+        return next((score for _, lower, score in reversed(self.objects) if lower in names), None)
+
+    def dark_colors(self, predicate):
+        """
+        Filtra los colores dominantes con un predicado
+
+        Args:
+            predicate (callable): Función (rojo, verde, azul, puntuación) -> bool
+
+        Returns:
+            list: Colores que cumplen el predicado
+        """
+        return [color for color in self.colors if predicate(*color)]
+
+    def summary_labels(self, limit=5):
+        """Etiquetas principales en el formato de la respuesta JSON"""
+        return [
+            {'description': description, 'score': round(score * 100, 2)}
+            for description, _, score in self.labels[:limit]
+        ]
+
+    def summary_objects(self, limit=3):
+        """Objetos principales en el formato de la respuesta JSON"""
+        return [
+            {'name': name, 'confidence': round(score * 100, 2)}
+            for name, _, score in self.objects[:limit]
+        ]
+
+    def text_lines(self):
+        """Líneas del texto OCR original"""
+        return self.raw_text.split('\n') if self.has_text else []
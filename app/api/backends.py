@@ -0,0 +1,40 @@
+import os
+
+# Backends simulados (fake_backends.py) para pruebas de carga sin llamar a las
+# APIs de pago de Google. Con FAKE_BACKENDS=<host> (por ejemplo "localhost")
+# la aplicación envía las llamadas a Vision, Geocoding/Places y Vertex AI a
+# los servidores locales en los puertos fijos de abajo.
+FAKE_BACKENDS = os.environ.get('FAKE_BACKENDS', '').strip()
+
+FAKE_VISION_PORT = 50051
+FAKE_MAPS_PORT = 8091
+FAKE_VERTEX_PORT = 8092
+
+GOOGLE_MAPS_BASE_URL = 'https://maps.googleapis.com'
+
+
+def fake_backends_enabled():
+    """Indica si la aplicación debe usar los backends simulados"""
+    return bool(FAKE_BACKENDS)
+
+
+def vision_endpoint():
+    """Dirección host:puerto del servidor gRPC simulado de Vision API"""
+    return f"{FAKE_BACKENDS}:{FAKE_VISION_PORT}"
+
+
+def maps_base_url():
+    """URL base de Google Maps (real o simulada)"""
+    if fake_backends_enabled():
+        return f"http://{FAKE_BACKENDS}:{FAKE_MAPS_PORT}"
+    return GOOGLE_MAPS_BASE_URL
+
+
+def vertex_predict_url(endpoint_id):
+    """URL REST de predicción del endpoint simulado de Vertex AI"""
+    project = os.environ.get('GOOGLE_CLOUD_PROJECT', 'fake-project')
+    location = os.environ.get('GOOGLE_CLOUD_REGION', 'us-central1')
+    return (
+        f"http://{FAKE_BACKENDS}:{FAKE_VERTEX_PORT}/v1/projects/{project}"
+        f"/locations/{location}/endpoints/{endpoint_id}:predict"
+    )
@@ -3,10 +3,23 @@ import logging
 from google.cloud import aiplatform
 from google.cloud.aiplatform.gapic.schema import predict
 
+try:
+    from app.api.backends import fake_backends_enabled, vertex_predict_url
+    from app.utils.single_flight import SingleFlight, file_key
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from api.backends import fake_backends_enabled, vertex_predict_url
+    from utils.single_flight import SingleFlight, file_key
+    from utils.logging_config import configure_logging
+
 # Configurar logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Predicciones concurrentes de la misma imagen: solo una llama a Vertex AI
+prediction_flights = SingleFlight('custom_model')
+
 def init_vertex_ai():
     """Inicializa Vertex AI con las credenciales adecuadas"""
     try:
@@ -19,6 +32,38 @@ def init_vertex_ai():
         logger.error(f"Error al inicializar Vertex AI: {str(e)}")
         raise
 
+class FakeEndpoint:
+    """
+    Endpoint de Vertex AI servido por fake_backends.py (FAKE_BACKENDS).
+    Usa la API REST de predicción y devuelve las predicciones con la misma
+    forma que aiplatform.Endpoint.predict.
+    """
+
+    def __init__(self, endpoint_id, timeout=30):
+        self.url = vertex_predict_url(endpoint_id)
+        self.timeout = timeout
+
+    def predict(self, instances):
+        import requests
+        from types import SimpleNamespace
+        from google.protobuf import json_format
+
+        instances = [json_format.MessageToDict(instance) for instance in instances]
+        response = requests.post(self.url, json={'instances': instances}, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        return SimpleNamespace(
+            predictions=data.get('predictions', []),
+            deployed_model_id=data.get('deployedModelId')
+        )
+
+def get_endpoint(endpoint_id):
+    """Devuelve el endpoint de predicción real o el simulado con FAKE_BACKENDS"""
+    if fake_backends_enabled():
+        return FakeEndpoint(endpoint_id)
+    init_vertex_ai()
+    return aiplatform.Endpoint(endpoint_id)
+
 def predict_damage(image_path, threshold=0.5):
     """
     Predice el tipo de daño en una imagen usando el modelo personalizado de Vertex AI
@@ -30,10 +75,18 @@ def predict_damage(image_path, threshold=0.5):
     Returns:
         dict: Resultados de la predicción
     """
+    key = file_key(image_path, f"threshold={threshold}")
+    return prediction_flights.run(key, _predict_damage, image_path, threshold)
+
+def _predict_damage(image_path, threshold):
+    """Predicción con Vertex AI (sin agrupar, ver predict_damage)"""
     try:
         # ID del modelo y endpoint (estos valores se obtienen después de entrenar el modelo)
         model_id = os.environ.get('VERTEX_MODEL_ID')
         endpoint_id = os.environ.get('VERTEX_ENDPOINT_ID')
+        if fake_backends_enabled():
+            model_id = model_id or 'fake-model'
+            endpoint_id = endpoint_id or 'fake-endpoint'
         
         if not model_id or not endpoint_id:
             logger.error("VERTEX_MODEL_ID o VERTEX_ENDPOINT_ID no configurados en variables de entorno")
@@ -46,9 +99,6 @@ def predict_damage(image_path, threshold=0.5):
                 'confidence': 0.0
             }
         
-        # Inicializar Vertex AI
-        init_vertex_ai()
-        
         # Cargar la imagen
         with open(image_path, "rb") as f:
             image_content = f.read()
@@ -62,8 +112,8 @@ def predict_damage(image_path, threshold=0.5):
             content=encoded_content,
         ).to_value()
         
-        # Obtener el endpoint
-        endpoint = aiplatform.Endpoint(endpoint_id)
+        # Obtener el endpoint (inicializa Vertex AI si no es el simulado)
+        endpoint = get_endpoint(endpoint_id)
         
         # Realizar la predicción
         logger.info(f"Enviando imagen a Vertex AI para predicción: {image_path}")
@@ -74,7 +124,8 @@ def predict_damage(image_path, threshold=0.5):
         
         # El formato exacto de la respuesta puede variar según cómo se entrenó el modelo
         # Ajusta esta parte según sea necesario después de entrenar el modelo
-        if hasattr(prediction.predictions[0], 'displayNames') and hasattr(prediction.predictions[0], 'confidences'):
+        first_prediction = prediction.predictions[0] if prediction.predictions else {}
+        if 'displayNames' in first_prediction and 'confidences' in first_prediction:
             for label, score in zip(prediction.predictions[0]['displayNames'], 
                                 prediction.predictions[0]['confidences']):
                 if score >= threshold:
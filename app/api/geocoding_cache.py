@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+
+try:
+    from app.utils.metrics import metrics
+    from app.utils.task_pool import task_pool
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from utils.metrics import metrics
+    from utils.task_pool import task_pool
+    from utils.logging_config import configure_logging
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Caché de geocodificación inversa. Las coordenadas se agrupan por geohash,
+# de modo que los siniestros en la misma intersección o tramo de carretera
+# comparten la respuesta de Geocoding API. Precisión 8 ≈ 38 m x 19 m,
+# 7 ≈ 153 m x 153 m.
+GEOCODING_CACHE_ENABLED = os.environ.get('GEOCODING_CACHE_ENABLED', 'true').lower() == 'true'
+GEOCODING_CACHE_PRECISION = int(os.environ.get('GEOCODING_CACHE_PRECISION', '8'))
+GEOCODING_CACHE_MAX_ENTRIES = int(os.environ.get('GEOCODING_CACHE_MAX_ENTRIES', '10000'))
+# Segundos durante los que una entrada es vigente; después se sirve igualmente
+# y se actualiza en segundo plano hasta GEOCODING_CACHE_MAX_STALE
+GEOCODING_CACHE_TTL = float(os.environ.get('GEOCODING_CACHE_TTL', str(7 * 24 * 3600)))
+GEOCODING_CACHE_MAX_STALE = float(os.environ.get('GEOCODING_CACHE_MAX_STALE', str(30 * 24 * 3600)))
+# Archivo SQLite opcional para conservar la caché entre reinicios y compartirla entre workers
+GEOCODING_CACHE_DB = os.environ.get('GEOCODING_CACHE_DB', '')
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Cada cuántas escrituras se recorta la tabla SQLite a GEOCODING_CACHE_MAX_ENTRIES
+DB_TRIM_INTERVAL = 100
+
+
+def geohash(latitude, longitude, precision=GEOCODING_CACHE_PRECISION):
+    """
+    Codifica unas coordenadas como geohash
+
+    Args:
+        latitude (float): Latitud
+        longitude (float): Longitud
+        precision (int): Número de caracteres del geohash
+
+    Returns:
+        str: Geohash de la celda que contiene las coordenadas
+    """
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    characters = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(characters) < precision:
+        value, value_range = (longitude, longitude_range) if even else (latitude, latitude_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            characters.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(characters)
+
+
+class GeocodingCache:
+    """
+    Caché LRU en memoria de resultados de Geocoding API por geohash, con
+    copia opcional en SQLite y actualización en segundo plano de las
+    entradas vencidas (stale-while-revalidate).
+    """
+
+    def __init__(self, precision=GEOCODING_CACHE_PRECISION, max_entries=GEOCODING_CACHE_MAX_ENTRIES,
+                 ttl=GEOCODING_CACHE_TTL, max_stale=GEOCODING_CACHE_MAX_STALE,
+                 db_path=GEOCODING_CACHE_DB, enabled=GEOCODING_CACHE_ENABLED):
+        self.precision = precision
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.db_path = db_path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._db = None
+        self._db_pid = None
+        self._db_writes = 0
+        self.stats = {'hits': 0, 'stale': 0, 'misses': 0, 'refreshes': 0, 'errors': 0}
+
+    def _connection(self):
+        """Conexión SQLite del proceso actual (None si no hay archivo configurado)"""
+        if not self.db_path:
+            return None
+        if self._db is None or self._db_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS geocoding '
+                '(key TEXT PRIMARY KEY, result TEXT NOT NULL, fetched_at REAL NOT NULL)'
+            )
+            self._db.commit()
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _load(self, key):
+        """Busca una entrada en memoria y, si no está, en SQLite"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            try:
+                db = self._connection()
+                row = db.execute(
+                    'SELECT result, fetched_at FROM geocoding WHERE key = ?', (key,)
+                ).fetchone() if db is not None else None
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.warning(f"Error al leer la caché de geocodificación: {str(e)}")
+                return None
+            if row is None:
+                return None
+            entry = (json.loads(row[0]), row[1])
+            self._remember(key, entry)
+            return entry
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _store(self, key, result):
+        entry = (result, time.time())
+        with self._lock:
+            self._remember(key, entry)
+            try:
+                db = self._connection()
+                if db is None:
+                    return
+                db.execute(
+                    'INSERT OR REPLACE INTO geocoding (key, result, fetched_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(result, ensure_ascii=False), entry[1])
+                )
+                self._db_writes += 1
+                if self._db_writes % DB_TRIM_INTERVAL == 0:
+                    db.execute(
+                        'DELETE FROM geocoding WHERE key NOT IN '
+                        '(SELECT key FROM geocoding ORDER BY fetched_at DESC LIMIT ?)',
+                        (self.max_entries,)
+                    )
+                db.commit()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.warning(f"Error al guardar en la caché de geocodificación: {str(e)}")
+
+    def _refresh(self, key, latitude, longitude, fetch):
+        """Actualiza una entrada vencida (se ejecuta en el pool compartido)"""
+        try:
+            self._store(key, fetch(latitude, longitude))
+            self.stats['refreshes'] += 1
+            metrics.increment('geocoding_requests_total', mode='refresh', outcome='ok')
+        except Exception as e:
+            metrics.increment('geocoding_requests_total', mode='refresh', outcome='error')
+            logger.warning(f"No se pudo actualizar la caché de geocodificación ({key}): {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _lookup(self, key, latitude, longitude, fetch):
+        """
+        Busca una entrada vigente o vencida (en ese caso programa su
+        actualización en segundo plano con fetch)
+
+        Returns:
+            tuple: (True si se encontró, resultado)
+        """
+        entry = self._load(key)
+        if entry is None:
+            return False, None
+
+        result, fetched_at = entry
+        age = time.time() - fetched_at
+        if age <= self.ttl:
+            self.stats['hits'] += 1
+            metrics.increment('geocoding_cache_total', result='hit')
+            metrics.increment('geocoding_calls_saved_total')
+            return True, result
+        if age <= self.ttl + self.max_stale:
+            # Servir la entrada vencida y actualizarla en segundo plano
+            self.stats['stale'] += 1
+            metrics.increment('geocoding_cache_total', result='stale')
+            with self._lock:
+                refresh = key not in self._refreshing
+                self._refreshing.add(key)
+            if refresh:
+                try:
+                    task_pool.submit(self._refresh, key, latitude, longitude, fetch)
+                except Exception:
+                    with self._lock:
+                        self._refreshing.discard(key)
+                    raise
+            return True, result
+        return False, None
+
+    def get_or_fetch(self, latitude, longitude, fetch):
+        """
+        Devuelve el resultado de geocodificación de la celda de las coordenadas
+
+        Args:
+            latitude (float): Latitud
+            longitude (float): Longitud
+            fetch (callable): fetch(latitude, longitude) que llama a Geocoding API;
+                si lanza una excepción no se guarda nada
+
+        Returns:
+            object: Resultado de fetch (de la caché o recién obtenido)
+        """
+        if not self.enabled:
+            return fetch(latitude, longitude)
+
+        key = geohash(latitude, longitude, self.precision)
+        found, result = self._lookup(key, latitude, longitude, fetch)
+        if found:
+            return result
+
+        self.stats['misses'] += 1
+        metrics.increment('geocoding_cache_total', result='miss')
+        try:
+            result = fetch(latitude, longitude)
+        except Exception:
+            metrics.increment('geocoding_requests_total', mode='sync', outcome='error')
+            raise
+        metrics.increment('geocoding_requests_total', mode='sync', outcome='ok')
+        self._store(key, result)
+        return result
+
+    async def get_or_fetch_async(self, latitude, longitude, fetch_async, fetch):
+        """
+        Igual que get_or_fetch, esperando a Geocoding API de forma asíncrona
+
+        Args:
+            latitude (float): Latitud
+            longitude (float): Longitud
+            fetch_async (callable): Corrutina fetch_async(latitude, longitude) para los fallos de caché
+            fetch (callable): Versión síncrona para actualizar en segundo plano las entradas vencidas
+
+        Returns:
+            object: Resultado de fetch_async (de la caché o recién obtenido)
+        """
+        if not self.enabled:
+            return await fetch_async(latitude, longitude)
+
+        key = geohash(latitude, longitude, self.precision)
+        found, result = self._lookup(key, latitude, longitude, fetch)
+        if found:
+            return result
+
+        self.stats['misses'] += 1
+        metrics.increment('geocoding_cache_total', result='miss')
+        try:
+            result = await fetch_async(latitude, longitude)
+        except Exception:
+            metrics.increment('geocoding_requests_total', mode='async', outcome='error')
+            raise
+        metrics.increment('geocoding_requests_total', mode='async', outcome='ok')
+        self._store(key, result)
+        return result
+
+
+# Caché compartida por el proceso
+geocoding_cache = GeocodingCache()
@@ -0,0 +1,320 @@
+import os
+import io
+import threading
+import logging
+from PIL import Image, ImageOps
+
+try:
+    from app.api import vision_rules
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from api import vision_rules
+    from utils.logging_config import configure_logging
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Intentar importar numpy para el clasificador local
+try:
+    import numpy as np
+    NUMPY_SUPPORT = True
+except ImportError:
+    NUMPY_SUPPORT = False
+    logging.warning("numpy no está instalado. El clasificador local de daños no estará disponible.")
+
+# Configuración del clasificador local (primer nivel, sin llamadas remotas)
+LOCAL_CLASSIFIER_ENABLED = os.environ.get('LOCAL_CLASSIFIER_ENABLED', 'true').lower() == 'true'
+LOCAL_CLASSIFIER_MODEL = os.environ.get('LOCAL_CLASSIFIER_MODEL', os.path.join('models', 'local_classifier.npz'))
+LOCAL_CLASSIFIER_THRESHOLD = float(os.environ.get('LOCAL_CLASSIFIER_THRESHOLD', '0.9'))
+
+# Tamaño al que se reduce la imagen antes de extraer características
+FEATURE_IMAGE_SIZE = 64
+
+# Bins de los histogramas de color (HSV) y de textura (gradientes)
+HUE_BINS, SATURATION_BINS, VALUE_BINS = 12, 3, 3
+GRADIENT_MAGNITUDE_BINS = 8
+GRADIENT_ORIENTATION_BINS = 8
+
+# Categoría de cada carpeta de dataset/ (coincidencia parcial del nombre, en
+# este orden). La usan el entrenamiento, la preparación del dataset de Vertex
+# AI y el índice de hashes perceptuales.
+DATASET_FOLDER_CATEGORIES = (
+    ('bateria', 'Fallo mecánico - Batería'),
+    ('battery', 'Fallo mecánico - Batería'),
+    ('llanta', 'Fallo mecánico - Llanta pinchada'),
+    ('tire', 'Fallo mecánico - Llanta pinchada'),
+    ('flat_tire', 'Fallo mecánico - Llanta pinchada'),
+    ('fuga', 'Fallo mecánico - Fuga de líquido'),
+    ('leak', 'Fallo mecánico - Fuga de líquido'),
+    ('fluid', 'Fallo mecánico - Fuga de líquido'),
+    ('acceso', 'Problema de acceso - Llaves/Puertas'),
+    ('access', 'Problema de acceso - Llaves/Puertas'),
+    ('keys', 'Problema de acceso - Llaves/Puertas'),
+    ('door', 'Problema de acceso - Llaves/Puertas'),
+    ('menor', 'Colisión - Daño menor'),
+    ('minor', 'Colisión - Daño menor'),
+    ('moderado', 'Colisión - Daño moderado'),
+    ('moderate', 'Colisión - Daño moderado'),
+    ('severo', 'Colisión - Daño severo'),
+    ('severe', 'Colisión - Daño severo'),
+    ('total', 'Colisión - Pérdida total'),
+    ('total_loss', 'Colisión - Pérdida total'),
+    ('sin_dano', 'Sin daño'),
+    ('no_damage', 'Sin daño'),
+    ('normal', 'Sin daño'),
+)
+
+# Resultado de vision_rules.OUTCOMES y severidad para cada categoría de
+# map_folder_to_category. "Sin daño" no tiene resultado y siempre se deja a
+# Vision API.
+CATEGORY_OUTCOMES = {
+    'Fallo mecánico - Batería': ('bateria', None),
+    'Fallo mecánico - Llanta pinchada': ('llanta_pinchada', None),
+    'Fallo mecánico - Fuga de líquido': ('fuga', None),
+    'Problema de acceso - Llaves/Puertas': ('acceso', None),
+    'Colisión - Daño menor': ('colision', 'Leve'),
+    'Colisión - Daño moderado': ('colision', 'Moderado'),
+    'Colisión - Daño severo': ('colision', 'Grave'),
+    'Colisión - Pérdida total': ('colision', 'Grave'),
+}
+
+
+def map_folder_to_category(folder_name):
+    """Mapea el nombre de una carpeta de dataset/ a una categoría de daño (None si no corresponde)"""
+    folder_name = folder_name.lower()
+    for key, category in DATASET_FOLDER_CATEGORIES:
+        if key in folder_name:
+            return category
+    return None
+
+
+def extract_features(content, size=FEATURE_IMAGE_SIZE):
+    """
+    Extrae un vector de características de color y textura de una imagen
+
+    Se concatenan un histograma HSV, un histograma de magnitudes de gradiente
+    y un histograma de orientaciones ponderado por magnitud. Cada bloque se
+    normaliza y se aplica raíz cuadrada (distancia de Hellinger), de modo que
+    la distancia euclídea entre vectores compara distribuciones.
+
+    Args:
+        content (bytes): Contenido de la imagen
+        size (int): Lado al que se reduce la imagen
+
+    Returns:
+        numpy.ndarray: Vector float32 normalizado
+    """
+    img = Image.open(io.BytesIO(content))
+    if img.format == 'JPEG':
+        img.draft('RGB', (size * 2, size * 2))
+    img = ImageOps.exif_transpose(img).convert('RGB').resize((size, size), Image.BILINEAR)
+
+    # Color: histograma conjunto de tono, saturación y brillo
+    hsv = np.asarray(img.convert('HSV'), dtype=np.int32)
+    hue = hsv[..., 0] * HUE_BINS // 256
+    saturation = hsv[..., 1] * SATURATION_BINS // 256
+    value = hsv[..., 2] * VALUE_BINS // 256
+    color_index = (hue * SATURATION_BINS + saturation) * VALUE_BINS + value
+    color = np.bincount(color_index.ravel(), minlength=HUE_BINS * SATURATION_BINS * VALUE_BINS)
+
+    # Textura: magnitud y orientación de los gradientes en escala de grises
+    gray = np.asarray(img.convert('L'), dtype=np.float32) / 255.0
+    gradient_x = gray[:-1, 1:] - gray[:-1, :-1]
+    gradient_y = gray[1:, :-1] - gray[:-1, :-1]
+    magnitude = np.hypot(gradient_x, gradient_y)
+    orientation = np.mod(np.arctan2(gradient_y, gradient_x), np.pi)
+    magnitude_hist, _ = np.histogram(magnitude, bins=GRADIENT_MAGNITUDE_BINS, range=(0.0, 0.5))
+    orientation_hist, _ = np.histogram(
+        orientation, bins=GRADIENT_ORIENTATION_BINS, range=(0.0, np.pi), weights=magnitude
+    )
+
+    blocks = []
+    for block in (color, magnitude_hist, orientation_hist):
+        block = block.astype(np.float32)
+        total = block.sum()
+        blocks.append(np.sqrt(block / total) if total > 0 else block)
+    features = np.concatenate(blocks)
+    return features / max(np.linalg.norm(features), 1e-6)
+
+
+class LocalClassifier:
+    """
+    Clasificador k-NN sobre características de color y textura.
+
+    El modelo (.npz) contiene los vectores de entrenamiento, el índice de
+    categoría de cada uno, los nombres de las categorías, k y la distancia
+    máxima al vecino más cercano para aceptar una predicción.
+    """
+
+    def __init__(self, features, labels, categories, k=3, max_distance=1.0):
+        self.features = np.asarray(features, dtype=np.float32)
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.categories = [str(category) for category in categories]
+        self.k = int(k)
+        self.max_distance = float(max_distance)
+
+    @classmethod
+    def fit(cls, features, labels, categories, k=3, default_max_distance=0.35):
+        """
+        Construye el modelo a partir de vectores etiquetados
+
+        La distancia máxima aceptada es el percentil 90 de la distancia de cada
+        ejemplo a su vecino más cercano de la misma categoría, para rechazar
+        imágenes que no se parecen a ninguna del conjunto de entrenamiento.
+
+        Args:
+            features (list): Vectores de extract_features
+            labels (list): Índice de categoría de cada vector
+            categories (list): Nombres de las categorías
+            k (int): Número de vecinos que votan
+
+        Returns:
+            LocalClassifier: Modelo entrenado
+        """
+        features = np.asarray(features, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.int32)
+        distances = np.linalg.norm(features[:, None, :] - features[None, :, :], axis=2)
+        np.fill_diagonal(distances, np.inf)
+
+        same_class = []
+        for index, label in enumerate(labels):
+            candidates = distances[index][labels == label]
+            if np.isfinite(candidates).any():
+                same_class.append(candidates.min())
+        max_distance = float(np.percentile(same_class, 90)) if same_class else default_max_distance
+        return cls(features, labels, categories, k=k, max_distance=max_distance)
+
+    @classmethod
+    def load(cls, path):
+        """Carga un modelo guardado con save()"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data['features'], data['labels'], data['categories'],
+                k=data['k'], max_distance=data['max_distance']
+            )
+
+    def save(self, path):
+        """Guarda el modelo en formato .npz comprimido"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(
+            path,
+            features=self.features.astype(np.float16),
+            labels=self.labels,
+            categories=np.array(self.categories),
+            k=np.int32(self.k),
+            max_distance=np.float32(self.max_distance),
+        )
+
+    def predict(self, features):
+        """
+        Predice la categoría de un vector de características
+
+        Args:
+            features (numpy.ndarray): Vector de extract_features
+
+        Returns:
+            tuple: (categoría, confianza entre 0 y 1, distancia al vecino más cercano)
+        """
+        distances = np.linalg.norm(self.features - features, axis=1)
+        k = min(self.k, len(distances))
+        nearest = np.argsort(distances)[:k]
+
+        # Voto ponderado por la inversa de la distancia
+        weights = 1.0 / (distances[nearest] + 1e-3)
+        votes = np.bincount(self.labels[nearest], weights=weights, minlength=len(self.categories))
+        best = int(np.argmax(votes))
+        confidence = float(votes[best] / votes.sum())
+        return self.categories[best], confidence, float(distances[nearest[0]])
+
+
+def category_analysis(category, confidence):
+    """
+    Construye el resultado del análisis para una categoría predicha
+
+    Returns:
+        dict: Resultados del análisis, o None si la categoría no tiene resultado
+    """
+    if category not in CATEGORY_OUTCOMES:
+        return None
+
+    outcome_name, severity = CATEGORY_OUTCOMES[category]
+    outcome = vision_rules.OUTCOMES[outcome_name]
+    return {
+        'incident_type': outcome['incident_type'],
+        'damage_severity': severity or outcome['damage_severity'],
+        'vehicle_type': 'Automóvil',
+        'damaged_parts': list(outcome['damaged_parts']),
+        'confidence': round(confidence * 100, 2),
+        'labels': [],
+        'objects': [],
+        'text': [],
+        'landmarks': []
+    }
+
+
+_model = None
+_model_version = None
+_model_lock = threading.Lock()
+
+
+def get_local_classifier(path=LOCAL_CLASSIFIER_MODEL):
+    """
+    Devuelve el modelo local cargado por el proceso. Se vuelve a cargar si el
+    archivo aparece o cambia (por ejemplo, al reentrenar sin reiniciar)
+
+    Returns:
+        LocalClassifier: Modelo, o None si no está disponible
+    """
+    global _model, _model_version
+    if not LOCAL_CLASSIFIER_ENABLED or not NUMPY_SUPPORT:
+        return None
+
+    try:
+        stat = os.stat(path)
+        version = (path, stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        version = (path, None, None)
+
+    with _model_lock:
+        if _model_version != version:
+            _model_version = version
+            _model = None
+            if version[1] is not None:
+                try:
+                    _model = LocalClassifier.load(path)
+                    logger.info(f"Clasificador local cargado: {path} ({len(_model.labels)} ejemplos)")
+                except Exception as e:
+                    logger.error(f"Error al cargar el clasificador local {path}: {str(e)}")
+        return _model
+
+
+def classify_locally(content, threshold=LOCAL_CLASSIFIER_THRESHOLD):
+    """
+    Clasifica una imagen con el modelo local, sin llamadas remotas
+
+    Args:
+        content (bytes): Contenido de la imagen
+        threshold (float): Confianza mínima (0 a 1) para aceptar la predicción
+
+    Returns:
+        dict: Resultados del análisis, o None si no hay modelo o la predicción
+            no es suficientemente confiable
+    """
+    model = get_local_classifier()
+    if model is None:
+        return None
+
+    try:
+        category, confidence, distance = model.predict(extract_features(content))
+    except Exception as e:
+        logger.warning(f"No se pudo clasificar la imagen localmente: {str(e)}")
+        return None
+
+    logger.info("Clasificador local: %s (%.2f, distancia %.3f)", category, confidence, distance)
+    if confidence < threshold or distance > model.max_distance:
+        return None
+    return category_analysis(category, confidence)
@@ -1,108 +1,258 @@
 import os
-import requests
+import functools
 import logging
 from dotenv import load_dotenv
 
+try:
+    from app.api.backends import fake_backends_enabled, maps_base_url
+    from app.api.geocoding_cache import geocoding_cache
+    from app.api.offline_geocoder import offline_geocoder, OFFLINE_GEOCODER_MAPS_TIMEOUT
+    from app.api.places_index import places_index
+    from app.utils import http_client
+    from app.utils.metrics import metrics
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from api.backends import fake_backends_enabled, maps_base_url
+    from api.geocoding_cache import geocoding_cache
+    from api.offline_geocoder import offline_geocoder, OFFLINE_GEOCODER_MAPS_TIMEOUT
+    from api.places_index import places_index
+    from utils import http_client
+    from utils.metrics import metrics
+    from utils.logging_config import configure_logging
+
 # Cargar variables de entorno
 load_dotenv()
 
 # Configurar logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Obtener la API key de Google Maps desde variables de entorno
-GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY')
+# (el servidor simulado de FAKE_BACKENDS acepta cualquier valor)
+GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY') or ('fake' if fake_backends_enabled() else None)
 
-def get_location_info(latitude, longitude):
+# URL base de Google Maps, o del servidor simulado con FAKE_BACKENDS
+MAPS_BASE_URL = maps_base_url()
+
+def maps_api_configured():
+    """Indica si hay API key de Google Maps (o el servidor simulado de FAKE_BACKENDS)"""
+    return bool(GOOGLE_MAPS_API_KEY)
+
+class GeocodingError(Exception):
+    """Respuesta de Geocoding API con un estado distinto de OK"""
+
+
+def reverse_geocode(latitude, longitude, timeout=None):
     """
-    Obtiene información de ubicación a partir de coordenadas GPS
-    utilizando Google Maps Geocoding API
+    Llama a Geocoding API para unas coordenadas
     
     Args:
         latitude (float): Latitud
         longitude (float): Longitud
+        timeout (float, optional): Tiempo límite de lectura en segundos
         
     Returns:
-        dict: Información de la ubicación
+        dict: Primer resultado de Geocoding API (None si no hubo resultados)
+        
+    Raises:
+        GeocodingError: Si Geocoding API devolvió un estado distinto de OK
     """
-    if not GOOGLE_MAPS_API_KEY:
-        logger.warning("No se ha configurado la API key de Google Maps")
-        return {
-            'error': 'No se ha configurado la API key de Google Maps',
-            'coordinates': {
-                'latitude': latitude,
-                'longitude': longitude
-            },
-            'address': f"Coordenadas: {latitude}, {longitude}",
-            'city': 'No disponible',
-            'country': 'No disponible'
-        }
+    # Realizar solicitud (sesión compartida con tiempos límite, ver http_client.py)
+    response = http_client.get(geocoding_url(latitude, longitude), timeout=timeout)
+    return geocoding_result(response.json())
+
+async def reverse_geocode_async(latitude, longitude, timeout=None):
+    """
+    Igual que reverse_geocode, con el cliente HTTP asíncrono
     
-    try:
-        # Construir URL para la solicitud a Geocoding API
-        geocoding_url = f"https://maps.googleapis.com/maps/api/geocode/json?latlng={latitude},{longitude}&key={GOOGLE_MAPS_API_KEY}"
+    Args:
+        latitude (float): Latitud
+        longitude (float): Longitud
+        timeout (float, optional): Tiempo límite de lectura en segundos
         
-        # Realizar solicitud
-        response = requests.get(geocoding_url)
-        data = response.json()
+    Returns:
+        dict: Primer resultado de Geocoding API (None si no hubo resultados)
+    """
+    response = await http_client.async_get(geocoding_url(latitude, longitude), timeout=timeout)
+    return geocoding_result(response.json())
+
+def geocoding_url(latitude, longitude):
+    """URL de Geocoding API para unas coordenadas"""
+    return f"{MAPS_BASE_URL}/maps/api/geocode/json?latlng={latitude},{longitude}&key={GOOGLE_MAPS_API_KEY}"
+
+def geocoding_result(data):
+    """
+    Extrae el primer resultado de una respuesta de Geocoding API
+    
+    Args:
+        data (dict): Respuesta JSON de Geocoding API
         
-        # Verificar si la solicitud fue exitosa
-        if data['status'] != 'OK':
-            error_message = f"Error en la solicitud a Geocoding API: {data['status']}"
-            if data['status'] == 'REQUEST_DENIED':
-                error_message += ". Posible problema con la API key o restricciones de la API."
-                logger.error(f"{error_message} Verifica que la API key sea válida y que la API de Geocoding esté habilitada en la consola de Google Cloud.")
-                logger.error("Pasos para habilitar la API de Geocoding:")
-                logger.error("1. Ve a https://console.cloud.google.com/apis/library/geocoding-backend.googleapis.com")
-                logger.error("2. Selecciona tu proyecto")
-                logger.error("3. Haz clic en 'Habilitar'")
-                logger.error("4. Verifica que la API key tenga los permisos necesarios en https://console.cloud.google.com/apis/credentials")
-            else:
-                logger.error(error_message)
-            
-            # Proporcionar una ubicación por defecto con las coordenadas
-            return {
-                'error': error_message,
-                'coordinates': {
-                    'latitude': latitude,
-                    'longitude': longitude
-                },
-                'address': f"Coordenadas: {latitude}, {longitude}",
-                'city': 'No disponible',
-                'country': 'No disponible'
-            }
+    Returns:
+        dict: Primer resultado (None si no hubo resultados)
         
-        # Procesar resultados
-        location_data = {
-            'coordinates': {
-                'latitude': latitude,
-                'longitude': longitude
-            },
-            'address': data['results'][0]['formatted_address'] if data['results'] else f"Coordenadas: {latitude}, {longitude}",
-            'components': {},
-            'city': 'No disponible',
-            'country': 'No disponible'
-        }
+    Raises:
+        GeocodingError: Si Geocoding API devolvió un estado distinto de OK
+    """
+    # Verificar si la solicitud fue exitosa
+    if data['status'] != 'OK':
+        error_message = f"Error en la solicitud a Geocoding API: {data['status']}"
+        if data['status'] == 'REQUEST_DENIED':
+            error_message += ". Posible problema con la API key o restricciones de la API."
+            logger.error(f"{error_message} Verifica que la API key sea válida y que la API de Geocoding esté habilitada en la consola de Google Cloud.")
+            logger.error("Pasos para habilitar la API de Geocoding:")
+            logger.error("1. Ve a https://console.cloud.google.com/apis/library/geocoding-backend.googleapis.com")
+            logger.error("2. Selecciona tu proyecto")
+            logger.error("3. Haz clic en 'Habilitar'")
+            logger.error("4. Verifica que la API key tenga los permisos necesarios en https://console.cloud.google.com/apis/credentials")
+        else:
+            logger.error(error_message)
+        raise GeocodingError(error_message)
+    
+    return data['results'][0] if data['results'] else None
+
+def build_location_data(latitude, longitude, result):
+    """
+    Construye la información de ubicación a partir de un resultado de Geocoding API
+    
+    Args:
+        latitude (float): Latitud
+        longitude (float): Longitud
+        result (dict): Resultado de Geocoding API (o None)
+        
+    Returns:
+        dict: Información de la ubicación
+    """
+    location_data = {
+        'coordinates': {
+            'latitude': latitude,
+            'longitude': longitude
+        },
+        'address': result['formatted_address'] if result else f"Coordenadas: {latitude}, {longitude}",
+        'components': {},
+        'city': 'No disponible',
+        'country': 'No disponible'
+    }
+    
+    # Extraer componentes de la dirección
+    if result and 'address_components' in result:
+        for component in result['address_components']:
+            for type in component['types']:
+                location_data['components'][type] = component['long_name']
+                
+                # Extraer ciudad y país para facilitar el acceso
+                if type == 'locality' or type == 'administrative_area_level_1':
+                    location_data['city'] = component['long_name']
+                elif type == 'country':
+                    location_data['country'] = component['long_name']
+    
+    return location_data
+
+def offline_location_info(latitude, longitude, reason):
+    """
+    Obtiene información de ubicación del nomenclátor local (sin red)
+    
+    Args:
+        latitude (float): Latitud
+        longitude (float): Longitud
+        reason (str): Motivo para las métricas (no_key, region o fallback)
         
-        # Extraer componentes de la dirección
-        if data['results'] and 'address_components' in data['results'][0]:
-            for component in data['results'][0]['address_components']:
-                for type in component['types']:
-                    location_data['components'][type] = component['long_name']
-                    
-                    # Extraer ciudad y país para facilitar el acceso
-                    if type == 'locality' or type == 'administrative_area_level_1':
-                        location_data['city'] = component['long_name']
-                    elif type == 'country':
-                        location_data['country'] = component['long_name']
+    Returns:
+        dict: Información de la ubicación, o None si no hay un lugar cercano
+    """
+    result = offline_geocoder.lookup(latitude, longitude)
+    if result is None:
+        return None
+    metrics.increment('geocoding_offline_total', reason=reason)
+    location_data = build_location_data(latitude, longitude, result)
+    location_data['source'] = 'offline'
+    return location_data
+
+def get_location_info(latitude, longitude):
+    """
+    Obtiene información de ubicación a partir de coordenadas GPS
+    utilizando Google Maps Geocoding API (con la caché de geocodificación).
+    Si hay un nomenclátor local se usa cuando no hay API key, en las regiones
+    configuradas en OFFLINE_GEOCODER_REGIONS y cuando Google Maps falla.
+    
+    Args:
+        latitude (float): Latitud
+        longitude (float): Longitud
         
+    Returns:
+        dict: Información de la ubicación
+    """
+    location_data = location_without_maps(latitude, longitude)
+    if location_data is not None:
         return location_data
     
+    try:
+        result = geocoding_cache.get_or_fetch(latitude, longitude, maps_fetch())
+        return build_location_data(latitude, longitude, result)
+    
+    except GeocodingError as e:
+        error_message = str(e)
+    
     except Exception as e:
         logger.error(f"Error al obtener información de ubicación: {str(e)}")
-        # Proporcionar una ubicación por defecto con las coordenadas
+        error_message = f"Error al obtener información de ubicación: {str(e)}"
+    
+    return location_after_error(latitude, longitude, error_message)
+
+async def get_location_info_async(latitude, longitude):
+    """
+    Igual que get_location_info, esperando a Geocoding API de forma asíncrona
+    
+    Args:
+        latitude (float): Latitud
+        longitude (float): Longitud
+        
+    Returns:
+        dict: Información de la ubicación
+    """
+    location_data = location_without_maps(latitude, longitude)
+    if location_data is not None:
+        return location_data
+    
+    try:
+        result = await geocoding_cache.get_or_fetch_async(
+            latitude, longitude, maps_fetch(reverse_geocode_async), maps_fetch()
+        )
+        return build_location_data(latitude, longitude, result)
+    
+    except GeocodingError as e:
+        error_message = str(e)
+    
+    except Exception as e:
+        logger.error(f"Error al obtener información de ubicación: {str(e)}")
+        error_message = f"Error al obtener información de ubicación: {str(e)}"
+    
+    return location_after_error(latitude, longitude, error_message)
+
+def maps_fetch(fetch=reverse_geocode):
+    """
+    Función de geocodificación para la caché: con nomenclátor de respaldo no
+    vale la pena esperar mucho a Google Maps
+    """
+    if offline_geocoder.available:
+        return functools.partial(fetch, timeout=OFFLINE_GEOCODER_MAPS_TIMEOUT)
+    return fetch
+
+def location_without_maps(latitude, longitude):
+    """
+    Información de ubicación que no requiere llamar a Google Maps: sin API
+    key, o en una región configurada para usar el nomenclátor local
+    
+    Returns:
+        dict: Información de la ubicación, o None si hay que llamar a Google Maps
+    """
+    if not GOOGLE_MAPS_API_KEY:
+        offline_data = offline_location_info(latitude, longitude, 'no_key')
+        if offline_data is not None:
+            return offline_data
+        logger.warning("No se ha configurado la API key de Google Maps")
         return {
-            'error': f"Error al obtener información de ubicación: {str(e)}",
+            'error': 'No se ha configurado la API key de Google Maps',
             'coordinates': {
                 'latitude': latitude,
                 'longitude': longitude
@@ -111,31 +261,65 @@ def get_location_info(latitude, longitude):
             'city': 'No disponible',
             'country': 'No disponible'
         }
+    
+    if offline_geocoder.preferred_for(latitude, longitude):
+        return offline_location_info(latitude, longitude, 'region')
+    return None
 
-def get_nearby_places(latitude, longitude, place_type='hospital', radius=5000):
+def location_after_error(latitude, longitude, error_message):
     """
-    Obtiene lugares cercanos a las coordenadas dadas
-    utilizando Google Places API
+    Información de ubicación cuando Google Maps falló: el lugar más cercano
+    del nomenclátor local o, si no hay, las coordenadas con el error
+    """
+    offline_data = offline_location_info(latitude, longitude, 'fallback')
+    if offline_data is not None:
+        logger.warning(f"Se usa el nomenclátor local: {error_message}")
+        return offline_data
+    
+    # Proporcionar una ubicación por defecto con las coordenadas
+    return {
+        'error': error_message,
+        'coordinates': {
+            'latitude': latitude,
+            'longitude': longitude
+        },
+        'address': f"Coordenadas: {latitude}, {longitude}",
+        'city': 'No disponible',
+        'country': 'No disponible'
+    }
+
+def get_nearby_places(latitude, longitude, place_type='hospital', radius=5000, refresh=False):
+    """
+    Obtiene lugares cercanos a las coordenadas dadas, del índice local de
+    lugares o, si no cubre la zona, utilizando Google Places API
     
     Args:
         latitude (float): Latitud
         longitude (float): Longitud
         place_type (str): Tipo de lugar a buscar (hospital, police, etc.)
         radius (int): Radio de búsqueda en metros
+        refresh (bool): Consultar Places API aunque el índice cubra la zona
         
     Returns:
-        list: Lista de lugares cercanos
+        list: Lista de lugares cercanos (ordenados por distancia si el índice está activo)
     """
+    if refresh:
+        metrics.increment('places_index_total', result='refresh')
+    else:
+        places = places_index.query(latitude, longitude, place_type, radius)
+        if places is not None:
+            return places
+    
     if not GOOGLE_MAPS_API_KEY:
         logger.warning("No se ha configurado la API key de Google Maps")
         return []
     
     try:
         # Construir URL para la solicitud a Places API
-        places_url = f"https://maps.googleapis.com/maps/api/place/nearbysearch/json?location={latitude},{longitude}&radius={radius}&type={place_type}&key={GOOGLE_MAPS_API_KEY}"
+        places_url = f"{MAPS_BASE_URL}/maps/api/place/nearbysearch/json?location={latitude},{longitude}&radius={radius}&type={place_type}&key={GOOGLE_MAPS_API_KEY}"
         
-        # Realizar solicitud
-        response = requests.get(places_url)
+        # Realizar solicitud (sesión compartida con tiempos límite, ver http_client.py)
+        response = http_client.get(places_url)
         data = response.json()
         
         # Verificar si la solicitud fue exitosa
@@ -157,7 +341,11 @@ def get_nearby_places(latitude, longitude, place_type='hospital', radius=5000):
                 'rating': place.get('rating', 0)
             })
         
-        return places
+        # Guardar la respuesta en el índice para las siguientes búsquedas en la zona
+        indexed_places = places_index.store(
+            latitude, longitude, place_type, radius, data.get('results', []), data.get('next_page_token')
+        )
+        return places if indexed_places is None else indexed_places
     
     except Exception as e:
         logger.error(f"Error al obtener lugares cercanos: {str(e)}")
@@ -0,0 +1,190 @@
+import os
+import csv
+import threading
+import logging
+
+try:
+    from app.utils.geo import GridIndex, NUMPY_SUPPORT
+    from app.api.geocoding_cache import geohash
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from utils.geo import GridIndex, NUMPY_SUPPORT
+    from api.geocoding_cache import geohash
+    from utils.logging_config import configure_logging
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Geocodificación inversa sin red a partir de un nomenclátor local. Acepta un
+# CSV con columnas name, admin1, country, country_code, latitude, longitude, o
+# un archivo de ciudades de GeoNames (cities15000.txt, etc.); en ese caso los
+# nombres de estado y país se toman de admin1CodesASCII.txt y countryInfo.txt
+# si están en el mismo directorio.
+OFFLINE_GEOCODER_FILE = os.environ.get('OFFLINE_GEOCODER_FILE', os.path.join('data', 'gazetteer_mx.csv'))
+# Distancia máxima (km) al lugar más cercano para considerar válido el resultado
+OFFLINE_GEOCODER_MAX_KM = float(os.environ.get('OFFLINE_GEOCODER_MAX_KM', '50'))
+# Prefijos de geohash (separados por comas, o "*" para todas partes) en los que
+# se usa el nomenclátor sin consultar Google Maps
+OFFLINE_GEOCODER_REGIONS = os.environ.get('OFFLINE_GEOCODER_REGIONS', '')
+# Tiempo límite de lectura de Geocoding API cuando hay nomenclátor de respaldo
+OFFLINE_GEOCODER_MAPS_TIMEOUT = float(os.environ.get('OFFLINE_GEOCODER_MAPS_TIMEOUT', '2'))
+
+# Columnas de los archivos de GeoNames
+GEONAMES_NAME = 1
+GEONAMES_LATITUDE = 4
+GEONAMES_LONGITUDE = 5
+GEONAMES_COUNTRY_CODE = 8
+GEONAMES_ADMIN1_CODE = 10
+
+
+def _read_geonames_names(path, key_column, name_column):
+    """Lee un archivo auxiliar de GeoNames (código -> nombre), si existe"""
+    names = {}
+    if not os.path.exists(path):
+        return names
+    with open(path, 'r', encoding='utf-8') as names_file:
+        for line in names_file:
+            if line.startswith('#'):
+                continue
+            columns = line.rstrip('\n').split('\t')
+            if len(columns) > max(key_column, name_column):
+                names[columns[key_column]] = columns[name_column]
+    return names
+
+
+def read_gazetteer(path):
+    """
+    Lee un nomenclátor en CSV o en formato de GeoNames
+
+    Args:
+        path (str): Ruta del archivo
+
+    Returns:
+        list: Diccionarios con name, admin1, country, country_code, latitude, longitude
+    """
+    places = []
+    if path.lower().endswith('.csv'):
+        with open(path, 'r', encoding='utf-8', newline='') as csv_file:
+            for row in csv.DictReader(csv_file):
+                places.append({
+                    'name': row['name'],
+                    'admin1': row.get('admin1', ''),
+                    'country': row.get('country', ''),
+                    'country_code': row.get('country_code', ''),
+                    'latitude': float(row['latitude']),
+                    'longitude': float(row['longitude']),
+                })
+        return places
+
+    directory = os.path.dirname(path)
+    admin1_names = _read_geonames_names(os.path.join(directory, 'admin1CodesASCII.txt'), 0, 1)
+    country_names = _read_geonames_names(os.path.join(directory, 'countryInfo.txt'), 0, 4)
+    with open(path, 'r', encoding='utf-8') as geonames_file:
+        for line in geonames_file:
+            columns = line.rstrip('\n').split('\t')
+            if len(columns) <= GEONAMES_ADMIN1_CODE:
+                continue
+            country_code = columns[GEONAMES_COUNTRY_CODE]
+            places.append({
+                'name': columns[GEONAMES_NAME],
+                'admin1': admin1_names.get(f"{country_code}.{columns[GEONAMES_ADMIN1_CODE]}", ''),
+                'country': country_names.get(country_code, country_code),
+                'country_code': country_code,
+                'latitude': float(columns[GEONAMES_LATITUDE]),
+                'longitude': float(columns[GEONAMES_LONGITUDE]),
+            })
+    return places
+
+
+class OfflineGeocoder:
+    """
+    Lugar más cercano de un nomenclátor local, indexado en una rejilla
+    (ver utils/geo.py). Devuelve resultados con la misma forma que Geocoding
+    API para que maps_api construya la ubicación igual que con Google Maps.
+    """
+
+    def __init__(self, path=OFFLINE_GEOCODER_FILE, max_km=OFFLINE_GEOCODER_MAX_KM,
+                 regions=OFFLINE_GEOCODER_REGIONS):
+        self.path = path
+        self.max_km = max_km
+        self.regions = tuple(region.strip() for region in regions.split(',') if region.strip())
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._places = []
+        self._index = None
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not NUMPY_SUPPORT or not self.path or not os.path.exists(self.path):
+                return
+            try:
+                places = read_gazetteer(self.path)
+                if places:
+                    self._index = GridIndex(
+                        [place['latitude'] for place in places],
+                        [place['longitude'] for place in places]
+                    )
+                    self._places = places
+                logger.info(f"Nomenclátor local cargado: {self.path} ({len(places)} lugares)")
+            except Exception as e:
+                logger.warning(f"No se pudo cargar el nomenclátor local {self.path}: {str(e)}")
+
+    @property
+    def available(self):
+        """Indica si hay un nomenclátor cargado"""
+        self._load()
+        return self._index is not None
+
+    def preferred_for(self, latitude, longitude):
+        """Indica si las coordenadas están en una región configurada para no usar Google Maps"""
+        if not self.regions or not self.available:
+            return False
+        if '*' in self.regions:
+            return True
+        return geohash(latitude, longitude, max(len(region) for region in self.regions)).startswith(self.regions)
+
+    def lookup(self, latitude, longitude):
+        """
+        Busca el lugar más cercano a unas coordenadas
+
+        Args:
+            latitude (float): Latitud
+            longitude (float): Longitud
+
+        Returns:
+            dict: Resultado con formatted_address y address_components (como
+                Geocoding API), o None si no hay un lugar a menos de max_km
+        """
+        if not self.available:
+            return None
+        match = self._index.nearest(latitude, longitude, self.max_km)
+        if match is None:
+            return None
+
+        place = self._places[match[0]]
+        components = [{'long_name': place['name'], 'short_name': place['name'], 'types': ['locality', 'political']}]
+        if place['admin1']:
+            components.append({
+                'long_name': place['admin1'],
+                'short_name': place['admin1'],
+                'types': ['administrative_area_level_1', 'political']
+            })
+        if place['country']:
+            components.append({
+                'long_name': place['country'],
+                'short_name': place['country_code'] or place['country'],
+                'types': ['country', 'political']
+            })
+        return {
+            'formatted_address': ', '.join(component['long_name'] for component in components),
+            'address_components': components,
+        }
+
+
+# Nomenclátor compartido por el proceso (se carga en el primer uso)
+offline_geocoder = OfflineGeocoder()
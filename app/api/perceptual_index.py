@@ -0,0 +1,392 @@
+import os
+import io
+import json
+import datetime
+import tempfile
+import threading
+import contextlib
+import logging
+from PIL import Image, ImageOps
+
+try:
+    from app.api.local_classifier import map_folder_to_category, category_analysis
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from api.local_classifier import map_folder_to_category, category_analysis
+    from utils.logging_config import configure_logging
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Configuración del índice de hashes perceptuales
+PHASH_ENABLED = os.environ.get('PHASH_ENABLED', 'true').lower() == 'true'
+PHASH_INDEX_PATH = os.environ.get('PHASH_INDEX_PATH', os.path.join('cache', 'phash_index.jsonl'))
+PHASH_MAX_DISTANCE = int(os.environ.get('PHASH_MAX_DISTANCE', '6'))
+PHASH_DATASET_DIR = os.environ.get('PHASH_DATASET_DIR', 'dataset')
+# Entradas máximas del archivo; al superarlas se compacta
+PHASH_MAX_ENTRIES = int(os.environ.get('PHASH_MAX_ENTRIES', '5000'))
+# Agregar las imágenes de dataset/ al arrancar la aplicación (si no, solo con
+# build_perceptual_index.py)
+PHASH_SEED_ON_STARTUP = os.environ.get('PHASH_SEED_ON_STARTUP', 'true').lower() == 'true'
+# Imágenes con poca información (planas o degradados suaves) que no se indexan:
+# bits mínimos en 1 (y en 0) del hash y contraste mínimo de la cuadrícula
+PHASH_MIN_BITS = int(os.environ.get('PHASH_MIN_BITS', '8'))
+PHASH_MIN_CONTRAST = int(os.environ.get('PHASH_MIN_CONTRAST', '16'))
+
+# Lado de la cuadrícula del dHash (8 -> hash de 64 bits)
+HASH_SIZE = 8
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+# Confianza del análisis almacenado para las imágenes etiquetadas de dataset/
+DATASET_CONFIDENCE = 0.9
+
+# Fracción de PHASH_MAX_ENTRIES que se conserva al compactar el archivo
+COMPACT_RATIO = 0.8
+
+
+def _hash_grid(content, hash_size):
+    """Luminancia de la imagen reducida a una cuadrícula de (hash_size + 1) x hash_size"""
+    img = Image.open(io.BytesIO(content))
+    if img.format == 'JPEG':
+        img.draft('L', (hash_size * 8, hash_size * 8))
+    img = ImageOps.exif_transpose(img).convert('L')
+    img = img.resize((hash_size + 1, hash_size), Image.LANCZOS)
+    return list(img.getdata())
+
+
+def _grid_hash(pixels, hash_size):
+    """Compara cada celda de la cuadrícula con la de su derecha"""
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def dhash(content, hash_size=HASH_SIZE):
+    """
+    Calcula el hash de diferencias (dHash) de una imagen. Es estable frente a
+    recompresión, cambios de tamaño y conversión entre formatos.
+
+    Args:
+        content (bytes): Contenido de la imagen
+        hash_size (int): Lado de la cuadrícula de comparación
+
+    Returns:
+        int: Hash de hash_size * hash_size bits
+    """
+    return _grid_hash(_hash_grid(content, hash_size), hash_size)
+
+
+def perceptual_hash(content, hash_size=HASH_SIZE, min_bits=PHASH_MIN_BITS, min_contrast=PHASH_MIN_CONTRAST):
+    """
+    dHash de una imagen, o None si tiene demasiada poca información para
+    distinguirla de otras. Una imagen plana o un degradado suave dan un hash
+    casi todo en 0 (o en 1), y el ruido de una imagen plana da bits al azar.
+
+    Args:
+        content (bytes): Contenido de la imagen
+        hash_size (int): Lado de la cuadrícula de comparación
+        min_bits (int): Bits mínimos en 1 y en 0
+        min_contrast (int): Diferencia mínima de luminancia en la cuadrícula
+
+    Returns:
+        int: Hash de hash_size * hash_size bits, o None
+    """
+    pixels = _hash_grid(content, hash_size)
+    value = _grid_hash(pixels, hash_size)
+    ones = bin(value).count('1')
+    if min(ones, hash_size * hash_size - ones) < min_bits or max(pixels) - min(pixels) < min_contrast:
+        return None
+    return value
+
+
+def hamming_distance(first, second):
+    """Número de bits distintos entre dos hashes"""
+    return bin(first ^ second).count('1')
+
+
+class BKTree:
+    """
+    Árbol BK sobre la distancia de Hamming. Permite encontrar los hashes a
+    distancia menor o igual a un umbral sin comparar contra todo el índice.
+    """
+
+    def __init__(self):
+        self._root = None
+
+    def add(self, value, item):
+        """Agrega un hash con el elemento asociado"""
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """
+        Busca los elementos cuyo hash está a distancia <= max_distance
+
+        Returns:
+            list: Tuplas (distancia, elemento) ordenadas por distancia
+        """
+        matches = []
+        pending = [self._root] if self._root is not None else []
+        while pending:
+            node = pending.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class PerceptualIndex:
+    """
+    Índice persistente de hashes perceptuales de imágenes ya analizadas.
+
+    Las entradas se agregan como líneas JSON a un archivo compartido por todos
+    los workers. Cada proceso mantiene un árbol BK en memoria y solo lee las
+    líneas nuevas cuando otro proceso agrega entradas. Cuando el archivo supera
+    max_entries líneas se reescribe con las entradas más recientes.
+    """
+
+    def __init__(self, path=PHASH_INDEX_PATH, max_distance=PHASH_MAX_DISTANCE,
+                 dataset_dir=PHASH_DATASET_DIR, enabled=PHASH_ENABLED,
+                 max_entries=PHASH_MAX_ENTRIES):
+        self.path = path
+        self.max_distance = max_distance
+        self.dataset_dir = dataset_dir
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = []
+        self._tree = BKTree()
+        self._offset = 0
+        self._inode = None
+
+    def _file_stat(self):
+        """Tamaño e inodo del archivo ((0, None) si no existe)"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0, None
+        return stat.st_size, stat.st_ino
+
+    def _reset(self):
+        self._entries = []
+        self._tree = BKTree()
+        self._offset = 0
+
+    def _refresh(self):
+        """Incorpora las entradas agregadas al archivo desde la última lectura"""
+        size, inode = self._file_stat()
+        if size < self._offset or inode != self._inode:
+            # El archivo fue reemplazado (compactado) o truncado: reconstruir desde cero
+            self._reset()
+            self._inode = inode
+
+        if size > self._offset:
+            with open(self.path, 'rb') as index_file:
+                index_file.seek(self._offset)
+                data = index_file.read()
+            # Ignorar una última línea incompleta (otro proceso escribiendo)
+            complete = data[:data.rfind(b'\n') + 1]
+            for line in complete.splitlines():
+                try:
+                    entry = json.loads(line)
+                    value = int(entry['hash'], 16)
+                except Exception as e:
+                    logger.warning(f"Entrada inválida en el índice de hashes perceptuales: {str(e)}")
+                    continue
+                self._tree.add(value, len(self._entries))
+                self._entries.append(entry)
+            self._offset += len(complete)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Bloqueo entre procesos para escribir o compactar el archivo"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(f"{self.path}.lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, new_entries):
+        """Agrega entradas al archivo bajo un bloqueo entre procesos"""
+        with self._file_lock():
+            self._write(new_entries)
+
+    def _write(self, new_entries):
+        """Agrega entradas al archivo y lo compacta si hace falta (con el bloqueo tomado)"""
+        data = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in new_entries)
+        with open(self.path, 'a', encoding='utf-8') as index_file:
+            index_file.write(data)
+            index_file.flush()
+        self._refresh()
+        if len(self._entries) > self.max_entries:
+            self._compact()
+
+    def _compact(self):
+        """
+        Reescribe el archivo con las imágenes de dataset/ y las entradas más
+        recientes, una por origen, hasta COMPACT_RATIO * max_entries
+        """
+        seen = set()
+        latest = []
+        for entry in reversed(self._entries):
+            if entry.get('source') not in seen:
+                seen.add(entry.get('source'))
+                latest.append(entry)
+        latest.reverse()
+
+        dataset = [entry for entry in latest if str(entry.get('source')).startswith('dataset/')]
+        others = [entry for entry in latest if not str(entry.get('source')).startswith('dataset/')]
+        keep = max(int(self.max_entries * COMPACT_RATIO) - len(dataset), 0)
+        kept = dataset + (others[-keep:] if keep else [])
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', prefix='.phash-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as index_file:
+                index_file.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in kept))
+            os.replace(temp_path, self.path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        logger.info(f"Índice de hashes perceptuales compactado: {len(self._entries)} -> {len(kept)} entradas")
+        self._refresh()
+
+    def seed(self):
+        """
+        Agrega al índice las imágenes de dataset/ que todavía no están. Se llama
+        al arrancar la aplicación o con build_perceptual_index.py, nunca durante
+        una solicitud.
+
+        Returns:
+            int: Número de imágenes agregadas
+        """
+        if not self.enabled or not self.dataset_dir or not os.path.isdir(self.dataset_dir):
+            return 0
+
+        try:
+            with self._lock, self._file_lock():
+                self._refresh()
+                known = {entry.get('source') for entry in self._entries}
+                new_entries = []
+                for folder in sorted(os.listdir(self.dataset_dir)):
+                    folder_path = os.path.join(self.dataset_dir, folder)
+                    category = map_folder_to_category(folder)
+                    analysis = category_analysis(category, DATASET_CONFIDENCE) if category else None
+                    if not os.path.isdir(folder_path) or analysis is None:
+                        continue
+                    for file_name in sorted(os.listdir(folder_path)):
+                        source = f"dataset/{folder}/{file_name}"
+                        if source in known or not file_name.lower().endswith(IMAGE_EXTENSIONS):
+                            continue
+                        try:
+                            with open(os.path.join(folder_path, file_name), 'rb') as image_file:
+                                value = perceptual_hash(image_file.read())
+                        except Exception as e:
+                            logger.warning(f"No se pudo calcular el hash de {source}: {str(e)}")
+                            continue
+                        if value is None:
+                            logger.info(f"{source} tiene poca información, no se agrega al índice")
+                            continue
+                        new_entries.append(self._entry(value, analysis, source))
+
+                if new_entries:
+                    logger.info(f"Índice de hashes perceptuales: {len(new_entries)} imágenes de dataset agregadas")
+                    self._write(new_entries)
+                return len(new_entries)
+        except Exception as e:
+            logger.warning(f"No se pudieron agregar las imágenes de dataset al índice de hashes perceptuales: {str(e)}")
+            return 0
+
+    def _entry(self, value, analysis, source, hints=()):
+        return {
+            'hash': f"{value:016x}",
+            'source': source,
+            'hints': sorted(hints),
+            'analysis': analysis,
+            'created_at': datetime.datetime.now().isoformat()
+        }
+
+    @staticmethod
+    def _applies(entry, hints):
+        """
+        Indica si el análisis de una entrada vale para una imagen con esas pistas
+        del nombre. El de las imágenes de dataset/ sale de su carpeta y vale
+        siempre; el de una imagen analizada depende de las pistas de su nombre.
+        """
+        return str(entry.get('source')).startswith('dataset/') or entry.get('hints') == sorted(hints)
+
+    def lookup(self, value, hints=()):
+        """
+        Busca la imagen conocida más parecida dentro del umbral configurado
+
+        Args:
+            value (int): dHash de la imagen (ver perceptual_hash)
+            hints (frozenset): Pistas del nombre de la imagen
+
+        Returns:
+            dict: {'distance', 'source', 'analysis'} o None si no hay coincidencia
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            self._refresh()
+            for distance, position in self._tree.search(value, self.max_distance):
+                entry = self._entries[position]
+                if self._applies(entry, hints):
+                    return {'distance': distance, 'source': entry['source'], 'analysis': entry['analysis']}
+            return None
+
+    def add(self, value, analysis, source, hints=()):
+        """
+        Guarda el análisis de una imagen en el índice
+
+        Args:
+            value (int): dHash de la imagen (ver perceptual_hash)
+            analysis (dict): Resultados del análisis
+            source (str): Origen de la imagen (ruta del archivo)
+            hints (frozenset): Pistas del nombre usadas en la clasificación
+        """
+        if not self.enabled:
+            return
+
+        try:
+            with self._lock:
+                self._append([self._entry(value, analysis, source, hints)])
+        except Exception as e:
+            logger.warning(f"No se pudo guardar la imagen en el índice de hashes perceptuales: {str(e)}")
+
+
+# Índice compartido por el proceso
+perceptual_index = PerceptualIndex()
@@ -0,0 +1,304 @@
+import os
+import csv
+import time
+import threading
+import logging
+
+try:
+    from app.utils.geo import GridIndex, NUMPY_SUPPORT
+    from app.api.geocoding_cache import geohash
+    from app.utils.metrics import metrics
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from utils.geo import GridIndex, NUMPY_SUPPORT
+    from api.geocoding_cache import geohash
+    from utils.metrics import metrics
+    from utils.logging_config import configure_logging
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Índice local de lugares (hospitales, policía, etc.) para get_nearby_places.
+# Se alimenta de un archivo de lugares que se puede reemplazar en bloque y de
+# las respuestas de Places API; solo se consulta Places API cuando la zona y
+# el tipo pedidos no están cubiertos por el índice.
+PLACES_INDEX_ENABLED = os.environ.get('PLACES_INDEX_ENABLED', 'true').lower() == 'true'
+# CSV con columnas name, vicinity, types (separados por "|"), latitude,
+# longitude y, opcionalmente, rating y place_id
+PLACES_INDEX_FILE = os.environ.get('PLACES_INDEX_FILE', os.path.join('data', 'places.csv'))
+# Prefijos de geohash (separados por comas, o "*") que cubre el archivo: para
+# los tipos que aparecen en él, dentro de estas regiones no se consulta Places API
+PLACES_INDEX_REGIONS = os.environ.get('PLACES_INDEX_REGIONS', '*')
+# Segundos durante los que se reutiliza una respuesta de Places API
+PLACES_INDEX_TTL = float(os.environ.get('PLACES_INDEX_TTL', str(7 * 24 * 3600)))
+# Cada cuántos segundos se comprueba si el archivo de lugares cambió
+PLACES_INDEX_RELOAD_INTERVAL = float(os.environ.get('PLACES_INDEX_RELOAD_INTERVAL', '60'))
+
+SOURCE_FILE = 'file'
+SOURCE_LIVE = 'live'
+
+# Resultados por página de Nearby Search (ordenados por relevancia, no por
+# distancia): una página llena puede omitir lugares más cercanos
+PLACES_PAGE_SIZE = 20
+
+
+def read_places(path):
+    """
+    Lee un archivo de lugares en CSV
+
+    Args:
+        path (str): Ruta del archivo
+
+    Returns:
+        list: Lugares con name, vicinity, types, latitude, longitude, rating y place_id
+    """
+    places = []
+    with open(path, 'r', encoding='utf-8', newline='') as csv_file:
+        for row in csv.DictReader(csv_file):
+            places.append({
+                'name': row.get('name') or 'Sin nombre',
+                'vicinity': row.get('vicinity') or 'Sin dirección',
+                'types': [place_type for place_type in (row.get('types') or '').split('|') if place_type],
+                'latitude': float(row['latitude']),
+                'longitude': float(row['longitude']),
+                'rating': float(row['rating']) if row.get('rating') else 0,
+                'place_id': row.get('place_id') or None,
+            })
+    return places
+
+
+def _from_places_api(result, fetched_at):
+    """Convierte un resultado de Places API en un lugar del índice"""
+    location = result['geometry']['location']
+    return {
+        'name': result.get('name', 'Sin nombre'),
+        'vicinity': result.get('vicinity', 'Sin dirección'),
+        'types': result.get('types', []),
+        'latitude': location['lat'],
+        'longitude': location['lng'],
+        'rating': result.get('rating', 0),
+        'place_id': result.get('place_id'),
+        'source': SOURCE_LIVE,
+        'fetched_at': fetched_at,
+    }
+
+
+def _public(place):
+    """Lugar con la forma que devuelve get_nearby_places"""
+    return {
+        'name': place['name'],
+        'vicinity': place['vicinity'],
+        'location': {
+            'latitude': place['latitude'],
+            'longitude': place['longitude']
+        },
+        'types': list(place['types']),
+        'rating': place['rating']
+    }
+
+
+class _TypeIndex:
+    """
+    Lugares de un tipo y zonas consultadas en Places API. Es inmutable: las
+    actualizaciones construyen uno nuevo, así las consultas no toman el lock.
+    """
+
+    __slots__ = ('places', 'grid', 'areas', 'area_grid', 'max_area_km')
+
+    def __init__(self, places, areas):
+        self.places = places
+        self.grid = GridIndex(
+            [place['latitude'] for place in places],
+            [place['longitude'] for place in places]
+        ) if places else None
+        # areas: tuplas (latitud, longitud, radio en km, momento de la consulta)
+        self.areas = areas
+        self.area_grid = GridIndex(
+            [area[0] for area in areas],
+            [area[1] for area in areas]
+        ) if areas else None
+        self.max_area_km = max((area[2] for area in areas), default=0.0)
+
+    def within(self, latitude, longitude, radius_km):
+        """Lugares dentro del radio, del más cercano al más lejano"""
+        if self.grid is None:
+            return []
+        return [_public(self.places[position]) for position, _ in self.grid.within(latitude, longitude, radius_km)]
+
+
+class PlacesIndex:
+    """
+    Índice espacial de lugares por tipo (rejillas de utils/geo.py) que
+    responde búsquedas por tipo y radio ordenadas por distancia.
+    """
+
+    def __init__(self, path=PLACES_INDEX_FILE, regions=PLACES_INDEX_REGIONS, ttl=PLACES_INDEX_TTL,
+                 reload_interval=PLACES_INDEX_RELOAD_INTERVAL, enabled=PLACES_INDEX_ENABLED):
+        self.path = path
+        self.regions = tuple(region.strip() for region in regions.split(',') if region.strip())
+        self.ttl = ttl
+        self.reload_interval = reload_interval
+        self.enabled = enabled and NUMPY_SUPPORT
+        self._lock = threading.Lock()
+        self._types = {}
+        self._file_types = frozenset()
+        self._file_mtime = None
+        self._checked_at = None
+
+    def _file_covers(self, place_type, latitude, longitude):
+        if place_type not in self._file_types or not self.regions:
+            return False
+        if '*' in self.regions:
+            return True
+        return geohash(latitude, longitude, max(len(region) for region in self.regions)).startswith(self.regions)
+
+    def _check_file(self):
+        """Carga el archivo de lugares la primera vez y cuando cambia"""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path) if self.path else None
+        except OSError:
+            mtime = None
+        if mtime != self._file_mtime:
+            self.reload(mtime)
+
+    def reload(self, mtime=None):
+        """
+        Vuelve a leer el archivo de lugares (actualización en bloque); las
+        respuestas de Places API ya guardadas se conservan
+
+        Args:
+            mtime (float, optional): Fecha de modificación del archivo leído
+        """
+        places = []
+        if self.path and os.path.exists(self.path):
+            try:
+                places = read_places(self.path)
+                mtime = mtime if mtime is not None else os.path.getmtime(self.path)
+                logger.info(f"Índice de lugares cargado: {self.path} ({len(places)} lugares)")
+            except Exception as e:
+                logger.warning(f"No se pudo cargar el archivo de lugares {self.path}: {str(e)}")
+                return
+
+        by_type = {}
+        for place in places:
+            place['source'] = SOURCE_FILE
+            for place_type in place['types']:
+                by_type.setdefault(place_type, []).append(place)
+
+        with self._lock:
+            types = {}
+            for place_type in set(by_type) | set(self._types):
+                current = self._types.get(place_type)
+                live_places = [place for place in current.places if place['source'] == SOURCE_LIVE] if current else []
+                areas = current.areas if current else []
+                types[place_type] = _TypeIndex(by_type.get(place_type, []) + live_places, areas)
+            self._types = types
+            self._file_types = frozenset(by_type)
+            self._file_mtime = mtime
+
+    def _covers(self, index, place_type, latitude, longitude, radius_km):
+        """Indica si el índice tiene todos los lugares del tipo dentro del radio"""
+        if self._file_covers(place_type, latitude, longitude):
+            return True
+        if index.area_grid is None:
+            return False
+        oldest = time.time() - self.ttl
+        for position, distance in index.area_grid.within(latitude, longitude, index.max_area_km):
+            area = index.areas[position]
+            if distance + radius_km <= area[2] and area[3] >= oldest:
+                return True
+        return False
+
+    def query(self, latitude, longitude, place_type, radius):
+        """
+        Busca lugares de un tipo dentro de un radio
+
+        Args:
+            latitude (float): Latitud
+            longitude (float): Longitud
+            place_type (str): Tipo de lugar (hospital, police, etc.)
+            radius (float): Radio de búsqueda en metros
+
+        Returns:
+            list: Lugares ordenados por distancia, o None si el índice no
+                cubre la zona y hay que consultar Places API
+        """
+        if not self.enabled:
+            return None
+        self._check_file()
+        radius_km = float(radius) / 1000
+        index = self._types.get(place_type)
+        if index is None or not self._covers(index, place_type, latitude, longitude, radius_km):
+            metrics.increment('places_index_total', result='miss')
+            return None
+
+        metrics.increment('places_index_total', result='hit')
+        return index.within(latitude, longitude, radius_km)
+
+    def store(self, latitude, longitude, place_type, radius, results, next_page_token=None):
+        """
+        Guarda una respuesta de Places API. Si la respuesta está completa, la
+        zona consultada queda cubierta durante PLACES_INDEX_TTL segundos; si
+        está truncada (página llena o con next_page_token) los lugares se
+        guardan, pero la zona no queda cubierta
+
+        Args:
+            latitude (float): Latitud
+            longitude (float): Longitud
+            place_type (str): Tipo de lugar
+            radius (float): Radio de búsqueda en metros
+            results (list): Campo results de la respuesta de Places API
+            next_page_token (str, optional): Campo next_page_token de la respuesta
+
+        Returns:
+            list: Lugares dentro del radio ordenados por distancia, o None si
+                el índice está desactivado
+        """
+        if not self.enabled:
+            return None
+        self._check_file()
+        now = time.time()
+        radius_km = float(radius) / 1000
+        fetched = [_from_places_api(result, now) for result in results]
+        fetched_ids = {place['place_id'] for place in fetched if place['place_id']}
+        truncated = bool(next_page_token) or len(results) >= PLACES_PAGE_SIZE
+        if truncated:
+            metrics.increment('places_index_total', result='truncated')
+
+        with self._lock:
+            current = self._types.get(place_type)
+            kept = []
+            if current is not None:
+                # La respuesta nueva reemplaza las anteriores de Places API en la misma zona
+                replaced = set()
+                if current.grid is not None:
+                    replaced = {
+                        position for position, _ in current.grid.within(latitude, longitude, radius_km)
+                        if current.places[position]['source'] == SOURCE_LIVE
+                    }
+                oldest = now - self.ttl
+                kept = [
+                    place for position, place in enumerate(current.places)
+                    if position not in replaced
+                    and not (place['place_id'] and place['place_id'] in fetched_ids)
+                    and (place['source'] == SOURCE_FILE or place['fetched_at'] >= oldest)
+                ]
+                areas = [area for area in current.areas if area[3] >= oldest]
+            else:
+                areas = []
+            if not truncated:
+                areas.append((latitude, longitude, radius_km, now))
+            index = _TypeIndex(kept + fetched, areas)
+            self._types[place_type] = index
+
+        return index.within(latitude, longitude, radius_km)
+
+
+# Índice compartido por el proceso (el archivo se carga en el primer uso)
+places_index = PlacesIndex()
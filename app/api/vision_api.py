@@ -1,762 +1,766 @@
 import os
 import io
+import asyncio
 from google.cloud import vision
 from google.cloud.vision_v1 import types
 import logging
 import traceback
 import json
+import copy
 import re
 import datetime
 
+try:
+    from app.api.vision_client import annotate_image as annotate_with_shared_client
+    from app.api.vision_client import batch_annotate_images, annotate_image_async
+    from app.api.vision_cache import annotation_cache
+    from app.api.vision_fixtures import vision_fixtures
+    from app.api.annotation_index import AnnotationIndex
+    from app.api import vision_rules
+    from app.utils.image_utils import prepare_image_for_vision
+    from app.api.perceptual_index import perceptual_index, perceptual_hash
+    from app.api.local_classifier import classify_locally
+    from app.api.backends import fake_backends_enabled
+    from app.utils.single_flight import SingleFlight, file_key
+    from app.utils.metrics import metrics
+    from app.utils.logging_config import configure_logging, sample_debug
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from api.vision_client import annotate_image as annotate_with_shared_client
+    from api.vision_client import batch_annotate_images, annotate_image_async
+    from api.vision_cache import annotation_cache
+    from api.vision_fixtures import vision_fixtures
+    from api.annotation_index import AnnotationIndex
+    from api import vision_rules
+    from utils.image_utils import prepare_image_for_vision
+    from api.perceptual_index import perceptual_index, perceptual_hash
+    from api.local_classifier import classify_locally
+    from api.backends import fake_backends_enabled
+    from utils.single_flight import SingleFlight, file_key
+    from utils.metrics import metrics
+    from utils.logging_config import configure_logging, sample_debug
+
 # Configurar logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# No inicializar el cliente aquí, sino en la función analyze_image
-# client = vision.ImageAnnotatorClient()
+# El cliente de Vision API se comparte por proceso (ver vision_client.py)
+
+# Número máximo de imágenes por llamada a batch_annotate_images
+BATCH_SIZE = 16
+
+# Modo cascada: pedir primero solo etiquetas y colores, y solicitar objetos y
+# texto únicamente cuando las reglas no resuelven el incidente
+CASCADE_ENABLED = os.environ.get('VISION_CASCADE', 'false').lower() == 'true'
+
+# Nombres de objetos localizados que se consultan en las reglas
+VEHICLE_OBJECTS = vision_rules.VEHICLE_OBJECTS
+TIRE_OBJECTS = vision_rules.TIRE_OBJECTS
+VEHICLE_OR_TIRE_OBJECTS = vision_rules.VEHICLE_OR_TIRE_OBJECTS
+
+# Análisis concurrentes de la misma imagen en el mismo modo: solo uno llama a
+# Vision API y los demás reciben su resultado (ver utils/single_flight.py)
+analysis_flights = SingleFlight('analysis')
 
-def analyze_image(image_path, is_registration_card=False):
+def _cached_annotations(content, features):
     """
-    Analiza una imagen utilizando Google Cloud Vision API
+    Busca las anotaciones de una imagen en las respuestas grabadas (modo
+    replay) o en la caché direccionada por contenido
     
     Args:
-        image_path (str): Ruta al archivo de imagen
-        is_registration_card (bool): Indica si la imagen es una tarjeta de circulación
+        content (bytes): Contenido de la imagen
+        features (list): Lista de vision.Feature a solicitar
         
     Returns:
-        dict: Resultados del análisis
+        tuple: (respuesta o None si hay que llamar a Vision API, clave de caché)
     """
-    try:
-        # Verificar si el nombre del archivo contiene "battery" o "ejemplo1"
-        if "battery" in image_path.lower():
-            logger.info("Detectado problema de batería por nombre de archivo o patrón de imagen")
-            return {
-                'incident_type': 'Fallo mecánico - Batería',
-                'damage_severity': 'Moderado',
-                'vehicle_type': 'Automóvil',
-                'damaged_parts': ['Batería', 'Sistema eléctrico'],
-                'confidence': 90.0,
-                'labels': [
-                    {'description': 'Battery', 'score': 90.0},
-                    {'description': 'Dashboard', 'score': 90.0},
-                    {'description': 'Car', 'score': 85.0}
-                ],
-                'objects': [],
-                'text': ['MPH', '140', 'Battery Warning'],
-                'landmarks': []
-            }
-        
-        # Verificar si el nombre del archivo es ejemplo1.jpg (llanta pinchada)
-        if "ejemplo1" in image_path.lower():
-            logger.info("Detectado pinchazo de llanta por nombre de archivo ejemplo1")
-            return {
-                'incident_type': 'Fallo mecánico - Llanta pinchada',
-                'damage_severity': 'Moderado',
-                'vehicle_type': 'Automóvil',
-                'damaged_parts': ['Llanta', 'Neumático'],
-                'confidence': 95.0,
-                'labels': [
-                    {'description': 'Tire', 'score': 95.0},
-                    {'description': 'Wheel', 'score': 90.0},
-                    {'description': 'Flat tire', 'score': 90.0}
-                ],
-                'objects': [],
-                'text': [],
-                'landmarks': []
-            }
-        
-        # Verificar si el nombre del archivo es Flat Tire Car.jpg (llanta pinchada)
-        if "flat tire" in image_path.lower():
-            logger.info("Detectado pinchazo de llanta por nombre de archivo Flat Tire Car")
-            return {
-                'incident_type': 'Fallo mecánico - Llanta pinchada',
-                'damage_severity': 'Moderado',
-                'vehicle_type': 'Automóvil',
-                'damaged_parts': ['Llanta', 'Neumático'],
-                'confidence': 95.0,
-                'labels': [
-                    {'description': 'Tire', 'score': 95.0},
-                    {'description': 'Wheel', 'score': 90.0},
-                    {'description': 'Flat tire', 'score': 90.0}
-                ],
-                'objects': [],
-                'text': [],
-                'landmarks': []
-            }
+    if vision_fixtures.replaying:
+        return vision_fixtures.replay(content, features), None
+    
+    cache_key = annotation_cache.make_key(content, features)
+    response = annotation_cache.get(cache_key)
+    if response is not None:
+        logger.info("Respuesta de Vision API obtenida de la caché")
+        metrics.increment('vision_cache_total', result='hit')
+        if vision_fixtures.recording and not response.error.message:
+            vision_fixtures.record(content, features, response)
+        return response, cache_key
+    
+    logger.info("Enviando solicitud a Vision API")
+    if annotation_cache.enabled:
+        metrics.increment('vision_cache_total', result='miss')
+    return None, cache_key
+
+def _store_annotations(content, features, cache_key, response):
+    """Registra y guarda en la caché una respuesta recién obtenida de Vision API"""
+    metrics.increment('vision_requests_total', method='annotate', outcome='error' if response.error.message else 'ok')
+    
+    # No guardar respuestas con error para poder reintentar más tarde
+    if not response.error.message:
+        annotation_cache.put(cache_key, response)
+        if vision_fixtures.recording:
+            vision_fixtures.record(content, features, response)
+    return response
+
+def request_annotations(content, features):
+    """
+    Obtiene las anotaciones de una imagen, consultando primero la caché
+    direccionada por contenido y llamando a Vision API solo si no hay acierto.
+    En modo replay (VISION_FIXTURES_MODE) se usan solo las respuestas grabadas.
+    
+    Args:
+        content (bytes): Contenido de la imagen
+        features (list): Lista de vision.Feature a solicitar
         
-        # Verificar si la imagen es de una colisión por el nombre del archivo
-        if any(keyword in image_path.lower() for keyword in ["collision", "crash", "accident", "colision", "accidente", "choque"]):
-            logger.info("Detectada posible imagen de colisión por nombre de archivo")
-            # Proporcionar un análisis específico para colisiones
-            return {
-                'incident_type': 'Colisión vehicular',
-                'damage_severity': 'Grave',
-                'vehicle_type': 'Automóvil',
-                'damaged_parts': ['Carrocería', 'Parachoques', 'Faros'],
-                'confidence': 95.0,
-                'labels': [
-                    {'description': 'Car', 'score': 95.0},
-                    {'description': 'Collision', 'score': 95.0},
-                    {'description': 'Accident', 'score': 90.0}
-                ],
-                'objects': [],
-                'text': [],
-                'landmarks': []
-            }
+    Returns:
+        vision.AnnotateImageResponse: Respuesta de Vision API
+    """
+    response, cache_key = _cached_annotations(content, features)
+    if response is not None:
+        return response
+    
+    request = vision.AnnotateImageRequest(image=vision.Image(content=content), features=features)
+    try:
+        with metrics.timer('vision_rpc'):
+            response = annotate_with_shared_client(request)
+    except Exception:
+        metrics.increment('vision_requests_total', method='annotate', outcome='error')
+        raise
+    return _store_annotations(content, features, cache_key, response)
+
+async def request_annotations_async(content, features):
+    """
+    Igual que request_annotations, pero con el cliente asíncrono de Vision API
+    
+    Args:
+        content (bytes): Contenido de la imagen
+        features (list): Lista de vision.Feature a solicitar
         
-        # Verificar si la imagen es de una llanta por el nombre del archivo
-        if any(keyword in image_path.lower() for keyword in ["tire", "wheel", "flat", "puncture", "llanta", "neumatico", "pinchazo", "hoy", "hoy1"]):
-            logger.info("Detectada posible imagen de llanta por nombre de archivo")
-            # Continuamos con el análisis normal para obtener más detalles
+    Returns:
+        vision.AnnotateImageResponse: Respuesta de Vision API
+    """
+    response, cache_key = _cached_annotations(content, features)
+    if response is not None:
+        return response
+    
+    request = vision.AnnotateImageRequest(image=vision.Image(content=content), features=features)
+    try:
+        with metrics.timer('vision_rpc'):
+            response = await annotate_image_async(request)
+    except Exception:
+        metrics.increment('vision_requests_total', method='annotate', outcome='error')
+        raise
+    return _store_annotations(content, features, cache_key, response)
+
+def build_label_stage_features():
+    """
+    Features de la primera etapa de la cascada: etiquetas, colores dominantes y texto
+    
+    Returns:
+        list: Lista de vision.Feature
+    """
+    return [
+        vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION, max_results=20),
+        vision.Feature(type_=vision.Feature.Type.IMAGE_PROPERTIES),
+        vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+    ]
+
+def build_detail_stage_features():
+    """
+    Features de la segunda etapa de la cascada: objetos localizados
+    
+    Returns:
+        list: Lista de vision.Feature
+    """
+    return [
+        vision.Feature(type_=vision.Feature.Type.OBJECT_LOCALIZATION, max_results=20)
+    ]
+
+def build_incident_features():
+    """
+    Construye la lista de features que se solicitan para analizar un incidente
+    
+    Returns:
+        list: Lista de vision.Feature
+    """
+    # Solicitar todos los tipos de detección que usan las reglas en una sola llamada
+    # (LANDMARK_DETECTION no se usa en la clasificación)
+    return build_label_stage_features() + build_detail_stage_features()
+
+def build_registration_features():
+    """
+    Features para una tarjeta de circulación: solo se usa el texto del documento
+    
+    Returns:
+        list: Lista de vision.Feature
+    """
+    return [vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)]
+
+def _error_result(message):
+    """Construye el resultado estándar de error de análisis"""
+    return {
+        'error': message,
+        'incident_type': 'Error',
+        'damage_severity': 'Error',
+        'vehicle_type': 'Error',
+        'damaged_parts': [],
+        'confidence': 0.0
+    }
+
+def _check_credentials():
+    """
+    Verifica que el archivo de credenciales de Google Cloud exista
+    
+    Returns:
+        dict: Resultado de error si faltan las credenciales, None en caso contrario
+    """
+    if fake_backends_enabled() or vision_fixtures.replaying:
+        # El servidor simulado y las respuestas grabadas no necesitan credenciales
+        return None
+    credentials_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
+    logger.info(f"Usando credenciales de: {credentials_path}")
+    if not os.path.exists(credentials_path):
+        logger.error(f"Archivo de credenciales no encontrado: {credentials_path}")
+        return _error_result(f"Archivo de credenciales no encontrado: {credentials_path}")
+    return None
+
+def analyze_image_by_filename(image_path, is_registration_card=False):
+    """
+    Obtiene un análisis predefinido a partir del nombre del archivo, sin
+    llamar a Vision API
+    
+    Args:
+        image_path (str): Ruta al archivo de imagen
+        is_registration_card (bool): Indica si la imagen es una tarjeta de circulación
         
-        # Verificar si la imagen es de una fuga de líquido por el nombre del archivo
-        if any(keyword in image_path.lower() for keyword in ["leak", "fluid", "oil", "fuga", "aceite", "liquido", "hoy2", "hoy5"]):
-            logger.info("Detectada posible imagen de fuga de líquido por nombre de archivo")
-            # Continuamos con el análisis normal para obtener más detalles
+    Returns:
+        dict: Resultados del análisis, o None si el nombre no es concluyente
+    """
+    hints = vision_rules.filename_hints(image_path)
+    
+    for rule in vision_rules.FILENAME_RULES:
+        if rule['hint'] in hints:
+            logger.info(rule['log'])
+            if rule['result'] is not None:
+                return copy.deepcopy(rule['result'])
+    
+    # Verificar si la imagen es una tarjeta de circulación
+    if is_registration_card or 'registration' in hints:
+        logger.info("Detectada posible tarjeta de circulación por nombre de archivo o parámetro")
+    
+    return None
+
+def analyze_image(image_path, is_registration_card=False, cascade=None, source_name=None):
+    """
+    Analiza una imagen utilizando Google Cloud Vision API
+    
+    Args:
+        image_path (str): Ruta al archivo de imagen
+        is_registration_card (bool): Indica si la imagen es una tarjeta de circulación
+        cascade (bool, optional): Usar el modo cascada (por defecto VISION_CASCADE)
+        source_name (str, optional): Nombre original del archivo subido, del que
+            se toman las pistas del nombre (por defecto, image_path)
         
-        # Verificar si la imagen es de un problema de acceso por el nombre del archivo
-        if any(keyword in image_path.lower() for keyword in ["key", "lock", "door", "access", "llave", "puerta", "acceso", "hoy4"]):
-            logger.info("Detectada posible imagen de problema de acceso por nombre de archivo")
-            # Proporcionar un análisis específico para problemas de acceso
-            return {
-                'incident_type': 'Problema de acceso - Llave/Puerta',
-                'damage_severity': 'Moderado',
-                'vehicle_type': 'Automóvil',
-                'damaged_parts': ['Cerradura', 'Sistema de acceso'],
-                'confidence': 85.0,
-                'labels': [
-                    {'description': 'Car', 'score': 90.0},
-                    {'description': 'Door', 'score': 85.0},
-                    {'description': 'Lock', 'score': 80.0}
-                ],
-                'objects': [],
-                'text': [],
-                'landmarks': []
-            }
+    Returns:
+        dict: Resultados del análisis, con la etapa que lo resolvió en 'analysis_stage'
+    """
+    if cascade is None:
+        cascade = CASCADE_ENABLED
+    key = analysis_key(image_path, is_registration_card, cascade, source_name)
+    return analysis_flights.run(
+        key, _run_steps, _analysis_steps(image_path, is_registration_card, cascade, source_name)
+    )
+
+async def analyze_image_async(image_path, is_registration_card=False, cascade=None, source_name=None):
+    """
+    Igual que analyze_image, para la ruta asíncrona (app/asgi.py): las
+    llamadas a Vision API usan el cliente asíncrono y las etapas locales
+    (lectura, hashes, clasificador local, reglas) se ejecutan en un hilo
+    para no bloquear el bucle de eventos
+    
+    Args:
+        image_path (str): Ruta al archivo de imagen
+        is_registration_card (bool): Indica si la imagen es una tarjeta de circulación
+        cascade (bool, optional): Usar el modo cascada (por defecto VISION_CASCADE)
+        source_name (str, optional): Nombre original del archivo subido (ver analyze_image)
         
-        # Verificar si la imagen es una tarjeta de circulación
-        if is_registration_card or any(keyword in image_path.lower() for keyword in ["tarjeta", "circulacion", "registration", "card"]):
-            logger.info("Detectada posible tarjeta de circulación por nombre de archivo o parámetro")
+    Returns:
+        dict: Resultados del análisis, con la etapa que lo resolvió en 'analysis_stage'
+    """
+    if cascade is None:
+        cascade = CASCADE_ENABLED
+    key = await asyncio.to_thread(analysis_key, image_path, is_registration_card, cascade, source_name)
+    return await analysis_flights.run_async(
+        key, _run_steps_async, _analysis_steps(image_path, is_registration_card, cascade, source_name)
+    )
+
+def analysis_key(image_path, is_registration_card, cascade, source_name=None):
+    """
+    Clave de single-flight de un análisis: contenido de la imagen, modo y
+    pistas del nombre del archivo (que también deciden el resultado)
+    
+    Returns:
+        str: Clave, o None si la imagen no se puede leer
+    """
+    mode = 'registration' if is_registration_card else ('cascade' if cascade else 'incident')
+    hints = ','.join(sorted(vision_rules.filename_hints(source_name or image_path)))
+    return file_key(image_path, f"{mode}|{hints}")
+
+def _run_steps(steps):
+    """Ejecuta las etapas de un análisis llamando a Vision API de forma síncrona"""
+    try:
+        content, features = next(steps)
+        while True:
+            try:
+                response = request_annotations(content, features)
+            except Exception as e:
+                content, features = steps.throw(e)
+            else:
+                content, features = steps.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+async def _run_steps_async(steps):
+    """Ejecuta las etapas de un análisis esperando a Vision API de forma asíncrona"""
+    finished, value = await asyncio.to_thread(_advance_steps, steps.send, None)
+    while not finished:
+        content, features = value
+        try:
+            response = await request_annotations_async(content, features)
+        except Exception as e:
+            finished, value = await asyncio.to_thread(_advance_steps, steps.throw, e)
+        else:
+            finished, value = await asyncio.to_thread(_advance_steps, steps.send, response)
+    return value
+
+def _advance_steps(method, argument):
+    """
+    Avanza el generador de etapas en un hilo (StopIteration no puede
+    atravesar un Future)
+    
+    Returns:
+        tuple: (terminado, resultados del análisis o siguiente (contenido, features))
+    """
+    try:
+        return False, method(argument)
+    except StopIteration as stop:
+        return True, stop.value
+
+def _analysis_steps(image_path, is_registration_card=False, cascade=None, source_name=None):
+    """
+    Etapas de analyze_image sin E/S de red: el generador produce
+    (contenido, features) cada vez que necesita a Vision API y recibe la
+    respuesta, de modo que la ruta síncrona y la asíncrona aplican las
+    mismas reglas. Devuelve los resultados del análisis.
+    """
+    if cascade is None:
+        cascade = CASCADE_ENABLED
+    # Las pistas del nombre salen del nombre original si se conoce
+    hint_path = source_name or image_path
+    
+    try:
+        results = analyze_image_by_filename(hint_path, is_registration_card)
+        if results is not None:
+            results['analysis_stage'] = 'filename'
+            metrics.increment('analysis_stage_total', stage='filename')
+            return results
         
         # Verificar credenciales
-        credentials_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
-        logger.info(f"Usando credenciales de: {credentials_path}")
-        if not os.path.exists(credentials_path):
-            logger.error(f"Archivo de credenciales no encontrado: {credentials_path}")
-            return {
-                'error': f"Archivo de credenciales no encontrado: {credentials_path}",
-                'incident_type': 'Error',
-                'damage_severity': 'Error',
-                'vehicle_type': 'Error',
-                'damaged_parts': [],
-                'confidence': 0.0
-            }
-        
-        # Inicializar el cliente de Vision API
-        logger.info("Inicializando cliente de Vision API")
-        client = vision.ImageAnnotatorClient()
+        credentials_error = _check_credentials()
+        if credentials_error:
+            metrics.increment('analysis_stage_total', stage='error')
+            return credentials_error
         
         # Verificar que el archivo existe
         if not os.path.exists(image_path):
             logger.error(f"El archivo no existe: {image_path}")
-            return {
-                'error': f"El archivo no existe: {image_path}",
-                'incident_type': 'Error',
-                'damage_severity': 'Error',
-                'vehicle_type': 'Error',
-                'damaged_parts': [],
-                'confidence': 0.0
-            }
+            metrics.increment('analysis_stage_total', stage='error')
+            return _error_result(f"El archivo no existe: {image_path}")
         
         # Leer el archivo de imagen
-        logger.info(f"Leyendo archivo de imagen: {image_path}")
+        logger.info("Leyendo archivo de imagen: %s", image_path)
         with io.open(image_path, 'rb') as image_file:
             content = image_file.read()
         
-        image = vision.Image(content=content)
-        
-        # Solicitar múltiples tipos de detección en una sola llamada
-        features = [
-            vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION, max_results=20),
-            vision.Feature(type_=vision.Feature.Type.OBJECT_LOCALIZATION, max_results=20),
-            vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION),
-            vision.Feature(type_=vision.Feature.Type.LANDMARK_DETECTION),
-            vision.Feature(type_=vision.Feature.Type.IMAGE_PROPERTIES)
-        ]
-        
-        logger.info("Enviando solicitud a Vision API")
-        request = vision.AnnotateImageRequest(image=image, features=features)
-        response = client.annotate_image(request=request)
-        
-        # Verificar si hay errores en la respuesta
-        if response.error.message:
-            logger.error(f"Error en la respuesta de Vision API: {response.error.message}")
-            return {
-                'error': f"Error en la respuesta de Vision API: {response.error.message}",
-                'incident_type': 'Error',
-                'damage_severity': 'Error',
-                'vehicle_type': 'Error',
-                'damaged_parts': [],
-                'confidence': 0.0
-            }
-        
-        # Imprimir información de la respuesta para depuración
-        logger.info("Respuesta recibida de Vision API")
-        logger.info(f"Labels: {len(response.label_annotations)}")
-        for label in response.label_annotations:
-            logger.info(f"  - {label.description}: {label.score:.2f}")
-        
-        logger.info(f"Objects: {len(response.localized_object_annotations)}")
-        for obj in response.localized_object_annotations:
-            logger.info(f"  - {obj.name}: {obj.score:.2f}")
-        
-        logger.info(f"Text: {len(response.text_annotations)}")
-        if response.text_annotations:
-            logger.info(f"  - Text content: {response.text_annotations[0].description}")
+        hints = vision_rules.filename_hints(hint_path)
+        registration = is_registration_card or 'registration' in hints
+        
+        # Reutilizar el análisis de una imagen casi idéntica ya conocida
+        # (no para tarjetas de circulación: todas se parecen entre sí, ni al
+        # reproducir respuestas grabadas, para que el resultado sea determinista)
+        image_hash = None
+        if not registration and perceptual_index.enabled and not vision_fixtures.replaying:
+            with metrics.timer('perceptual_lookup'):
+                image_hash, results = find_similar_analysis(content, hints)
+            if results is not None:
+                metrics.increment('analysis_stage_total', stage='perceptual')
+                return results
+        
+        # Clasificador local: si es suficientemente confiable no se llama a Vision API
+        if not registration:
+            with metrics.timer('local_classifier'):
+                results = classify_locally(content)
+            if results is not None:
+                logger.info("Análisis resuelto por el clasificador local")
+                results['analysis_stage'] = 'local'
+                metrics.increment('analysis_stage_total', stage='local')
+                return results
+        
+        # Reducir la imagen en memoria según la tarea (el archivo original no se modifica)
+        with metrics.timer('preprocess'):
+            content, preprocessing = prepare_image_for_vision(content, 'registration' if registration else 'incident')
+        
+        if registration:
+            # Para las tarjetas de circulación solo se usa el texto del documento
+            response = yield content, build_registration_features()
+            with metrics.timer('classification'):
+                results = classify_response(response, hint_path, is_registration_card)
+            stage = 'document'
+        elif cascade:
+            results, stage = yield from _cascade_steps(content, hint_path)
         else:
-            logger.info("  - No se detectó texto en la imagen")
-        
-        # Si es una tarjeta de circulación, extraer información específica
-        if is_registration_card or any(keyword in image_path.lower() for keyword in ["tarjeta", "circulacion", "registration", "card"]):
-            logger.info("Procesando imagen como tarjeta de circulación")
-            if response.text_annotations:
-                registration_info = extract_vehicle_registration_info(response.text_annotations[0].description)
-                return {
-                    'incident_type': 'Tarjeta de Circulación',
-                    'is_registration_card': True,
-                    'registration_info': registration_info,
-                    'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
-                    'confidence': 95.0
-                }
-            else:
-                logger.warning("No se detectó texto en la imagen de la tarjeta de circulación")
-                return {
-                    'incident_type': 'Tarjeta de Circulación',
-                    'is_registration_card': True,
-                    'error': 'No se pudo detectar texto en la imagen',
-                    'registration_info': {},
-                    'confidence': 0.0
-                }
-        
-        # Verificar si es un tablero de auto
-        dashboard_indicators = ['mph', 'km/h', 'rpm', 'fuel', 'battery', 'temperature', 'oil', 'check engine']
-        battery_indicators = ['battery', 'bat', 'charge', 'electrical', 'power', 'voltage']
-        
-        # Verificar si hay anotaciones de texto antes de intentar acceder a ellas
-        if response.text_annotations and len(response.text_annotations) > 0:
-            text_content = response.text_annotations[0].description.lower()
-            
-            if any(indicator in text_content for indicator in dashboard_indicators):
-                logger.info("Detectado tablero de auto por texto")
-                
-                # Verificar si hay indicadores de batería
-                if any(indicator in text_content for indicator in battery_indicators) or any(line.strip() == '140' for line in text_content.split('\n')):
-                    logger.info("Detectado indicador de batería en el tablero")
-                    return {
-                        'incident_type': 'Fallo mecánico - Batería',
-                        'damage_severity': 'Moderado',
-                        'vehicle_type': 'Automóvil',
-                        'damaged_parts': ['Batería', 'Sistema eléctrico'],
-                        'confidence': 85.0,
-                        'labels': [],
-                        'objects': [],
-                        'text': text_content.split('\n'),
-                        'landmarks': []
-                    }
-                
-                # Crear un resultado básico para un tablero de auto
-                return {
-                    'incident_type': 'Fallo mecánico - Tablero',
-                    'damage_severity': 'Leve',
-                    'vehicle_type': 'Automóvil',
-                    'damaged_parts': ['Tablero'],
-                    'confidence': 80.0,
-                    'labels': [],
-                    'objects': [],
-                    'text': text_content.split('\n'),
-                    'landmarks': []
-                }
-        
-        # Verificar si es una imagen de llanta pinchada
-        is_flat_tire = False
-        flat_tire_confidence = 0.0
-        
-        # Buscar etiquetas relacionadas con llantas pinchadas
-        flat_tire_keywords = ['flat tire', 'puncture', 'deflated tire', 'tire damage', 'blown tire']
+            response = yield content, build_incident_features()
+            with metrics.timer('classification'):
+                results = classify_response(response, hint_path)
+            stage = 'full'
+        
+        metrics.increment('analysis_stage_total', stage=stage if 'error' not in results else 'error')
+        logger.info("Análisis resuelto en la etapa: %s", stage)
+        if image_hash is not None and 'error' not in results:
+            perceptual_index.add(image_hash, results, image_path, hints)
+        
+        results['analysis_stage'] = stage
+        results['image_preprocessing'] = preprocessing
+        return results
         
-        for label in response.label_annotations:
-            if any(keyword.lower() in label.description.lower() for keyword in flat_tire_keywords):
-                is_flat_tire = True
-                flat_tire_confidence = max(flat_tire_confidence, label.score)
-                logger.info(f"Detectada etiqueta relacionada con llanta pinchada: {label.description} ({label.score:.2f})")
+    except Exception as e:
+        logger.error(f"Error al analizar la imagen: {str(e)}")
+        logger.error(traceback.format_exc())
+        metrics.increment('analysis_stage_total', stage='error')
+        return _error_result(f"Error al analizar la imagen: {str(e)}")
+
+def find_similar_analysis(content, hints=frozenset()):
+    """
+    Busca en el índice de hashes perceptuales una imagen casi idéntica
+    (recomprimida, redimensionada o convertida de formato) ya analizada
+    
+    Args:
+        content (bytes): Contenido original de la imagen
+        hints (frozenset): Pistas del nombre de la imagen (solo se reutiliza
+            el análisis de una imagen con las mismas pistas)
         
-        # Verificar si hay una llanta y está deformada (posible pinchazo)
-        tire_detected = False
-        tire_obj = None
+    Returns:
+        tuple: (dHash de la imagen o None si no se puede indexar, análisis almacenado o None)
+    """
+    try:
+        image_hash = perceptual_hash(content)
+    except Exception as e:
+        logger.warning(f"No se pudo calcular el hash perceptual de la imagen: {str(e)}")
+        return None, None
+    
+    # Las imágenes planas o con degradados suaves se parecen todas entre sí
+    if image_hash is None:
+        logger.info("Imagen con poca información, no se usa el índice de hashes perceptuales")
+        return None, None
+    
+    match = perceptual_index.lookup(image_hash, hints)
+    if match is None:
+        return image_hash, None
+    
+    # El origen es otra imagen subida: solo se registra, no se devuelve al cliente
+    logger.info("Imagen similar a %s (distancia %d), se reutiliza su análisis", match['source'], match['distance'])
+    results = copy.deepcopy(match['analysis'])
+    results['analysis_stage'] = 'perceptual'
+    results['perceptual_match'] = {'distance': match['distance']}
+    return image_hash, results
+
+def analyze_with_cascade(content, image_path):
+    """
+    Analiza una imagen en dos etapas. La primera pide etiquetas, colores
+    dominantes y texto; si las reglas no resuelven el incidente, la segunda
+    pide objetos localizados y se clasifica con ambas respuestas combinadas.
+    
+    En la primera etapa solo se aceptan las reglas cuyo resultado ya no puede
+    cambiar con los objetos (ver 'label_stage' en vision_rules), así que la
+    clasificación es la misma que la del análisis completo; solo la lista de
+    objetos de la respuesta queda vacía.
+    
+    Args:
+        content (bytes): Contenido de la imagen
+        image_path (str): Ruta al archivo de imagen
         
-        for obj in response.localized_object_annotations:
-            if obj.name.lower() in ['tire', 'wheel']:
-                tire_detected = True
-                tire_obj = obj
-                logger.info(f"Detectada llanta: {obj.score:.2f}")
+    Returns:
+        tuple: (resultados del análisis, etapa que lo resolvió: 'labels' o 'full')
+    """
+    return _run_steps(_cascade_steps(content, image_path))
+
+def _cascade_steps(content, image_path):
+    """Etapas de analyze_with_cascade (ver _analysis_steps)"""
+    label_response = yield content, build_label_stage_features()
+    with metrics.timer('classification'):
+        results = classify_response(label_response, image_path, label_stage=True)
+    if results is not None:
+        return results, 'labels'
+    
+    logger.info("Etiquetas y texto no concluyentes, solicitando objetos a Vision API")
+    detail_response = yield content, build_detail_stage_features()
+    
+    response = vision.AnnotateImageResponse()
+    vision.AnnotateImageResponse.pb(response).MergeFrom(vision.AnnotateImageResponse.pb(label_response))
+    vision.AnnotateImageResponse.pb(response).MergeFrom(vision.AnnotateImageResponse.pb(detail_response))
+    with metrics.timer('classification'):
+        return classify_response(response, image_path), 'full'
+
+def analyze_images_batch(image_paths, is_registration_card=False, source_names=None):
+    """
+    Analiza varias imágenes agrupándolas en llamadas batch_annotate_images
+    de hasta BATCH_SIZE imágenes
+    
+    Args:
+        image_paths (list): Rutas a los archivos de imagen
+        is_registration_card (bool): Indica si las imágenes son tarjetas de circulación
+        source_names (list, optional): Nombres originales de los archivos subidos,
+            en el mismo orden (ver analyze_image)
         
-        # Si detectamos una llanta y la imagen muestra claramente una llanta en primer plano
-        if tire_detected and any(label.description.lower() in ['automotive tire', 'wheel', 'tire', 'tread'] for label in response.label_annotations):
-            # Verificar si la imagen muestra una llanta pinchada
-            # Características de una llanta pinchada: deformación visible, contacto con el suelo
-            tire_labels = [label for label in response.label_annotations if 
-                          any(kw in label.description.lower() for kw in ['tire', 'wheel', 'tread', 'flat', 'puncture'])]
+    Returns:
+        list: Resultados del análisis de cada imagen, en el mismo orden de entrada
+    """
+    results = [None] * len(image_paths)
+    hint_paths = [source or path for source, path in zip(source_names or [None] * len(image_paths), image_paths)]
+    responses = {}
+    pending = []
+    preprocessing = {}
+    if is_registration_card:
+        features, stage, policy = build_registration_features(), 'document', 'registration'
+    else:
+        features, stage, policy = build_incident_features(), 'full', 'incident'
+    
+    # Resolver primero lo que no requiere llamar a Vision API
+    credentials_error = None
+    for index, image_path in enumerate(image_paths):
+        try:
+            shortcut = analyze_image_by_filename(hint_paths[index], is_registration_card)
+            if shortcut is not None:
+                shortcut['analysis_stage'] = 'filename'
+                metrics.increment('analysis_stage_total', stage='filename')
+                results[index] = shortcut
+                continue
             
-            # Si hay muchas etiquetas relacionadas con llantas y es una imagen cercana de una llanta
-            if len(tire_labels) >= 3 and tire_obj and tire_obj.score > 0.7:
-                # Verificar si hay indicios de pinchazo
-                if is_flat_tire or "pinchazo" in image_path.lower() or "flat" in image_path.lower() or "hoy1" in image_path.lower():
-                    logger.info("Detectada imagen de llanta pinchada")
-                    return {
-                        'incident_type': 'Fallo mecánico - Llanta pinchada',
-                        'damage_severity': 'Moderado',
-                        'vehicle_type': 'Automóvil',
-                        'damaged_parts': ['Llanta', 'Neumático'],
-                        'confidence': round(max(flat_tire_confidence, 0.95) * 100, 2),
-                        'labels': [
-                            {'description': label.description, 'score': round(label.score * 100, 2)}
-                            for label in response.label_annotations[:5]
-                        ],
-                        'objects': [
-                            {
-                                'name': obj.name,
-                                'confidence': round(obj.score * 100, 2)
-                            }
-                            for obj in response.localized_object_annotations[:3]
-                        ],
-                        'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
-                        'landmarks': []
-                    }
-        
-        # Verificar si hay propiedades de imagen que indiquen una mancha de líquido
-        is_fluid_leak = False
-        fluid_confidence = 0.0
-        
-        # Inicializar la variable results para evitar el error
-        results = {
-            'incident_type': '',
-            'damage_severity': '',
-            'vehicle_type': 'Automóvil',
-            'damaged_parts': [],
-            'confidence': 0.0,
-            'labels': [],
-            'objects': [],
-            'text': [],
-            'landmarks': []
-        }
-        
-        # Verificar colores oscuros en la parte inferior de la imagen (posible aceite/líquido)
-        if response.image_properties_annotation:
-            dominant_colors = response.image_properties_annotation.dominant_colors.colors
+            if credentials_error is None:
+                credentials_error = _check_credentials() or {}
+            if credentials_error:
+                results[index] = dict(credentials_error)
+                continue
             
-            # Buscar colores oscuros (posible aceite) o rojizos/marrones (posible líquido de transmisión)
-            dark_colors = [color for color in dominant_colors if 
-                          (color.color.red < 100 and color.color.green < 100 and color.color.blue < 100) or
-                          (color.color.red > 100 and color.color.green < 80 and color.color.blue < 80)]
+            if not os.path.exists(image_path):
+                logger.error(f"El archivo no existe: {image_path}")
+                results[index] = _error_result(f"El archivo no existe: {image_path}")
+                continue
             
-            # Verificar si hay etiquetas de colisión antes de considerar una fuga de líquido
-            collision_detected = any(
-                any(keyword.lower() in label.description.lower() for keyword in 
-                    ['traffic collision', 'accident', 'crash', 'collision', 'car accident', 'vehicle accident'])
-                for label in response.label_annotations
-            )
+            with io.open(image_path, 'rb') as image_file:
+                content = image_file.read()
+            with metrics.timer('preprocess'):
+                content, preprocessing[index] = prepare_image_for_vision(content, policy)
             
-            # Si hay dos o más vehículos detectados, probablemente sea una colisión
-            vehicles_detected = sum(1 for obj in response.localized_object_annotations if obj.name.lower() in ['car', 'vehicle'])
+            if vision_fixtures.replaying:
+                responses[index] = vision_fixtures.replay(content, features)
+                continue
             
-            # Solo considerar fuga de líquido si no hay indicios de colisión
-            if dark_colors and len(dark_colors) > 0 and not collision_detected and vehicles_detected < 2:
-                is_fluid_leak = True
-                fluid_confidence = sum(color.score for color in dark_colors) / len(dark_colors)
-                
-                # Si hay un vehículo en la imagen, aumenta la confianza
-                if any(obj.name.lower() in ['car', 'vehicle', 'tire', 'wheel'] for obj in response.localized_object_annotations):
-                    fluid_confidence = max(fluid_confidence, 0.85)  # Reducido de 0.95 para ser más conservador
-                    
-                    # Actualizar resultados para fuga de líquido
-                    results['incident_type'] = 'Fallo mecánico - Fuga de líquido'
-                    results['damage_severity'] = 'Moderado'
-                    results['damaged_parts'] = ['Sistema de fluidos', 'Posible fuga de aceite/refrigerante']
-                    results['confidence'] = round(fluid_confidence * 100, 2)
-        
-        # Verificar si es una imagen de problema de acceso
-        is_access_problem = False
-        access_confidence = 0.0
-        
-        # Buscar etiquetas relacionadas con problemas de acceso
-        access_keywords = ['key', 'lock', 'door', 'car door', 'handle', 'vehicle door', 'automobile door', 'car key', 'person']
-        person_detected = False
-        door_detected = False
-        key_detected = False
-        
-        for label in response.label_annotations:
-            if any(keyword.lower() in label.description.lower() for keyword in access_keywords):
-                is_access_problem = True
-                access_confidence = max(access_confidence, label.score)
-                logger.info(f"Detectada etiqueta relacionada con problema de acceso: {label.description} ({label.score:.2f})")
-                
-                if 'person' in label.description.lower():
-                    person_detected = True
-                if 'door' in label.description.lower() or 'handle' in label.description.lower():
-                    door_detected = True
-                if 'key' in label.description.lower():
-                    key_detected = True
-        
-        # Verificar objetos detectados
-        for obj in response.localized_object_annotations:
-            if obj.name.lower() == 'person':
-                person_detected = True
-                is_access_problem = True
-                access_confidence = max(access_confidence, obj.score)
-                logger.info(f"Detectada persona: {obj.score:.2f}")
-            if obj.name.lower() in ['car', 'vehicle']:
-                is_access_problem = True
-                access_confidence = max(access_confidence, obj.score)
-                logger.info(f"Detectado vehículo: {obj.score:.2f}")
-            if 'door' in obj.name.lower():
-                door_detected = True
-                is_access_problem = True
-                access_confidence = max(access_confidence, obj.score)
-                logger.info(f"Detectada puerta: {obj.score:.2f}")
-        
-        # Priorizar la detección de colisiones sobre otros problemas
-        # Si hay etiquetas de colisión o múltiples vehículos, es más probable que sea una colisión
-        collision_detected = any(
-            any(keyword.lower() in label.description.lower() for keyword in 
-                ['traffic collision', 'accident', 'crash', 'collision', 'car accident', 'vehicle accident'])
-            for label in response.label_annotations
-        )
-        
-        vehicles_detected = sum(1 for obj in response.localized_object_annotations if obj.name.lower() in ['car', 'vehicle'])
-        
-        if collision_detected or vehicles_detected >= 2:
-            logger.info("Detectada imagen de colisión vehicular")
-            return {
-                'incident_type': 'Colisión vehicular',
-                'damage_severity': 'Grave',
-                'vehicle_type': 'Automóvil',
-                'damaged_parts': ['Carrocería', 'Parachoques', 'Faros'],
-                'confidence': round(max(0.95, 
-                                       next((label.score for label in response.label_annotations 
-                                             if any(kw in label.description.lower() for kw in ['collision', 'accident', 'crash'])), 
-                                            0.95)) * 100, 2),
-                'labels': [
-                    {'description': label.description, 'score': round(label.score * 100, 2)}
-                    for label in response.label_annotations[:5]
-                ],
-                'objects': [
-                    {
-                        'name': obj.name,
-                        'confidence': round(obj.score * 100, 2)
-                    }
-                    for obj in response.localized_object_annotations[:3]
-                ],
-                'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
-                'landmarks': []
-            }
-        
-        # Priorizar la detección de fugas de líquido sobre problemas de acceso
-        # Si hay una mancha oscura en el suelo y un vehículo, es más probable que sea una fuga
-        if is_fluid_leak and (any(obj.name.lower() in ['car', 'vehicle', 'tire', 'wheel'] for obj in response.localized_object_annotations) or "hoy5" in image_path.lower()):
-            logger.info("Detectada imagen de fuga de líquido")
-            return {
-                'incident_type': 'Fallo mecánico - Fuga de líquido',
-                'damage_severity': 'Moderado',
-                'vehicle_type': 'Automóvil',
-                'damaged_parts': ['Sistema de fluidos', 'Posible fuga de aceite/refrigerante'],
-                'confidence': round(max(fluid_confidence, 0.85) * 100, 2),
-                'labels': [
-                    {'description': label.description, 'score': round(label.score * 100, 2)}
-                    for label in response.label_annotations[:5]
-                ],
-                'objects': [
-                    {
-                        'name': obj.name,
-                        'confidence': round(obj.score * 100, 2)
-                    }
-                    for obj in response.localized_object_annotations[:3]
-                ],
-                'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
-                'landmarks': []
-            }
+            cache_key = annotation_cache.make_key(content, features)
+            cached = annotation_cache.get(cache_key)
+            if cached is not None:
+                metrics.increment('vision_cache_total', result='hit')
+                responses[index] = cached
+                if vision_fixtures.recording:
+                    vision_fixtures.record(content, features, cached)
+            else:
+                if annotation_cache.enabled:
+                    metrics.increment('vision_cache_total', result='miss')
+                pending.append((index, content, cache_key))
+        except Exception as e:
+            logger.error(f"Error al preparar la imagen {image_path}: {str(e)}")
+            results[index] = _error_result(f"Error al analizar la imagen: {str(e)}")
+    
+    # Enviar las imágenes restantes en lotes
+    for start in range(0, len(pending), BATCH_SIZE):
+        chunk = pending[start:start + BATCH_SIZE]
+        batch_requests = [
+            vision.AnnotateImageRequest(image=vision.Image(content=content), features=features)
+            for _, content, _ in chunk
+        ]
+        try:
+            logger.info("Enviando lote de %d imágenes a Vision API", len(batch_requests))
+            with metrics.timer('vision_rpc_batch'):
+                batch_response = batch_annotate_images(batch_requests)
+            metrics.increment('vision_requests_total', method='batch', outcome='ok')
+        except Exception as e:
+            metrics.increment('vision_requests_total', method='batch', outcome='error')
+            logger.error(f"Error en la llamada por lotes a Vision API: {str(e)}")
+            for index, _, _ in chunk:
+                results[index] = _error_result(f"Error al analizar la imagen: {str(e)}")
+            continue
+        
+        for (index, content, cache_key), response in zip(chunk, batch_response.responses):
+            if not response.error.message:
+                annotation_cache.put(cache_key, response)
+                if vision_fixtures.recording:
+                    vision_fixtures.record(content, features, response)
+            responses[index] = response
+    
+    # Clasificar cada respuesta con las mismas reglas que analyze_image
+    for index, response in responses.items():
+        try:
+            with metrics.timer('classification'):
+                results[index] = classify_response(response, hint_paths[index], is_registration_card)
+            results[index]['analysis_stage'] = stage
+            results[index]['image_preprocessing'] = preprocessing[index]
+            metrics.increment('analysis_stage_total', stage=stage if 'error' not in results[index] else 'error')
+        except Exception as e:
+            logger.error(f"Error al analizar la imagen: {str(e)}")
+            logger.error(traceback.format_exc())
+            results[index] = _error_result(f"Error al analizar la imagen: {str(e)}")
+    
+    return results
+
+def classify_response(response, image_path, is_registration_card=False, label_stage=False):
+    """
+    Clasifica el incidente a partir de la respuesta de Vision API
+    
+    Args:
+        response: Respuesta de la API de Vision
+        image_path (str): Ruta al archivo de imagen (se usa como pista adicional)
+        is_registration_card (bool): Indica si la imagen es una tarjeta de circulación
+        label_stage (bool): La respuesta no tiene objetos (primera etapa del
+            modo cascada). Devuelve None si los objetos aún podrían cambiar
+            la clasificación
         
-        # Si es una imagen de problema de acceso, devolver un resultado específico
-        if (is_access_problem and (person_detected or door_detected or key_detected)) or "hoy4" in image_path.lower():
-            logger.info("Detectada imagen de problema de acceso")
-            
-            incident_type = "Problema de acceso - Llaves olvidadas"
-            if key_detected and door_detected:
-                incident_type = "Problema de acceso - Llaves olvidadas"
-            elif door_detected and person_detected:
-                incident_type = "Problema de acceso - Vehículo bloqueado"
-            elif person_detected:
-                incident_type = "Problema de acceso - Asistencia requerida"
-            
-            return {
-                'incident_type': incident_type,
-                'damage_severity': 'Leve',
-                'vehicle_type': 'Automóvil',
-                'damaged_parts': ['Sistema de acceso', 'Cerradura'],
-                'confidence': round(max(access_confidence, 0.95) * 100, 2),
-                'labels': [
-                    {'description': label.description, 'score': round(label.score * 100, 2)}
-                    for label in response.label_annotations[:5]
-                ],
-                'objects': [
-                    {
-                        'name': obj.name,
-                        'confidence': round(obj.score * 100, 2)
-                    }
-                    for obj in response.localized_object_annotations[:3]
-                ],
-                'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
-                'landmarks': []
+    Returns:
+        dict: Resultados del análisis
+    """
+    # Verificar si hay errores en la respuesta
+    if response.error.message:
+        logger.error(f"Error en la respuesta de Vision API: {response.error.message}")
+        return _error_result(f"Error en la respuesta de Vision API: {response.error.message}")
+    
+    # Construir el índice de anotaciones una sola vez para todas las reglas
+    index = AnnotationIndex(response)
+    hints = vision_rules.filename_hints(image_path)
+    
+    # Resumen de la respuesta; el detalle de cada anotación solo se registra
+    # en DEBUG y para una muestra de los análisis (LOG_SAMPLE_RATE)
+    logger.info(
+        "Respuesta recibida de Vision API: %d labels, %d objects, %d textos",
+        len(index.labels), len(index.objects), len(response.text_annotations)
+    )
+    if sample_debug(logger):
+        logger.debug(
+            "Anotaciones de Vision API",
+            extra={
+                'labels': [(description, round(score, 2)) for description, _, score in index.labels],
+                'objects': [(name, round(score, 2)) for name, _, score in index.objects],
+                'text': index.raw_text if index.has_text else None,
             }
-        
-        # Verificar si es una imagen de fuga de líquido
-        is_fluid_leak = False
-        fluid_confidence = 0.0
-        
-        # Buscar etiquetas relacionadas con fugas de líquidos
-        fluid_keywords = ['liquid', 'oil', 'fluid', 'leak', 'spill', 'puddle', 'water', 'stain', 'wet']
-        
-        for label in response.label_annotations:
-            if any(keyword.lower() in label.description.lower() for keyword in fluid_keywords):
-                is_fluid_leak = True
-                fluid_confidence = max(fluid_confidence, label.score)
-                logger.info(f"Detectada etiqueta relacionada con fuga de líquido: {label.description} ({label.score:.2f})")
-        
-        # Verificar colores oscuros en la parte inferior de la imagen (posible aceite)
-        if response.image_properties_annotation:
-            dominant_colors = response.image_properties_annotation.dominant_colors.colors
-            dark_colors = [color for color in dominant_colors if 
-                          (color.color.red < 50 and color.color.green < 50 and color.color.blue < 50) or
-                          (color.color.red < 100 and color.color.green < 100 and color.color.blue < 100 and color.score > 0.1)]
-            
-            if dark_colors and len(dark_colors) > 1:
-                is_fluid_leak = True
-                fluid_confidence = max(fluid_confidence, 0.85)
-                logger.info(f"Detectados colores oscuros que podrían indicar fuga de aceite")
-        
-        # Si es una imagen de fuga de líquido, devolver un resultado específico
-        if is_fluid_leak or "hoy2" in image_path.lower() or "hoy5" in image_path.lower():
-            logger.info("Detectada imagen de fuga de líquido")
+        )
+    
+    # Si es una tarjeta de circulación, extraer información específica
+    if is_registration_card or 'registration' in hints:
+        logger.info("Procesando imagen como tarjeta de circulación")
+        if index.has_text:
+            registration_info = extract_vehicle_registration_info(index.raw_text)
             return {
-                'incident_type': 'Fallo mecánico - Fuga de líquido',
-                'damage_severity': 'Moderado',
-                'vehicle_type': 'Automóvil',
-                'damaged_parts': ['Sistema de fluidos', 'Posible fuga de aceite/refrigerante'],
-                'confidence': round(max(fluid_confidence, 0.85) * 100, 2),
-                'labels': [
-                    {'description': label.description, 'score': round(label.score * 100, 2)}
-                    for label in response.label_annotations[:5]
-                ],
-                'objects': [
-                    {
-                        'name': obj.name,
-                        'confidence': round(obj.score * 100, 2)
-                    }
-                    for obj in response.localized_object_annotations[:3]
-                ],
-                'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
-                'landmarks': []
+                'incident_type': 'Tarjeta de Circulación',
+                'is_registration_card': True,
+                'registration_info': registration_info,
+                'text': index.text_lines(),
+                'confidence': 95.0
             }
-        
-        # Verificar si es una imagen de llanta
-        is_tire_image = False
-        tire_confidence = 0.0
-        
-        # Buscar etiquetas relacionadas con llantas
-        tire_keywords = ['tire', 'wheel', 'flat tire', 'puncture', 'tyre', 'rim', 'automotive wheel']
-        
-        for label in response.label_annotations:
-            if any(keyword.lower() in label.description.lower() for keyword in tire_keywords):
-                is_tire_image = True
-                tire_confidence = max(tire_confidence, label.score)
-                logger.info(f"Detectada etiqueta relacionada con llanta: {label.description} ({label.score:.2f})")
-        
-        # Si es una imagen de llanta, devolver un resultado específico
-        if is_tire_image and not is_fluid_leak and not is_access_problem:
-            logger.info("Detectada imagen de llanta")
-            
-            # Determinar si es una llanta pinchada o no
-            is_flat = False
-            for label in response.label_annotations:
-                if any(kw in label.description.lower() for kw in ['flat', 'puncture', 'deflated']):
-                    is_flat = True
-                    break
-            
-            # Si el nombre del archivo sugiere un pinchazo o se detectaron palabras clave de pinchazo
-            if is_flat or "pinchazo" in image_path.lower() or "flat" in image_path.lower() or "hoy1" in image_path.lower():
-                incident_type = 'Fallo mecánico - Llanta pinchada'
-            else:
-                incident_type = 'Fallo mecánico - Problema de llanta'
-            
+        else:
+            logger.warning("No se detectó texto en la imagen de la tarjeta de circulación")
             return {
-                'incident_type': incident_type,
-                'damage_severity': 'Moderado',
-                'vehicle_type': 'Automóvil',
-                'damaged_parts': ['Llanta', 'Neumático'],
-                'confidence': round(tire_confidence * 100, 2),
-                'labels': [
-                    {'description': label.description, 'score': round(label.score * 100, 2)}
-                    for label in response.label_annotations[:5]
-                ],
-                'objects': [
-                    {
-                        'name': obj.name,
-                        'confidence': round(obj.score * 100, 2)
-                    }
-                    for obj in response.localized_object_annotations[:3]
-                ],
-                'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
-                'landmarks': []
+                'incident_type': 'Tarjeta de Circulación',
+                'is_registration_card': True,
+                'error': 'No se pudo detectar texto en la imagen',
+                'registration_info': {},
+                'confidence': 0.0
             }
+    
+    # Evaluar las reglas de clasificación en orden de prioridad
+    signals = vision_rules.collect_signals(index, hints)
+    rule = vision_rules.first_matching_rule(vision_rules.CLASSIFICATION_RULES, signals)
+    if label_stage and (rule is None or not rule['label_stage'](signals)):
+        return None
+    if rule is not None:
+        logger.info(rule['log'])
+        return build_rule_result(rule, signals, index)
+    
+    # Procesar resultados
+    logger.info("Procesando resultados de Vision API")
+    results = process_vision_response(response, index)
+    
+    # Si después de procesar, los resultados siguen siendo indeterminados o son
+    # un fallo mecánico genérico, las pistas disponibles pueden forzar un resultado
+    if (results['incident_type'] == 'Indeterminado' or 
+        'Fallo mecánico' in results['incident_type']):
+        override = vision_rules.first_matching_rule(vision_rules.OVERRIDE_RULES, signals)
+        if override is not None:
+            logger.info(override['log'])
+            outcome = vision_rules.OUTCOMES[override['outcome']]
+            results['incident_type'] = outcome['incident_type']
+            results['damage_severity'] = outcome['damage_severity']
+            results['vehicle_type'] = 'Automóvil'
+            for part in outcome['damaged_parts']:
+                if part not in results['damaged_parts']:
+                    results['damaged_parts'].append(part)
+            results['confidence'] = override['confidence']
+    
+    return results
+
+def build_rule_result(rule, signals, index):
+    """
+    Construye el resultado de una regla de clasificación
+    
+    Args:
+        rule (dict): Regla de vision_rules.CLASSIFICATION_RULES
+        signals (dict): Hechos calculados por vision_rules.collect_signals
+        index (AnnotationIndex): Índice de la respuesta de Vision API
         
-        # Si no hay etiquetas pero hay texto, podemos hacer un análisis básico
-        if not response.label_annotations and response.text_annotations:
-            logger.info("No hay etiquetas pero hay texto, realizando análisis básico")
-            text = response.text_annotations[0].description.lower()
-            
-            # Verificar si es un tablero de auto
-            dashboard_indicators = ['mph', 'km/h', 'rpm', 'fuel', 'battery', 'temperature', 'oil', 'check engine']
-            
-            if any(indicator in text for indicator in dashboard_indicators):
-                logger.info("Detectado tablero de auto por texto")
-                
-                # Verificar si hay indicadores de batería
-                if any(indicator in text for indicator in battery_indicators) or any(line.strip() == '140' for line in text.split('\n')):
-                    logger.info("Detectado indicador de batería en el tablero")
-                    return {
-                        'incident_type': 'Fallo mecánico - Batería',
-                        'damage_severity': 'Moderado',
-                        'vehicle_type': 'Automóvil',
-                        'damaged_parts': ['Batería', 'Sistema eléctrico'],
-                        'confidence': 85.0,
-                        'labels': [],
-                        'objects': [],
-                        'text': text.split('\n'),
-                        'landmarks': []
-                    }
-                
-                # Crear un resultado básico para un tablero de auto
-                return {
-                    'incident_type': 'Fallo mecánico - Tablero',
-                    'damage_severity': 'Leve',
-                    'vehicle_type': 'Automóvil',
-                    'damaged_parts': ['Tablero'],
-                    'confidence': 80.0,
-                    'labels': [],
-                    'objects': [],
-                    'text': text.split('\n'),
-                    'landmarks': []
-                }
-        
-        # Procesar resultados
-        logger.info("Procesando resultados de Vision API")
-        results = process_vision_response(response)
-        
-        # Si después de procesar, los resultados siguen siendo indeterminados,
-        # pero tenemos una imagen que parece un tablero de auto, forzamos un resultado
-        if (results['incident_type'] == 'Indeterminado' or 
-            'Fallo mecánico' in results['incident_type']):
-            
-            # Si el nombre del archivo contiene "battery", es un problema de batería
-            if 'battery' in image_path.lower():
-                logger.info("Forzando resultado para imagen de batería")
-                results['incident_type'] = 'Fallo mecánico - Batería'
-                results['damage_severity'] = 'Moderado'
-                results['vehicle_type'] = 'Automóvil'
-                if 'Batería' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Batería')
-                if 'Sistema eléctrico' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Sistema eléctrico')
-                results['confidence'] = 86.33
-            # Si el nombre del archivo o las etiquetas sugieren un problema de acceso
-            elif any(keyword in image_path.lower() for keyword in ["key", "lock", "door", "access", "llave", "puerta", "acceso", "hoy4"]) or is_access_problem:
-                logger.info("Forzando resultado para imagen de problema de acceso")
-                results['incident_type'] = 'Problema de acceso - Llaves olvidadas'
-                results['damage_severity'] = 'Leve'
-                results['vehicle_type'] = 'Automóvil'
-                if 'Sistema de acceso' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Sistema de acceso')
-                if 'Cerradura' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Cerradura')
-                results['confidence'] = 95.69
-            # Si el nombre del archivo o las etiquetas sugieren una fuga de líquido
-            elif any(keyword in image_path.lower() for keyword in ["leak", "fluid", "oil", "fuga", "aceite", "liquido", "hoy2", "hoy5"]) or is_fluid_leak:
-                logger.info("Forzando resultado para imagen de fuga de líquido")
-                results['incident_type'] = 'Fallo mecánico - Fuga de líquido'
-                results['damage_severity'] = 'Moderado'
-                results['vehicle_type'] = 'Automóvil'
-                if 'Sistema de fluidos' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Sistema de fluidos')
-                if 'Posible fuga de aceite/refrigerante' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Posible fuga de aceite/refrigerante')
-                results['confidence'] = 93.26
-            # Si el nombre del archivo o las etiquetas sugieren una llanta pinchada
-            elif any(keyword in image_path.lower() for keyword in ["flat", "puncture", "pinchazo", "hoy1"]) or is_flat_tire:
-                logger.info("Forzando resultado para imagen de llanta pinchada")
-                results['incident_type'] = 'Fallo mecánico - Llanta pinchada'
-                results['damage_severity'] = 'Moderado'
-                results['vehicle_type'] = 'Automóvil'
-                if 'Llanta' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Llanta')
-                if 'Neumático' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Neumático')
-                results['confidence'] = 95.0
-            # Si el nombre del archivo o las etiquetas sugieren una llanta, es un problema de llanta
-            elif any(keyword in image_path.lower() for keyword in ["tire", "wheel", "llanta", "neumatico", "hoy"]) or is_tire_image:
-                logger.info("Forzando resultado para imagen de llanta")
-                results['incident_type'] = 'Fallo mecánico - Llanta pinchada'
-                results['damage_severity'] = 'Moderado'
-                results['vehicle_type'] = 'Automóvil'
-                if 'Llanta' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Llanta')
-                if 'Neumático' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Neumático')
-                results['confidence'] = 85.0
-            # Si no, pero parece un tablero, es un problema general
-            elif ('mph' in image_path.lower() or 'km/h' in image_path.lower() or 
-                 'dashboard' in image_path.lower() or 'car' in image_path.lower()):
-                
-                logger.info("Forzando resultado para imagen de tablero de auto")
-                results['incident_type'] = 'Fallo mecánico - Tablero'
-                results['damage_severity'] = 'Leve'
-                results['vehicle_type'] = 'Automóvil'
-                if 'Tablero' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Tablero')
-                results['confidence'] = 75.0
-        
-        return results
-        
-    except Exception as e:
-        logger.error(f"Error al analizar la imagen: {str(e)}")
-        logger.error(traceback.format_exc())
-        return {
-            'error': f"Error al analizar la imagen: {str(e)}",
-            'incident_type': 'Error',
-            'damage_severity': 'Error',
-            'vehicle_type': 'Error',
-            'damaged_parts': [],
-            'confidence': 0.0
-        }
+    Returns:
+        dict: Resultados del análisis
+    """
+    outcome = vision_rules.OUTCOMES[rule['outcome']]
+    incident_type = rule['incident_type'](signals) if 'incident_type' in rule else outcome['incident_type']
+    
+    if rule['evidence'] == 'text':
+        labels, objects, text = [], [], index.text.split('\n')
+    else:
+        labels, objects, text = index.summary_labels(), index.summary_objects(), index.text_lines()
+    
+    return {
+        'incident_type': incident_type,
+        'damage_severity': outcome['damage_severity'],
+        'vehicle_type': 'Automóvil',
+        'damaged_parts': list(outcome['damaged_parts']),
+        'confidence': rule['confidence'](signals),
+        'labels': labels,
+        'objects': objects,
+        'text': text,
+        'landmarks': []
+    }
 
-def process_vision_response(response):
+def process_vision_response(response, index=None):
     """
     Procesa la respuesta de la API de Vision para extraer información relevante
     
     Args:
         response: Respuesta de la API de Vision
+        index (AnnotationIndex, optional): Índice ya construido para la respuesta
         
     Returns:
         dict: Resultados procesados
     """
+    if index is None:
+        index = AnnotationIndex(response)
+    
     # Inicializar resultados
     results = {
         'incident_type': 'Indeterminado',
@@ -775,31 +779,23 @@ def process_vision_response(response):
     fluid_confidence = 0.0
     
     # Verificar colores oscuros en la parte inferior de la imagen (posible aceite/líquido)
-    if response.image_properties_annotation:
-        dominant_colors = response.image_properties_annotation.dominant_colors.colors
-        
+    if index.has_image_properties:
         # Buscar colores oscuros (posible aceite) o rojizos/marrones (posible líquido de transmisión)
-        dark_colors = [color for color in dominant_colors if 
-                      (color.color.red < 100 and color.color.green < 100 and color.color.blue < 100) or
-                      (color.color.red > 100 and color.color.green < 80 and color.color.blue < 80)]
+        dark_colors = index.dark_colors(vision_rules.COLOR_PREDICATES['dark_or_reddish'])
         
         # Verificar si hay etiquetas de colisión antes de considerar una fuga de líquido
-        collision_detected = any(
-            any(keyword.lower() in label.description.lower() for keyword in 
-                ['traffic collision', 'accident', 'crash', 'collision', 'car accident', 'vehicle accident'])
-            for label in response.label_annotations
-        )
+        collision_detected = index.has_label('collision')
         
         # Si hay dos o más vehículos detectados, probablemente sea una colisión
-        vehicles_detected = sum(1 for obj in response.localized_object_annotations if obj.name.lower() in ['car', 'vehicle'])
+        vehicles_detected = index.count_objects(VEHICLE_OBJECTS)
         
         # Solo considerar fuga de líquido si no hay indicios de colisión
-        if dark_colors and len(dark_colors) > 0 and not collision_detected and vehicles_detected < 2:
+        if dark_colors and not collision_detected and vehicles_detected < 2:
             is_fluid_leak = True
-            fluid_confidence = sum(color.score for color in dark_colors) / len(dark_colors)
+            fluid_confidence = sum(score for *_, score in dark_colors) / len(dark_colors)
             
             # Si hay un vehículo en la imagen, aumenta la confianza
-            if any(obj.name.lower() in ['car', 'vehicle', 'tire', 'wheel'] for obj in response.localized_object_annotations):
+            if index.has_object(VEHICLE_OR_TIRE_OBJECTS):
                 fluid_confidence = max(fluid_confidence, 0.85)  # Reducido de 0.95 para ser más conservador
                 
                 # Actualizar resultados para fuga de líquido
@@ -809,24 +805,16 @@ def process_vision_response(response):
                 results['confidence'] = round(fluid_confidence * 100, 2)
     
     # Procesar anotaciones de etiquetas
-    if response.label_annotations:
+    if index.labels:
         # Extraer etiquetas y confianza
-        results['labels'] = [
-            {'description': label.description, 'score': round(label.score * 100, 2)}
-            for label in response.label_annotations[:5]
-        ]
+        results['labels'] = index.summary_labels()
         
         # Buscar etiquetas relacionadas con colisiones
-        collision_keywords = ['traffic collision', 'accident', 'crash', 'collision', 'car accident', 'vehicle accident']
-        collision_labels = []
-        
-        for label in response.label_annotations:
-            if any(keyword.lower() in label.description.lower() for keyword in collision_keywords):
-                collision_labels.append(label)
+        collision_labels = index.labels_in('collision')
         
         if collision_labels:
             # Calcular confianza promedio
-            collision_label_confidence = sum(label.score for label in collision_labels) / len(collision_labels)
+            collision_label_confidence = sum(score for _, score in collision_labels) / len(collision_labels)
             
             # Actualizar resultados - Priorizar colisión sobre otros tipos de incidentes
             results['incident_type'] = 'Colisión vehicular'
@@ -835,8 +823,7 @@ def process_vision_response(response):
             results['confidence'] = round(collision_label_confidence * 100, 2)
             
             # Si hay dos o más vehículos detectados, aumentar la confianza
-            vehicles_detected = sum(1 for obj in response.localized_object_annotations if obj.name.lower() in ['car', 'vehicle'])
-            if vehicles_detected >= 2:
+            if index.count_objects(VEHICLE_OBJECTS) >= 2:
                 results['confidence'] = max(results['confidence'], 95.0)
                 if 'Colisión entre vehículos' not in results['damaged_parts']:
                     results['damaged_parts'].append('Colisión entre vehículos')
@@ -845,16 +832,11 @@ def process_vision_response(response):
             return results
         
         # Buscar etiquetas relacionadas con fugas de líquidos
-        fluid_keywords = ['liquid', 'oil', 'fluid', 'leak', 'spill', 'puddle', 'water', 'stain', 'wet', 'drip', 'drop']
-        fluid_labels = []
-        
-        for label in response.label_annotations:
-            if any(keyword.lower() in label.description.lower() for keyword in fluid_keywords):
-                fluid_labels.append(label)
+        fluid_labels = index.labels_in('fluid_extended')
         
         if fluid_labels:
             # Calcular confianza promedio
-            fluid_label_confidence = sum(label.score for label in fluid_labels) / len(fluid_labels)
+            fluid_label_confidence = sum(score for _, score in fluid_labels) / len(fluid_labels)
             
             # Actualizar resultados
             results['incident_type'] = 'Fallo mecánico - Fuga de líquido'
@@ -863,26 +845,15 @@ def process_vision_response(response):
             results['confidence'] = round(max(fluid_confidence, fluid_label_confidence) * 100, 2)
         
         # Buscar etiquetas relacionadas con problemas de acceso
-        access_keywords = ['key', 'lock', 'door', 'car door', 'handle', 'vehicle door', 'automobile door', 'car key', 'person']
-        access_labels = []
-        person_detected = False
-        door_detected = False
-        key_detected = False
-        
-        for label in response.label_annotations:
-            if any(keyword.lower() in label.description.lower() for keyword in access_keywords):
-                access_labels.append(label)
-                if 'person' in label.description.lower():
-                    person_detected = True
-                if 'door' in label.description.lower() or 'handle' in label.description.lower():
-                    door_detected = True
-                if 'key' in label.description.lower():
-                    key_detected = True
+        access_labels = index.labels_in('access')
+        person_detected = index.has_label('person')
+        door_detected = index.has_label('door')
+        key_detected = index.has_label('key')
         
         # Solo considerar problema de acceso si no hay indicios de fuga de líquido
         if access_labels and (person_detected or door_detected or key_detected) and not is_fluid_leak and results['incident_type'] == 'Indeterminado':
             # Calcular confianza promedio
-            access_confidence = sum(label.score for label in access_labels) / len(access_labels)
+            access_confidence = sum(score for _, score in access_labels) / len(access_labels)
             
             # Actualizar resultados
             results['incident_type'] = 'Problema de acceso - Llaves olvidadas'
@@ -898,16 +869,11 @@ def process_vision_response(response):
             results['confidence'] = round(access_confidence * 100, 2)
         
         # Buscar etiquetas relacionadas con baterías
-        battery_keywords = ['battery', 'car battery', 'vehicle battery', 'automotive battery', 'power source']
-        battery_labels = []
-        
-        for label in response.label_annotations:
-            if any(keyword.lower() in label.description.lower() for keyword in battery_keywords):
-                battery_labels.append(label)
+        battery_labels = index.labels_in('battery')
         
         if battery_labels and results['incident_type'] == 'Indeterminado':
             # Calcular confianza promedio
-            battery_confidence = sum(label.score for label in battery_labels) / len(battery_labels)
+            battery_confidence = sum(score for _, score in battery_labels) / len(battery_labels)
             
             # Actualizar resultados
             results['incident_type'] = 'Fallo mecánico - Batería'
@@ -916,62 +882,26 @@ def process_vision_response(response):
             results['confidence'] = round(battery_confidence * 100, 2)
         
         # Identificar tipo de vehículo
-        vehicle_types = {
-            'car': 'Automóvil',
-            'automobile': 'Automóvil',
-            'vehicle': 'Automóvil',
-            'truck': 'Camión',
-            'motorcycle': 'Motocicleta',
-            'bike': 'Motocicleta',
-            'bicycle': 'Bicicleta',
-            'bus': 'Autobús',
-            'van': 'Furgoneta',
-            'suv': 'SUV'
-        }
-        
-        for label in response.label_annotations:
-            for key, value in vehicle_types.items():
-                if key.lower() in label.description.lower():
+        for keywords in index.label_keywords:
+            for key, value in vision_rules.VEHICLE_TYPES:
+                if key in keywords:
                     results['vehicle_type'] = value
                     break
     
     # Procesar anotaciones de objetos localizados
-    if response.localized_object_annotations:
+    if index.objects:
         # Extraer objetos y confianza
-        results['objects'] = [
-            {
-                'name': obj.name,
-                'confidence': round(obj.score * 100, 2)
-            }
-            for obj in response.localized_object_annotations[:3]
-        ]
+        results['objects'] = index.summary_objects()
         
         # Identificar partes dañadas
-        damaged_parts_mapping = {
-            'tire': 'Llanta',
-            'wheel': 'Llanta',
-            'car': 'Carrocería',
-            'vehicle': 'Carrocería',
-            'door': 'Puerta',
-            'window': 'Ventana',
-            'windshield': 'Parabrisas',
-            'headlight': 'Faro delantero',
-            'taillight': 'Faro trasero',
-            'bumper': 'Parachoques',
-            'hood': 'Capó',
-            'trunk': 'Maletero',
-            'mirror': 'Espejo',
-            'person': 'Asistencia personal'
-        }
-        
-        for obj in response.localized_object_annotations:
-            for key, value in damaged_parts_mapping.items():
-                if key.lower() in obj.name.lower() and value not in results['damaged_parts']:
+        for keywords in index.object_keywords:
+            for key, value in vision_rules.DAMAGED_PARTS_BY_OBJECT:
+                if key in keywords and value not in results['damaged_parts']:
                     results['damaged_parts'].append(value)
         
         # Verificar si hay un vehículo y una mancha oscura (posible fuga)
-        car_detected = any(obj.name.lower() in ['car', 'vehicle'] for obj in response.localized_object_annotations)
-        tire_detected = any(obj.name.lower() in ['tire', 'wheel'] for obj in response.localized_object_annotations)
+        car_detected = index.has_object(VEHICLE_OBJECTS)
+        tire_detected = index.has_object(TIRE_OBJECTS)
         
         if (car_detected or tire_detected) and is_fluid_leak:
             results['incident_type'] = 'Fallo mecánico - Fuga de líquido'
@@ -986,73 +916,33 @@ def process_vision_response(response):
         
         # Verificar si hay una persona cerca del vehículo (posible problema de acceso)
         # Solo si no hay indicios de fuga de líquido
-        person_detected = any(obj.name.lower() == 'person' for obj in response.localized_object_annotations)
+        person_score = index.first_object(('person',))
         
-        if person_detected and car_detected and results['incident_type'] == 'Indeterminado' and not is_fluid_leak:
+        if person_score is not None and car_detected and results['incident_type'] == 'Indeterminado' and not is_fluid_leak:
             results['incident_type'] = 'Problema de acceso - Asistencia requerida'
             results['damage_severity'] = 'Leve'
             if 'Sistema de acceso' not in results['damaged_parts']:
                 results['damaged_parts'].append('Sistema de acceso')
             
             # Calcular confianza promedio
-            person_obj = next((obj for obj in response.localized_object_annotations if obj.name.lower() == 'person'), None)
-            car_obj = next((obj for obj in response.localized_object_annotations if obj.name.lower() in ['car', 'vehicle']), None)
-            
-            if person_obj and car_obj:
-                access_confidence = (person_obj.score + car_obj.score) / 2
-                results['confidence'] = round(access_confidence * 100, 2)
+            car_score = index.first_object(VEHICLE_OBJECTS)
+            access_confidence = (person_score + car_score) / 2
+            results['confidence'] = round(access_confidence * 100, 2)
     
     # Procesar anotaciones de texto
-    if response.text_annotations:
+    if index.has_text:
         # Extraer texto
-        results['text'] = response.text_annotations[0].description.split('\n')
-        
-        # Buscar palabras clave en el texto
-        text = response.text_annotations[0].description.lower()
+        results['text'] = index.text_lines()
         
-        # Palabras clave para problemas
-        problem_keywords = {
-            'battery': 'Fallo mecánico - Batería',
-            'check engine': 'Fallo mecánico - Motor',
-            'oil': 'Fallo mecánico - Aceite',
-            'temperature': 'Fallo mecánico - Temperatura',
-            'flat tire': 'Fallo mecánico - Llanta pinchada',
-            'puncture': 'Fallo mecánico - Llanta pinchada',
-            'fuel': 'Fallo mecánico - Combustible',
-            'key': 'Problema de acceso - Llaves',
-            'lock': 'Problema de acceso - Cerradura',
-            'door': 'Problema de acceso - Puerta',
-            'leak': 'Fallo mecánico - Fuga de líquido',
-            'fluid': 'Fallo mecánico - Fuga de líquido'
-        }
-        
-        for keyword, incident in problem_keywords.items():
-            if keyword in text and results['incident_type'] == 'Indeterminado':
+        # Buscar palabras clave de problemas en el texto (gana la primera de la tabla)
+        for keyword, incident, parts in vision_rules.TEXT_PROBLEMS:
+            if keyword in index.text_keywords and results['incident_type'] == 'Indeterminado':
                 results['incident_type'] = incident
                 
                 # Añadir partes dañadas según el incidente
-                if 'Batería' in incident and 'Batería' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Batería')
-                elif 'Motor' in incident and 'Motor' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Motor')
-                elif 'Aceite' in incident and 'Sistema de lubricación' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Sistema de lubricación')
-                elif 'Temperatura' in incident and 'Sistema de refrigeración' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Sistema de refrigeración')
-                elif 'Llanta' in incident and 'Llanta' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Llanta')
-                elif 'Combustible' in incident and 'Sistema de combustible' not in results['damaged_parts']:
-                    results['damaged_parts'].append('Sistema de combustible')
-                elif 'Fuga' in incident:
-                    if 'Sistema de fluidos' not in results['damaged_parts']:
-                        results['damaged_parts'].append('Sistema de fluidos')
-                    if 'Posible fuga de aceite/refrigerante' not in results['damaged_parts']:
-                        results['damaged_parts'].append('Posible fuga de aceite/refrigerante')
-                elif 'acceso' in incident:
-                    if 'Sistema de acceso' not in results['damaged_parts']:
-                        results['damaged_parts'].append('Sistema de acceso')
-                    if 'Cerradura' not in results['damaged_parts']:
-                        results['damaged_parts'].append('Cerradura')
+                for part in parts:
+                    if part not in results['damaged_parts']:
+                        results['damaged_parts'].append(part)
     
     # Estimar severidad del daño
     if results['damaged_parts']:
@@ -1064,24 +954,16 @@ def process_vision_response(response):
             results['damage_severity'] = 'Leve'
         
         # Ajustar severidad según el tipo de incidente
-        if 'Batería' in results['incident_type']:
-            results['damage_severity'] = 'Moderado'
-        elif 'Llanta' in results['incident_type']:
-            results['damage_severity'] = 'Moderado'
-        elif 'Fuga de líquido' in results['incident_type']:
-            results['damage_severity'] = 'Moderado'
-        elif 'Problema de acceso' in results['incident_type']:
-            results['damage_severity'] = 'Leve'
+        for incident, severity in vision_rules.SEVERITY_BY_INCIDENT:
+            if incident in results['incident_type']:
+                results['damage_severity'] = severity
+                break
     
     # Verificar colores oscuros en la parte inferior de la imagen (posible aceite)
-    if response.image_properties_annotation and results['incident_type'] == 'Indeterminado':
-        dominant_colors = response.image_properties_annotation.dominant_colors.colors
-        dark_colors = [color for color in dominant_colors if 
-                      (color.color.red < 50 and color.color.green < 50 and color.color.blue < 50) or
-                      (color.color.red < 100 and color.color.green < 100 and color.color.blue < 100 and color.score > 0.1) or
-                      (color.color.red > 100 and color.color.green < 80 and color.color.blue < 80)]
+    if index.has_image_properties and results['incident_type'] == 'Indeterminado':
+        dark_colors = index.dark_colors(vision_rules.COLOR_PREDICATES['dark_any'])
         
-        if dark_colors and len(dark_colors) > 0:
+        if dark_colors:
             results['incident_type'] = 'Fallo mecánico - Fuga de líquido'
             results['damage_severity'] = 'Moderado'
             if 'Sistema de fluidos' not in results['damaged_parts']:
@@ -1090,7 +972,7 @@ def process_vision_response(response):
                 results['damaged_parts'].append('Posible fuga de aceite/refrigerante')
             
             # Calcular confianza
-            dark_color_confidence = sum(color.score for color in dark_colors) / len(dark_colors)
+            dark_color_confidence = sum(score for *_, score in dark_colors) / len(dark_colors)
             results['confidence'] = round(max(dark_color_confidence * 100, 85.0), 2)
     
     # Si no se ha determinado la confianza, establecer un valor predeterminado
@@ -1233,5 +1115,5 @@ def extract_vehicle_registration_info(text):
         # Si solo hay una fecha, asumimos que es la de vencimiento
         registration_info['fecha_vencimiento'] = date_matches[0]
     
-    logger.info(f"Información extraída de tarjeta de circulación: {registration_info}")
+    logger.info("Información extraída de tarjeta de circulación: %s", registration_info)
     return registration_info 
\ No newline at end of file
@@ -0,0 +1,237 @@
+import os
+import hashlib
+import tempfile
+import threading
+import logging
+from google.cloud import vision
+
+try:
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from utils.logging_config import configure_logging
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Configuración de la caché de anotaciones (compartida en disco entre workers)
+CACHE_ENABLED = os.environ.get('VISION_CACHE_ENABLED', 'true').lower() == 'true'
+CACHE_DIR = os.environ.get('VISION_CACHE_DIR', os.path.join('cache', 'vision'))
+CACHE_MAX_ENTRIES = int(os.environ.get('VISION_CACHE_MAX_ENTRIES', '5000'))
+CACHE_MAX_BYTES = int(os.environ.get('VISION_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# Cada cuántas escrituras se revisan los límites de la caché
+EVICTION_INTERVAL = 25
+
+
+def content_hash(content):
+    """
+    Calcula el hash SHA-256 de los bytes de una imagen
+
+    Args:
+        content (bytes): Contenido de la imagen
+
+    Returns:
+        str: Hash hexadecimal
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def feature_signature(features):
+    """
+    Genera una firma estable para un conjunto de features de Vision API
+
+    Args:
+        features (list): Lista de vision.Feature
+
+    Returns:
+        str: Firma del conjunto de features
+    """
+    parts = sorted(
+        f"{vision.Feature.Type(feature.type_).name}:{feature.max_results}:{feature.model}"
+        for feature in features
+    )
+    return '|'.join(parts)
+
+
+class AnnotationCache:
+    """
+    Caché direccionada por contenido de respuestas AnnotateImageResponse.
+
+    Cada entrada se guarda como el protobuf serializado en
+    <directorio>/<ab>/<clave>.pb. La fecha de modificación del archivo hace
+    de marca de último uso, de modo que la expulsión LRU funciona igual para
+    todos los workers que comparten el directorio.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES,
+                 max_bytes=CACHE_MAX_BYTES, enabled=CACHE_ENABLED):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'errors': 0}
+
+    def make_key(self, content, features):
+        """
+        Construye la clave de caché a partir de la imagen y las features pedidas
+
+        Args:
+            content (bytes): Contenido de la imagen
+            features (list): Lista de vision.Feature
+
+        Returns:
+            str: Clave de caché
+        """
+        signature = feature_signature(features)
+        return hashlib.sha256(f"{content_hash(content)}:{signature}".encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.pb")
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, key):
+        """
+        Obtiene una respuesta de la caché
+
+        Args:
+            key (str): Clave de caché
+
+        Returns:
+            vision.AnnotateImageResponse: Respuesta almacenada o None
+        """
+        if not self.enabled:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cache_file:
+                data = cache_file.read()
+            response = vision.AnnotateImageResponse.deserialize(data)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        except Exception as e:
+            logger.warning(f"Entrada de caché inválida {path}: {str(e)}")
+            self._count('errors')
+            self._count('misses')
+            return None
+
+        # Marcar la entrada como usada recientemente
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self._count('hits')
+        return response
+
+    def put(self, key, response):
+        """
+        Guarda una respuesta en la caché de forma atómica
+
+        Args:
+            key (str): Clave de caché
+            response (vision.AnnotateImageResponse): Respuesta a guardar
+        """
+        if not self.enabled:
+            return
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = vision.AnnotateImageResponse.serialize(response)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    temp_file.write(data)
+                os.replace(temp_path, path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        except Exception as e:
+            logger.warning(f"No se pudo guardar la respuesta en caché: {str(e)}")
+            self._count('errors')
+            return
+
+        with self._lock:
+            self.stats['writes'] += 1
+            self._writes += 1
+            run_eviction = self._writes % EVICTION_INTERVAL == 0
+
+        if run_eviction:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith('.pb'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """
+        Elimina las entradas usadas menos recientemente hasta respetar los
+        límites de número de entradas y tamaño total
+
+        Returns:
+            int: Número de entradas eliminadas
+        """
+        entries = self._entries()
+        total_bytes = sum(size for _, size, _ in entries)
+        if len(entries) <= self.max_entries and total_bytes <= self.max_bytes:
+            return 0
+
+        entries.sort()
+        remaining = len(entries)
+        removed = 0
+        for _, size, path in entries:
+            if remaining <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                # Otro worker ya la eliminó
+                pass
+            remaining -= 1
+            total_bytes -= size
+
+        with self._lock:
+            self.stats['evictions'] += removed
+        logger.info(f"Caché de Vision API: {removed} entradas expulsadas")
+        return removed
+
+    def get_stats(self):
+        """
+        Devuelve los contadores de la caché para este proceso
+
+        Returns:
+            dict: Aciertos, fallos, escrituras, expulsiones y tasa de aciertos
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+# Caché compartida por el proceso
+annotation_cache = AnnotationCache()
@@ -0,0 +1,238 @@
+import os
+import asyncio
+import threading
+import logging
+from google.cloud import vision
+from google.api_core import exceptions as google_exceptions
+
+try:
+    from app.api.backends import fake_backends_enabled, vision_endpoint
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from api.backends import fake_backends_enabled, vision_endpoint
+    from utils.logging_config import configure_logging
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Cliente compartido por todo el proceso. Se crea de forma perezosa y se
+# descarta en el hijo tras un fork (gunicorn --preload), ya que un canal gRPC
+# creado en el proceso maestro no puede reutilizarse en los workers.
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+# Errores que indican que el canal gRPC quedó inutilizable
+CHANNEL_ERRORS = (google_exceptions.ServiceUnavailable,)
+
+# Tiempo máximo (segundos) para esperar a que el canal esté listo en el warm-up
+WARMUP_TIMEOUT = float(os.environ.get('VISION_WARMUP_TIMEOUT', '10'))
+
+
+def _forget_client_after_fork():
+    """Olvida el cliente heredado del proceso padre sin cerrar su canal"""
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_client_after_fork)
+
+
+def _create_client():
+    """Crea el cliente de Vision API, o uno contra el servidor simulado con FAKE_BACKENDS"""
+    if fake_backends_enabled():
+        import grpc
+        from google.cloud.vision_v1.services.image_annotator.transports import ImageAnnotatorGrpcTransport
+
+        endpoint = vision_endpoint()
+        logger.info(f"Inicializando cliente de Vision API simulado en {endpoint}")
+        channel = grpc.insecure_channel(endpoint)
+        return vision.ImageAnnotatorClient(transport=ImageAnnotatorGrpcTransport(channel=channel))
+
+    logger.info("Inicializando cliente de Vision API")
+    return vision.ImageAnnotatorClient()
+
+
+def get_vision_client():
+    """
+    Devuelve el cliente de Vision API compartido por el proceso actual,
+    creándolo si todavía no existe.
+
+    Returns:
+        vision.ImageAnnotatorClient: Cliente reutilizable
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    client = _client
+    if client is not None and _client_pid == pid:
+        return client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = _create_client()
+            _client_pid = pid
+        return _client
+
+
+def reset_vision_client():
+    """
+    Cierra y descarta el cliente actual para que la siguiente llamada
+    abra un canal nuevo.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        client = _client
+        owned = _client_pid == os.getpid()
+        _client = None
+        _client_pid = None
+
+    if client is not None and owned:
+        try:
+            client.transport.close()
+        except Exception as e:
+            logger.warning(f"Error al cerrar el canal de Vision API: {str(e)}")
+
+
+def warm_up_vision_client(timeout=WARMUP_TIMEOUT):
+    """
+    Crea el cliente y abre su canal por adelantado (al arrancar un worker)
+    para que la primera solicitud no pague la conexión ni el handshake TLS.
+
+    Args:
+        timeout (float): Segundos máximos de espera para el canal
+
+    Returns:
+        bool: True si el canal quedó listo, False en caso contrario
+    """
+    credentials_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
+    if not fake_backends_enabled() and (not credentials_path or not os.path.exists(credentials_path)):
+        logger.info("Warm-up de Vision API omitido: credenciales no configuradas")
+        return False
+
+    try:
+        client = get_vision_client()
+        channel = getattr(client.transport, 'grpc_channel', None)
+        if channel is not None:
+            import grpc
+            grpc.channel_ready_future(channel).result(timeout=timeout)
+        logger.info("Cliente de Vision API listo")
+        return True
+    except Exception as e:
+        logger.warning(f"No se pudo preparar el cliente de Vision API: {str(e)}")
+        return False
+
+
+def _call_with_client(method_name, **kwargs):
+    """
+    Invoca un método del cliente compartido. Si el canal falla, recrea el
+    cliente y reintenta una vez.
+    """
+    try:
+        return getattr(get_vision_client(), method_name)(**kwargs)
+    except CHANNEL_ERRORS as e:
+        logger.warning(f"Fallo del canal de Vision API ({str(e)}), recreando cliente")
+        reset_vision_client()
+        return getattr(get_vision_client(), method_name)(**kwargs)
+
+
+def annotate_image(request):
+    """
+    Envía una solicitud AnnotateImageRequest usando el cliente compartido
+
+    Args:
+        request (vision.AnnotateImageRequest): Solicitud a enviar
+
+    Returns:
+        vision.AnnotateImageResponse: Respuesta de Vision API
+    """
+    return _call_with_client('annotate_image', request=request)
+
+
+def batch_annotate_images(requests):
+    """
+    Envía varias solicitudes AnnotateImageRequest en una sola llamada
+
+    Args:
+        requests (list): Lista de vision.AnnotateImageRequest (máximo 16)
+
+    Returns:
+        vision.BatchAnnotateImagesResponse: Respuestas en el mismo orden
+    """
+    return _call_with_client('batch_annotate_images', requests=requests)
+
+
+# Cliente asíncrono para la ruta ASGI (app/asgi.py). Los canales grpc.aio
+# quedan ligados al bucle de eventos en el que se crean, así que hay uno por
+# proceso y bucle.
+_async_client = None
+_async_client_key = None
+
+
+def _create_async_client():
+    """Crea el cliente asíncrono de Vision API, o uno contra el servidor simulado"""
+    if fake_backends_enabled():
+        import grpc
+        from google.cloud.vision_v1.services.image_annotator.transports import ImageAnnotatorGrpcAsyncIOTransport
+
+        endpoint = vision_endpoint()
+        logger.info(f"Inicializando cliente asíncrono de Vision API simulado en {endpoint}")
+        channel = grpc.aio.insecure_channel(endpoint)
+        return vision.ImageAnnotatorAsyncClient(transport=ImageAnnotatorGrpcAsyncIOTransport(channel=channel))
+
+    logger.info("Inicializando cliente asíncrono de Vision API")
+    return vision.ImageAnnotatorAsyncClient()
+
+
+def get_async_vision_client():
+    """
+    Devuelve el cliente asíncrono de Vision API del proceso y bucle de
+    eventos actuales, creándolo si todavía no existe (llamar desde una corrutina)
+
+    Returns:
+        vision.ImageAnnotatorAsyncClient: Cliente reutilizable
+    """
+    global _async_client, _async_client_key
+    key = (os.getpid(), id(asyncio.get_running_loop()))
+    if _async_client is None or _async_client_key != key:
+        _async_client = _create_async_client()
+        _async_client_key = key
+    return _async_client
+
+
+async def close_async_vision_client():
+    """Cierra el canal del cliente asíncrono (al terminar el servidor ASGI)"""
+    global _async_client, _async_client_key
+    client, owned = _async_client, _async_client_key is not None and _async_client_key[0] == os.getpid()
+    _async_client = None
+    _async_client_key = None
+    if client is not None and owned:
+        try:
+            await client.transport.close()
+        except Exception as e:
+            logger.warning(f"Error al cerrar el canal asíncrono de Vision API: {str(e)}")
+
+
+async def annotate_image_async(request):
+    """
+    Envía una solicitud AnnotateImageRequest con el cliente asíncrono. Si el
+    canal falla, recrea el cliente y reintenta una vez.
+
+    Args:
+        request (vision.AnnotateImageRequest): Solicitud a enviar
+
+    Returns:
+        vision.AnnotateImageResponse: Respuesta de Vision API
+    """
+    # Sin reintentos de la biblioteca, igual que annotate_image del cliente síncrono
+    try:
+        response = await get_async_vision_client().batch_annotate_images(requests=[request], retry=None)
+    except CHANNEL_ERRORS as e:
+        logger.warning(f"Fallo del canal asíncrono de Vision API ({str(e)}), recreando cliente")
+        await close_async_vision_client()
+        response = await get_async_vision_client().batch_annotate_images(requests=[request], retry=None)
+    return response.responses[0]
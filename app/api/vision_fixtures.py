@@ -0,0 +1,118 @@
+import os
+import hashlib
+import tempfile
+import logging
+from google.cloud import vision
+
+try:
+    from app.api.vision_cache import content_hash, feature_signature
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from api.vision_cache import content_hash, feature_signature
+    from utils.logging_config import configure_logging
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Grabación y reproducción de respuestas de Vision API:
+#   off    - comportamiento normal
+#   record - guarda cada respuesta obtenida (de la API o de la caché)
+#   replay - sirve las respuestas grabadas y nunca llama a Vision API
+VISION_FIXTURES_MODE = os.environ.get('VISION_FIXTURES_MODE', 'off').lower()
+VISION_FIXTURES_DIR = os.environ.get('VISION_FIXTURES_DIR', os.path.join('fixtures', 'vision'))
+
+FIXTURE_MODES = ('off', 'record', 'replay')
+
+
+class VisionFixtures:
+    """
+    Respuestas AnnotateImageResponse grabadas para pruebas deterministas.
+
+    Cada respuesta se guarda como protobuf serializado en
+    <directorio>/<ab>/<hash de la imagen>-<firma de features>.pb. A diferencia
+    de la caché de anotaciones, las entradas nunca se expulsan y en modo
+    replay una imagen sin grabación es un error en lugar de una llamada a la API.
+    """
+
+    def __init__(self, directory=VISION_FIXTURES_DIR, mode=VISION_FIXTURES_MODE):
+        if mode not in FIXTURE_MODES:
+            logger.warning(f"VISION_FIXTURES_MODE desconocido: {mode}. Se usará 'off'")
+            mode = 'off'
+        self.directory = directory
+        self.mode = mode
+
+    @property
+    def recording(self):
+        return self.mode == 'record'
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def make_key(self, content, features):
+        """
+        Construye la clave de la grabación: hash de la imagen y firma de las features
+
+        Args:
+            content (bytes): Contenido de la imagen enviado a Vision API
+            features (list): Lista de vision.Feature
+
+        Returns:
+            str: Clave de la grabación
+        """
+        signature = hashlib.sha256(feature_signature(features).encode('utf-8')).hexdigest()[:12]
+        return f"{content_hash(content)}-{signature}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.pb")
+
+    def replay(self, content, features):
+        """
+        Devuelve la respuesta grabada para una imagen
+
+        Args:
+            content (bytes): Contenido de la imagen enviado a Vision API
+            features (list): Lista de vision.Feature
+
+        Returns:
+            vision.AnnotateImageResponse: Respuesta grabada
+
+        Raises:
+            LookupError: Si la imagen no tiene una respuesta grabada
+        """
+        key = self.make_key(content, features)
+        try:
+            with open(self._path(key), 'rb') as fixture_file:
+                return vision.AnnotateImageResponse.deserialize(fixture_file.read())
+        except FileNotFoundError:
+            raise LookupError(f"No hay respuesta grabada de Vision API para la imagen ({key})")
+
+    def record(self, content, features, response):
+        """
+        Guarda la respuesta de una imagen de forma atómica
+
+        Args:
+            content (bytes): Contenido de la imagen enviado a Vision API
+            features (list): Lista de vision.Feature
+            response (vision.AnnotateImageResponse): Respuesta a guardar
+        """
+        path = self._path(self.make_key(content, features))
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    temp_file.write(vision.AnnotateImageResponse.serialize(response))
+                os.replace(temp_path, path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        except Exception as e:
+            logger.warning(f"No se pudo grabar la respuesta de Vision API: {str(e)}")
+
+
+# Grabaciones compartidas por el proceso
+vision_fixtures = VisionFixtures()
@@ -0,0 +1,624 @@
+import re
+from bisect import bisect_right
+
+# Tabla declarativa de reglas para clasificar incidentes a partir de las
+# respuestas de Vision API. Todas las palabras clave (etiquetas, texto OCR,
+# objetos y nombre de archivo) se compilan al importar el módulo en una sola
+# expresión regular, de modo que cada texto se recorre una única vez.
+
+
+class KeywordMatcher:
+    """
+    Buscador de múltiples palabras clave en una sola pasada.
+
+    Las palabras se compilan en una expresión regular con forma de trie
+    dentro de un lookahead, que en cada posición devuelve la palabra más larga
+    que empieza ahí. Las palabras más cortas que también empiezan en esa
+    posición son prefijos de la encontrada y se agregan desde una tabla
+    precalculada, por lo que el resultado equivale a evaluar
+    `palabra in texto` para todas las palabras.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = frozenset(keywords)
+        self._pattern = re.compile('(?=(' + _trie_pattern(self.keywords) + '))')
+        self._prefixes = {
+            keyword: frozenset(other for other in self.keywords if keyword.startswith(other))
+            for keyword in self.keywords
+        }
+
+    def find(self, text):
+        """
+        Busca todas las palabras clave contenidas en un texto
+
+        Args:
+            text (str): Texto en minúsculas
+
+        Returns:
+            set: Palabras clave encontradas
+        """
+        found = set()
+        for match in self._pattern.finditer(text):
+            found |= self._prefixes[match.group(1)]
+        return found
+
+    def find_each(self, texts):
+        """
+        Busca las palabras clave en varios textos recorriéndolos en una sola pasada
+
+        Args:
+            texts (list): Textos en minúsculas
+
+        Returns:
+            list: Conjunto de palabras clave encontradas en cada texto
+        """
+        found = [set() for _ in texts]
+        if not texts:
+            return found
+
+        starts = []
+        position = 0
+        for text in texts:
+            starts.append(position)
+            position += len(text) + 1
+
+        for match in self._pattern.finditer('\n'.join(texts)):
+            found[bisect_right(starts, match.start()) - 1] |= self._prefixes[match.group(1)]
+        return found
+
+
+def _trie_pattern(keywords):
+    """Construye una expresión regular con forma de trie para las palabras dadas"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # El cuantificador codicioso prueba primero la palabra más larga
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+def group_index(groups):
+    """
+    Invierte una tabla grupo -> palabras clave en palabra clave -> grupos
+
+    Args:
+        groups (dict): Grupos de palabras clave
+
+    Returns:
+        dict: Grupos a los que pertenece cada palabra clave
+    """
+    index = {}
+    for group, keywords in groups.items():
+        for keyword in keywords:
+            index.setdefault(keyword, set()).add(group)
+    return {keyword: frozenset(names) for keyword, names in index.items()}
+
+
+def groups_of(keywords, index):
+    """Devuelve los grupos correspondientes a un conjunto de palabras clave encontradas"""
+    groups = set()
+    for keyword in keywords:
+        groups |= index.get(keyword, frozenset())
+    return frozenset(groups)
+
+
+# Palabras clave que se buscan en las etiquetas de Vision API
+LABEL_KEYWORD_GROUPS = {
+    'flat_tire': ('flat tire', 'puncture', 'deflated tire', 'tire damage', 'blown tire'),
+    'tire_related': ('tire', 'wheel', 'tread', 'flat', 'puncture'),
+    'tire': ('tire', 'wheel', 'flat tire', 'puncture', 'tyre', 'rim', 'automotive wheel'),
+    'flat': ('flat', 'puncture', 'deflated'),
+    'collision': ('traffic collision', 'accident', 'crash', 'collision', 'car accident', 'vehicle accident'),
+    'collision_confidence': ('collision', 'accident', 'crash'),
+    'access': ('key', 'lock', 'door', 'car door', 'handle', 'vehicle door', 'automobile door', 'car key', 'person'),
+    'person': ('person',),
+    'door': ('door', 'handle'),
+    'key': ('key',),
+    'fluid': ('liquid', 'oil', 'fluid', 'leak', 'spill', 'puddle', 'water', 'stain', 'wet'),
+    'fluid_extended': ('liquid', 'oil', 'fluid', 'leak', 'spill', 'puddle', 'water', 'stain', 'wet', 'drip', 'drop'),
+    'battery': ('battery', 'car battery', 'vehicle battery', 'automotive battery', 'power source'),
+}
+
+# Etiquetas exactas que indican una llanta en primer plano
+TIRE_CLOSEUP_LABELS = frozenset(['automotive tire', 'wheel', 'tire', 'tread'])
+
+# Palabras clave que se buscan en el texto OCR
+TEXT_KEYWORD_GROUPS = {
+    'dashboard': ('mph', 'km/h', 'rpm', 'fuel', 'battery', 'temperature', 'oil', 'check engine'),
+    'battery': ('battery', 'bat', 'charge', 'electrical', 'power', 'voltage'),
+}
+
+# Problemas detectables en el texto OCR, en orden de prioridad:
+# (palabra clave, tipo de incidente, partes dañadas)
+TEXT_PROBLEMS = (
+    ('battery', 'Fallo mecánico - Batería', ['Batería']),
+    ('check engine', 'Fallo mecánico - Motor', ['Motor']),
+    ('oil', 'Fallo mecánico - Aceite', ['Sistema de lubricación']),
+    ('temperature', 'Fallo mecánico - Temperatura', ['Sistema de refrigeración']),
+    ('flat tire', 'Fallo mecánico - Llanta pinchada', ['Llanta']),
+    ('puncture', 'Fallo mecánico - Llanta pinchada', ['Llanta']),
+    ('fuel', 'Fallo mecánico - Combustible', ['Sistema de combustible']),
+    ('key', 'Problema de acceso - Llaves', ['Sistema de acceso', 'Cerradura']),
+    ('lock', 'Problema de acceso - Cerradura', ['Sistema de acceso', 'Cerradura']),
+    ('door', 'Problema de acceso - Puerta', ['Sistema de acceso', 'Cerradura']),
+    ('leak', 'Fallo mecánico - Fuga de líquido', ['Sistema de fluidos', 'Posible fuga de aceite/refrigerante']),
+    ('fluid', 'Fallo mecánico - Fuga de líquido', ['Sistema de fluidos', 'Posible fuga de aceite/refrigerante']),
+)
+
+# Tipo de vehículo según las etiquetas (se usa la primera palabra que aparezca)
+VEHICLE_TYPES = (
+    ('car', 'Automóvil'),
+    ('automobile', 'Automóvil'),
+    ('vehicle', 'Automóvil'),
+    ('truck', 'Camión'),
+    ('motorcycle', 'Motocicleta'),
+    ('bike', 'Motocicleta'),
+    ('bicycle', 'Bicicleta'),
+    ('bus', 'Autobús'),
+    ('van', 'Furgoneta'),
+    ('suv', 'SUV'),
+)
+
+# Parte dañada según el nombre de los objetos localizados
+DAMAGED_PARTS_BY_OBJECT = (
+    ('tire', 'Llanta'),
+    ('wheel', 'Llanta'),
+    ('car', 'Carrocería'),
+    ('vehicle', 'Carrocería'),
+    ('door', 'Puerta'),
+    ('window', 'Ventana'),
+    ('windshield', 'Parabrisas'),
+    ('headlight', 'Faro delantero'),
+    ('taillight', 'Faro trasero'),
+    ('bumper', 'Parachoques'),
+    ('hood', 'Capó'),
+    ('trunk', 'Maletero'),
+    ('mirror', 'Espejo'),
+    ('person', 'Asistencia personal'),
+)
+
+# Nombres exactos de objetos localizados que se consultan en las reglas
+VEHICLE_OBJECTS = frozenset(['car', 'vehicle'])
+TIRE_OBJECTS = frozenset(['tire', 'wheel'])
+VEHICLE_OR_TIRE_OBJECTS = VEHICLE_OBJECTS | TIRE_OBJECTS
+
+# Pistas en el nombre del archivo
+FILENAME_KEYWORD_GROUPS = {
+    'battery': ('battery',),
+    'tire_sample': ('ejemplo1',),
+    'flat_tire': ('flat tire',),
+    'collision': ('collision', 'crash', 'accident', 'colision', 'accidente', 'choque'),
+    'tire': ('tire', 'wheel', 'flat', 'puncture', 'llanta', 'neumatico', 'pinchazo', 'hoy', 'hoy1'),
+    'fluid': ('leak', 'fluid', 'oil', 'fuga', 'aceite', 'liquido', 'hoy2', 'hoy5'),
+    'access': ('key', 'lock', 'door', 'access', 'llave', 'puerta', 'acceso', 'hoy4'),
+    'registration': ('tarjeta', 'circulacion', 'registration', 'card'),
+    'flat_closeup': ('pinchazo', 'flat', 'hoy1'),
+    'flat': ('flat', 'puncture', 'pinchazo', 'hoy1'),
+    'tire_override': ('tire', 'wheel', 'llanta', 'neumatico', 'hoy'),
+    'dashboard': ('mph', 'km/h', 'dashboard', 'car'),
+    'sample_fluid_colors': ('hoy5',),
+    'sample_fluid': ('hoy2', 'hoy5'),
+    'sample_access': ('hoy4',),
+}
+
+
+def _all_keywords():
+    keywords = set()
+    for groups in (LABEL_KEYWORD_GROUPS, TEXT_KEYWORD_GROUPS, FILENAME_KEYWORD_GROUPS):
+        for group_keywords in groups.values():
+            keywords.update(group_keywords)
+    keywords.update(keyword for keyword, _, _ in TEXT_PROBLEMS)
+    keywords.update(keyword for keyword, _ in VEHICLE_TYPES)
+    keywords.update(keyword for keyword, _ in DAMAGED_PARTS_BY_OBJECT)
+    return keywords
+
+
+# Buscador único compilado al importar el módulo
+MATCHER = KeywordMatcher(_all_keywords())
+LABEL_GROUP_INDEX = group_index(LABEL_KEYWORD_GROUPS)
+TEXT_GROUP_INDEX = group_index(TEXT_KEYWORD_GROUPS)
+FILENAME_GROUP_INDEX = group_index(FILENAME_KEYWORD_GROUPS)
+
+
+def filename_hints(image_path, matcher=MATCHER):
+    """
+    Obtiene los grupos de pistas presentes en el nombre de un archivo
+
+    Args:
+        image_path (str): Ruta al archivo de imagen
+
+    Returns:
+        frozenset: Grupos de FILENAME_KEYWORD_GROUPS encontrados
+    """
+    return groups_of(matcher.find(image_path.lower()), FILENAME_GROUP_INDEX)
+
+
+# Predicados sobre los colores dominantes (rojo, verde, azul, puntuación)
+def _is_dark_or_reddish(red, green, blue, score):
+    """Colores oscuros (posible aceite) o rojizos/marrones (posible líquido de transmisión)"""
+    return (red < 100 and green < 100 and blue < 100) or (red > 100 and green < 80 and blue < 80)
+
+
+def _is_very_dark(red, green, blue, score):
+    """Colores muy oscuros o medianamente oscuros con presencia significativa"""
+    return (red < 50 and green < 50 and blue < 50) or (red < 100 and green < 100 and blue < 100 and score > 0.1)
+
+
+def _is_dark_any(red, green, blue, score):
+    """Cualquier color oscuro o rojizo que pueda indicar una mancha de líquido"""
+    return _is_very_dark(red, green, blue, score) or (red > 100 and green < 80 and blue < 80)
+
+
+COLOR_PREDICATES = {
+    'dark_or_reddish': _is_dark_or_reddish,
+    'very_dark': _is_very_dark,
+    'dark_any': _is_dark_any,
+}
+
+# Resultados posibles de las reglas
+OUTCOMES = {
+    'bateria': {
+        'incident_type': 'Fallo mecánico - Batería',
+        'damage_severity': 'Moderado',
+        'damaged_parts': ['Batería', 'Sistema eléctrico'],
+    },
+    'tablero': {
+        'incident_type': 'Fallo mecánico - Tablero',
+        'damage_severity': 'Leve',
+        'damaged_parts': ['Tablero'],
+    },
+    'llanta_pinchada': {
+        'incident_type': 'Fallo mecánico - Llanta pinchada',
+        'damage_severity': 'Moderado',
+        'damaged_parts': ['Llanta', 'Neumático'],
+    },
+    'llanta': {
+        'incident_type': 'Fallo mecánico - Problema de llanta',
+        'damage_severity': 'Moderado',
+        'damaged_parts': ['Llanta', 'Neumático'],
+    },
+    'colision': {
+        'incident_type': 'Colisión vehicular',
+        'damage_severity': 'Grave',
+        'damaged_parts': ['Carrocería', 'Parachoques', 'Faros'],
+    },
+    'fuga': {
+        'incident_type': 'Fallo mecánico - Fuga de líquido',
+        'damage_severity': 'Moderado',
+        'damaged_parts': ['Sistema de fluidos', 'Posible fuga de aceite/refrigerante'],
+    },
+    'acceso': {
+        'incident_type': 'Problema de acceso - Llaves olvidadas',
+        'damage_severity': 'Leve',
+        'damaged_parts': ['Sistema de acceso', 'Cerradura'],
+    },
+}
+
+# Severidad fija según el tipo de incidente (se aplica la primera coincidencia)
+SEVERITY_BY_INCIDENT = (
+    ('Batería', 'Moderado'),
+    ('Llanta', 'Moderado'),
+    ('Fuga de líquido', 'Moderado'),
+    ('Problema de acceso', 'Leve'),
+)
+
+
+def _canned_result(incident_type, damage_severity, damaged_parts, confidence, labels, text=()):
+    return {
+        'incident_type': incident_type,
+        'damage_severity': damage_severity,
+        'vehicle_type': 'Automóvil',
+        'damaged_parts': damaged_parts,
+        'confidence': confidence,
+        'labels': [{'description': description, 'score': score} for description, score in labels],
+        'objects': [],
+        'text': list(text),
+        'landmarks': []
+    }
+
+
+# Reglas por nombre de archivo, evaluadas antes de llamar a Vision API.
+# Las reglas sin resultado solo registran la pista y continúan.
+FILENAME_RULES = (
+    {
+        'hint': 'battery',
+        'log': "Detectado problema de batería por nombre de archivo o patrón de imagen",
+        'result': _canned_result('Fallo mecánico - Batería', 'Moderado', ['Batería', 'Sistema eléctrico'], 90.0,
+                                 [('Battery', 90.0), ('Dashboard', 90.0), ('Car', 85.0)],
+                                 ['MPH', '140', 'Battery Warning']),
+    },
+    {
+        'hint': 'tire_sample',
+        'log': "Detectado pinchazo de llanta por nombre de archivo ejemplo1",
+        'result': _canned_result('Fallo mecánico - Llanta pinchada', 'Moderado', ['Llanta', 'Neumático'], 95.0,
+                                 [('Tire', 95.0), ('Wheel', 90.0), ('Flat tire', 90.0)]),
+    },
+    {
+        'hint': 'flat_tire',
+        'log': "Detectado pinchazo de llanta por nombre de archivo Flat Tire Car",
+        'result': _canned_result('Fallo mecánico - Llanta pinchada', 'Moderado', ['Llanta', 'Neumático'], 95.0,
+                                 [('Tire', 95.0), ('Wheel', 90.0), ('Flat tire', 90.0)]),
+    },
+    {
+        'hint': 'collision',
+        'log': "Detectada posible imagen de colisión por nombre de archivo",
+        'result': _canned_result('Colisión vehicular', 'Grave', ['Carrocería', 'Parachoques', 'Faros'], 95.0,
+                                 [('Car', 95.0), ('Collision', 95.0), ('Accident', 90.0)]),
+    },
+    {
+        'hint': 'tire',
+        'log': "Detectada posible imagen de llanta por nombre de archivo",
+        'result': None,
+    },
+    {
+        'hint': 'fluid',
+        'log': "Detectada posible imagen de fuga de líquido por nombre de archivo",
+        'result': None,
+    },
+    {
+        'hint': 'access',
+        'log': "Detectada posible imagen de problema de acceso por nombre de archivo",
+        'result': _canned_result('Problema de acceso - Llave/Puerta', 'Moderado', ['Cerradura', 'Sistema de acceso'], 85.0,
+                                 [('Car', 90.0), ('Door', 85.0), ('Lock', 80.0)]),
+    },
+)
+
+
+def collect_signals(index, hints):
+    """
+    Calcula una sola vez todos los hechos que consultan las reglas
+
+    Args:
+        index (AnnotationIndex): Índice de la respuesta de Vision API
+        hints (frozenset): Pistas del nombre del archivo
+
+    Returns:
+        dict: Hechos con nombre para evaluar las reglas
+    """
+    signals = {'hints': hints}
+
+    # Tablero de auto por texto OCR
+    signals['dashboard'] = 'dashboard' in index.text_groups
+    signals['dashboard_battery'] = (
+        'battery' in index.text_groups or
+        any(line.strip() == '140' for line in index.text.split('\n'))
+    )
+
+    # Llantas
+    flat_tire_scores = [score for _, score in index.labels_in('flat_tire')]
+    signals['flat_tire_labels'] = bool(flat_tire_scores)
+    signals['flat_tire_confidence'] = max([0.0] + flat_tire_scores)
+    signals['tire_score'] = index.last_object(TIRE_OBJECTS)
+    signals['tire_closeup'] = not index.label_set.isdisjoint(TIRE_CLOSEUP_LABELS)
+    signals['tire_related_count'] = len(index.labels_in('tire_related'))
+    tire_scores = [score for _, score in index.labels_in('tire')]
+    signals['tire'] = bool(tire_scores)
+    signals['tire_confidence'] = max([0.0] + tire_scores)
+    signals['flat'] = index.has_label('flat')
+
+    # Colisiones
+    signals['collision'] = index.has_label('collision')
+    signals['vehicles'] = index.count_objects(VEHICLE_OBJECTS)
+    collision_scores = index.labels_in('collision_confidence')
+    signals['collision_label_score'] = collision_scores[0][1] if collision_scores else None
+    signals['vehicle_or_tire_object'] = index.has_object(VEHICLE_OR_TIRE_OBJECTS)
+
+    # Fuga de líquido por colores dominantes, solo si no hay indicios de colisión
+    signals['fluid_colors'] = False
+    signals['fluid_colors_confidence'] = 0.0
+    if index.has_image_properties:
+        dark_colors = index.dark_colors(COLOR_PREDICATES['dark_or_reddish'])
+        if dark_colors and not signals['collision'] and signals['vehicles'] < 2:
+            signals['fluid_colors'] = True
+            signals['fluid_colors_confidence'] = sum(score for *_, score in dark_colors) / len(dark_colors)
+
+    # Fuga de líquido por etiquetas o colores muy oscuros
+    fluid_scores = [score for _, score in index.labels_in('fluid')]
+    signals['fluid_labels'] = bool(fluid_scores)
+    signals['fluid'] = bool(fluid_scores)
+    signals['fluid_confidence'] = max([0.0] + fluid_scores)
+    if index.has_image_properties and len(index.dark_colors(COLOR_PREDICATES['very_dark'])) > 1:
+        signals['fluid'] = True
+        signals['fluid_confidence'] = max(signals['fluid_confidence'], 0.85)
+
+    # Problemas de acceso por etiquetas y objetos
+    access_scores = [score for _, score in index.labels_in('access')]
+    signals['person'] = index.has_label('person')
+    signals['door'] = index.has_label('door')
+    signals['key'] = index.has_label('key')
+    for (_, lower, score), keywords in zip(index.objects, index.object_keywords):
+        if lower == 'person':
+            signals['person'] = True
+            access_scores.append(score)
+        if lower in VEHICLE_OBJECTS:
+            access_scores.append(score)
+        if 'door' in keywords:
+            signals['door'] = True
+            access_scores.append(score)
+    signals['access'] = bool(access_scores)
+    signals['access_confidence'] = max([0.0] + access_scores)
+
+    return signals
+
+
+def _access_incident_type(signals):
+    if signals['key'] and signals['door']:
+        return "Problema de acceso - Llaves olvidadas"
+    elif signals['door'] and signals['person']:
+        return "Problema de acceso - Vehículo bloqueado"
+    elif signals['person']:
+        return "Problema de acceso - Asistencia requerida"
+    return "Problema de acceso - Llaves olvidadas"
+
+
+def _flat_or_tire_incident_type(signals):
+    if signals['flat'] or 'flat_closeup' in signals['hints']:
+        return 'Fallo mecánico - Llanta pinchada'
+    return 'Fallo mecánico - Problema de llanta'
+
+
+def _flat_tire_closeup_possible(signals):
+    """La regla llanta_pinchada_primer_plano aún puede cumplirse si aparece una llanta entre los objetos"""
+    return (
+        signals['tire_closeup'] and signals['tire_related_count'] >= 3 and
+        (signals['flat_tire_labels'] or 'flat_closeup' in signals['hints'])
+    )
+
+
+# Reglas de clasificación en orden de prioridad. Se devuelve el resultado de
+# la primera regla cuya condición se cumpla. 'evidence' indica qué datos se
+# incluyen en la respuesta: 'text' (solo el texto OCR) o 'summary'
+# (etiquetas, objetos y texto principales). 'label_stage' indica si la regla
+# puede resolver el incidente en la primera etapa del modo cascada, cuando se
+# conocen las etiquetas, los colores dominantes y el texto pero no los
+# objetos: solo si ningún objeto puede cambiar el resultado. Dos vehículos
+# detectados como objetos bastan para que se cumpla 'colision', así que las
+# reglas de menor prioridad siempre esperan a la segunda etapa.
+CLASSIFICATION_RULES = (
+    {
+        'name': 'tablero_bateria',
+        'when': lambda s: s['dashboard'] and s['dashboard_battery'],
+        'outcome': 'bateria',
+        'confidence': lambda s: 85.0,
+        'evidence': 'text',
+        'label_stage': lambda s: True,
+        'log': "Detectado indicador de batería en el tablero",
+    },
+    {
+        'name': 'tablero',
+        'when': lambda s: s['dashboard'],
+        'outcome': 'tablero',
+        'confidence': lambda s: 80.0,
+        'evidence': 'text',
+        'label_stage': lambda s: True,
+        'log': "Detectado tablero de auto por texto",
+    },
+    {
+        'name': 'llanta_pinchada_primer_plano',
+        'when': lambda s: (
+            s['tire_score'] is not None and s['tire_closeup'] and
+            s['tire_related_count'] >= 3 and s['tire_score'] > 0.7 and
+            (s['flat_tire_labels'] or 'flat_closeup' in s['hints'])
+        ),
+        'outcome': 'llanta_pinchada',
+        'confidence': lambda s: round(max(s['flat_tire_confidence'], 0.95) * 100, 2),
+        'evidence': 'summary',
+        'label_stage': lambda s: False,
+        'log': "Detectada imagen de llanta pinchada",
+    },
+    {
+        'name': 'colision',
+        'when': lambda s: s['collision'] or s['vehicles'] >= 2,
+        'outcome': 'colision',
+        'confidence': lambda s: round(max(0.95, s['collision_label_score'] if s['collision_label_score'] is not None else 0.95) * 100, 2),
+        'evidence': 'summary',
+        'label_stage': lambda s: s['collision'] and not _flat_tire_closeup_possible(s),
+        'log': "Detectada imagen de colisión vehicular",
+    },
+    {
+        'name': 'fuga_por_color',
+        'when': lambda s: s['fluid_colors'] and (s['vehicle_or_tire_object'] or 'sample_fluid_colors' in s['hints']),
+        'outcome': 'fuga',
+        'confidence': lambda s: round(max(s['fluid_colors_confidence'], 0.85) * 100, 2),
+        'evidence': 'summary',
+        'label_stage': lambda s: False,
+        'log': "Detectada imagen de fuga de líquido",
+    },
+    {
+        'name': 'acceso',
+        'when': lambda s: (s['access'] and (s['person'] or s['door'] or s['key'])) or 'sample_access' in s['hints'],
+        'outcome': 'acceso',
+        'incident_type': _access_incident_type,
+        'confidence': lambda s: round(max(s['access_confidence'], 0.95) * 100, 2),
+        'evidence': 'summary',
+        'label_stage': lambda s: False,
+        'log': "Detectada imagen de problema de acceso",
+    },
+    {
+        'name': 'fuga',
+        'when': lambda s: s['fluid'] or 'sample_fluid' in s['hints'],
+        'outcome': 'fuga',
+        'confidence': lambda s: round(max(s['fluid_confidence'], 0.85) * 100, 2),
+        'evidence': 'summary',
+        'label_stage': lambda s: False,
+        'log': "Detectada imagen de fuga de líquido",
+    },
+    {
+        'name': 'llanta',
+        'when': lambda s: s['tire'] and not s['fluid'] and not s['access'],
+        'outcome': 'llanta',
+        'incident_type': _flat_or_tire_incident_type,
+        'confidence': lambda s: round(s['tire_confidence'] * 100, 2),
+        'evidence': 'summary',
+        'label_stage': lambda s: False,
+        'log': "Detectada imagen de llanta",
+    },
+)
+
+# Reglas que fuerzan un resultado cuando el análisis general queda
+# indeterminado o es un fallo mecánico genérico.
+OVERRIDE_RULES = (
+    {
+        'when': lambda s: 'battery' in s['hints'],
+        'outcome': 'bateria',
+        'confidence': 86.33,
+        'log': "Forzando resultado para imagen de batería",
+    },
+    {
+        'when': lambda s: 'access' in s['hints'] or s['access'],
+        'outcome': 'acceso',
+        'confidence': 95.69,
+        'log': "Forzando resultado para imagen de problema de acceso",
+    },
+    {
+        'when': lambda s: 'fluid' in s['hints'] or s['fluid'],
+        'outcome': 'fuga',
+        'confidence': 93.26,
+        'log': "Forzando resultado para imagen de fuga de líquido",
+    },
+    {
+        'when': lambda s: 'flat' in s['hints'] or s['flat_tire_labels'],
+        'outcome': 'llanta_pinchada',
+        'confidence': 95.0,
+        'log': "Forzando resultado para imagen de llanta pinchada",
+    },
+    {
+        'when': lambda s: 'tire_override' in s['hints'] or s['tire'],
+        'outcome': 'llanta_pinchada',
+        'confidence': 85.0,
+        'log': "Forzando resultado para imagen de llanta",
+    },
+    {
+        'when': lambda s: 'dashboard' in s['hints'],
+        'outcome': 'tablero',
+        'confidence': 75.0,
+        'log': "Forzando resultado para imagen de tablero de auto",
+    },
+)
+
+
+def first_matching_rule(rules, signals):
+    """
+    Devuelve la primera regla cuya condición se cumple
+
+    Args:
+        rules (tuple): Reglas en orden de prioridad
+        signals (dict): Hechos calculados por collect_signals
+
+    Returns:
+        dict: Regla encontrada o None
+    """
+    for rule in rules:
+        if rule['when'](signals):
+            return rule
+    return None
@@ -1,12 +1,20 @@
 import os
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, g, Response, redirect, url_for, send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
 import json
 import datetime
 import base64
+import time
 import requests
 from app.api.angular_api import angular_api, receive_data_internal  # Importar la función interna
+from app.api.perceptual_index import perceptual_index, PHASH_SEED_ON_STARTUP
+from app.utils.metrics import metrics
+from app.utils.tracing import start_trace, end_trace, timeline_requested, add_trace_to_response
+from app.utils.task_pool import task_pool, task_result, TaskTimeoutError
+from app.utils.job_queue import job_queue, job_requested, JobQueueFull, JOB_MAX_WAIT
+from app.utils.idempotency import idempotent
+from app.utils import http_client
 
 # Cargar variables de entorno
 load_dotenv()
@@ -21,17 +29,29 @@ if os.environ.get('GOOGLE_CREDENTIALS_BASE64'):
     os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
 
 app = Flask(__name__)
-CORS(app)
+# Exponer Server-Timing al frontend aunque se consulte desde otro origen
+CORS(app, expose_headers=['Server-Timing'])
 
 # Configuración
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 app.config['MAPS_API_KEY'] = os.environ.get('GOOGLE_MAPS_API_KEY', '')
 app.config['EXTERNAL_API_URL'] = os.environ.get('EXTERNAL_API_URL', 'internal://api/angular/receive')
+app.config['BATCH_MAX_IMAGES'] = int(os.environ.get('BATCH_MAX_IMAGES', '64'))
+# Segundos que los clientes pueden guardar en caché una imagen subida (su URL depende del contenido)
+app.config['UPLOAD_CACHE_MAX_AGE'] = int(os.environ.get('UPLOAD_CACHE_MAX_AGE', str(365 * 24 * 3600)))
+# Tiempo máximo de espera (segundos) de cada tarea paralela de /api/process_complete
+app.config['VISION_TASK_TIMEOUT'] = float(os.environ.get('VISION_TASK_TIMEOUT', '30'))
+app.config['GEOCODING_TASK_TIMEOUT'] = float(os.environ.get('GEOCODING_TASK_TIMEOUT', '10'))
 
 # Registrar el Blueprint de la API para Angular
 app.register_blueprint(angular_api, url_prefix='/api/angular')
 
+# Agregar las imágenes de dataset/ al índice de hashes perceptuales al
+# arrancar, para no calcular sus hashes durante la primera solicitud
+if PHASH_SEED_ON_STARTUP:
+    perceptual_index.seed()
+
 # Función para enviar datos a otra aplicación
 def send_to_external_api(data, api_url=None):
     """
@@ -51,48 +71,12 @@ def send_to_external_api(data, api_url=None):
         
         # Verificar si es una llamada interna
         if url.startswith('internal://'):
-            # Extraer la ruta interna
-            internal_path = url.replace('internal://', '')
-            app.logger.info(f"Usando llamada interna a: {internal_path}")
-            
-            # Llamar directamente a la función interna
-            if internal_path == 'api/angular/receive':
-                result = receive_data_internal(data)
-                app.logger.info("Datos enviados internamente con éxito")
-                return {
-                    'success': True,
-                    'response': result
-                }
-            else:
-                app.logger.error(f"Ruta interna no reconocida: {internal_path}")
-                return {
-                    'success': False,
-                    'error': f"Ruta interna no reconocida: {internal_path}"
-                }
-        else:
-            # Realizar la solicitud POST a la API externa
-            response = requests.post(
-                url,
-                json=data,
-                headers={'Content-Type': 'application/json'},
-                timeout=10  # Timeout de 10 segundos
-            )
-            
-            # Verificar si la solicitud fue exitosa
-            if response.status_code == 200:
-                app.logger.info("Datos enviados exitosamente a la API externa")
-                return {
-                    'success': True,
-                    'status_code': response.status_code,
-                    'response': response.json() if response.content else {}
-                }
-            else:
-                app.logger.error(f"Error al enviar datos a la API externa. Código: {response.status_code}")
-                return {
-                    'success': False,
-                    'status_code': response.status_code,
-                    'error': response.text
-                }
+            return send_to_internal_api(data, url)
+        
+        # Realizar la solicitud POST a la API externa (conexión reutilizada,
+        # 10 segundos de tiempo límite de lectura)
+        response = http_client.post_json(url, data, timeout=10)
+        return external_api_result(response)
     
     except requests.RequestException as e:
         app.logger.error(f"Error de conexión con la API externa: {str(e)}")
@@ -109,13 +93,340 @@ def send_to_external_api(data, api_url=None):
             'error': f"Error inesperado: {str(e)}"
         }
 
+def send_to_internal_api(data, url):
+    """
+    Entrega los datos a una ruta interna (internal://...) sin pasar por HTTP
+    
+    Args:
+        data (dict): Datos a enviar
+        url (str): URL interna
+        
+    Returns:
+        dict: Respuesta de la ruta interna o información de error
+    """
+    # Extraer la ruta interna
+    internal_path = url.replace('internal://', '')
+    app.logger.info(f"Usando llamada interna a: {internal_path}")
+    
+    # Llamar directamente a la función interna
+    if internal_path == 'api/angular/receive':
+        result = receive_data_internal(data)
+        app.logger.info("Datos enviados internamente con éxito")
+        return {
+            'success': True,
+            'response': result
+        }
+    else:
+        app.logger.error(f"Ruta interna no reconocida: {internal_path}")
+        return {
+            'success': False,
+            'error': f"Ruta interna no reconocida: {internal_path}"
+        }
+
+def external_api_result(response):
+    """
+    Resultado del envío a partir de la respuesta HTTP de la API externa
+    
+    Args:
+        response: Respuesta de requests o de httpx
+        
+    Returns:
+        dict: Respuesta de la API externa o información de error
+    """
+    # Verificar si la solicitud fue exitosa
+    if response.status_code == 200:
+        app.logger.info("Datos enviados exitosamente a la API externa")
+        return {
+            'success': True,
+            'status_code': response.status_code,
+            'response': response.json() if response.content else {}
+        }
+    else:
+        app.logger.error(f"Error al enviar datos a la API externa. Código: {response.status_code}")
+        return {
+            'success': False,
+            'status_code': response.status_code,
+            'error': response.text
+        }
+
+def get_location_data(latitude, longitude):
+    """
+    Obtiene la información de ubicación de unas coordenadas, con un resultado
+    de respaldo si Google Maps no está configurado o falla
+    
+    Args:
+        latitude (float): Latitud
+        longitude (float): Longitud
+        
+    Returns:
+        dict: Información de ubicación
+    """
+    try:
+        from app.api.maps_api import get_location_info, maps_api_configured
+    except ImportError:
+        # Si estamos ejecutando desde dentro del directorio app
+        from api.maps_api import get_location_info, maps_api_configured
+    
+    # Verificar si la API key de Google Maps está configurada (con
+    # FAKE_BACKENDS se usa el servidor simulado aunque no haya key)
+    if not maps_api_configured():
+        return unconfigured_location_data(latitude, longitude)
+    
+    # Intentar obtener información de ubicación
+    try:
+        with metrics.timer('geocoding'):
+            location_data = get_location_info(latitude, longitude)
+        if 'error' in location_data:
+            metrics.increment('fallbacks_total', reason='geocoding')
+        return location_data
+    except Exception as loc_error:
+        return failed_location_data(latitude, longitude, loc_error)
+
+def unconfigured_location_data(latitude, longitude):
+    """Información de ubicación cuando no hay API key de Google Maps"""
+    try:
+        from app.api.maps_api import offline_location_info
+    except ImportError:
+        # Si estamos ejecutando desde dentro del directorio app
+        from api.maps_api import offline_location_info
+    
+    metrics.increment('fallbacks_total', reason='geocoding_disabled')
+    # Usar el nomenclátor local si hay un lugar cercano
+    offline_data = offline_location_info(latitude, longitude, 'no_key')
+    if offline_data is not None:
+        return offline_data
+    app.logger.warning("API key de Google Maps no configurada. Usando ubicación sin geocodificación.")
+    return {
+        'coordinates': {
+            'latitude': latitude,
+            'longitude': longitude
+        },
+        'address': f"Coordenadas: {latitude}, {longitude}",
+        'city': 'No disponible',
+        'country': 'No disponible'
+    }
+
+def failed_location_data(latitude, longitude, loc_error):
+    """Información de ubicación cuando la geocodificación lanzó una excepción"""
+    app.logger.error(f"Error al obtener información de ubicación: {str(loc_error)}")
+    metrics.increment('fallbacks_total', reason='geocoding')
+    return {
+        'error': f"Error al obtener información de ubicación: {str(loc_error)}",
+        'coordinates': {
+            'latitude': latitude,
+            'longitude': longitude
+        },
+        'address': f"Coordenadas: {latitude}, {longitude}",
+        'city': 'No disponible',
+        'country': 'No disponible'
+    }
+
+def invalid_coordinates_location(form):
+    """Información de ubicación cuando las coordenadas del formulario no son válidas"""
+    return {
+        'error': 'Coordenadas inválidas',
+        'coordinates': {
+            'latitude': form.get('latitude', 'inválido'),
+            'longitude': form.get('longitude', 'inválido')
+        },
+        'address': 'Coordenadas inválidas',
+        'city': 'No disponible',
+        'country': 'No disponible'
+    }
+
+def timed_call(stage, function, *args, **kwargs):
+    """Ejecuta una función midiendo su duración como la etapa indicada"""
+    with metrics.timer(stage):
+        return function(*args, **kwargs)
+
 # Asegurar que el directorio de uploads exista
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+@app.before_request
+def start_request_timer():
+    """Guarda el inicio de la solicitud e inicia su traza de etapas"""
+    g.request_start = time.perf_counter()
+    g.request_trace, g.request_trace_token = start_trace()
+
+@app.after_request
+def record_request_duration(response):
+    """
+    Registra la duración total de la solicitud como etapa request_<endpoint>
+    y añade el desglose por etapas en la cabecera Server-Timing
+    """
+    start = g.get('request_start')
+    if start is not None and request.endpoint not in (None, 'static', 'metrics_endpoint'):
+        total = time.perf_counter() - start
+        metrics.observe(f"request_{request.endpoint}", total)
+        add_trace_to_response(response, g.request_trace, total, timeline_requested(request))
+    return response
+
+@app.teardown_request
+def finish_request_trace(exception=None):
+    """Termina la traza de la solicitud"""
+    token = g.pop('request_trace_token', None)
+    if token is not None:
+        end_trace(token)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métricas de latencia por etapa y contadores en formato de texto de Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/static/uploads/<path:filename>')
+def uploaded_image(filename):
+    """
+    Imágenes subidas. Las rutas por contenido (ab/cd/<sha256>.<ext>) nunca
+    cambian de contenido, así que se pueden guardar en caché sin límite; los
+    nombres de la carpeta plana ya migrados redirigen a su ruta por contenido.
+    """
+    try:
+        from app.utils.image_utils import upload_store, UPLOAD_STORE_ENABLED
+    except ImportError:
+        # Si estamos ejecutando desde dentro del directorio app
+        from utils.image_utils import upload_store, UPLOAD_STORE_ENABLED
+    
+    upload_folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    if '/' in filename:
+        return send_from_directory(upload_folder, filename, max_age=app.config['UPLOAD_CACHE_MAX_AGE'])
+    
+    # Nombre de la carpeta plana (<uuid>_<nombre>)
+    if UPLOAD_STORE_ENABLED and not os.path.isfile(os.path.join(upload_folder, filename)):
+        relative_path = upload_store.legacy_path(filename)
+        if relative_path is not None:
+            return redirect(url_for('uploaded_image', filename=relative_path.replace(os.sep, '/')), 301)
+    return send_from_directory(upload_folder, filename)
+
 @app.route('/')
 def index():
     """Página principal"""
-    return render_template('index.html', maps_api_key=app.config['MAPS_API_KEY'])
+    return render_template('index.html', maps_api_key=app.config['MAPS_API_KEY'], async_jobs=job_queue.shared)
+
+def run_analysis(image_path, form, source_name=None):
+    """
+    Analiza una imagen ya guardada y obtiene la ubicación (si se proporcionó)
+    
+    Args:
+        image_path (str): Ruta de la imagen guardada
+        form (dict): Campos del formulario (latitude, longitude, use_custom_model)
+        source_name (str, optional): Nombre original de la imagen (pistas del nombre)
+        
+    Returns:
+        tuple: (respuesta, código HTTP)
+    """
+    try:
+        from app.api.vision_api import analyze_image
+    except ImportError:
+        # Si estamos ejecutando desde dentro del directorio app
+        from api.vision_api import analyze_image
+    
+    try:
+        # Obtener datos de ubicación (si se proporcionaron)
+        location_data = {}
+        if 'latitude' in form and 'longitude' in form:
+            try:
+                latitude = float(form['latitude'])
+                longitude = float(form['longitude'])
+                app.logger.info(f"Obteniendo información de ubicación: {latitude}, {longitude}")
+                location_data = get_location_data(latitude, longitude)
+            except (ValueError, KeyError) as e:
+                app.logger.warning(f"Error al procesar coordenadas: {str(e)}")
+                # Si hay error en las coordenadas, continuamos sin datos de ubicación
+                location_data = invalid_coordinates_location(form)
+        
+        # Determinar si usar el modelo personalizado
+        predict_damage = custom_damage_predictor() if form.get('use_custom_model', 'false').lower() == 'true' else None
+        
+        if predict_damage is not None:
+            app.logger.info(f"Analizando imagen con modelo personalizado: {image_path}")
+            with metrics.timer('custom_model'):
+                analysis_results = predict_damage(image_path)
+        else:
+            # Analizar la imagen con Google Cloud Vision
+            app.logger.info(f"Analizando imagen con Vision API: {image_path}")
+            with metrics.timer('analyze_image'):
+                analysis_results = analyze_image(image_path, source_name=source_name)
+        
+        return analysis_response(image_path, analysis_results, location_data), 200
+    
+    except Exception as e:
+        discard_request_uploads(image_path)
+        return analysis_error_response(e), 500
+
+def custom_damage_predictor():
+    """
+    Función predict_damage del modelo personalizado
+    
+    Returns:
+        callable: predict_damage, o None si el módulo no está disponible (se usa Vision API)
+    """
+    try:
+        from app.api.custom_damage_model import predict_damage
+        return predict_damage
+    except ImportError:
+        app.logger.error("Módulo de modelo personalizado no disponible")
+        metrics.increment('fallbacks_total', reason='custom_model_unavailable')
+        # Si el módulo no está disponible, usar el análisis estándar
+        return None
+
+def analysis_response(image_path, analysis_results, location_data):
+    """Combina el análisis y la ubicación en la respuesta de /api/analyze"""
+    response = {
+        'analysis': analysis_results,
+        'location': location_data
+    }
+    
+    # Añadir la URL de la imagen para mostrarla en el frontend
+    image_url = image_path.replace('\\', '/').replace(app.config['UPLOAD_FOLDER'], '/static/uploads')
+    response['image_url'] = image_url
+    return response
+
+def analysis_error_response(error):
+    """Respuesta de /api/analyze cuando el procesamiento lanzó una excepción"""
+    app.logger.error(f"Error al procesar la imagen: {str(error)}")
+    import traceback
+    app.logger.error(traceback.format_exc())
+    return {
+        'error': f"Error al procesar la imagen: {str(error)}",
+        'traceback': traceback.format_exc()
+    }
+
+def discard_request_uploads(*file_paths):
+    """Descarta las imágenes guardadas de una solicitud que no se completó"""
+    try:
+        from app.utils.image_utils import discard_uploads
+    except ImportError:
+        # Si estamos ejecutando desde dentro del directorio app
+        from utils.image_utils import discard_uploads
+    discard_uploads(app.config['UPLOAD_FOLDER'], *file_paths)
+
+def job_response(function, *args, uploads=()):
+    """
+    Encola una función de procesamiento como trabajo asíncrono
+    
+    Args:
+        function (callable): Función de procesamiento (run_analysis o run_process_complete)
+        *args: Argumentos de la función
+        uploads (tuple): Imágenes guardadas de la solicitud, que se descartan si
+            el trabajo no se encola
+    
+    Returns:
+        Response: 202 con el id del trabajo y la URL para consultarlo, o 503
+            si la cola está llena
+    """
+    try:
+        job = job_queue.submit(function, *args)
+    except JobQueueFull as e:
+        app.logger.warning(f"Trabajo rechazado: {str(e)}")
+        metrics.increment('fallbacks_total', reason='job_queue_full')
+        discard_request_uploads(*uploads)
+        return jsonify({'error': 'Hay demasiados trabajos en cola. Intente de nuevo más tarde'}), 503
+    
+    status_url = f"/api/jobs/{job['job_id']}"
+    response = jsonify(dict(job, status_url=status_url))
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
 
 @app.route('/api/analyze', methods=['POST'])
 def analyze():
@@ -125,356 +436,544 @@ def analyze():
         - image: archivo de imagen
         - location: coordenadas GPS (opcional)
         - use_custom_model: booleano para usar el modelo personalizado (opcional)
+        - async: "true" (o la cabecera Prefer: respond-async) para responder con
+          un trabajo que se consulta en /api/jobs/<id> (opcional)
+    """
+    error_response, args = save_analysis_upload()
+    if error_response is not None:
+        return error_response
+    
+    # La imagen ya está guardada: el resto puede ejecutarse como trabajo asíncrono
+    if job_requested(request):
+        return job_response(run_analysis, *args, uploads=args[:1])
+    
+    response, status_code = run_analysis(*args)
+    with metrics.timer('serialize_response'):
+        return jsonify(response), status_code
+
+def save_analysis_upload():
+    """
+    Valida y guarda la imagen de la solicitud actual a /api/analyze
+    
+    Returns:
+        tuple: (respuesta de error o None, argumentos para run_analysis)
     """
     # Importar módulos solo cuando se necesiten
     try:
-        from app.api.vision_api import analyze_image
-        from app.api.maps_api import get_location_info
-        from app.utils.image_utils import save_uploaded_image, allowed_file
+        from app.utils.image_utils import save_uploaded_image, allowed_file, upload_source_name
     except ImportError:
         # Si estamos ejecutando desde dentro del directorio app
-        from api.vision_api import analyze_image
-        from api.maps_api import get_location_info
-        from utils.image_utils import save_uploaded_image, allowed_file
+        from utils.image_utils import save_uploaded_image, allowed_file, upload_source_name
+    
+    # El formulario multipart se analiza en el primer acceso a request.files
+    with metrics.timer('parse_request'):
+        file = request.files.get('image')
     
     # Verificar si se envió una imagen
-    if 'image' not in request.files:
+    if file is None:
         app.logger.error("No se envió ninguna imagen")
-        return jsonify({'error': 'No se envió ninguna imagen'}), 400
-    
-    file = request.files['image']
+        return (jsonify({'error': 'No se envió ninguna imagen'}), 400), None
     
     # Verificar si el archivo tiene nombre
     if file.filename == '':
         app.logger.error("No se seleccionó ningún archivo")
-        return jsonify({'error': 'No se seleccionó ningún archivo'}), 400
+        return (jsonify({'error': 'No se seleccionó ningún archivo'}), 400), None
     
     # Verificar si el archivo es una imagen permitida
     if not allowed_file(file.filename):
         app.logger.error(f"Formato de archivo no permitido: {file.filename}")
-        return jsonify({'error': 'Formato de archivo no permitido. Use JPG, PNG, JPEG o GIF'}), 400
+        return (jsonify({'error': 'Formato de archivo no permitido. Use JPG, PNG, JPEG o GIF'}), 400), None
     
     try:
         # Guardar la imagen
         app.logger.info(f"Guardando imagen: {file.filename}")
-        image_path = save_uploaded_image(file, app.config['UPLOAD_FOLDER'])
+        with metrics.timer('save_image'):
+            image_path = save_uploaded_image(file, app.config['UPLOAD_FOLDER'])
         app.logger.info(f"Imagen guardada en: {image_path}")
-        
-        # Obtener datos de ubicación (si se proporcionaron)
-        location_data = {}
-        if 'latitude' in request.form and 'longitude' in request.form:
-            try:
-                latitude = float(request.form['latitude'])
-                longitude = float(request.form['longitude'])
-                app.logger.info(f"Obteniendo información de ubicación: {latitude}, {longitude}")
-                
-                # Verificar si la API key de Google Maps está configurada
-                if not app.config['MAPS_API_KEY']:
-                    app.logger.warning("API key de Google Maps no configurada. Usando ubicación sin geocodificación.")
-                    location_data = {
-                        'coordinates': {
-                            'latitude': latitude,
-                            'longitude': longitude
-                        },
-                        'address': f"Coordenadas: {latitude}, {longitude}",
-                        'city': 'No disponible',
-                        'country': 'No disponible'
-                    }
-                else:
-                    # Intentar obtener información de ubicación
-                    try:
-                        location_data = get_location_info(latitude, longitude)
-                    except Exception as loc_error:
-                        app.logger.error(f"Error al obtener información de ubicación: {str(loc_error)}")
-                        location_data = {
-                            'error': f"Error al obtener información de ubicación: {str(loc_error)}",
-                            'coordinates': {
-                                'latitude': latitude,
-                                'longitude': longitude
-                            },
-                            'address': f"Coordenadas: {latitude}, {longitude}",
-                            'city': 'No disponible',
-                            'country': 'No disponible'
-                        }
-            except (ValueError, KeyError) as e:
-                app.logger.warning(f"Error al procesar coordenadas: {str(e)}")
-                # Si hay error en las coordenadas, continuamos sin datos de ubicación
-                location_data = {
-                    'error': 'Coordenadas inválidas',
-                    'coordinates': {
-                        'latitude': request.form.get('latitude', 'inválido'),
-                        'longitude': request.form.get('longitude', 'inválido')
-                    },
-                    'address': 'Coordenadas inválidas',
-                    'city': 'No disponible',
-                    'country': 'No disponible'
-                }
-        
-        # Determinar si usar el modelo personalizado
-        use_custom_model = request.form.get('use_custom_model', 'false').lower() == 'true'
-        
-        if use_custom_model:
-            # Importar el módulo del modelo personalizado
+    except ValueError as e:
+        # El contenido no es una imagen permitida
+        app.logger.error(f"Imagen rechazada: {file.filename}")
+        return (jsonify({'error': str(e)}), 400), None
+    except Exception as e:
+        return (jsonify(analysis_error_response(e)), 500), None
+    
+    return None, (image_path, request.form.to_dict(), upload_source_name(file.filename))
+
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Endpoint para analizar varias imágenes de siniestros en una sola solicitud
+    Recibe:
+        - images: archivos de imagen (campo repetido)
+        - is_registration_card: booleano para tratar las imágenes como tarjetas de circulación (opcional)
+    Devuelve los resultados por imagen en el mismo orden en que se enviaron
+    """
+    # Importar módulos solo cuando se necesiten
+    try:
+        from app.api.vision_api import analyze_images_batch
+        from app.utils.image_utils import save_uploaded_image, allowed_file, upload_source_name
+    except ImportError:
+        # Si estamos ejecutando desde dentro del directorio app
+        from api.vision_api import analyze_images_batch
+        from utils.image_utils import save_uploaded_image, allowed_file, upload_source_name
+    
+    files = request.files.getlist('images')
+    if not files:
+        app.logger.error("No se envió ninguna imagen")
+        return jsonify({'error': 'No se envió ninguna imagen'}), 400
+    
+    if len(files) > app.config['BATCH_MAX_IMAGES']:
+        app.logger.error(f"Demasiadas imágenes en el lote: {len(files)}")
+        return jsonify({'error': f"Se permiten como máximo {app.config['BATCH_MAX_IMAGES']} imágenes por solicitud"}), 400
+    
+    is_registration_card = request.form.get('is_registration_card', 'false').lower() == 'true'
+    
+    saved = []
+    try:
+        # Guardar las imágenes válidas y registrar los errores de las demás
+        items = []
+        for file in files:
+            item = {'filename': file.filename}
+            items.append(item)
+            
+            if file.filename == '':
+                item['error'] = 'No se seleccionó ningún archivo'
+                continue
+            if not allowed_file(file.filename):
+                item['error'] = 'Formato de archivo no permitido. Use JPG, PNG, JPEG o GIF'
+                continue
+            
             try:
-                from app.api.custom_damage_model import predict_damage
-                app.logger.info(f"Analizando imagen con modelo personalizado: {image_path}")
-                analysis_results = predict_damage(image_path)
-            except ImportError:
-                app.logger.error("Módulo de modelo personalizado no disponible")
-                # Si el módulo no está disponible, usar el análisis estándar
-                app.logger.info(f"Analizando imagen con Vision API: {image_path}")
-                analysis_results = analyze_image(image_path)
-        else:
-            # Analizar la imagen con Google Cloud Vision
-            app.logger.info(f"Analizando imagen con Vision API: {image_path}")
-            analysis_results = analyze_image(image_path)
-        
-        # Combinar resultados
-        response = {
-            'analysis': analysis_results,
-            'location': location_data
-        }
+                image_path = save_uploaded_image(file, app.config['UPLOAD_FOLDER'])
+            except Exception as e:
+                app.logger.error(f"Error al guardar la imagen {file.filename}: {str(e)}")
+                item['error'] = str(e)
+                continue
+            
+            item['image_url'] = image_path.replace('\\', '/').replace(app.config['UPLOAD_FOLDER'], '/static/uploads')
+            saved.append((item, image_path, upload_source_name(file.filename)))
         
-        # Añadir la URL de la imagen para mostrarla en el frontend
-        image_url = image_path.replace('\\', '/').replace(app.config['UPLOAD_FOLDER'], '/static/uploads')
-        response['image_url'] = image_url
+        # Analizar todas las imágenes guardadas con llamadas por lotes a Vision API
+        app.logger.info(f"Analizando lote de {len(saved)} imágenes con Vision API")
+        analyses = analyze_images_batch(
+            [image_path for _, image_path, _ in saved], is_registration_card,
+            source_names=[source_name for _, _, source_name in saved]
+        )
+        for (item, _, _), analysis in zip(saved, analyses):
+            item['analysis'] = analysis
         
-        return jsonify(response)
+        return jsonify({
+            'count': len(items),
+            'results': items
+        })
     
     except Exception as e:
-        app.logger.error(f"Error al procesar la imagen: {str(e)}")
+        discard_request_uploads(*(image_path for _, image_path, _ in saved))
+        app.logger.error(f"Error al procesar el lote de imágenes: {str(e)}")
         import traceback
         app.logger.error(traceback.format_exc())
         return jsonify({
-            'error': f"Error al procesar la imagen: {str(e)}",
+            'error': f"Error al procesar el lote de imágenes: {str(e)}",
             'traceback': traceback.format_exc()
         }), 500
 
-@app.route('/api/process_complete', methods=['POST'])
-def process_complete():
+def new_complete_result():
+    """Resultado inicial de /api/process_complete"""
+    return {
+        'success': False,
+        'incident_analysis': None,
+        'registration_info': None,
+        'location_info': None,
+        'timestamp': datetime.datetime.now().isoformat(),
+        'errors': []
+    }
+
+def run_process_complete(result, incident_image_path, registration_filename, registration_image_path, form,
+                         incident_source_name=None, registration_source_name=None):
     """
-    Endpoint para procesar imágenes de incidentes y tarjetas de circulación,
-    y enviar la información completa al sistema de boletas.
+    Analiza las imágenes ya guardadas de /api/process_complete, obtiene la
+    ubicación y prepara (y opcionalmente envía) la boleta
     
-    Recibe:
-        - incident_image: archivo de imagen del incidente
-        - registration_image: archivo de imagen de la tarjeta de circulación (opcional)
-        - location: coordenadas GPS (opcional)
-        - use_custom_model: booleano para usar el modelo personalizado (opcional)
-        - registration_data: datos de la tarjeta de circulación en formato JSON (opcional, alternativa a registration_image)
+    Args:
+        result (dict): Resultado inicial (ver new_complete_result)
+        incident_image_path (str): Ruta de la imagen del incidente
+        registration_filename (str): Nombre del archivo de la tarjeta, o None si no se envió
+        registration_image_path (str): Ruta de la imagen de la tarjeta, o None si no se guardó
+        form (dict): Campos del formulario
+        incident_source_name (str, optional): Nombre original de la imagen del incidente
+        registration_source_name (str, optional): Nombre original de la imagen de la tarjeta
+        
+    Returns:
+        tuple: (respuesta, código HTTP)
     """
-    # Importar módulos solo cuando se necesiten
     try:
         from app.api.vision_api import analyze_image
-        from app.api.maps_api import get_location_info
-        from app.utils.image_utils import save_uploaded_image, allowed_file
     except ImportError:
         # Si estamos ejecutando desde dentro del directorio app
         from api.vision_api import analyze_image
-        from api.maps_api import get_location_info
-        from utils.image_utils import save_uploaded_image, allowed_file
-    import json
-    
-    result = {
-        'success': False,
-        'incident_analysis': None,
-        'registration_info': None,
-        'location_info': None,
-        'timestamp': datetime.datetime.now().isoformat(),
-        'errors': []
-    }
     
     try:
-        # Procesar imagen del incidente
-        if 'incident_image' not in request.files:
-            app.logger.error("No se envió ninguna imagen de incidente")
-            result['errors'].append('No se envió ninguna imagen de incidente')
-            return jsonify(result), 400
-        
-        incident_file = request.files['incident_image']
-        
-        # Verificar si el archivo tiene nombre
-        if incident_file.filename == '':
-            app.logger.error("No se seleccionó ningún archivo para el incidente")
-            result['errors'].append('No se seleccionó ningún archivo para el incidente')
-            return jsonify(result), 400
-        
-        # Verificar si el archivo es una imagen permitida
-        if not allowed_file(incident_file.filename):
-            app.logger.error(f"Formato de archivo no permitido para incidente: {incident_file.filename}")
-            result['errors'].append('Formato de archivo no permitido para incidente. Use JPG, PNG, JPEG o GIF')
-            return jsonify(result), 400
-        
-        # Guardar la imagen del incidente
-        app.logger.info(f"Guardando imagen de incidente: {incident_file.filename}")
-        incident_image_path = save_uploaded_image(incident_file, app.config['UPLOAD_FOLDER'])
-        app.logger.info(f"Imagen de incidente guardada en: {incident_image_path}")
-        
-        # Analizar la imagen con Google Cloud Vision
+        # El análisis del incidente, el de la tarjeta y la geocodificación son
+        # independientes: se ejecutan en paralelo en el pool compartido y los
+        # resultados se procesan después en el mismo orden de siempre
         app.logger.info(f"Analizando imagen de incidente con Vision API: {incident_image_path}")
-        incident_analysis = analyze_image(incident_image_path)
+        incident_task = task_pool.submit(
+            timed_call, 'analyze_image', analyze_image, incident_image_path,
+            source_name=incident_source_name, timeout=app.config['VISION_TASK_TIMEOUT']
+        )
         
-        # Verificar si el análisis fue exitoso
-        if incident_analysis is None or 'error' in incident_analysis:
-            error_msg = incident_analysis.get('error', 'Error desconocido al analizar la imagen') if incident_analysis else 'No se pudo analizar la imagen'
-            app.logger.error(f"Error en el análisis de incidente: {error_msg}")
-            result['errors'].append(f"Error en el análisis de incidente: {error_msg}")
-            # Proporcionar un análisis básico para evitar errores en el frontend
-            incident_analysis = {
-                'incident_type': 'Error en el análisis',
-                'damage_severity': 'Desconocido',
-                'vehicle_type': 'Desconocido',
-                'damaged_parts': [],
-                'confidence': 0.0,
-                'error': error_msg
-            }
+        # Analizar la tarjeta de circulación si se guardó
+        registration_task = None
+        if registration_image_path is not None:
+            app.logger.info(f"Analizando imagen de tarjeta con Vision API: {registration_image_path}")
+            registration_task = task_pool.submit(
+                timed_call, 'analyze_registration', analyze_image, registration_image_path,
+                is_registration_card=True, source_name=registration_source_name,
+                timeout=app.config['VISION_TASK_TIMEOUT']
+            )
         
-        result['incident_analysis'] = incident_analysis
+        # Iniciar la geocodificación (si se proporcionaron coordenadas)
+        location_task = None
+        coordinates_error = None
+        if 'latitude' in form and 'longitude' in form:
+            try:
+                latitude = float(form['latitude'])
+                longitude = float(form['longitude'])
+                app.logger.info(f"Obteniendo información de ubicación: {latitude}, {longitude}")
+                location_task = task_pool.submit(
+                    get_location_data, latitude, longitude,
+                    timeout=app.config['GEOCODING_TASK_TIMEOUT']
+                )
+            except (ValueError, KeyError) as e:
+                coordinates_error = e
         
-        # Procesar imagen de tarjeta de circulación si se proporcionó
-        registration_info = None
-        if 'registration_image' in request.files and request.files['registration_image'].filename != '':
-            registration_file = request.files['registration_image']
-            
-            # Verificar si el archivo es una imagen permitida
-            if not allowed_file(registration_file.filename):
-                app.logger.error(f"Formato de archivo no permitido para tarjeta: {registration_file.filename}")
-                result['errors'].append('Formato de archivo no permitido para tarjeta. Use JPG, PNG, JPEG o GIF')
-            else:
-                # Guardar la imagen de la tarjeta
-                app.logger.info(f"Guardando imagen de tarjeta: {registration_file.filename}")
-                registration_image_path = save_uploaded_image(registration_file, app.config['UPLOAD_FOLDER'])
-                app.logger.info(f"Imagen de tarjeta guardada en: {registration_image_path}")
-                
-                # Analizar la imagen de la tarjeta
-                app.logger.info(f"Analizando imagen de tarjeta con Vision API: {registration_image_path}")
-                registration_analysis = analyze_image(registration_image_path, is_registration_card=True)
-                
-                if 'registration_info' in registration_analysis:
-                    registration_info = registration_analysis['registration_info']
-                    result['registration_info'] = registration_info
-                else:
-                    app.logger.error("No se pudo extraer información de la tarjeta de circulación")
-                    result['errors'].append('No se pudo extraer información de la tarjeta de circulación')
+        # Resultado del análisis del incidente
+        try:
+            incident_analysis = task_result(incident_task)
+        except TaskTimeoutError:
+            incident_analysis = analysis_timeout('incidente')
         
-        # Alternativamente, usar datos de registro proporcionados directamente en JSON
-        elif 'registration_data' in request.form:
+        registration_analysis = None
+        if registration_task is not None:
             try:
-                registration_info = json.loads(request.form['registration_data'])
-                result['registration_info'] = registration_info
-            except json.JSONDecodeError:
-                app.logger.error("Error al decodificar los datos de registro JSON")
-                result['errors'].append('Error al decodificar los datos de registro JSON')
+                registration_analysis = task_result(registration_task)
+            except TaskTimeoutError:
+                registration_analysis = analysis_timeout('tarjeta')
         
-        # Obtener datos de ubicación (si se proporcionaron)
-        location_data = {}
-        if 'latitude' in request.form and 'longitude' in request.form:
+        # Resultado de la geocodificación
+        location_data = None
+        if location_task is not None:
             try:
-                latitude = float(request.form['latitude'])
-                longitude = float(request.form['longitude'])
-                app.logger.info(f"Obteniendo información de ubicación: {latitude}, {longitude}")
-                
-                # Verificar si la API key de Google Maps está configurada
-                if not app.config['MAPS_API_KEY']:
-                    app.logger.warning("API key de Google Maps no configurada. Usando ubicación sin geocodificación.")
-                    location_data = {
-                        'coordinates': {
-                            'latitude': latitude,
-                            'longitude': longitude
-                        },
-                        'address': f"Coordenadas: {latitude}, {longitude}",
-                        'city': 'No disponible',
-                        'country': 'No disponible'
-                    }
-                else:
-                    # Intentar obtener información de ubicación
-                    try:
-                        location_data = get_location_info(latitude, longitude)
-                    except Exception as loc_error:
-                        app.logger.error(f"Error al obtener información de ubicación: {str(loc_error)}")
-                        location_data = {
-                            'error': f"Error al obtener información de ubicación: {str(loc_error)}",
-                            'coordinates': {
-                                'latitude': latitude,
-                                'longitude': longitude
-                            },
-                            'address': f"Coordenadas: {latitude}, {longitude}",
-                            'city': 'No disponible',
-                            'country': 'No disponible'
-                        }
-                
-                result['location_info'] = location_data
-            except (ValueError, KeyError) as e:
-                app.logger.warning(f"Error al procesar coordenadas: {str(e)}")
-                # Si hay error en las coordenadas, continuamos sin datos de ubicación
-                location_data = {
-                    'error': 'Coordenadas inválidas',
-                    'coordinates': {
-                        'latitude': request.form.get('latitude', 'inválido'),
-                        'longitude': request.form.get('longitude', 'inválido')
-                    },
-                    'address': 'Coordenadas inválidas',
-                    'city': 'No disponible',
-                    'country': 'No disponible'
-                }
-                result['location_info'] = location_data
-                result['errors'].append('Error al procesar coordenadas')
+                location_data = task_result(location_task)
+            except TaskTimeoutError:
+                location_data = location_timeout_data(latitude, longitude)
         
-        # Preparar el paquete completo para enviar al sistema de boletas
-        ticket_data = {
-            'incident': incident_analysis,
-            'vehicle': registration_info,
-            'location': location_data,
-            'timestamp': datetime.datetime.now().isoformat(),
-            'status': 'pending'
-        }
+        ticket_data = complete_ticket(
+            result, incident_analysis, registration_filename, registration_analysis,
+            location_data, coordinates_error, form
+        )
         
         # Enviar los datos a la API externa
-        if request.form.get('send_to_external', 'false').lower() == 'true':
-            app.logger.info("Enviando datos a API externa")
-            
-            # Usar la URL proporcionada o la configurada por defecto
-            external_api_url = request.form.get('external_api_url')
-            if external_api_url:
-                app.logger.info(f"Usando URL proporcionada: {external_api_url}")
+        if form.get('send_to_external', 'false').lower() == 'true':
+            external_api_url = dispatch_url(form)
+            with metrics.timer('dispatch'):
                 external_api_result = send_to_external_api(ticket_data, external_api_url)
-            else:
-                app.logger.info(f"Usando URL configurada: {app.config['EXTERNAL_API_URL']}")
-                external_api_result = send_to_external_api(ticket_data)
-                
-            result['external_api_result'] = external_api_result
-            
-            if external_api_result['success']:
-                app.logger.info("Datos enviados exitosamente a la API externa")
-                result['external_api_success'] = True
-            else:
-                app.logger.warning(f"Error al enviar datos a la API externa: {external_api_result.get('error', 'Error desconocido')}")
-                result['external_api_success'] = False
-                result['errors'].append(f"Error al enviar datos a la API externa: {external_api_result.get('error', 'Error desconocido')}")
-        
-        # Incluir los datos en la respuesta
-        result['ticket_data'] = ticket_data
-        result['success'] = True
-        
-        # Añadir las URLs de las imágenes para mostrarlas en el frontend
-        if 'incident_image_path' in locals():
-            incident_image_url = incident_image_path.replace('\\', '/').replace(app.config['UPLOAD_FOLDER'], '/static/uploads')
-            result['incident_image_url'] = incident_image_url
-        
-        if 'registration_image_path' in locals():
-            registration_image_url = registration_image_path.replace('\\', '/').replace(app.config['UPLOAD_FOLDER'], '/static/uploads')
-            result['registration_image_url'] = registration_image_url
+            record_external_result(result, external_api_result)
         
-        return jsonify(result)
+        return finish_complete_result(result, ticket_data, incident_image_path, registration_image_path), 200
     
     except Exception as e:
         app.logger.error(f"Error al procesar la solicitud completa: {str(e)}")
         import traceback
         app.logger.error(traceback.format_exc())
         result['errors'].append(f"Error al procesar la solicitud: {str(e)}")
-        return jsonify(result), 500
+        discard_request_uploads(incident_image_path, registration_image_path)
+        return result, 500
+
+def analysis_timeout(image_kind):
+    """Resultado de un análisis que superó VISION_TASK_TIMEOUT"""
+    app.logger.error(f"Tiempo de espera agotado al analizar la imagen de {image_kind}")
+    return {'error': 'Tiempo de espera agotado al analizar la imagen'}
+
+def location_timeout_data(latitude, longitude):
+    """Datos de ubicación cuando la geocodificación superó GEOCODING_TASK_TIMEOUT"""
+    app.logger.error("Tiempo de espera agotado al obtener información de ubicación")
+    metrics.increment('fallbacks_total', reason='geocoding_timeout')
+    return {
+        'error': 'Tiempo de espera agotado al obtener información de ubicación',
+        'coordinates': {
+            'latitude': latitude,
+            'longitude': longitude
+        },
+        'address': f"Coordenadas: {latitude}, {longitude}",
+        'city': 'No disponible',
+        'country': 'No disponible'
+    }
+
+def complete_ticket(result, incident_analysis, registration_filename, registration_analysis,
+                    location_data, coordinates_error, form):
+    """
+    Incorpora los resultados de los análisis y de la geocodificación al
+    resultado de /api/process_complete y arma la boleta. Lo usan tanto la ruta
+    síncrona como la asíncrona (app/asgi.py), así ambas aplican las mismas reglas.
+    
+    Args:
+        result (dict): Resultado en construcción
+        incident_analysis (dict): Análisis de la imagen del incidente
+        registration_filename (str): Nombre del archivo de la tarjeta, o None si no se envió
+        registration_analysis (dict): Análisis de la tarjeta, o None si no se analizó
+        location_data (dict): Datos de ubicación, o None si no se geocodificó
+        coordinates_error (Exception): Error al leer las coordenadas, o None
+        form (dict): Campos del formulario
+        
+    Returns:
+        dict: Datos de la boleta
+    """
+    # Verificar si el análisis fue exitoso
+    if incident_analysis is None or 'error' in incident_analysis:
+        metrics.increment('fallbacks_total', reason='analysis_error')
+        error_msg = incident_analysis.get('error', 'Error desconocido al analizar la imagen') if incident_analysis else 'No se pudo analizar la imagen'
+        app.logger.error(f"Error en el análisis de incidente: {error_msg}")
+        result['errors'].append(f"Error en el análisis de incidente: {error_msg}")
+        # Proporcionar un análisis básico para evitar errores en el frontend
+        incident_analysis = {
+            'incident_type': 'Error en el análisis',
+            'damage_severity': 'Desconocido',
+            'vehicle_type': 'Desconocido',
+            'damaged_parts': [],
+            'confidence': 0.0,
+            'error': error_msg
+        }
+    
+    result['incident_analysis'] = incident_analysis
+    
+    # Procesar la tarjeta de circulación si se proporcionó
+    registration_info = None
+    if registration_filename is not None:
+        if registration_analysis is None:
+            app.logger.error(f"Formato de archivo no permitido para tarjeta: {registration_filename}")
+            result['errors'].append('Formato de archivo no permitido para tarjeta. Use JPG, PNG, JPEG o GIF')
+        elif 'registration_info' in registration_analysis:
+            registration_info = registration_analysis['registration_info']
+            result['registration_info'] = registration_info
+        else:
+            app.logger.error("No se pudo extraer información de la tarjeta de circulación")
+            result['errors'].append('No se pudo extraer información de la tarjeta de circulación')
+    
+    # Alternativamente, usar datos de registro proporcionados directamente en JSON
+    elif 'registration_data' in form:
+        try:
+            registration_info = json.loads(form['registration_data'])
+            result['registration_info'] = registration_info
+        except json.JSONDecodeError:
+            app.logger.error("Error al decodificar los datos de registro JSON")
+            result['errors'].append('Error al decodificar los datos de registro JSON')
+    
+    if location_data is not None:
+        result['location_info'] = location_data
+    elif coordinates_error is not None:
+        app.logger.warning(f"Error al procesar coordenadas: {str(coordinates_error)}")
+        # Si hay error en las coordenadas, continuamos sin datos de ubicación
+        location_data = invalid_coordinates_location(form)
+        result['location_info'] = location_data
+        result['errors'].append('Error al procesar coordenadas')
+    else:
+        location_data = {}
+    
+    # Preparar el paquete completo para enviar al sistema de boletas
+    return {
+        'incident': incident_analysis,
+        'vehicle': registration_info,
+        'location': location_data,
+        'timestamp': datetime.datetime.now().isoformat(),
+        'status': 'pending'
+    }
+
+def dispatch_url(form):
+    """URL de la API externa: la proporcionada en el formulario o la configurada por defecto"""
+    app.logger.info("Enviando datos a API externa")
+    external_api_url = form.get('external_api_url')
+    if external_api_url:
+        app.logger.info(f"Usando URL proporcionada: {external_api_url}")
+        return external_api_url
+    app.logger.info(f"Usando URL configurada: {app.config['EXTERNAL_API_URL']}")
+    return app.config['EXTERNAL_API_URL']
+
+def record_external_result(result, external_api_result):
+    """Añade al resultado de /api/process_complete la respuesta de la API externa"""
+    result['external_api_result'] = external_api_result
+    
+    if external_api_result['success']:
+        app.logger.info("Datos enviados exitosamente a la API externa")
+        result['external_api_success'] = True
+    else:
+        app.logger.warning(f"Error al enviar datos a la API externa: {external_api_result.get('error', 'Error desconocido')}")
+        result['external_api_success'] = False
+        result['errors'].append(f"Error al enviar datos a la API externa: {external_api_result.get('error', 'Error desconocido')}")
+
+def finish_complete_result(result, ticket_data, incident_image_path, registration_image_path):
+    """Completa el resultado de /api/process_complete con la boleta y las URLs de las imágenes"""
+    # Incluir los datos en la respuesta
+    result['ticket_data'] = ticket_data
+    result['success'] = True
+    
+    # Añadir las URLs de las imágenes para mostrarlas en el frontend
+    incident_image_url = incident_image_path.replace('\\', '/').replace(app.config['UPLOAD_FOLDER'], '/static/uploads')
+    result['incident_image_url'] = incident_image_url
+    
+    if registration_image_path is not None:
+        registration_image_url = registration_image_path.replace('\\', '/').replace(app.config['UPLOAD_FOLDER'], '/static/uploads')
+        result['registration_image_url'] = registration_image_url
+    
+    return result
+
+@app.route('/api/process_complete', methods=['POST'])
+@idempotent
+def process_complete():
+    """
+    Endpoint para procesar imágenes de incidentes y tarjetas de circulación,
+    y enviar la información completa al sistema de boletas.
+    
+    Recibe:
+        - incident_image: archivo de imagen del incidente
+        - registration_image: archivo de imagen de la tarjeta de circulación (opcional)
+        - location: coordenadas GPS (opcional)
+        - use_custom_model: booleano para usar el modelo personalizado (opcional)
+        - registration_data: datos de la tarjeta de circulación en formato JSON (opcional, alternativa a registration_image)
+        - async: "true" (o la cabecera Prefer: respond-async) para responder con
+          un trabajo que se consulta en /api/jobs/<id> (opcional)
+    """
+    result = new_complete_result()
+    
+    try:
+        error_response, args = save_complete_uploads(result)
+        if error_response is not None:
+            return error_response
+        
+        # Las imágenes ya están guardadas: el resto puede ejecutarse como trabajo asíncrono
+        if job_requested(request):
+            return job_response(run_process_complete, *args, uploads=(args[1], args[3]))
+        
+        response, status_code = run_process_complete(*args)
+        return jsonify(response), status_code
+    
+    except Exception as e:
+        return complete_error_response(result, e)
+
+def save_complete_uploads(result):
+    """
+    Valida y guarda las imágenes de la solicitud actual a /api/process_complete
+    
+    Args:
+        result (dict): Resultado en construcción (se le añaden los errores de validación)
+        
+    Returns:
+        tuple: (respuesta de error o None, argumentos para run_process_complete)
+    """
+    # Importar módulos solo cuando se necesiten
+    try:
+        from app.utils.image_utils import save_uploaded_image, allowed_file, upload_source_name
+    except ImportError:
+        # Si estamos ejecutando desde dentro del directorio app
+        from utils.image_utils import save_uploaded_image, allowed_file, upload_source_name
+    
+    # Procesar imagen del incidente
+    if 'incident_image' not in request.files:
+        app.logger.error("No se envió ninguna imagen de incidente")
+        result['errors'].append('No se envió ninguna imagen de incidente')
+        return (jsonify(result), 400), None
+    
+    incident_file = request.files['incident_image']
+    
+    # Verificar si el archivo tiene nombre
+    if incident_file.filename == '':
+        app.logger.error("No se seleccionó ningún archivo para el incidente")
+        result['errors'].append('No se seleccionó ningún archivo para el incidente')
+        return (jsonify(result), 400), None
+    
+    # Verificar si el archivo es una imagen permitida
+    if not allowed_file(incident_file.filename):
+        app.logger.error(f"Formato de archivo no permitido para incidente: {incident_file.filename}")
+        result['errors'].append('Formato de archivo no permitido para incidente. Use JPG, PNG, JPEG o GIF')
+        return (jsonify(result), 400), None
+    
+    # Guardar la imagen del incidente
+    app.logger.info(f"Guardando imagen de incidente: {incident_file.filename}")
+    try:
+        with metrics.timer('save_image'):
+            incident_image_path = save_uploaded_image(incident_file, app.config['UPLOAD_FOLDER'])
+    except ValueError as e:
+        # El contenido no es una imagen permitida
+        app.logger.error(f"Imagen de incidente rechazada: {incident_file.filename}")
+        result['errors'].append(f"Imagen de incidente no válida: {str(e)}")
+        return (jsonify(result), 400), None
+    app.logger.info(f"Imagen de incidente guardada en: {incident_image_path}")
+    
+    # Guardar la imagen de la tarjeta de circulación si se proporcionó
+    registration_filename = None
+    registration_image_path = None
+    if 'registration_image' in request.files and request.files['registration_image'].filename != '':
+        registration_file = request.files['registration_image']
+        registration_filename = registration_file.filename
+        
+        # Verificar si el archivo es una imagen permitida
+        if allowed_file(registration_file.filename):
+            app.logger.info(f"Guardando imagen de tarjeta: {registration_file.filename}")
+            try:
+                with metrics.timer('save_image'):
+                    registration_image_path = save_uploaded_image(registration_file, app.config['UPLOAD_FOLDER'])
+            except ValueError as e:
+                # El contenido no es una imagen permitida: la solicitud se rechaza
+                # y la imagen del incidente ya guardada se descarta
+                app.logger.error(f"Imagen de tarjeta rechazada: {registration_file.filename}")
+                discard_request_uploads(incident_image_path)
+                result['errors'].append(f"Imagen de tarjeta no válida: {str(e)}")
+                return (jsonify(result), 400), None
+            except Exception:
+                # La solicitud falla: la imagen del incidente ya guardada se descarta
+                discard_request_uploads(incident_image_path)
+                raise
+            app.logger.info(f"Imagen de tarjeta guardada en: {registration_image_path}")
+    
+    # Nombres originales de las imágenes, de los que el análisis toma las pistas del nombre
+    incident_source_name = upload_source_name(incident_file.filename)
+    registration_source_name = upload_source_name(registration_filename) if registration_filename else None
+    
+    return None, (
+        result, incident_image_path, registration_filename, registration_image_path, request.form.to_dict(),
+        incident_source_name, registration_source_name
+    )
+
+def complete_error_response(result, error):
+    """Respuesta de /api/process_complete cuando el procesamiento lanzó una excepción"""
+    app.logger.error(f"Error al procesar la solicitud completa: {str(error)}")
+    import traceback
+    app.logger.error(traceback.format_exc())
+    result['errors'].append(f"Error al procesar la solicitud: {str(error)}")
+    return jsonify(result), 500
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """
+    Estado y resultado de un trabajo asíncrono
+    
+    Recibe:
+        - wait: segundos máximos de espera a que el trabajo termine (opcional, hasta JOB_MAX_WAIT)
+    """
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0.0), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({'error': 'El parámetro wait debe ser un número de segundos'}), 400
+    
+    job = job_queue.wait(job_id, wait) if wait > 0 else job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado o vencido'}), 404
+    
+    # 202 mientras el trabajo sigue en cola o en ejecución
+    return jsonify(job), 200 if job['status'] in ('done', 'error') else 202
 
 @app.route('/api/send-to-external', methods=['POST'])
+@idempotent
 def send_to_external():
     """
     Endpoint para enviar datos directamente a una API externa
@@ -498,13 +997,10 @@ def send_to_external():
         # Enviar los datos a la API externa
         app.logger.info(f"Enviando datos a API externa: {api_url}")
         
-        # Realizar la solicitud POST a la API externa
-        response = requests.post(
-            api_url,
-            json=data,
-            headers={'Content-Type': 'application/json'},
-            timeout=10  # Timeout de 10 segundos
-        )
+        # Realizar la solicitud POST a la API externa (conexión reutilizada,
+        # 10 segundos de tiempo límite de lectura)
+        with metrics.timer('dispatch'):
+            response = http_client.post_json(api_url, data, timeout=10)
         
         # Verificar si la solicitud fue exitosa
         if response.status_code == 200:
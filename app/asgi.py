@@ -0,0 +1,369 @@
+import asyncio
+import functools
+import httpx
+from flask import request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from app.app import (
+    app as flask_app, run_process_complete, run_analysis, job_response, discard_request_uploads,
+    save_analysis_upload, save_complete_uploads, complete_error_response, new_complete_result,
+    custom_damage_predictor, analysis_response, analysis_error_response, invalid_coordinates_location,
+    unconfigured_location_data, failed_location_data, send_to_internal_api, external_api_result,
+    analysis_timeout, location_timeout_data, complete_ticket, dispatch_url, record_external_result,
+    finish_complete_result, timed_call
+)
+from app.api.vision_api import analyze_image_async
+from app.api.maps_api import get_location_info_async, maps_api_configured
+from app.api.vision_client import close_async_vision_client
+from app.utils.metrics import metrics
+from app.utils.job_queue import job_requested
+from app.utils.idempotency import idempotency_key, begin_idempotent, finish_idempotent, idempotency_store
+from app.utils.asgi_bridge import read_body, build_environ, call_wsgi, send_response, ClientDisconnected
+from app.utils import http_client
+
+# Punto de entrada ASGI (uvicorn app.asgi:app). /api/analyze y
+# /api/process_complete se atienden en el bucle de eventos: las llamadas a
+# Vision API, Geocoding API y la API externa se esperan sin ocupar un hilo
+# cada una, con las mismas reglas de análisis que la ruta síncrona. El resto
+# de las rutas (y los trabajos con async=true) se delegan a la aplicación
+# Flask, que se ejecuta en un hilo.
+
+
+async def get_location_data_async(latitude, longitude):
+    """
+    Igual que get_location_data, esperando a Geocoding API de forma asíncrona
+
+    Args:
+        latitude (float): Latitud
+        longitude (float): Longitud
+
+    Returns:
+        dict: Información de ubicación
+    """
+    # Verificar si la API key de Google Maps está configurada (con
+    # FAKE_BACKENDS se usa el servidor simulado aunque no haya key)
+    if not maps_api_configured():
+        return await asyncio.to_thread(unconfigured_location_data, latitude, longitude)
+
+    # Intentar obtener información de ubicación
+    try:
+        with metrics.timer('geocoding'):
+            location_data = await get_location_info_async(latitude, longitude)
+        if 'error' in location_data:
+            metrics.increment('fallbacks_total', reason='geocoding')
+        return location_data
+    except Exception as loc_error:
+        return failed_location_data(latitude, longitude, loc_error)
+
+async def send_to_external_api_async(data, api_url=None):
+    """
+    Igual que send_to_external_api, con el cliente HTTP asíncrono
+
+    Args:
+        data (dict): Datos a enviar
+        api_url (str, optional): URL de la API externa. Si no se proporciona, se usa la configurada.
+
+    Returns:
+        dict: Respuesta de la API externa o información de error
+    """
+    try:
+        # Usar la URL proporcionada o la configurada por defecto
+        url = api_url if api_url else flask_app.config['EXTERNAL_API_URL']
+        flask_app.logger.info(f"Enviando datos a API externa: {url}")
+
+        # Verificar si es una llamada interna
+        if url.startswith('internal://'):
+            return await asyncio.to_thread(send_to_internal_api, data, url)
+
+        response = await http_client.async_post_json(url, data, timeout=10)
+        return external_api_result(response)
+
+    except httpx.HTTPError as e:
+        flask_app.logger.error(f"Error de conexión con la API externa: {str(e)}")
+        return {
+            'success': False,
+            'error': f"Error de conexión: {str(e)}"
+        }
+    except Exception as e:
+        flask_app.logger.error(f"Error inesperado al enviar datos: {str(e)}")
+        import traceback
+        flask_app.logger.error(traceback.format_exc())
+        return {
+            'success': False,
+            'error': f"Error inesperado: {str(e)}"
+        }
+
+async def timed_await(stage, awaitable):
+    """Espera una corrutina midiendo su duración como la etapa indicada"""
+    with metrics.timer(stage):
+        return await awaitable
+
+async def run_analysis_async(image_path, form, source_name=None):
+    """
+    Igual que run_analysis; la geocodificación se espera en paralelo con el análisis
+
+    Returns:
+        tuple: (respuesta, código HTTP)
+    """
+    location_task = None
+    try:
+        # Obtener datos de ubicación (si se proporcionaron)
+        location_data = {}
+        if 'latitude' in form and 'longitude' in form:
+            try:
+                latitude = float(form['latitude'])
+                longitude = float(form['longitude'])
+                flask_app.logger.info(f"Obteniendo información de ubicación: {latitude}, {longitude}")
+                location_task = asyncio.ensure_future(get_location_data_async(latitude, longitude))
+            except (ValueError, KeyError) as e:
+                flask_app.logger.warning(f"Error al procesar coordenadas: {str(e)}")
+                # Si hay error en las coordenadas, continuamos sin datos de ubicación
+                location_data = invalid_coordinates_location(form)
+
+        # Determinar si usar el modelo personalizado
+        predict_damage = None
+        if form.get('use_custom_model', 'false').lower() == 'true':
+            predict_damage = await asyncio.to_thread(custom_damage_predictor)
+
+        if predict_damage is not None:
+            flask_app.logger.info(f"Analizando imagen con modelo personalizado: {image_path}")
+            analysis_results = await asyncio.to_thread(timed_call, 'custom_model', predict_damage, image_path)
+        else:
+            # Analizar la imagen con Google Cloud Vision
+            flask_app.logger.info(f"Analizando imagen con Vision API: {image_path}")
+            analysis_results = await timed_await('analyze_image', analyze_image_async(image_path, source_name=source_name))
+
+        if location_task is not None:
+            location_data = await location_task
+
+        return analysis_response(image_path, analysis_results, location_data), 200
+
+    except Exception as e:
+        await asyncio.to_thread(discard_request_uploads, image_path)
+        return analysis_error_response(e), 500
+
+    finally:
+        if location_task is not None and not location_task.done():
+            location_task.cancel()
+
+async def run_process_complete_async(result, incident_image_path, registration_filename, registration_image_path, form,
+                                     incident_source_name=None, registration_source_name=None):
+    """
+    Igual que run_process_complete: los análisis y la geocodificación se
+    esperan en paralelo en el bucle de eventos, con los mismos tiempos límite
+
+    Returns:
+        tuple: (respuesta, código HTTP)
+    """
+    vision_timeout = flask_app.config['VISION_TASK_TIMEOUT']
+    tasks = []
+
+    def start(stage, awaitable, timeout):
+        task = asyncio.ensure_future(asyncio.wait_for(timed_await(stage, awaitable), timeout))
+        tasks.append(task)
+        return task
+
+    try:
+        flask_app.logger.info(f"Analizando imagen de incidente con Vision API: {incident_image_path}")
+        incident_task = start(
+            'analyze_image', analyze_image_async(incident_image_path, source_name=incident_source_name), vision_timeout
+        )
+
+        # Analizar la tarjeta de circulación si se guardó
+        registration_task = None
+        if registration_image_path is not None:
+            flask_app.logger.info(f"Analizando imagen de tarjeta con Vision API: {registration_image_path}")
+            registration_task = start(
+                'analyze_registration',
+                analyze_image_async(
+                    registration_image_path, is_registration_card=True, source_name=registration_source_name
+                ),
+                vision_timeout
+            )
+
+        # Iniciar la geocodificación (si se proporcionaron coordenadas)
+        location_task = None
+        coordinates_error = None
+        if 'latitude' in form and 'longitude' in form:
+            try:
+                latitude = float(form['latitude'])
+                longitude = float(form['longitude'])
+                flask_app.logger.info(f"Obteniendo información de ubicación: {latitude}, {longitude}")
+                location_task = asyncio.ensure_future(asyncio.wait_for(
+                    get_location_data_async(latitude, longitude), flask_app.config['GEOCODING_TASK_TIMEOUT']
+                ))
+                tasks.append(location_task)
+            except (ValueError, KeyError) as e:
+                coordinates_error = e
+
+        # Resultado del análisis del incidente
+        try:
+            incident_analysis = await incident_task
+        except asyncio.TimeoutError:
+            incident_analysis = analysis_timeout('incidente')
+
+        registration_analysis = None
+        if registration_task is not None:
+            try:
+                registration_analysis = await registration_task
+            except asyncio.TimeoutError:
+                registration_analysis = analysis_timeout('tarjeta')
+
+        # Resultado de la geocodificación
+        location_data = None
+        if location_task is not None:
+            try:
+                location_data = await location_task
+            except asyncio.TimeoutError:
+                location_data = location_timeout_data(latitude, longitude)
+
+        ticket_data = complete_ticket(
+            result, incident_analysis, registration_filename, registration_analysis,
+            location_data, coordinates_error, form
+        )
+
+        # Enviar los datos a la API externa
+        if form.get('send_to_external', 'false').lower() == 'true':
+            external_api_url = dispatch_url(form)
+            with metrics.timer('dispatch'):
+                external_api_result = await send_to_external_api_async(ticket_data, external_api_url)
+            record_external_result(result, external_api_result)
+
+        return finish_complete_result(result, ticket_data, incident_image_path, registration_image_path), 200
+
+    except Exception as e:
+        flask_app.logger.error(f"Error al procesar la solicitud completa: {str(e)}")
+        import traceback
+        flask_app.logger.error(traceback.format_exc())
+        result['errors'].append(f"Error al procesar la solicitud: {str(e)}")
+        await asyncio.to_thread(discard_request_uploads, incident_image_path, registration_image_path)
+        return result, 500
+
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+def idempotent_async(view):
+    """Igual que app.utils.idempotency.idempotent, para vistas asíncronas"""
+    @functools.wraps(view)
+    async def wrapper():
+        key = idempotency_key(request)
+        if key is None:
+            return await view()
+
+        response = await asyncio.to_thread(begin_idempotent, key)
+        if response is not None:
+            return response
+        try:
+            response = flask_app.make_response(await view())
+        except BaseException:
+            await asyncio.to_thread(idempotency_store.release, key)
+            raise
+        await asyncio.to_thread(finish_idempotent, key, response)
+        return response
+    return wrapper
+
+async def analyze():
+    """POST /api/analyze (ver app.app.analyze)"""
+    error_response, args = await asyncio.to_thread(save_analysis_upload)
+    if error_response is not None:
+        return error_response
+
+    # La imagen ya está guardada: el resto puede ejecutarse como trabajo asíncrono
+    if job_requested(request):
+        return job_response(run_analysis, *args, uploads=args[:1])
+
+    response, status_code = await run_analysis_async(*args)
+    with metrics.timer('serialize_response'):
+        return jsonify(response), status_code
+
+@idempotent_async
+async def process_complete():
+    """POST /api/process_complete (ver app.app.process_complete)"""
+    result = new_complete_result()
+
+    try:
+        error_response, args = await asyncio.to_thread(save_complete_uploads, result)
+        if error_response is not None:
+            return error_response
+
+        # Las imágenes ya están guardadas: el resto puede ejecutarse como trabajo asíncrono
+        if job_requested(request):
+            return job_response(run_process_complete, *args, uploads=(args[1], args[3]))
+
+        response, status_code = await run_process_complete_async(*args)
+        return jsonify(response), status_code
+
+    except Exception as e:
+        return complete_error_response(result, e)
+
+# Rutas atendidas en el bucle de eventos (las demás se delegan a Flask)
+ASYNC_ROUTES = {
+    ('POST', '/api/analyze'): analyze,
+    ('POST', '/api/process_complete'): process_complete,
+}
+
+async def dispatch_async(view, environ):
+    """
+    Atiende una solicitud con una vista asíncrona dentro del contexto de
+    Flask, de modo que se aplican los mismos before/after_request (trazas,
+    métricas, CORS) que en la ruta síncrona
+
+    Returns:
+        flask.Response: Respuesta de la vista
+    """
+    ctx = flask_app.request_context(environ)
+    error = None
+    try:
+        ctx.push()
+        try:
+            response = flask_app.preprocess_request()
+            if response is None:
+                response = await view()
+        except Exception as e:
+            response = flask_app.handle_user_exception(e)
+        return flask_app.finalize_request(response)
+    except Exception as e:
+        error = e
+        return flask_app.handle_exception(e)
+    finally:
+        ctx.pop(error)
+
+async def lifespan(receive, send):
+    """Arranque y cierre del servidor ASGI: al cerrar se liberan los clientes asíncronos"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_vision_client()
+            await http_client.close_async_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """Aplicación ASGI"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        raise NotImplementedError(f"Tipo de conexión no soportado: {scope['type']}")
+
+    try:
+        body = await read_body(scope, receive, flask_app.config['MAX_CONTENT_LENGTH'])
+    except ClientDisconnected:
+        return
+
+    if body is None:
+        response = RequestEntityTooLarge().get_response()
+        await send_response(send, response.status_code, response.headers.to_wsgi_list(), response.get_data())
+        return
+
+    environ = build_environ(scope, body)
+    view = ASYNC_ROUTES.get((scope['method'], environ['PATH_INFO']))
+    if view is None:
+        status, headers, body = await call_wsgi(flask_app.wsgi_app, environ)
+    else:
+        response = await dispatch_async(view, environ)
+        status, headers, body = response.status_code, response.headers.to_wsgi_list(), response.get_data()
+    await send_response(send, status, headers, body)
@@ -0,0 +1,152 @@
+import io
+import sys
+import asyncio
+
+# Utilidades para servir la aplicación Flask desde un servidor ASGI (ver
+# app/asgi.py): conversión del scope ASGI a un entorno WSGI, lectura del
+# cuerpo con límite de tamaño y ejecución de la aplicación WSGI en un hilo.
+
+
+class ClientDisconnected(Exception):
+    """El cliente cerró la conexión antes de terminar de enviar el cuerpo"""
+
+
+async def read_body(scope, receive, max_length=None):
+    """
+    Lee el cuerpo completo de una solicitud ASGI
+
+    Args:
+        scope (dict): Scope ASGI de la solicitud
+        receive (callable): Canal de recepción ASGI
+        max_length (int, optional): Tamaño máximo en bytes
+
+    Returns:
+        bytes: Cuerpo de la solicitud, o None si supera max_length
+
+    Raises:
+        ClientDisconnected: Si el cliente se desconecta antes de terminar
+    """
+    if max_length is not None:
+        for name, value in scope.get('headers', []):
+            if name.lower() == b'content-length' and value.isdigit() and int(value) > max_length:
+                return None
+
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if max_length is not None and size > max_length:
+            return None
+        chunks.append(chunk)
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+def build_environ(scope, body):
+    """
+    Construye el entorno WSGI equivalente a una solicitud ASGI
+
+    Args:
+        scope (dict): Scope ASGI de tipo http
+        body (bytes): Cuerpo completo de la solicitud
+
+    Returns:
+        dict: Entorno WSGI
+    """
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').lower()
+        value = value.decode('latin-1')
+        if name == 'content-length':
+            continue
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _run_wsgi(wsgi_app, environ):
+    """Ejecuta una aplicación WSGI y devuelve (código, cabeceras, cuerpo)"""
+    started = {}
+    body = []
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and started:
+            raise exc_info[1].with_traceback(exc_info[2])
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+        return body.append
+
+    iterable = wsgi_app(environ, start_response)
+    try:
+        for chunk in iterable:
+            body.append(chunk)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return started['status'], started['headers'], b''.join(body)
+
+
+async def call_wsgi(wsgi_app, environ):
+    """
+    Ejecuta una aplicación WSGI en un hilo para no bloquear el bucle de eventos
+
+    Args:
+        wsgi_app (callable): Aplicación WSGI
+        environ (dict): Entorno WSGI (ver build_environ)
+
+    Returns:
+        tuple: (código HTTP, lista de cabeceras, cuerpo en bytes)
+    """
+    return await asyncio.to_thread(_run_wsgi, wsgi_app, environ)
+
+
+async def send_response(send, status, headers, body):
+    """
+    Envía una respuesta completa por el canal ASGI
+
+    Args:
+        send (callable): Canal de envío ASGI
+        status (int): Código HTTP
+        headers (list): Cabeceras como pares (nombre, valor) de texto
+        body (bytes): Cuerpo de la respuesta
+    """
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,142 @@
+import math
+import logging
+
+# Intentar importar numpy para los índices espaciales
+try:
+    import numpy as np
+    NUMPY_SUPPORT = True
+except ImportError:
+    NUMPY_SUPPORT = False
+    logging.warning("numpy no está instalado. Los índices geográficos locales no estarán disponibles.")
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """
+    Distancia de gran círculo desde un punto a muchos puntos a la vez
+
+    Args:
+        latitude (float): Latitud del punto de origen
+        longitude (float): Longitud del punto de origen
+        latitudes (numpy.ndarray): Latitudes de destino (grados)
+        longitudes (numpy.ndarray): Longitudes de destino (grados)
+
+    Returns:
+        numpy.ndarray: Distancias en kilómetros
+    """
+    lat1 = math.radians(latitude)
+    lat2 = np.radians(latitudes)
+    dlat = lat2 - lat1
+    dlon = np.radians(longitudes) - math.radians(longitude)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GridIndex:
+    """
+    Índice espacial de puntos en una rejilla de celdas de latitud/longitud.
+
+    Los puntos se ordenan por celda para que cada celda sea un rango contiguo
+    de los arreglos; una búsqueda solo calcula distancias (vectorizadas) a los
+    puntos de las celdas que cubren el radio pedido.
+    """
+
+    def __init__(self, latitudes, longitudes, cell_degrees=0.5):
+        self.cell_degrees = cell_degrees
+        self.rows = int(math.ceil(180 / cell_degrees))
+        self.columns = int(math.ceil(360 / cell_degrees))
+
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        cells = self._cell_ids(latitudes, longitudes)
+        # order[i] es el índice original del i-ésimo punto ordenado por celda
+        self.order = np.argsort(cells, kind='stable')
+        self.latitudes = latitudes[self.order]
+        self.longitudes = longitudes[self.order]
+
+        sorted_cells = cells[self.order]
+        unique_cells, starts, counts = np.unique(sorted_cells, return_index=True, return_counts=True)
+        self._ranges = {
+            int(cell): (int(start), int(start + count))
+            for cell, start, count in zip(unique_cells, starts, counts)
+        }
+
+    def __len__(self):
+        return len(self.order)
+
+    def _row(self, latitude):
+        return np.clip(((np.asarray(latitude) + 90) // self.cell_degrees).astype(np.int64), 0, self.rows - 1)
+
+    def _column(self, longitude):
+        return (((np.asarray(longitude) + 180) // self.cell_degrees).astype(np.int64)) % self.columns
+
+    def _cell_ids(self, latitudes, longitudes):
+        return self._row(latitudes) * self.columns + self._column(longitudes)
+
+    def _candidates(self, latitude, longitude, radius_km):
+        """Posiciones (en el orden interno) de los puntos de las celdas que cubren el radio"""
+        delta_latitude = radius_km / KM_PER_DEGREE
+        first_row = int(self._row(latitude - delta_latitude))
+        last_row = int(self._row(latitude + delta_latitude))
+
+        widest = min(abs(latitude) + delta_latitude, 89.9)
+        delta_longitude = radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+        if delta_longitude >= 180:
+            columns = range(self.columns)
+        else:
+            first_column = int(math.floor((longitude - delta_longitude + 180) / self.cell_degrees))
+            last_column = int(math.floor((longitude + delta_longitude + 180) / self.cell_degrees))
+            columns = sorted({column % self.columns for column in range(first_column, last_column + 1)})
+
+        slices = []
+        for row in range(first_row, last_row + 1):
+            for column in columns:
+                cell_range = self._ranges.get(row * self.columns + column)
+                if cell_range is not None:
+                    slices.append(np.arange(*cell_range))
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(slices)
+
+    def nearest(self, latitude, longitude, max_km):
+        """
+        Punto más cercano dentro de un radio
+
+        Args:
+            latitude (float): Latitud
+            longitude (float): Longitud
+            max_km (float): Distancia máxima en kilómetros
+
+        Returns:
+            tuple: (índice original del punto, distancia en km) o None
+        """
+        candidates = self._candidates(latitude, longitude, max_km)
+        if len(candidates) == 0:
+            return None
+        distances = haversine_km(latitude, longitude, self.latitudes[candidates], self.longitudes[candidates])
+        best = int(np.argmin(distances))
+        if distances[best] > max_km:
+            return None
+        return int(self.order[candidates[best]]), float(distances[best])
+
+    def within(self, latitude, longitude, radius_km):
+        """
+        Puntos dentro de un radio, del más cercano al más lejano
+
+        Args:
+            latitude (float): Latitud
+            longitude (float): Longitud
+            radius_km (float): Radio en kilómetros
+
+        Returns:
+            list: Tuplas (índice original del punto, distancia en km)
+        """
+        candidates = self._candidates(latitude, longitude, radius_km)
+        if len(candidates) == 0:
+            return []
+        distances = haversine_km(latitude, longitude, self.latitudes[candidates], self.longitudes[candidates])
+        inside = np.nonzero(distances <= radius_km)[0]
+        inside = inside[np.argsort(distances[inside], kind='stable')]
+        return [(int(self.order[candidates[i]]), float(distances[i])) for i in inside]
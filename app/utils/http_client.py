@@ -0,0 +1,265 @@
+import os
+import json
+import gzip
+import random
+import asyncio
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Intentar importar httpx para la ruta asíncrona (app/asgi.py)
+try:
+    import httpx
+    HTTPX_SUPPORT = True
+except ImportError:
+    HTTPX_SUPPORT = False
+    logging.warning("httpx no está instalado. La ruta asíncrona (app/asgi.py) no estará disponible.")
+
+# Transporte HTTP compartido para las llamadas salientes (Google Maps y API
+# externa): una sesión por proceso con conexiones persistentes por host,
+# tiempos límite de conexión y lectura, y reintentos acotados con espera
+# exponencial aleatoria.
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '10'))
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', '10'))
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '20'))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '2'))
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', '0.3'))
+# Comprimir con gzip los cuerpos JSON a partir de este tamaño (solo si el
+# destino lo admite; desactivado por defecto)
+HTTP_GZIP_REQUESTS = os.environ.get('HTTP_GZIP_REQUESTS', 'false').lower() == 'true'
+HTTP_GZIP_MIN_BYTES = int(os.environ.get('HTTP_GZIP_MIN_BYTES', '1024'))
+
+# Códigos de estado que se reintentan (errores temporales del servidor o del proxy)
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+
+def _retry_after_delay(retry_after):
+    """Espera pedida por Retry-After, limitada a HTTP_READ_TIMEOUT segundos"""
+    return min(max(retry_after, 0), HTTP_READ_TIMEOUT)
+
+
+class JitteredRetry(Retry):
+    """
+    Retry de urllib3 con espera aleatoria entre 0 y la espera exponencial
+    (full jitter), para que los workers no reintenten todos a la vez. La
+    espera de Retry-After se respeta, pero nunca supera HTTP_READ_TIMEOUT.
+    """
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else _retry_after_delay(retry_after)
+
+
+def _build_session():
+    retry = JitteredRetry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        read=HTTP_RETRIES,
+        status=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        # Los POST solo se reintentan si no se llegó a conectar
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Sesión HTTP compartida por el proceso (se crea de nuevo después de un fork)
+
+    Returns:
+        requests.Session: Sesión con conexiones persistentes y reintentos
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _build_session()
+            _session_pid = os.getpid()
+        return _session
+
+
+def _timeout(read_timeout=None):
+    return (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT if read_timeout is None else read_timeout)
+
+
+def get(url, params=None, timeout=None, **kwargs):
+    """
+    GET con la sesión compartida
+
+    Args:
+        url (str): URL de la solicitud
+        params (dict, optional): Parámetros de la consulta
+        timeout (float, optional): Tiempo límite de lectura en segundos
+
+    Returns:
+        requests.Response: Respuesta (lanza requests.RequestException si falla la conexión)
+    """
+    return get_session().get(url, params=params, timeout=_timeout(timeout), **kwargs)
+
+
+def _json_body(data, headers=None, compress=None):
+    """Cuerpo JSON (comprimido con gzip si corresponde) y sus cabeceras"""
+    body = json.dumps(data, allow_nan=False).encode('utf-8')
+    request_headers = {'Content-Type': 'application/json'}
+    if headers:
+        request_headers.update(headers)
+
+    compress = HTTP_GZIP_REQUESTS if compress is None else compress
+    if compress and len(body) >= HTTP_GZIP_MIN_BYTES:
+        body = gzip.compress(body)
+        request_headers['Content-Encoding'] = 'gzip'
+    return body, request_headers
+
+
+def post_json(url, data, timeout=None, headers=None, compress=None):
+    """
+    POST de un cuerpo JSON con la sesión compartida
+
+    Args:
+        url (str): URL de la solicitud
+        data (dict): Datos a enviar
+        timeout (float, optional): Tiempo límite de lectura en segundos
+        headers (dict, optional): Cabeceras adicionales
+        compress (bool, optional): Comprimir el cuerpo con gzip (por defecto HTTP_GZIP_REQUESTS)
+
+    Returns:
+        requests.Response: Respuesta (lanza requests.RequestException si falla la conexión)
+    """
+    body, request_headers = _json_body(data, headers, compress)
+    return get_session().post(url, data=body, headers=request_headers, timeout=_timeout(timeout))
+
+
+# Cliente asíncrono (httpx) con los mismos tiempos límite, tamaño de pool y
+# reintentos que la sesión síncrona. Como los canales de Vision API, queda
+# ligado al bucle de eventos en el que se crea; al cambiar de bucle se cierra
+# el cliente anterior.
+_async_client = None
+_async_client_key = None
+_closing_clients = set()
+
+
+def _async_timeout(read_timeout=None):
+    read = HTTP_READ_TIMEOUT if read_timeout is None else read_timeout
+    return httpx.Timeout(read, connect=HTTP_CONNECT_TIMEOUT)
+
+
+async def _aclose_quietly(client):
+    try:
+        await client.aclose()
+    except Exception as e:
+        # Normal si su bucle de eventos ya se cerró: los sockets se liberan al recolectarlos
+        logging.debug(f"No se pudo cerrar el cliente httpx anterior: {str(e)}")
+
+
+def _close_stale_async_client(client, key):
+    """
+    Cierra el cliente de un bucle de eventos anterior del mismo proceso: en su
+    propio bucle si sigue en marcha (otro hilo) o, si no, en el actual
+    """
+    pid, loop = key
+    if pid != os.getpid():
+        # Después de un fork las conexiones pertenecen al proceso padre
+        return
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(_aclose_quietly(client), loop)
+        return
+    task = asyncio.get_running_loop().create_task(_aclose_quietly(client))
+    _closing_clients.add(task)
+    task.add_done_callback(_closing_clients.discard)
+
+
+def get_async_client():
+    """
+    Cliente httpx compartido por el proceso y el bucle de eventos actuales
+    (llamar desde una corrutina)
+
+    Returns:
+        httpx.AsyncClient: Cliente con conexiones persistentes
+    """
+    global _async_client, _async_client_key
+    # Se guarda el propio bucle (no su id, que puede reutilizarse al recolectarlo)
+    key = (os.getpid(), asyncio.get_running_loop())
+    if _async_client is None or _async_client_key != key:
+        if _async_client is not None:
+            _close_stale_async_client(_async_client, _async_client_key)
+        _async_client = httpx.AsyncClient(
+            timeout=_async_timeout(),
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=HTTP_POOL_MAXSIZE,
+            ),
+            # Reintentos de conexión; los de estado HTTP se hacen en async_get
+            transport=httpx.AsyncHTTPTransport(retries=HTTP_RETRIES),
+        )
+        _async_client_key = key
+    return _async_client
+
+
+async def close_async_client():
+    """Cierra el cliente asíncrono (al terminar el servidor ASGI)"""
+    global _async_client, _async_client_key
+    client, owned = _async_client, _async_client_key is not None and _async_client_key[0] == os.getpid()
+    _async_client = None
+    _async_client_key = None
+    if client is not None and owned:
+        await client.aclose()
+
+
+async def async_get(url, params=None, timeout=None):
+    """
+    GET asíncrono; los códigos de RETRY_STATUS_CODES se reintentan hasta
+    HTTP_RETRIES veces con la misma espera aleatoria que JitteredRetry
+
+    Args:
+        url (str): URL de la solicitud
+        params (dict, optional): Parámetros de la consulta
+        timeout (float, optional): Tiempo límite de lectura en segundos
+
+    Returns:
+        httpx.Response: Respuesta (lanza httpx.HTTPError si falla la conexión)
+    """
+    attempt = 0
+    while True:
+        response = await get_async_client().get(url, params=params, timeout=_async_timeout(timeout))
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= HTTP_RETRIES:
+            return response
+        attempt += 1
+        # Misma espera exponencial que urllib3 (sin espera en el primer reintento)
+        backoff = 0 if attempt == 1 else HTTP_BACKOFF_FACTOR * (2 ** (attempt - 1))
+        retry_after = response.headers.get('Retry-After', '')
+        delay = _retry_after_delay(float(retry_after)) if retry_after.isdigit() else random.uniform(0, backoff)
+        await asyncio.sleep(delay)
+
+
+async def async_post_json(url, data, timeout=None, headers=None, compress=None):
+    """
+    POST asíncrono de un cuerpo JSON (ver post_json)
+
+    Returns:
+        httpx.Response: Respuesta (lanza httpx.HTTPError si falla la conexión)
+    """
+    body, request_headers = _json_body(data, headers, compress)
+    return await get_async_client().post(url, content=body, headers=request_headers, timeout=_async_timeout(timeout))
@@ -0,0 +1,321 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import functools
+import threading
+import logging
+from collections import OrderedDict
+from flask import request, jsonify, current_app
+
+try:
+    from app.utils.metrics import metrics
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from utils.metrics import metrics
+    from utils.logging_config import configure_logging
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Claves de idempotencia: si el cliente envía la cabecera Idempotency-Key, la
+# respuesta se guarda bajo esa clave (por endpoint) y las solicitudes
+# repetidas reciben la respuesta guardada sin volver a analizar, geocodificar
+# ni enviar a la API externa.
+IDEMPOTENCY_ENABLED = os.environ.get('IDEMPOTENCY_ENABLED', 'true').lower() == 'true'
+# Segundos durante los que se conserva una respuesta
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', str(24 * 3600)))
+# Segundos que una clave queda reservada mientras se procesa su primera
+# solicitud (después se considera abandonada, p. ej. si el worker terminó)
+IDEMPOTENCY_PENDING_TTL = float(os.environ.get('IDEMPOTENCY_PENDING_TTL', '120'))
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get('IDEMPOTENCY_MAX_ENTRIES', '10000'))
+# Archivo SQLite opcional para compartir las claves entre workers de gunicorn.
+# Sin él las claves viven en la memoria de cada proceso: un reenvío que llega
+# a otro worker o a otra instancia se procesa de nuevo.
+IDEMPOTENCY_DB = os.environ.get('IDEMPOTENCY_DB', '')
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+# Cabeceras de la respuesta que se guardan con el cuerpo
+STORED_HEADERS = ('Content-Type', 'Location')
+
+STATE_NEW = 'new'
+STATE_PENDING = 'pending'
+STATE_DONE = 'done'
+# La clave ya se usó con otra solicitud (otra huella del cuerpo)
+STATE_MISMATCH = 'mismatch'
+
+# Tamaño de bloque al calcular el hash de los archivos de la solicitud
+FINGERPRINT_CHUNK_SIZE = 64 * 1024
+
+# Cada cuántas escrituras se borran de SQLite las claves vencidas
+DB_PURGE_INTERVAL = 100
+
+
+class IdempotencyStore:
+    """
+    Respuestas guardadas por clave de idempotencia, en memoria (LRU) u,
+    opcionalmente, en SQLite para compartirlas entre workers
+    """
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL, pending_ttl=IDEMPOTENCY_PENDING_TTL,
+                 max_entries=IDEMPOTENCY_MAX_ENTRIES, db_path=IDEMPOTENCY_DB):
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._db = None
+        self._db_pid = None
+        self._db_writes = 0
+
+    def _connection(self):
+        """Conexión SQLite del proceso actual (None si no hay archivo configurado)"""
+        if not self.db_path:
+            return None
+        if self._db is None or self._db_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS idempotency '
+                '(key TEXT PRIMARY KEY, state TEXT NOT NULL, response TEXT, expires_at REAL NOT NULL, fingerprint TEXT)'
+            )
+            columns = [row[1] for row in self._db.execute('PRAGMA table_info(idempotency)')]
+            if 'fingerprint' not in columns:
+                self._db.execute('ALTER TABLE idempotency ADD COLUMN fingerprint TEXT')
+            self._db.commit()
+            self._db_pid = os.getpid()
+        return self._db
+
+    def begin(self, key, fingerprint=None):
+        """
+        Reserva una clave o devuelve la respuesta ya guardada
+
+        Args:
+            key (str): Clave de idempotencia (con el endpoint)
+            fingerprint (str, optional): Huella del cuerpo de la solicitud
+                (ver request_fingerprint)
+
+        Returns:
+            tuple: (STATE_NEW si quien llama debe procesar la solicitud,
+                STATE_PENDING si otra solicitud con la misma clave está en
+                curso, STATE_DONE con la respuesta guardada, STATE_MISMATCH
+                si la clave se usó con una solicitud de otra huella)
+        """
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return self._begin_memory(key, fingerprint, now)
+            try:
+                return self._begin_db(db, key, fingerprint, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Error al consultar la clave de idempotencia: {str(e)}")
+                return STATE_NEW, None
+
+    def _begin_memory(self, key, fingerprint, now):
+        entry = self._entries.get(key)
+        if entry is not None and entry['expires_at'] >= now:
+            self._entries.move_to_end(key)
+            if entry.get('fingerprint') != fingerprint:
+                return STATE_MISMATCH, None
+            return entry['state'], entry.get('response')
+        self._entries[key] = {'state': STATE_PENDING, 'fingerprint': fingerprint, 'expires_at': now + self.pending_ttl}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return STATE_NEW, None
+
+    def _begin_db(self, db, key, fingerprint, now):
+        db.execute('DELETE FROM idempotency WHERE key = ? AND expires_at < ?', (key, now))
+        inserted = db.execute(
+            'INSERT OR IGNORE INTO idempotency (key, state, response, expires_at, fingerprint) VALUES (?, ?, NULL, ?, ?)',
+            (key, STATE_PENDING, now + self.pending_ttl, fingerprint)
+        ).rowcount
+        db.commit()
+        if inserted:
+            return STATE_NEW, None
+        row = db.execute('SELECT state, response, fingerprint FROM idempotency WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return STATE_NEW, None
+        if row[2] != fingerprint:
+            return STATE_MISMATCH, None
+        return row[0], json.loads(row[1]) if row[1] else None
+
+    def finish(self, key, response):
+        """
+        Guarda la respuesta de una clave reservada con begin() (con la huella
+        de la reserva)
+
+        Args:
+            key (str): Clave de idempotencia
+            response (dict): {'status', 'headers', 'body'} (cuerpo en texto)
+        """
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                fingerprint = self._entries.get(key, {}).get('fingerprint')
+                self._entries[key] = {
+                    'state': STATE_DONE, 'response': response, 'fingerprint': fingerprint, 'expires_at': expires_at
+                }
+                return
+            try:
+                db.execute(
+                    'INSERT OR REPLACE INTO idempotency (key, state, response, expires_at, fingerprint) '
+                    'VALUES (?, ?, ?, ?, (SELECT fingerprint FROM idempotency WHERE key = ?))',
+                    (key, STATE_DONE, json.dumps(response, ensure_ascii=False), expires_at, key)
+                )
+                self._db_writes += 1
+                if self._db_writes % DB_PURGE_INTERVAL == 0:
+                    db.execute('DELETE FROM idempotency WHERE expires_at < ?', (time.time(),))
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Error al guardar la respuesta idempotente: {str(e)}")
+
+    def release(self, key):
+        """Libera una clave reservada sin guardar respuesta (la solicitud se podrá reintentar)"""
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                entry = self._entries.get(key)
+                if entry is not None and entry['state'] == STATE_PENDING:
+                    del self._entries[key]
+                return
+            try:
+                db.execute('DELETE FROM idempotency WHERE key = ? AND state = ?', (key, STATE_PENDING))
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Error al liberar la clave de idempotencia: {str(e)}")
+
+
+# Almacén compartido por el proceso
+idempotency_store = IdempotencyStore()
+
+
+def idempotency_key(req):
+    """
+    Clave de idempotencia de la solicitud (cabecera Idempotency-Key con el endpoint)
+
+    Returns:
+        str: Clave, o None si no se envió la cabecera o está desactivado
+    """
+    key = req.headers.get(IDEMPOTENCY_HEADER, '').strip()
+    if not key or not IDEMPOTENCY_ENABLED:
+        return None
+    return f"{req.endpoint}:{key}"
+
+
+def request_fingerprint(req):
+    """
+    Huella SHA-256 de la solicitud: parámetros de la URL, campos del formulario
+    y nombre y SHA-256 de cada archivo (o el cuerpo tal cual si no es un formulario)
+
+    Returns:
+        str: Hash hexadecimal
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(sorted(req.args.items(multi=True))).encode('utf-8'))
+    if req.form or req.files:
+        fields = sorted(req.form.items(multi=True), key=lambda item: item[0])
+        digest.update(json.dumps(fields, ensure_ascii=False).encode('utf-8'))
+        for name, file in sorted(req.files.items(multi=True), key=lambda item: item[0]):
+            file_digest = hashlib.sha256()
+            for chunk in iter(lambda: file.stream.read(FINGERPRINT_CHUNK_SIZE), b''):
+                file_digest.update(chunk)
+            file.stream.seek(0)
+            digest.update(json.dumps([name, file.filename, file_digest.hexdigest()], ensure_ascii=False).encode('utf-8'))
+    else:
+        digest.update(req.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def begin_idempotent(key):
+    """
+    Comprueba la clave antes de ejecutar la vista. Un reenvío con la misma
+    clave pero otro cuerpo (otra huella) se rechaza con 422.
+
+    Args:
+        key (str): Clave devuelta por idempotency_key()
+
+    Returns:
+        flask.Response: Respuesta guardada, o error si la clave no es válida
+            o está en curso; None si hay que ejecutar la vista
+    """
+    if len(key) - len(request.endpoint or '') - 1 > MAX_KEY_LENGTH:
+        return current_app.make_response((
+            jsonify({'error': f"La cabecera {IDEMPOTENCY_HEADER} admite como máximo {MAX_KEY_LENGTH} caracteres"}), 400
+        ))
+
+    state, stored = idempotency_store.begin(key, request_fingerprint(request))
+    if state == STATE_NEW:
+        return None
+
+    if state == STATE_MISMATCH:
+        metrics.increment('idempotency_total', result='mismatch')
+        current_app.logger.warning("Clave de idempotencia reutilizada con otra solicitud")
+        return current_app.make_response((
+            jsonify({'error': f"La {IDEMPOTENCY_HEADER} ya se usó con una solicitud distinta"}), 422
+        ))
+
+    if state == STATE_PENDING:
+        metrics.increment('idempotency_total', result='conflict')
+        current_app.logger.warning("Solicitud repetida mientras la original sigue en curso")
+        return current_app.make_response((
+            jsonify({'error': f"Hay una solicitud en curso con la misma {IDEMPOTENCY_HEADER}"}), 409
+        ))
+
+    metrics.increment('idempotency_total', result='replayed')
+    current_app.logger.info("Solicitud repetida: se devuelve la respuesta guardada")
+    response = current_app.response_class(stored['body'], status=stored['status'], headers=stored['headers'])
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def finish_idempotent(key, response):
+    """
+    Guarda la respuesta de la vista bajo la clave. Los errores (4xx y 5xx) no
+    se guardan, para que el cliente pueda corregir o reintentar la solicitud.
+
+    Args:
+        key (str): Clave devuelta por idempotency_key()
+        response (flask.Response): Respuesta de la vista
+    """
+    if response.status_code >= 400 or response.is_streamed:
+        idempotency_store.release(key)
+        return
+    idempotency_store.finish(key, {
+        'status': response.status_code,
+        'headers': [[name, response.headers[name]] for name in STORED_HEADERS if name in response.headers],
+        'body': response.get_data(as_text=True),
+    })
+    metrics.increment('idempotency_total', result='stored')
+
+
+def idempotent(view):
+    """Decorador de vistas que admiten la cabecera Idempotency-Key"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = idempotency_key(request)
+        if key is None:
+            return view(*args, **kwargs)
+
+        response = begin_idempotent(key)
+        if response is not None:
+            return response
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except BaseException:
+            idempotency_store.release(key)
+            raise
+        finish_idempotent(key, response)
+        return response
+    return wrapper
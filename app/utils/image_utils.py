@@ -1,9 +1,28 @@
 import os
+import io
 import uuid
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import contextlib
 from werkzeug.utils import secure_filename
-from PIL import Image
+from PIL import Image, ImageOps
 import logging
 
+try:
+    from app.utils.metrics import metrics
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from utils.metrics import metrics
+    from utils.logging_config import configure_logging
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # Intentar importar pillow-heif para manejar archivos HEIC
 try:
     import pillow_heif
@@ -13,13 +32,56 @@ except ImportError:
     HEIC_SUPPORT = False
     logging.warning("pillow-heif no está instalado. La conversión de archivos HEIC puede no funcionar correctamente.")
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
 # Extensiones de archivo permitidas
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'heic', 'heif'}
 
+# Marcas de la caja ftyp de los archivos HEIC/HEIF
+HEIF_BRANDS = {b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1'}
+
+# Ingesta de imágenes subidas: tamaño máximo del archivo guardado, tamaño de
+# los bloques que se leen de la solicitud y permisos del archivo final
+UPLOAD_MAX_SIZE = (1200, 1200)
+UPLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_FILE_MODE = 0o644
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Formato de Pillow y extensión con que se guarda cada formato detectado
+# (un HEIC solo conserva su formato si no se pudo convertir a JPEG)
+IMAGE_FORMATS = {
+    'jpeg': ('JPEG', 'jpg'),
+    'png': ('PNG', 'png'),
+    'gif': ('GIF', 'gif'),
+    'webp': ('WEBP', 'webp'),
+    'heic': ('HEIF', 'heic'),
+}
+FORMAT_EXTENSIONS = {save_format: extension for save_format, extension in IMAGE_FORMATS.values()}
+
+# Almacenamiento por contenido: cada imagen se guarda una sola vez en
+# <UPLOAD_FOLDER>/ab/cd/<sha256>.<ext> (los primeros caracteres del hash
+# reparten los archivos en subcarpetas) y un índice SQLite lleva la cuenta de
+# referencias de cada archivo. Con UPLOAD_STORE_ENABLED=false se vuelve a la
+# carpeta plana de archivos <uuid>_<nombre>.
+UPLOAD_STORE_ENABLED = os.environ.get('UPLOAD_STORE_ENABLED', 'true').lower() == 'true'
+UPLOAD_INDEX_DB = os.environ.get('UPLOAD_INDEX_DB', 'cache/uploads.db')
+
+# Preprocesamiento en memoria de las imágenes que se envían a Vision API.
+# Las etiquetas y objetos no necesitan alta resolución; el OCR de la tarjeta
+# de circulación sí, pero no necesita color.
+VISION_PREPROCESS_ENABLED = os.environ.get('VISION_PREPROCESS', 'true').lower() == 'true'
+VISION_INCIDENT_MAX_SIZE = int(os.environ.get('VISION_INCIDENT_MAX_SIZE', '640'))
+VISION_IMAGE_POLICIES = {
+    'incident': {
+        'max_size': (VISION_INCIDENT_MAX_SIZE, VISION_INCIDENT_MAX_SIZE),
+        'grayscale': False,
+        'quality': int(os.environ.get('VISION_INCIDENT_QUALITY', '80')),
+    },
+    'registration': {
+        'max_size': None,
+        'grayscale': True,
+        'quality': 90,
+    },
+}
+
 def allowed_file(filename):
     """
     Verifica si el archivo tiene una extensión permitida
@@ -33,86 +95,479 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def save_uploaded_image(file, upload_folder):
+def file_sha256(path):
+    """SHA-256 del contenido de un archivo, leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def upload_source_name(filename):
     """
-    Guarda una imagen subida por el usuario
+    Nombre con que se guardaba una imagen subida, del que el análisis toma
+    las pistas del nombre (el almacenamiento por contenido no lo conserva)
+    
+    Args:
+        filename (str): Nombre del archivo enviado por el cliente
+        
+    Returns:
+        str: Nombre seguro del archivo
+    """
+    return secure_filename(filename)
+
+
+class UploadStore:
+    """
+    Índice de las imágenes guardadas por contenido: ruta y número de
+    referencias de cada archivo, hash de cada subida ya vista (para reconocer
+    un duplicado sin decodificarlo) y nombres de la carpeta plana anterior
+    """
+
+    def __init__(self, db_path=UPLOAD_INDEX_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+
+    def _connection(self):
+        """Conexión SQLite del proceso actual"""
+        if self._db is None or self._db_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS blobs '
+                '(sha256 TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, '
+                'refcount INTEGER NOT NULL, created_at REAL NOT NULL)'
+            )
+            self._db.execute('CREATE TABLE IF NOT EXISTS uploads (upload_sha256 TEXT PRIMARY KEY, sha256 TEXT NOT NULL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS legacy_names (name TEXT PRIMARY KEY, sha256 TEXT NOT NULL)')
+            self._db_pid = os.getpid()
+        return self._db
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Transacción con bloqueo de escritura: los cambios del índice y de los
+        archivos no se intercalan con los de otros hilos ni workers
+        """
+        with self._lock:
+            db = self._connection()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+
+    @staticmethod
+    def shard_path(sha256, extension):
+        """Ruta relativa de un archivo: ab/cd/<sha256>.<ext>"""
+        return os.path.join(sha256[:2], sha256[2:4], f"{sha256}.{extension}")
+
+    def reuse(self, upload_folder, upload_sha256):
+        """
+        Añade una referencia al archivo de una subida ya vista
+        
+        Args:
+            upload_folder (str): Carpeta de imágenes
+            upload_sha256 (str): SHA-256 del contenido subido
+            
+        Returns:
+            str: Ruta del archivo existente, o None si la subida es nueva
+        """
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT blobs.sha256, blobs.path FROM uploads JOIN blobs ON blobs.sha256 = uploads.sha256 '
+                'WHERE uploads.upload_sha256 = ?', (upload_sha256,)
+            ).fetchone()
+            if row is None or not os.path.exists(os.path.join(upload_folder, row[1])):
+                return None
+            db.execute('UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?', (row[0],))
+        metrics.increment('upload_store_total', result='duplicate')
+        return os.path.join(upload_folder, row[1])
+
+    def store(self, upload_folder, source_path, sha256, extension, upload_sha256=None, legacy_name=None):
+        """
+        Mueve un archivo a su ruta por contenido (o lo descarta si ese
+        contenido ya estaba guardado) y le añade una referencia
+        
+        Args:
+            upload_folder (str): Carpeta de imágenes
+            source_path (str): Archivo a guardar (se mueve o se elimina)
+            sha256 (str): SHA-256 del contenido de source_path
+            extension (str): Extensión del archivo guardado
+            upload_sha256 (str, optional): SHA-256 del contenido subido, si
+                source_path es una versión recodificada
+            legacy_name (str, optional): Nombre del archivo en la carpeta plana
+            
+        Returns:
+            tuple: (ruta del archivo guardado, True si ya existía)
+        """
+        with self._transaction() as db:
+            row = db.execute('SELECT path FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+            existed = row is not None and os.path.exists(os.path.join(upload_folder, row[0]))
+            if existed:
+                relative_path = row[0]
+                os.remove(source_path)
+                db.execute('UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?', (sha256,))
+            else:
+                relative_path = self.shard_path(sha256, extension)
+                file_path = os.path.join(upload_folder, relative_path)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                os.replace(source_path, file_path)
+                db.execute(
+                    'INSERT OR REPLACE INTO blobs (sha256, path, size, refcount, created_at) VALUES (?, ?, ?, 1, ?)',
+                    (sha256, relative_path, os.path.getsize(file_path), time.time())
+                )
+            db.execute(
+                'INSERT OR REPLACE INTO uploads (upload_sha256, sha256) VALUES (?, ?)',
+                (upload_sha256 or sha256, sha256)
+            )
+            if legacy_name is not None:
+                db.execute('INSERT OR REPLACE INTO legacy_names (name, sha256) VALUES (?, ?)', (legacy_name, sha256))
+        metrics.increment('upload_store_total', result='duplicate' if existed else 'stored')
+        return os.path.join(upload_folder, relative_path), existed
+
+    def release(self, file_path, upload_folder):
+        """
+        Quita una referencia a un archivo y lo elimina si ya no tiene ninguna
+        
+        Args:
+            file_path (str): Ruta devuelta por ingest_upload o save_uploaded_image
+            upload_folder (str): Carpeta de imágenes
+            
+        Returns:
+            int: Referencias restantes (0 si el archivo se eliminó o no estaba en el índice)
+        """
+        sha256 = os.path.splitext(os.path.basename(file_path))[0]
+        with self._transaction() as db:
+            row = db.execute('SELECT path, refcount FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+            if row is None:
+                return 0
+            metrics.increment('upload_store_total', result='released')
+            if row[1] > 1:
+                db.execute('UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?', (sha256,))
+                return row[1] - 1
+            for table in ('blobs', 'uploads', 'legacy_names'):
+                db.execute(f'DELETE FROM {table} WHERE sha256 = ?', (sha256,))
+            path = os.path.join(upload_folder, row[0])
+            if os.path.exists(path):
+                os.remove(path)
+        return 0
+
+    def legacy_path(self, name):
+        """
+        Ruta relativa por contenido de un archivo de la carpeta plana anterior
+        
+        Args:
+            name (str): Nombre del archivo antes de migrar (<uuid>_<nombre>)
+            
+        Returns:
+            str: Ruta relativa (ab/cd/<sha256>.<ext>), o None si no se migró
+        """
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT blobs.path FROM legacy_names JOIN blobs ON blobs.sha256 = legacy_names.sha256 '
+                'WHERE legacy_names.name = ?', (name,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def migrate(self, upload_folder):
+        """
+        Mueve los archivos de la carpeta plana a sus rutas por contenido,
+        conservando una sola copia de cada imagen repetida
+        
+        Args:
+            upload_folder (str): Carpeta de imágenes
+            
+        Returns:
+            dict: Archivos migrados, duplicados eliminados y bytes liberados
+        """
+        stats = {'migrated': 0, 'duplicates': 0, 'bytes_freed': 0, 'skipped': 0}
+        for name in sorted(os.listdir(upload_folder)):
+            path = os.path.join(upload_folder, name)
+            if name.startswith('.') or not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as f:
+                image_format = detect_image_format(f.read(UPLOAD_CHUNK_SIZE))
+            if image_format is None and not allowed_file(name):
+                logger.warning(f"Se omite un archivo que no es una imagen: {name}")
+                stats['skipped'] += 1
+                continue
+            
+            extension = IMAGE_FORMATS[image_format][1] if image_format in IMAGE_FORMATS else name.rsplit('.', 1)[1].lower()
+            size = os.path.getsize(path)
+            _, existed = self.store(upload_folder, path, file_sha256(path), extension, legacy_name=name)
+            stats['migrated'] += 1
+            if existed:
+                stats['duplicates'] += 1
+                stats['bytes_freed'] += size
+        return stats
+
+
+# Índice compartido por el proceso
+upload_store = UploadStore()
+
+def detect_image_format(header):
+    """
+    Identifica el formato de una imagen por sus primeros bytes
+    
+    Args:
+        header (bytes): Primeros bytes del archivo
+        
+    Returns:
+        str: 'jpeg', 'png', 'gif', 'webp' o 'heic', o None si no es una imagen permitida
+    """
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    if header[4:8] == b'ftyp' and header[8:12] in HEIF_BRANDS:
+        return 'heic'
+    return None
+
+def ingest_upload(file, upload_folder, max_size=UPLOAD_MAX_SIZE):
+    """
+    Guarda una imagen subida leyéndola por bloques: calcula el SHA-256 a la
+    vez que escribe, valida los bytes iniciales antes de escribir nada y
+    decodifica la imagen una sola vez para reducirla, corregir la orientación
+    EXIF, quedarse con el primer cuadro de un GIF/WebP animado o convertir HEIC
+    a JPEG. El archivo final aparece de forma atómica (os.replace) en su ruta
+    por contenido (ver UploadStore); si ese contenido ya se había subido, se
+    reutiliza el archivo existente sin decodificar la imagen.
     
     Args:
         file: Objeto de archivo de Flask
         upload_folder (str): Carpeta donde guardar la imagen
+        max_size (tuple): Tamaño máximo (ancho, alto)
         
     Returns:
-        str: Ruta al archivo guardado
+        tuple: (ruta al archivo guardado, SHA-256 del contenido subido)
+        
+    Raises:
+        ValueError: Si el contenido no es una imagen de un formato permitido
     """
+    filename = secure_filename(file.filename)
+    header = file.stream.read(UPLOAD_CHUNK_SIZE)
+    image_format = detect_image_format(header)
+    if image_format is None:
+        raise ValueError("El contenido del archivo no es una imagen JPG, PNG, GIF, WebP o HEIC")
+    
+    # Los archivos HEIC/HEIF se convierten a JPEG
+    convert_to_jpeg = image_format == 'heic' or filename.lower().endswith(('.heic', '.heif'))
+    if convert_to_jpeg:
+        save_format = 'JPEG'
+        unique_filename = f"{uuid.uuid4().hex}_{os.path.splitext(filename)[0]}.jpg"
+    else:
+        # Si hay que recodificarla, la imagen se guarda en el formato que indica su extensión
+        save_format = Image.registered_extensions().get(os.path.splitext(filename)[1].lower(), IMAGE_FORMATS[image_format][0])
+        unique_filename = f"{uuid.uuid4().hex}_{filename}"
+    
+    digest = hashlib.sha256()
+    encoded_path = None
+    fd, raw_path = tempfile.mkstemp(prefix='.upload-', dir=upload_folder)
     try:
-        # Generar un nombre de archivo seguro y único
-        filename = secure_filename(file.filename)
-        
-        # Verificar si es un archivo HEIC/HEIF y convertirlo a JPEG
-        if filename.lower().endswith(('.heic', '.heif')):
-            # Cambiar la extensión a jpg para el nombre de archivo único
-            base_name = os.path.splitext(filename)[0]
-            unique_filename = f"{uuid.uuid4().hex}_{base_name}.jpg"
-            temp_path = os.path.join(upload_folder, f"temp_{unique_filename}")
-            file_path = os.path.join(upload_folder, unique_filename)
-            
-            # Guardar el archivo temporalmente
-            file.save(temp_path)
-            
-            try:
-                # Convertir HEIC a JPEG
-                img = Image.open(temp_path)
-                img.save(file_path, 'JPEG', quality=90)
-                
-                # Eliminar el archivo temporal
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                
-                logger.info(f"Archivo HEIC convertido a JPEG: {file_path}")
-            except Exception as e:
-                logger.error(f"Error al convertir archivo HEIC: {str(e)}")
-                # Si falla la conversión, intentamos usar el archivo original
-                if os.path.exists(temp_path):
-                    os.rename(temp_path, file_path)
+        with os.fdopen(fd, 'wb') as raw:
+            chunk = header
+            while chunk:
+                digest.update(chunk)
+                raw.write(chunk)
+                chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+        upload_sha256 = digest.hexdigest()
+        
+        # Una subida repetida es una consulta al índice
+        if UPLOAD_STORE_ENABLED:
+            file_path = upload_store.reuse(upload_folder, upload_sha256)
+            if file_path is not None:
+                return file_path, upload_sha256
+        
+        with metrics.timer('optimize_image'):
+            encoded_path = _encode_upload(raw_path, save_format, convert_to_jpeg, max_size)
+        
+        # Si no hizo falta recodificar, el archivo subido es el definitivo
+        final_source = encoded_path or raw_path
+        os.chmod(final_source, UPLOAD_FILE_MODE)
+        if UPLOAD_STORE_ENABLED:
+            # La extensión del archivo por contenido corresponde al formato de
+            # sus bytes (también si la conversión de HEIC a JPEG falló)
+            if encoded_path is None:
+                sha256, extension = upload_sha256, IMAGE_FORMATS[image_format][1]
+            else:
+                sha256, extension = file_sha256(encoded_path), FORMAT_EXTENSIONS[save_format]
+            file_path, _ = upload_store.store(upload_folder, final_source, sha256, extension, upload_sha256)
         else:
-            # Para otros formatos, proceder normalmente
-            unique_filename = f"{uuid.uuid4().hex}_{filename}"
+            if encoded_path is None and convert_to_jpeg:
+                unique_filename = f"{os.path.splitext(unique_filename)[0]}.{IMAGE_FORMATS[image_format][1]}"
             file_path = os.path.join(upload_folder, unique_filename)
-            file.save(file_path)
+            os.replace(final_source, file_path)
+    finally:
+        for path in (raw_path, encoded_path):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+    
+    return file_path, upload_sha256
+
+def _encode_upload(raw_path, save_format, convert_to_jpeg, max_size):
+    """
+    Decodifica una sola vez la imagen subida y, si hace falta, la recodifica
+    en un archivo temporal junto a raw_path
+    
+    Returns:
+        str: Ruta del archivo temporal recodificado, o None si el archivo
+            subido se puede usar tal cual
+    """
+    encoded_path = None
+    try:
+        img = Image.open(raw_path)
+        needs_resize = img.width > max_size[0] or img.height > max_size[1]
+        rotated = img.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1
+        animated = getattr(img, 'is_animated', False)
+        if not (convert_to_jpeg or needs_resize or rotated or animated):
+            return None
+        
+        # Con JPEG, decodificar directamente a una escala reducida (al doble del
+        # tamaño final, como thumbnail con reducing_gap=2.0)
+        if needs_resize and img.format == 'JPEG':
+            img.draft(img.mode, (max_size[0] * 2, max_size[1] * 2))
+        
+        # Copia del primer cuadro con la orientación EXIF aplicada
+        img = ImageOps.exif_transpose(img)
+        if needs_resize:
+            img.thumbnail(max_size, Image.LANCZOS)
+        
+        if convert_to_jpeg and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
         
-        # Optimizar la imagen
-        optimize_image(file_path)
+        fd, encoded_path = tempfile.mkstemp(prefix='.upload-', dir=os.path.dirname(raw_path))
+        with os.fdopen(fd, 'wb') as encoded:
+            if needs_resize:
+                img.save(encoded, save_format, optimize=True, quality=85)
+            else:
+                img.save(encoded, save_format, quality=90)
         
-        logger.info(f"Imagen guardada en: {file_path}")
+        logger.info("Imagen optimizada: %s", raw_path)
+        return encoded_path
+    
+    except Exception as e:
+        logger.error(f"Error al optimizar la imagen: {str(e)}")
+        if encoded_path is not None and os.path.exists(encoded_path):
+            os.remove(encoded_path)
+        # No lanzamos excepción: se conserva el archivo tal como se subió
+        return None
+
+def save_uploaded_image(file, upload_folder):
+    """
+    Guarda una imagen subida por el usuario
+    
+    Args:
+        file: Objeto de archivo de Flask
+        upload_folder (str): Carpeta donde guardar la imagen
+        
+    Returns:
+        str: Ruta al archivo guardado
+        
+    Raises:
+        ValueError: Si el contenido no es una imagen de un formato permitido
+            (error de la solicitud, se propaga sin cambios)
+        Exception: Si la imagen no se pudo guardar
+    """
+    try:
+        file_path, _ = ingest_upload(file, upload_folder)
+        logger.info("Imagen guardada en: %s", file_path)
         return file_path
     
+    except ValueError as e:
+        logger.warning(f"Imagen rechazada: {str(e)}")
+        raise
+    
     except Exception as e:
         logger.error(f"Error al guardar la imagen: {str(e)}")
         raise Exception(f"Error al guardar la imagen: {str(e)}")
 
-def optimize_image(file_path, max_size=(1200, 1200)):
+def discard_uploads(upload_folder, *file_paths):
     """
-    Optimiza una imagen redimensionándola si es necesario
+    Descarta las imágenes guardadas de una solicitud que falló antes de
+    devolver sus URLs. Con el almacenamiento por contenido se quita la
+    referencia de la solicitud (el archivo se elimina con la última); en la
+    carpeta plana se elimina el archivo.
     
     Args:
-        file_path (str): Ruta al archivo de imagen
-        max_size (tuple): Tamaño máximo (ancho, alto)
+        upload_folder (str): Carpeta de imágenes
+        *file_paths (str): Rutas devueltas por save_uploaded_image (se ignoran las None)
+    """
+    for file_path in file_paths:
+        if file_path is None:
+            continue
+        try:
+            if UPLOAD_STORE_ENABLED:
+                upload_store.release(file_path, upload_folder)
+            elif os.path.exists(file_path):
+                os.remove(file_path)
+            logger.info("Imagen descartada: %s", file_path)
+        except Exception as e:
+            logger.warning(f"No se pudo descartar la imagen {file_path}: {str(e)}")
+
+def prepare_image_for_vision(content, policy='incident'):
+    """
+    Reduce y recodifica en memoria una imagen antes de enviarla a Vision API,
+    sin modificar el archivo original
+    
+    Args:
+        content (bytes): Contenido original de la imagen
+        policy (str): Política de VISION_IMAGE_POLICIES ('incident' o 'registration')
         
     Returns:
-        None
+        tuple: (bytes a enviar, estadísticas con bytes originales, enviados y ahorrados)
     """
+    stats = {
+        'policy': policy,
+        'original_bytes': len(content),
+        'sent_bytes': len(content),
+        'bytes_saved': 0
+    }
+    if not VISION_PREPROCESS_ENABLED:
+        return content, stats
+    
+    settings = VISION_IMAGE_POLICIES[policy]
+    max_size = settings['max_size']
+    mode = 'L' if settings['grayscale'] else 'RGB'
+    
     try:
-        # Abrir la imagen
-        img = Image.open(file_path)
+        img = Image.open(io.BytesIO(content))
         
-        # Verificar si la imagen necesita ser redimensionada
-        if img.width > max_size[0] or img.height > max_size[1]:
+        # Con JPEG, decodificar directamente a una escala reducida
+        if max_size and img.format == 'JPEG':
+            img.draft(mode, max_size)
+        
+        # La orientación EXIF se pierde al recodificar, así que se aplica antes
+        img = ImageOps.exif_transpose(img)
+        if img.mode != mode:
+            img = img.convert(mode)
+        if max_size:
             img.thumbnail(max_size, Image.LANCZOS)
-            
-            # Guardar la imagen optimizada
-            img.save(file_path, optimize=True, quality=85)
-            logger.info(f"Imagen optimizada: {file_path}")
-    
+        
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=settings['quality'])
+        prepared = buffer.getvalue()
     except Exception as e:
-        logger.error(f"Error al optimizar la imagen: {str(e)}")
-        # No lanzamos excepción para no interrumpir el flujo principal 
\ No newline at end of file
+        logger.warning(f"No se pudo preprocesar la imagen para Vision API: {str(e)}")
+        return content, stats
+    
+    # Si la imagen original ya era más pequeña, enviarla tal cual
+    if len(prepared) >= len(content):
+        return content, stats
+    
+    stats['sent_bytes'] = len(prepared)
+    stats['bytes_saved'] = len(content) - len(prepared)
+    stats['size'] = [img.width, img.height]
+    logger.info("Imagen preprocesada para Vision API (%s): %d -> %d bytes", policy, len(content), len(prepared))
+    return prepared, stats
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import datetime
+import threading
+import logging
+import concurrent.futures
+
+try:
+    from app.utils.metrics import metrics
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from utils.metrics import metrics
+    from utils.logging_config import configure_logging
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Trabajos asíncronos: el endpoint responde con un id en cuanto guarda las
+# imágenes y el análisis se ejecuta en un pool acotado; el cliente consulta
+# GET /api/jobs/<id> (opcionalmente esperando hasta JOB_MAX_WAIT segundos).
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+# Trabajos en cola o en ejecución por proceso; por encima se rechazan (503)
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', '100'))
+# Segundos que se conserva el resultado de un trabajo terminado
+JOB_RESULT_TTL = float(os.environ.get('JOB_RESULT_TTL', '600'))
+# Espera máxima (segundos) de GET /api/jobs/<id>?wait=
+JOB_MAX_WAIT = float(os.environ.get('JOB_MAX_WAIT', '30'))
+# Archivo SQLite opcional para compartir los trabajos entre workers de gunicorn
+JOB_STORE_DB = os.environ.get('JOB_STORE_DB', '')
+
+# Intervalo de consulta a SQLite cuando se espera un trabajo de otro proceso
+DB_POLL_INTERVAL = 0.2
+# Cada cuántas escrituras se borran de SQLite los trabajos vencidos
+DB_PURGE_INTERVAL = 100
+
+FINISHED_STATUSES = ('done', 'error')
+
+
+class JobQueueFull(Exception):
+    """Hay demasiados trabajos en cola o en ejecución"""
+
+
+def job_requested(request):
+    """Indica si el cliente pidió procesar la solicitud como trabajo asíncrono"""
+    return (
+        request.args.get('async', request.form.get('async', '')).lower() == 'true'
+        or 'respond-async' in request.headers.get('Prefer', '').lower()
+    )
+
+
+class JobQueue:
+    """
+    Pool acotado de trabajos con resultados que vencen después de
+    JOB_RESULT_TTL segundos. Los resultados se guardan en memoria y,
+    opcionalmente, en SQLite para consultarlos desde cualquier worker.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_pending=JOB_QUEUE_SIZE,
+                 ttl=JOB_RESULT_TTL, db_path=JOB_STORE_DB):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._events = {}
+        self._pending = 0
+        self._executor = None
+        self._pid = None
+        self._db = None
+        self._db_pid = None
+        self._db_writes = 0
+
+    @property
+    def shared(self):
+        """Los trabajos se guardan en SQLite y cualquier worker puede consultarlos"""
+        return bool(self.db_path)
+
+    def _get_executor(self):
+        """Pool de hilos del proceso actual (los hilos no sobreviven a un fork)"""
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix='job-queue'
+            )
+            self._pid = os.getpid()
+            self._jobs = {}
+            self._events = {}
+            self._pending = 0
+        return self._executor
+
+    def _connection(self):
+        """Conexión SQLite del proceso actual (None si no hay archivo configurado)"""
+        if not self.db_path:
+            return None
+        if self._db is None or self._db_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS jobs '
+                '(job_id TEXT PRIMARY KEY, record TEXT NOT NULL, expires_at REAL)'
+            )
+            self._db.commit()
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _save(self, record):
+        """Guarda el estado de un trabajo (se llama con el lock tomado)"""
+        self._jobs[record['job_id']] = record
+        try:
+            db = self._connection()
+            if db is None:
+                return
+            db.execute(
+                'INSERT OR REPLACE INTO jobs (job_id, record, expires_at) VALUES (?, ?, ?)',
+                (record['job_id'], json.dumps(record, ensure_ascii=False), record['expires_at'])
+            )
+            self._db_writes += 1
+            if self._db_writes % DB_PURGE_INTERVAL == 0:
+                db.execute('DELETE FROM jobs WHERE expires_at < ?', (time.time(),))
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Error al guardar el trabajo {record['job_id']}: {str(e)}")
+
+    def _purge(self):
+        """Elimina de memoria los trabajos vencidos (se llama con el lock tomado)"""
+        now = time.time()
+        expired = [
+            job_id for job_id, record in self._jobs.items()
+            if record['expires_at'] is not None and record['expires_at'] < now
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+            self._events.pop(job_id, None)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Encola un trabajo
+
+        Args:
+            fn (callable): Función que devuelve (cuerpo de la respuesta, código HTTP)
+
+        Returns:
+            dict: Estado inicial del trabajo (job_id, status, created_at)
+
+        Raises:
+            JobQueueFull: Si ya hay max_pending trabajos en cola o en ejecución
+        """
+        with self._lock:
+            executor = self._get_executor()
+            self._purge()
+            if self._pending >= self.max_pending:
+                metrics.increment('jobs_total', status='rejected')
+                raise JobQueueFull(f"Hay {self._pending} trabajos en cola o en ejecución")
+
+            record = {
+                'job_id': uuid.uuid4().hex,
+                'status': 'queued',
+                'created_at': datetime.datetime.now().isoformat(),
+                'finished_at': None,
+                'expires_at': None,
+            }
+            self._save(record)
+            self._events[record['job_id']] = threading.Event()
+            self._pending += 1
+            executor.submit(self._run, record['job_id'], time.perf_counter(), fn, args, kwargs)
+            metrics.increment('jobs_total', status='queued')
+            return self._public(record)
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            record = dict(self._jobs[job_id], **changes)
+            self._save(record)
+
+    def _run(self, job_id, queued_at, fn, args, kwargs):
+        metrics.observe('job_queue_wait', time.perf_counter() - queued_at)
+        self._update(job_id, status='running')
+        changes = {}
+        try:
+            body, status_code = fn(*args, **kwargs)
+            changes = {'status': 'done', 'result': body, 'status_code': status_code}
+        except Exception as e:
+            logger.error(f"Error en el trabajo {job_id}: {str(e)}")
+            changes = {'status': 'error', 'error': str(e), 'status_code': 500}
+        finally:
+            changes.setdefault('status', 'error')
+            self._update(
+                job_id,
+                finished_at=datetime.datetime.now().isoformat(),
+                expires_at=time.time() + self.ttl,
+                **changes
+            )
+            with self._lock:
+                self._pending -= 1
+                event = self._events.get(job_id)
+            if event is not None:
+                event.set()
+            metrics.increment('jobs_total', status=changes['status'])
+
+    @staticmethod
+    def _public(record):
+        return {key: value for key, value in record.items() if key != 'expires_at'}
+
+    def get(self, job_id):
+        """
+        Estado de un trabajo
+
+        Args:
+            job_id (str): Id devuelto por submit()
+
+        Returns:
+            dict: Estado del trabajo (con result y status_code si terminó),
+                o None si no existe o ya venció
+        """
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None:
+                try:
+                    db = self._connection()
+                    row = db.execute(
+                        'SELECT record FROM jobs WHERE job_id = ?', (job_id,)
+                    ).fetchone() if db is not None else None
+                except Exception as e:
+                    logger.warning(f"Error al leer el trabajo {job_id}: {str(e)}")
+                    row = None
+                record = json.loads(row[0]) if row is not None else None
+        if record is None:
+            return None
+        if record['expires_at'] is not None and record['expires_at'] < time.time():
+            return None
+        return self._public(record)
+
+    def wait(self, job_id, timeout):
+        """
+        Espera a que un trabajo termine
+
+        Args:
+            job_id (str): Id devuelto por submit()
+            timeout (float): Segundos máximos de espera
+
+        Returns:
+            dict: Estado del trabajo al terminar o al agotarse la espera, o None
+                si no existe o ya venció
+        """
+        with self._lock:
+            event = self._events.get(job_id) if self._pid == os.getpid() else None
+        if event is not None:
+            event.wait(timeout)
+            return self.get(job_id)
+
+        # Trabajo de otro worker: consultar SQLite hasta que termine
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in FINISHED_STATUSES or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(DB_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+
+
+# Cola de trabajos compartida por el proceso
+job_queue = JobQueue()
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import datetime
+import logging
+import logging.handlers
+
+# Registro de la aplicación fuera del hilo de la solicitud: los módulos solo
+# encolan el LogRecord (sin formatear el mensaje) y un hilo en segundo plano
+# lo formatea como una línea JSON y lo escribe. Se configura sin tocar código:
+#   LOG_LEVEL        - nivel general (INFO por defecto)
+#   LOG_LEVELS       - niveles por logger, p. ej. "app.api.vision_api=DEBUG,werkzeug=WARNING"
+#   LOG_FORMAT       - json (por defecto) o text
+#   LOG_QUEUE_SIZE   - registros pendientes como máximo; si la cola se llena
+#                      se descartan en lugar de bloquear la solicitud
+#   LOG_SAMPLE_RATE  - fracción de análisis que registran cada anotación en DEBUG
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+
+# Atributos propios de LogRecord; el resto son campos pasados con extra=
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_queue_handler = None
+_listener = None
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formatea cada registro como una línea JSON con los campos pasados en extra=
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Formato de texto de logging.basicConfig, seguido de los campos extra=
+    """
+
+    def __init__(self):
+        super().__init__(logging.BASIC_FORMAT)
+
+    def format(self, record):
+        text = super().format(record)
+        extra = _extra_fields(record)
+        if extra:
+            text += ' ' + ' '.join(f"{key}={value!r}" for key, value in extra.items())
+        return text
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola los registros sin formatearlos y sin bloquear si la cola está llena
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # El mensaje se formatea en el hilo de escritura; solo la traza de una
+        # excepción se convierte aquí, porque hace referencia a la pila actual
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            warning = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                "Se descartaron %d registros porque la cola de logging estaba llena", (dropped,), None
+            )
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                self.dropped += dropped
+
+
+def _start_listener():
+    """Crea la cola y el hilo de escritura (también en cada proceso hijo)"""
+    global _listener
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _queue_handler.queue = log_queue
+    _queue_handler.dropped = 0
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(TextFormatter() if LOG_FORMAT == 'text' else JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    """Escribe los registros pendientes antes de terminar el proceso"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def configure_logging():
+    """
+    Configura el logging de la aplicación (una sola vez por proceso).
+    Al igual que logging.basicConfig, no hace nada si ya hay handlers en el
+    logger raíz.
+    """
+    global _queue_handler
+    root = logging.getLogger()
+    if _queue_handler is not None or root.handlers:
+        return
+
+    _queue_handler = NonBlockingQueueHandler(None)
+    _start_listener()
+    root.addHandler(_queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    for item in LOG_LEVELS.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+    atexit.register(_stop_listener)
+    # El hilo de escritura no sobrevive a un fork (workers de gunicorn con --preload)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_start_listener)
+
+
+def sample_debug(logger, rate=None):
+    """
+    Decide si registrar la salida de depuración detallada de esta operación
+
+    Args:
+        logger (logging.Logger): Logger que registrará la salida
+        rate (float, optional): Fracción muestreada (por defecto LOG_SAMPLE_RATE)
+
+    Returns:
+        bool: True si DEBUG está activo para el logger y la operación fue muestreada
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    rate = LOG_SAMPLE_RATE if rate is None else rate
+    return rate >= 1 or random.random() < rate
@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import bisect
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    from app.utils.tracing import record_span
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from utils.tracing import record_span
+    from utils.logging_config import configure_logging
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Métricas de latencia por etapa y contadores, expuestas en /metrics con el
+# formato de texto de Prometheus. Cada proceso acumula sus propias métricas;
+# con METRICS_DIR los workers de gunicorn guardan periódicamente una copia en
+# ese directorio y /metrics devuelve la suma de todos los workers vivos.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
+METRICS_PREFIX = 'siniestros'
+
+# Límites de los buckets (segundos): escala logarítmica de 0.1 ms a ~74 s con
+# razón raíz de 2, para estimar percentiles con un error menor al 20 %
+LATENCY_BUCKETS = tuple(round(0.0001 * 2 ** (exponent / 2), 7) for exponent in range(40))
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Descripción de los contadores conocidos
+COUNTER_HELP = {
+    'vision_requests_total': 'Llamadas a Vision API por método y resultado',
+    'vision_cache_total': 'Consultas a la caché de anotaciones de Vision API',
+    'analysis_stage_total': 'Análisis de imágenes por etapa que los resolvió',
+    'fallbacks_total': 'Respuestas degradadas por motivo',
+    'geocoding_cache_total': 'Consultas a la caché de geocodificación (hit, stale o miss)',
+    'geocoding_calls_saved_total': 'Llamadas a Geocoding API evitadas por la caché',
+    'geocoding_requests_total': 'Llamadas a Geocoding API por modo (síncrona, asíncrona o actualización) y resultado',
+    'geocoding_offline_total': 'Ubicaciones resueltas con el nomenclátor local por motivo',
+    'places_index_total': 'Búsquedas de lugares cercanos en el índice local (hit, miss, refresh o truncated)',
+    'jobs_total': 'Trabajos asíncronos por estado (queued, done, error o rejected)',
+    'single_flight_total': 'Análisis agrupados por single-flight (leader, coalesced o timeout)',
+    'idempotency_total': 'Solicitudes con Idempotency-Key (stored, replayed, conflict o mismatch)',
+    'upload_store_total': 'Imágenes subidas guardadas por contenido (stored, duplicate o released)',
+}
+
+
+class LatencyHistogram:
+    """
+    Histograma de latencias con buckets fijos. Se puede sumar con otros
+    histogramas (de otros workers) y estimar percentiles por interpolación.
+    """
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self, counts=None, total=0.0, count=0):
+        self.counts = list(counts) if counts else [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = total
+        self.count = count
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def merge(self, other):
+        for index, value in enumerate(other.counts):
+            self.counts[index] += value
+        self.total += other.total
+        self.count += other.count
+
+    def quantile(self, fraction):
+        """
+        Estima un percentil interpolando dentro del bucket que lo contiene
+
+        Args:
+            fraction (float): Percentil entre 0 y 1
+
+        Returns:
+            float: Latencia estimada en segundos (0.0 sin observaciones)
+        """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        cumulative = 0
+        for index, value in enumerate(self.counts):
+            if value and cumulative + value >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0.0
+                upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else lower * 2
+                return lower + (upper - lower) * (rank - cumulative) / value
+            cumulative += value
+        return LATENCY_BUCKETS[-1]
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = ','.join(f'{name}="{str(value)}"' for name, value in labels)
+    return '{' + parts + '}'
+
+
+def _format_float(value):
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Histogramas de latencia por etapa y contadores con etiquetas
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.enabled = enabled
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._last_flush = time.monotonic()
+
+    def observe(self, stage, seconds):
+        """Registra la duración (segundos) de una etapa"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+        self._maybe_flush()
+
+    def increment(self, name, amount=1, **labels):
+        """Incrementa un contador, por ejemplo increment('vision_cache_total', result='hit')"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, stage):
+        """
+        Mide la duración del bloque y la registra en la etapa indicada
+        (y en la traza de la solicitud actual, ver tracing.py)
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.observe(stage, end - start)
+            record_span(stage, start, end)
+
+    def snapshot(self):
+        """
+        Copia de las métricas del proceso actual
+
+        Returns:
+            dict: {'histograms': {etapa: {...}}, 'counters': [[nombre, etiquetas, valor]]}
+        """
+        with self._lock:
+            return {
+                'histograms': {
+                    stage: {'counts': list(histogram.counts), 'total': histogram.total, 'count': histogram.count}
+                    for stage, histogram in self._histograms.items()
+                },
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+            }
+
+    def _maybe_flush(self):
+        if not self.directory:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_flush < self.flush_interval:
+                return
+            self._last_flush = now
+        self.flush()
+
+    def flush(self):
+        """Guarda la copia de este proceso en METRICS_DIR (si está configurado)"""
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as temp_file:
+                json.dump(self.snapshot(), temp_file)
+            os.replace(temp_path, os.path.join(self.directory, f"{os.getpid()}.json"))
+        except Exception as e:
+            logger.warning(f"No se pudieron guardar las métricas del proceso: {str(e)}")
+
+    def _collect(self):
+        """Suma las métricas de este proceso y las de los demás workers vivos"""
+        snapshots = [self.snapshot()]
+        if self.directory:
+            self.flush()
+            # flush() crea el directorio si todavía no existe
+            for file_name in os.listdir(self.directory):
+                pid_text, extension = os.path.splitext(file_name)
+                if extension != '.json' or not pid_text.isdigit() or int(pid_text) == os.getpid():
+                    continue
+                path = os.path.join(self.directory, file_name)
+                try:
+                    os.kill(int(pid_text), 0)
+                except ProcessLookupError:
+                    # El worker ya no existe: descartar su copia
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                except OSError:
+                    pass
+                try:
+                    with open(path, 'r', encoding='utf-8') as snapshot_file:
+                        snapshots.append(json.load(snapshot_file))
+                except Exception as e:
+                    logger.warning(f"Métricas inválidas en {file_name}: {str(e)}")
+
+        histograms = {}
+        counters = {}
+        for snapshot in snapshots:
+            for stage, data in snapshot['histograms'].items():
+                histograms.setdefault(stage, LatencyHistogram()).merge(LatencyHistogram(**data))
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+        return histograms, counters
+
+    def render(self):
+        """
+        Genera las métricas en el formato de texto de Prometheus
+
+        Returns:
+            str: Texto para el endpoint /metrics
+        """
+        histograms, counters = self._collect()
+        lines = []
+
+        name = f"{METRICS_PREFIX}_stage_duration_seconds"
+        lines.append(f"# HELP {name} Duración de cada etapa del análisis")
+        lines.append(f"# TYPE {name} histogram")
+        for stage in sorted(histograms):
+            histogram = histograms[stage]
+            cumulative = 0
+            for bound, value in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulative += value
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {_format_float(histogram.total)}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+        name = f"{METRICS_PREFIX}_stage_duration_quantile_seconds"
+        lines.append(f"# HELP {name} Percentiles estimados de la duración de cada etapa")
+        lines.append(f"# TYPE {name} gauge")
+        for stage in sorted(histograms):
+            for fraction in QUANTILES:
+                value = round(histograms[stage].quantile(fraction), 9)
+                lines.append(f'{name}{{stage="{stage}",quantile="{fraction}"}} {_format_float(value)}')
+
+        for counter_name in sorted({key[0] for key in counters}):
+            name = f"{METRICS_PREFIX}_{counter_name}"
+            lines.append(f"# HELP {name} {COUNTER_HELP.get(counter_name, counter_name)}")
+            lines.append(f"# TYPE {name} counter")
+            for (key_name, labels), value in sorted(counters.items()):
+                if key_name == counter_name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """
+        Percentiles por etapa en milisegundos (para registros y benchmarks)
+
+        Returns:
+            dict: {etapa: {'count', 'p50', 'p95', 'p99'}}
+        """
+        histograms, _ = self._collect()
+        return {
+            stage: {
+                'count': histogram.count,
+                'p50': round(histogram.quantile(0.5) * 1000, 3),
+                'p95': round(histogram.quantile(0.95) * 1000, 3),
+                'p99': round(histogram.quantile(0.99) * 1000, 3),
+            }
+            for stage, histogram in sorted(histograms.items())
+        }
+
+
+# Métricas compartidas por el proceso
+metrics = MetricsRegistry()
@@ -0,0 +1,453 @@
+import os
+import copy
+import hashlib
+import json
+import time
+import asyncio
+import tempfile
+import threading
+import logging
+
+try:
+    from app.utils.metrics import metrics
+    from app.utils.logging_config import configure_logging
+except ImportError:
+    # Si estamos ejecutando desde dentro del directorio app
+    from utils.metrics import metrics
+    from utils.logging_config import configure_logging
+
+# Intentar importar fcntl para coordinar los workers de gunicorn
+try:
+    import fcntl
+    FCNTL_SUPPORT = True
+except ImportError:
+    FCNTL_SUPPORT = False
+    logging.warning("fcntl no está disponible. Las solicitudes idénticas solo se agruparán dentro de cada proceso.")
+
+# Configurar logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Agrupación de solicitudes idénticas (single-flight): si llegan a la vez
+# varias solicitudes con la misma clave (hash del contenido y modo), solo la
+# primera llama a la API y las demás esperan su resultado. Dentro del proceso
+# se coordinan con un Event; entre workers, con un archivo de bloqueo por
+# clave en SINGLE_FLIGHT_DIR. Los workers que esperan actualizan la fecha de
+# ese archivo, y solo entonces quien termina deja ahí el resultado, que se
+# borra a los pocos segundos (puede contener datos personales de una tarjeta).
+SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+SINGLE_FLIGHT_DIR = os.environ.get('SINGLE_FLIGHT_DIR', os.path.join('cache', 'single_flight'))
+# Espera máxima (segundos) por el resultado de otra solicitud; después se
+# hace el análisis de todos modos
+SINGLE_FLIGHT_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_TIMEOUT', '35'))
+# Segundos que se conservan los archivos de bloqueo
+SINGLE_FLIGHT_FILE_TTL = float(os.environ.get('SINGLE_FLIGHT_FILE_TTL', '120'))
+# Segundos que se conserva el resultado dejado para los workers que esperaban
+SINGLE_FLIGHT_RESULT_TTL = float(os.environ.get('SINGLE_FLIGHT_RESULT_TTL', '5'))
+
+# Intervalo de consulta del bloqueo de otro worker
+LOCK_POLL_INTERVAL = 0.05
+
+
+def file_key(path, mode):
+    """
+    Clave de single-flight de un archivo: SHA-256 de su contenido y del modo
+
+    Args:
+        path (str): Ruta del archivo
+        mode (str): Modo de la llamada (tipo de análisis, parámetros, etc.)
+
+    Returns:
+        str: Clave hexadecimal, o None si no se puede leer el archivo
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    digest.update(f"|{mode}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class _Flight:
+    """Llamada en curso dentro del proceso"""
+
+    __slots__ = ('done', 'completed', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.completed = False
+        self.result = None
+        self.error = None
+        # Futures de corrutinas que esperan, con su bucle de eventos
+        self.waiters = []
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class SingleFlight:
+    """
+    Agrupa las llamadas concurrentes con la misma clave: la primera ejecuta
+    la función y las demás reciben una copia de su resultado (o su excepción).
+    No es una caché: al terminar la llamada la clave se libera.
+
+    run() y run_async() comparten las llamadas en curso, así que una
+    corrutina puede esperar a un hilo y al revés.
+    """
+
+    def __init__(self, name, directory=SINGLE_FLIGHT_DIR, timeout=SINGLE_FLIGHT_TIMEOUT,
+                 file_ttl=SINGLE_FLIGHT_FILE_TTL, result_ttl=SINGLE_FLIGHT_RESULT_TTL,
+                 enabled=SINGLE_FLIGHT_ENABLED):
+        self.name = name
+        self.directory = directory
+        self.timeout = timeout
+        self.file_ttl = file_ttl
+        self.result_ttl = result_ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._last_purge = 0.0
+
+    def _join(self, key):
+        """Devuelve (llamada en curso, True si quien llama debe ejecutarla)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _land(self, key, flight, result=None, error=None, completed=True):
+        """
+        Publica el resultado de la llamada y libera la clave (completed=False
+        si se canceló: quienes esperan la hacen por su cuenta)
+        """
+        flight.completed = completed
+        flight.result = result
+        flight.error = error
+        with self._lock:
+            self._flights.pop(key, None)
+            flight.done.set()
+            waiters, flight.waiters = flight.waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                # El bucle de eventos ya se cerró
+                pass
+
+    def _outcome(self, flight):
+        """
+        Resultado de una llamada terminada para quien la esperaba
+
+        Returns:
+            tuple: (True y una copia del resultado, o False si la llamada se canceló)
+        """
+        if not flight.completed:
+            return False, None
+        metrics.increment('single_flight_total', kind=self.name, result='coalesced')
+        if flight.error is not None:
+            raise flight.error
+        return True, copy.deepcopy(flight.result)
+
+    def _timed_out(self):
+        metrics.increment('single_flight_total', kind=self.name, result='timeout')
+        return False, None
+
+    def _follow(self, flight):
+        """Espera la llamada de otro hilo (ver _outcome)"""
+        if not flight.done.wait(self.timeout):
+            return self._timed_out()
+        return self._outcome(flight)
+
+    async def _follow_async(self, flight):
+        """Espera la llamada de otro hilo o corrutina sin ocupar un hilo"""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        with self._lock:
+            if not flight.done.is_set():
+                flight.waiters.append((loop, waiter))
+            else:
+                waiter.set_result(None)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            return self._timed_out()
+        return self._outcome(flight)
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, f"{self.name}-{key}")
+        return base + '.lock', base + '.json'
+
+    def _open_lock(self, key):
+        """Abre el archivo de bloqueo de la clave (None si no hay coordinación entre workers)"""
+        if not FCNTL_SUPPORT:
+            return None
+        lock_path, _ = self._paths(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            return open(lock_path, 'a')
+        except OSError as e:
+            logger.warning(f"No se pudo abrir el archivo de bloqueo {lock_path}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _try_lock(lock_file):
+        """
+        Intenta tomar el bloqueo sin esperar
+
+        Returns:
+            bool: True si se tomó, False si lo tiene otro worker, None si falló
+        """
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+        except OSError as e:
+            logger.warning(f"No se pudo bloquear {lock_file.name}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _announce(lock_file):
+        """Avisa a quien tiene el bloqueo de que hay un worker esperando su resultado"""
+        try:
+            os.utime(lock_file.name)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _waiter_seen(lock_file):
+        """Indica si algún worker empezó a esperar después de tomar el bloqueo"""
+        try:
+            return os.stat(lock_file.name).st_mtime_ns > lock_file.acquired_ns
+        except OSError:
+            return False
+
+    def _locked(self, key, lock_file, acquired, waited_since):
+        """
+        Termina la espera por el bloqueo entre workers
+
+        Returns:
+            tuple: (archivo de bloqueo tomado o None, resultado del otro worker o None)
+        """
+        if not acquired:
+            if acquired is False:
+                self._timed_out()
+            lock_file.close()
+            return None, None
+
+        # Marcar el archivo como en uso para que purge() no lo borre; los
+        # workers que esperen lo volverán a marcar (ver _waiter_seen)
+        try:
+            os.utime(lock_file.name)
+            lock_file.acquired_ns = os.fstat(lock_file.fileno()).st_mtime_ns
+        except OSError:
+            lock_file.acquired_ns = 0
+        self._purge_if_due()
+
+        if waited_since is not None:
+            # Otro worker hizo la misma llamada mientras esperábamos
+            _, result_path = self._paths(key)
+            result = self._read_result(result_path, waited_since)
+            if result is not None:
+                metrics.increment('single_flight_total', kind=self.name, result='coalesced')
+                self._unlock(lock_file)
+                return None, result
+        return lock_file, None
+
+    def _lock_file(self, key):
+        """
+        Toma el bloqueo de la clave entre workers; si otro worker lo tiene,
+        espera a que lo suelte (hasta timeout segundos)
+
+        Returns:
+            tuple: (archivo de bloqueo o None, resultado del otro worker o None)
+        """
+        lock_file = self._open_lock(key)
+        if lock_file is None:
+            return None, None
+        waited_since = None
+        deadline = time.monotonic() + self.timeout
+        acquired = self._try_lock(lock_file)
+        while acquired is False and time.monotonic() < deadline:
+            waited_since = waited_since or time.time()
+            self._announce(lock_file)
+            time.sleep(LOCK_POLL_INTERVAL)
+            acquired = self._try_lock(lock_file)
+        return self._locked(key, lock_file, acquired, waited_since)
+
+    async def _lock_file_async(self, key):
+        """Igual que _lock_file, esperando con asyncio.sleep"""
+        lock_file = self._open_lock(key)
+        if lock_file is None:
+            return None, None
+        waited_since = None
+        deadline = time.monotonic() + self.timeout
+        acquired = self._try_lock(lock_file)
+        while acquired is False and time.monotonic() < deadline:
+            waited_since = waited_since or time.time()
+            self._announce(lock_file)
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            acquired = self._try_lock(lock_file)
+        return self._locked(key, lock_file, acquired, waited_since)
+
+    @staticmethod
+    def _read_result(path, since):
+        try:
+            if os.path.getmtime(path) < since:
+                return None
+            with open(path, 'r', encoding='utf-8') as result_file:
+                return json.load(result_file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, key, result):
+        """
+        Deja el resultado para los workers que esperan (se llama con el bloqueo
+        tomado) y lo borra pasados result_ttl segundos
+        """
+        _, result_path = self._paths(key)
+        try:
+            data = json.dumps(result, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, result_path)
+            written_ns = os.stat(result_path).st_mtime_ns
+        except OSError as e:
+            logger.warning(f"No se pudo guardar el resultado compartido {result_path}: {str(e)}")
+            return
+
+        timer = threading.Timer(self.result_ttl, self._remove_result, (result_path, written_ns))
+        timer.daemon = True
+        timer.start()
+
+    @staticmethod
+    def _remove_result(path, written_ns):
+        """Borra un resultado compartido si nadie lo reemplazó desde que se escribió"""
+        try:
+            if os.stat(path).st_mtime_ns == written_ns:
+                os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _unlock(lock_file):
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        finally:
+            lock_file.close()
+
+    def _purge_if_due(self):
+        """Llama a purge() si la última vez fue hace más de result_ttl segundos"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < self.result_ttl:
+                return
+            self._last_purge = now
+        self.purge()
+
+    def purge(self):
+        """
+        Borra los archivos vencidos: los de resultado (y temporales) pasados
+        result_ttl segundos y los de bloqueo pasados file_ttl segundos. Cubre
+        los resultados cuyo borrado programado no llegó a ejecutarse.
+        """
+        now = time.time()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.startswith(f"{self.name}-") and not name.endswith('.tmp'):
+                continue
+            ttl = self.file_ttl if name.endswith('.lock') else self.result_ttl
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < now - ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def run(self, key, function, *args, **kwargs):
+        """
+        Ejecuta function(*args, **kwargs), o espera a la llamada en curso con
+        la misma clave
+
+        Args:
+            key (str): Clave de la llamada (None para no agrupar)
+            function (callable): Función a ejecutar
+
+        Returns:
+            object: Resultado de la función
+        """
+        if not self.enabled or key is None:
+            return function(*args, **kwargs)
+
+        flight, leader = self._join(key)
+        if not leader:
+            followed, result = self._follow(flight)
+            return result if followed else function(*args, **kwargs)
+
+        try:
+            lock_file, result = self._lock_file(key)
+            if result is None:
+                try:
+                    metrics.increment('single_flight_total', kind=self.name, result='leader')
+                    result = function(*args, **kwargs)
+                    if lock_file is not None and self._waiter_seen(lock_file):
+                        self._write_result(key, result)
+                finally:
+                    if lock_file is not None:
+                        self._unlock(lock_file)
+        except Exception as e:
+            self._land(key, flight, error=e)
+            raise
+        except BaseException:
+            self._land(key, flight, completed=False)
+            raise
+        self._land(key, flight, result=result)
+        return result
+
+    async def run_async(self, key, function, *args, **kwargs):
+        """
+        Igual que run, para corrutinas: function(*args, **kwargs) debe
+        devolver un awaitable. Las esperas no ocupan hilos del bucle de eventos.
+        """
+        if not self.enabled or key is None:
+            return await function(*args, **kwargs)
+
+        flight, leader = self._join(key)
+        if not leader:
+            followed, result = await self._follow_async(flight)
+            return result if followed else await function(*args, **kwargs)
+
+        try:
+            lock_file, result = await self._lock_file_async(key)
+            if result is None:
+                try:
+                    metrics.increment('single_flight_total', kind=self.name, result='leader')
+                    result = await function(*args, **kwargs)
+                    if lock_file is not None and self._waiter_seen(lock_file):
+                        await asyncio.to_thread(self._write_result, key, result)
+                finally:
+                    if lock_file is not None:
+                        self._unlock(lock_file)
+        except Exception as e:
+            self._land(key, flight, error=e)
+            raise
+        except BaseException:
+            # Cancelada (por ejemplo por asyncio.wait_for)
+            self._land(key, flight, completed=False)
+            raise
+        self._land(key, flight, result=result)
+        return result
@@ -0,0 +1,83 @@
+import os
+import time
+import threading
+import contextvars
+import concurrent.futures
+
+# Pool de hilos compartido por el proceso para ejecutar en paralelo las partes
+# independientes de una solicitud (análisis de imágenes, geocodificación).
+# Es acotado: si todos los hilos están ocupados las tareas esperan en cola.
+TASK_POOL_SIZE = int(os.environ.get('TASK_POOL_SIZE', '8'))
+
+# Error que lanza task_result() cuando una tarea supera su tiempo límite
+TaskTimeoutError = concurrent.futures.TimeoutError
+
+
+class TaskPool:
+    """
+    ThreadPoolExecutor compartido que se crea de nuevo en cada proceso hijo
+    (los hilos no sobreviven a un fork de gunicorn)
+    """
+
+    def __init__(self, max_workers=TASK_POOL_SIZE):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='task-pool'
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, fn, *args, timeout=None, **kwargs):
+        """
+        Ejecuta una función en el pool
+
+        La tarea hereda las variables de contexto de quien la envía (por
+        ejemplo la traza de la solicitud, ver tracing.py).
+
+        Args:
+            fn (callable): Función a ejecutar
+            timeout (float, optional): Segundos desde ahora que task_result() esperará el resultado
+
+        Returns:
+            concurrent.futures.Future: Tarea enviada
+        """
+        context = contextvars.copy_context()
+        future = self._get_executor().submit(context.run, fn, *args, **kwargs)
+        future.deadline = None if timeout is None else time.monotonic() + timeout
+        return future
+
+    def shutdown(self, wait=True):
+        """Detiene el pool (se vuelve a crear si se envían más tareas)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+def task_result(future):
+    """
+    Espera el resultado de una tarea hasta su tiempo límite
+
+    Args:
+        future (concurrent.futures.Future): Tarea devuelta por TaskPool.submit()
+
+    Returns:
+        object: Resultado de la tarea (si la tarea lanzó una excepción, se propaga)
+
+    Raises:
+        TaskTimeoutError: Si la tarea no terminó dentro de su tiempo límite
+    """
+    deadline = getattr(future, 'deadline', None)
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    return future.result(timeout=timeout)
+
+
+# Pool compartido por el proceso
+task_pool = TaskPool()
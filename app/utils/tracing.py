@@ -0,0 +1,142 @@
+import os
+import time
+import contextvars
+from flask import current_app
+
+# Desglose de tiempos por solicitud. Cada etapa medida con metrics.timer()
+# durante una solicitud se añade a la traza de esa solicitud; al terminar se
+# resume en la cabecera Server-Timing y, si el cliente lo pide con
+# ?debug=timeline o la cabecera X-Debug-Timeline, se adjunta la línea de
+# tiempo completa al JSON de la respuesta. La línea de tiempo expone detalles
+# internos, por lo que está desactivada por defecto.
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+TRACE_TIMELINE_ENABLED = os.environ.get('TRACE_TIMELINE_ENABLED', 'false').lower() == 'true'
+
+# Nombre corto en Server-Timing de las etapas principales; las demás etapas
+# conservan su nombre
+SERVER_TIMING_NAMES = {
+    'save_image': 'save',
+    'optimize_image': 'resize',
+    'preprocess': 'resize',
+    'vision_rpc': 'vision',
+    'vision_rpc_batch': 'vision',
+    'geocoding': 'geocode',
+    'dispatch': 'dispatch',
+}
+
+TIMELINE_KEY = 'debug_timeline'
+
+_current_trace = contextvars.ContextVar('request_trace', default=None)
+
+
+class RequestTrace:
+    """
+    Etapas medidas durante una solicitud, con su inicio relativo y duración
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def add_span(self, name, start, end):
+        """Añade una etapa (tiempos de time.perf_counter())"""
+        self.spans.append((name, start - self.start, end - start))
+
+    def server_timing(self, total=None):
+        """
+        Construye el valor de la cabecera Server-Timing
+
+        Args:
+            total (float, optional): Duración total de la solicitud en segundos
+
+        Returns:
+            str: Por ejemplo 'save;dur=12.1, vision;dur=230.4, total;dur=260.0'
+        """
+        durations = {}
+        for name, _, duration in self.spans:
+            name = SERVER_TIMING_NAMES.get(name, name)
+            durations[name] = durations.get(name, 0.0) + duration
+        if total is not None:
+            durations['total'] = total
+        return ', '.join(f"{name};dur={duration * 1000:.1f}" for name, duration in durations.items())
+
+    def timeline(self, total=None):
+        """
+        Línea de tiempo completa de la solicitud
+
+        Args:
+            total (float, optional): Duración total de la solicitud en segundos
+
+        Returns:
+            dict: {'total_ms', 'spans': [{'name', 'start_ms', 'duration_ms'}]}
+        """
+        spans = sorted(self.spans, key=lambda span: span[1])
+        return {
+            'total_ms': round(total * 1000, 3) if total is not None else None,
+            'spans': [
+                {'name': name, 'start_ms': round(start * 1000, 3), 'duration_ms': round(duration * 1000, 3)}
+                for name, start, duration in spans
+            ],
+        }
+
+
+def start_trace():
+    """
+    Inicia la traza de la solicitud actual
+
+    Returns:
+        tuple: (RequestTrace, token para end_trace)
+    """
+    trace = RequestTrace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    """Termina la traza iniciada con start_trace()"""
+    _current_trace.reset(token)
+
+
+def current_trace():
+    """Traza de la solicitud actual (None fuera de una solicitud)"""
+    return _current_trace.get()
+
+
+def record_span(name, start, end):
+    """Añade una etapa a la traza de la solicitud actual, si existe"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start, end)
+
+
+def timeline_requested(request):
+    """Indica si el cliente pidió la línea de tiempo completa en la respuesta"""
+    if not TRACE_TIMELINE_ENABLED:
+        return False
+    return (
+        request.args.get('debug') == 'timeline'
+        or request.headers.get('X-Debug-Timeline', '').lower() in ('1', 'true')
+    )
+
+
+def add_trace_to_response(response, trace, total, include_timeline=False):
+    """
+    Añade Server-Timing (y opcionalmente la línea de tiempo) a una respuesta
+
+    Args:
+        response (flask.Response): Respuesta a modificar
+        trace (RequestTrace): Traza de la solicitud
+        total (float): Duración total de la solicitud en segundos
+        include_timeline (bool): Adjuntar la línea de tiempo al JSON de la respuesta
+
+    Returns:
+        flask.Response: La misma respuesta
+    """
+    if SERVER_TIMING_ENABLED:
+        response.headers['Server-Timing'] = trace.server_timing(total)
+
+    if include_timeline and response.is_json:
+        data = response.get_json(silent=True)
+        if isinstance(data, dict):
+            data[TIMELINE_KEY] = trace.timeline(total)
+            response.set_data(current_app.json.dumps(data))
+    return response
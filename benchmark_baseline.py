@@ -0,0 +1,1080 @@
+"""
+Clasificación original de respuestas de Vision API (cadena de if/elif de
+analyze_image en la revisión 785afc5), congelada como línea base de
+benchmark_classification.py.
+
+Solo se conservan las instrucciones posteriores a la llamada a Vision API, de
+modo que se mide la clasificación sin leer el archivo ni construir la
+solicitud; process_vision_response y extract_vehicle_registration_info se
+copian sin cambios. No modificar: el benchmark verifica que classify_response produce
+exactamente las mismas clasificaciones.
+"""
+
+import logging
+import traceback
+import re
+import datetime
+
+logger = logging.getLogger(__name__)
+
+def classify_baseline(response, image_path, is_registration_card=False):
+    """
+    Clasifica una respuesta de Vision API como lo hacía analyze_image
+
+    Args:
+        response (vision.AnnotateImageResponse): Respuesta de Vision API
+        image_path (str): Ruta (o nombre) del archivo de imagen
+        is_registration_card (bool): Indica si la imagen es una tarjeta de circulación
+
+    Returns:
+        dict: Resultados del análisis
+    """
+    try:
+        
+        
+        # Verificar si hay errores en la respuesta
+        if response.error.message:
+            logger.error(f"Error en la respuesta de Vision API: {response.error.message}")
+            return {
+                'error': f"Error en la respuesta de Vision API: {response.error.message}",
+                'incident_type': 'Error',
+                'damage_severity': 'Error',
+                'vehicle_type': 'Error',
+                'damaged_parts': [],
+                'confidence': 0.0
+            }
+        
+        # Imprimir información de la respuesta para depuración
+        logger.info("Respuesta recibida de Vision API")
+        logger.info(f"Labels: {len(response.label_annotations)}")
+        for label in response.label_annotations:
+            logger.info(f"  - {label.description}: {label.score:.2f}")
+        
+        logger.info(f"Objects: {len(response.localized_object_annotations)}")
+        for obj in response.localized_object_annotations:
+            logger.info(f"  - {obj.name}: {obj.score:.2f}")
+        
+        logger.info(f"Text: {len(response.text_annotations)}")
+        if response.text_annotations:
+            logger.info(f"  - Text content: {response.text_annotations[0].description}")
+        else:
+            logger.info("  - No se detectó texto en la imagen")
+        
+        # Si es una tarjeta de circulación, extraer información específica
+        if is_registration_card or any(keyword in image_path.lower() for keyword in ["tarjeta", "circulacion", "registration", "card"]):
+            logger.info("Procesando imagen como tarjeta de circulación")
+            if response.text_annotations:
+                registration_info = extract_vehicle_registration_info(response.text_annotations[0].description)
+                return {
+                    'incident_type': 'Tarjeta de Circulación',
+                    'is_registration_card': True,
+                    'registration_info': registration_info,
+                    'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
+                    'confidence': 95.0
+                }
+            else:
+                logger.warning("No se detectó texto en la imagen de la tarjeta de circulación")
+                return {
+                    'incident_type': 'Tarjeta de Circulación',
+                    'is_registration_card': True,
+                    'error': 'No se pudo detectar texto en la imagen',
+                    'registration_info': {},
+                    'confidence': 0.0
+                }
+        
+        # Verificar si es un tablero de auto
+        dashboard_indicators = ['mph', 'km/h', 'rpm', 'fuel', 'battery', 'temperature', 'oil', 'check engine']
+        battery_indicators = ['battery', 'bat', 'charge', 'electrical', 'power', 'voltage']
+        
+        # Verificar si hay anotaciones de texto antes de intentar acceder a ellas
+        if response.text_annotations and len(response.text_annotations) > 0:
+            text_content = response.text_annotations[0].description.lower()
+            
+            if any(indicator in text_content for indicator in dashboard_indicators):
+                logger.info("Detectado tablero de auto por texto")
+                
+                # Verificar si hay indicadores de batería
+                if any(indicator in text_content for indicator in battery_indicators) or any(line.strip() == '140' for line in text_content.split('\n')):
+                    logger.info("Detectado indicador de batería en el tablero")
+                    return {
+                        'incident_type': 'Fallo mecánico - Batería',
+                        'damage_severity': 'Moderado',
+                        'vehicle_type': 'Automóvil',
+                        'damaged_parts': ['Batería', 'Sistema eléctrico'],
+                        'confidence': 85.0,
+                        'labels': [],
+                        'objects': [],
+                        'text': text_content.split('\n'),
+                        'landmarks': []
+                    }
+                
+                # Crear un resultado básico para un tablero de auto
+                return {
+                    'incident_type': 'Fallo mecánico - Tablero',
+                    'damage_severity': 'Leve',
+                    'vehicle_type': 'Automóvil',
+                    'damaged_parts': ['Tablero'],
+                    'confidence': 80.0,
+                    'labels': [],
+                    'objects': [],
+                    'text': text_content.split('\n'),
+                    'landmarks': []
+                }
+        
+        # Verificar si es una imagen de llanta pinchada
+        is_flat_tire = False
+        flat_tire_confidence = 0.0
+        
+        # Buscar etiquetas relacionadas con llantas pinchadas
+        flat_tire_keywords = ['flat tire', 'puncture', 'deflated tire', 'tire damage', 'blown tire']
+        
+        for label in response.label_annotations:
+            if any(keyword.lower() in label.description.lower() for keyword in flat_tire_keywords):
+                is_flat_tire = True
+                flat_tire_confidence = max(flat_tire_confidence, label.score)
+                logger.info(f"Detectada etiqueta relacionada con llanta pinchada: {label.description} ({label.score:.2f})")
+        
+        # Verificar si hay una llanta y está deformada (posible pinchazo)
+        tire_detected = False
+        tire_obj = None
+        
+        for obj in response.localized_object_annotations:
+            if obj.name.lower() in ['tire', 'wheel']:
+                tire_detected = True
+                tire_obj = obj
+                logger.info(f"Detectada llanta: {obj.score:.2f}")
+        
+        # Si detectamos una llanta y la imagen muestra claramente una llanta en primer plano
+        if tire_detected and any(label.description.lower() in ['automotive tire', 'wheel', 'tire', 'tread'] for label in response.label_annotations):
+            # Verificar si la imagen muestra una llanta pinchada
+            # Características de una llanta pinchada: deformación visible, contacto con el suelo
+            tire_labels = [label for label in response.label_annotations if 
+                          any(kw in label.description.lower() for kw in ['tire', 'wheel', 'tread', 'flat', 'puncture'])]
+            
+            # Si hay muchas etiquetas relacionadas con llantas y es una imagen cercana de una llanta
+            if len(tire_labels) >= 3 and tire_obj and tire_obj.score > 0.7:
+                # Verificar si hay indicios de pinchazo
+                if is_flat_tire or "pinchazo" in image_path.lower() or "flat" in image_path.lower() or "hoy1" in image_path.lower():
+                    logger.info("Detectada imagen de llanta pinchada")
+                    return {
+                        'incident_type': 'Fallo mecánico - Llanta pinchada',
+                        'damage_severity': 'Moderado',
+                        'vehicle_type': 'Automóvil',
+                        'damaged_parts': ['Llanta', 'Neumático'],
+                        'confidence': round(max(flat_tire_confidence, 0.95) * 100, 2),
+                        'labels': [
+                            {'description': label.description, 'score': round(label.score * 100, 2)}
+                            for label in response.label_annotations[:5]
+                        ],
+                        'objects': [
+                            {
+                                'name': obj.name,
+                                'confidence': round(obj.score * 100, 2)
+                            }
+                            for obj in response.localized_object_annotations[:3]
+                        ],
+                        'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
+                        'landmarks': []
+                    }
+        
+        # Verificar si hay propiedades de imagen que indiquen una mancha de líquido
+        is_fluid_leak = False
+        fluid_confidence = 0.0
+        
+        # Inicializar la variable results para evitar el error
+        results = {
+            'incident_type': '',
+            'damage_severity': '',
+            'vehicle_type': 'Automóvil',
+            'damaged_parts': [],
+            'confidence': 0.0,
+            'labels': [],
+            'objects': [],
+            'text': [],
+            'landmarks': []
+        }
+        
+        # Verificar colores oscuros en la parte inferior de la imagen (posible aceite/líquido)
+        if response.image_properties_annotation:
+            dominant_colors = response.image_properties_annotation.dominant_colors.colors
+            
+            # Buscar colores oscuros (posible aceite) o rojizos/marrones (posible líquido de transmisión)
+            dark_colors = [color for color in dominant_colors if 
+                          (color.color.red < 100 and color.color.green < 100 and color.color.blue < 100) or
+                          (color.color.red > 100 and color.color.green < 80 and color.color.blue < 80)]
+            
+            # Verificar si hay etiquetas de colisión antes de considerar una fuga de líquido
+            collision_detected = any(
+                any(keyword.lower() in label.description.lower() for keyword in 
+                    ['traffic collision', 'accident', 'crash', 'collision', 'car accident', 'vehicle accident'])
+                for label in response.label_annotations
+            )
+            
+            # Si hay dos o más vehículos detectados, probablemente sea una colisión
+            vehicles_detected = sum(1 for obj in response.localized_object_annotations if obj.name.lower() in ['car', 'vehicle'])
+            
+            # Solo considerar fuga de líquido si no hay indicios de colisión
+            if dark_colors and len(dark_colors) > 0 and not collision_detected and vehicles_detected < 2:
+                is_fluid_leak = True
+                fluid_confidence = sum(color.score for color in dark_colors) / len(dark_colors)
+                
+                # Si hay un vehículo en la imagen, aumenta la confianza
+                if any(obj.name.lower() in ['car', 'vehicle', 'tire', 'wheel'] for obj in response.localized_object_annotations):
+                    fluid_confidence = max(fluid_confidence, 0.85)  # Reducido de 0.95 para ser más conservador
+                    
+                    # Actualizar resultados para fuga de líquido
+                    results['incident_type'] = 'Fallo mecánico - Fuga de líquido'
+                    results['damage_severity'] = 'Moderado'
+                    results['damaged_parts'] = ['Sistema de fluidos', 'Posible fuga de aceite/refrigerante']
+                    results['confidence'] = round(fluid_confidence * 100, 2)
+        
+        # Verificar si es una imagen de problema de acceso
+        is_access_problem = False
+        access_confidence = 0.0
+        
+        # Buscar etiquetas relacionadas con problemas de acceso
+        access_keywords = ['key', 'lock', 'door', 'car door', 'handle', 'vehicle door', 'automobile door', 'car key', 'person']
+        person_detected = False
+        door_detected = False
+        key_detected = False
+        
+        for label in response.label_annotations:
+            if any(keyword.lower() in label.description.lower() for keyword in access_keywords):
+                is_access_problem = True
+                access_confidence = max(access_confidence, label.score)
+                logger.info(f"Detectada etiqueta relacionada con problema de acceso: {label.description} ({label.score:.2f})")
+                
+                if 'person' in label.description.lower():
+                    person_detected = True
+                if 'door' in label.description.lower() or 'handle' in label.description.lower():
+                    door_detected = True
+                if 'key' in label.description.lower():
+                    key_detected = True
+        
+        # Verificar objetos detectados
+        for obj in response.localized_object_annotations:
+            if obj.name.lower() == 'person':
+                person_detected = True
+                is_access_problem = True
+                access_confidence = max(access_confidence, obj.score)
+                logger.info(f"Detectada persona: {obj.score:.2f}")
+            if obj.name.lower() in ['car', 'vehicle']:
+                is_access_problem = True
+                access_confidence = max(access_confidence, obj.score)
+                logger.info(f"Detectado vehículo: {obj.score:.2f}")
+            if 'door' in obj.name.lower():
+                door_detected = True
+                is_access_problem = True
+                access_confidence = max(access_confidence, obj.score)
+                logger.info(f"Detectada puerta: {obj.score:.2f}")
+        
+        # Priorizar la detección de colisiones sobre otros problemas
+        # Si hay etiquetas de colisión o múltiples vehículos, es más probable que sea una colisión
+        collision_detected = any(
+            any(keyword.lower() in label.description.lower() for keyword in 
+                ['traffic collision', 'accident', 'crash', 'collision', 'car accident', 'vehicle accident'])
+            for label in response.label_annotations
+        )
+        
+        vehicles_detected = sum(1 for obj in response.localized_object_annotations if obj.name.lower() in ['car', 'vehicle'])
+        
+        if collision_detected or vehicles_detected >= 2:
+            logger.info("Detectada imagen de colisión vehicular")
+            return {
+                'incident_type': 'Colisión vehicular',
+                'damage_severity': 'Grave',
+                'vehicle_type': 'Automóvil',
+                'damaged_parts': ['Carrocería', 'Parachoques', 'Faros'],
+                'confidence': round(max(0.95, 
+                                       next((label.score for label in response.label_annotations 
+                                             if any(kw in label.description.lower() for kw in ['collision', 'accident', 'crash'])), 
+                                            0.95)) * 100, 2),
+                'labels': [
+                    {'description': label.description, 'score': round(label.score * 100, 2)}
+                    for label in response.label_annotations[:5]
+                ],
+                'objects': [
+                    {
+                        'name': obj.name,
+                        'confidence': round(obj.score * 100, 2)
+                    }
+                    for obj in response.localized_object_annotations[:3]
+                ],
+                'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
+                'landmarks': []
+            }
+        
+        # Priorizar la detección de fugas de líquido sobre problemas de acceso
+        # Si hay una mancha oscura en el suelo y un vehículo, es más probable que sea una fuga
+        if is_fluid_leak and (any(obj.name.lower() in ['car', 'vehicle', 'tire', 'wheel'] for obj in response.localized_object_annotations) or "hoy5" in image_path.lower()):
+            logger.info("Detectada imagen de fuga de líquido")
+            return {
+                'incident_type': 'Fallo mecánico - Fuga de líquido',
+                'damage_severity': 'Moderado',
+                'vehicle_type': 'Automóvil',
+                'damaged_parts': ['Sistema de fluidos', 'Posible fuga de aceite/refrigerante'],
+                'confidence': round(max(fluid_confidence, 0.85) * 100, 2),
+                'labels': [
+                    {'description': label.description, 'score': round(label.score * 100, 2)}
+                    for label in response.label_annotations[:5]
+                ],
+                'objects': [
+                    {
+                        'name': obj.name,
+                        'confidence': round(obj.score * 100, 2)
+                    }
+                    for obj in response.localized_object_annotations[:3]
+                ],
+                'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
+                'landmarks': []
+            }
+        
+        # Si es una imagen de problema de acceso, devolver un resultado específico
+        if (is_access_problem and (person_detected or door_detected or key_detected)) or "hoy4" in image_path.lower():
+            logger.info("Detectada imagen de problema de acceso")
+            
+            incident_type = "Problema de acceso - Llaves olvidadas"
+            if key_detected and door_detected:
+                incident_type = "Problema de acceso - Llaves olvidadas"
+            elif door_detected and person_detected:
+                incident_type = "Problema de acceso - Vehículo bloqueado"
+            elif person_detected:
+                incident_type = "Problema de acceso - Asistencia requerida"
+            
+            return {
+                'incident_type': incident_type,
+                'damage_severity': 'Leve',
+                'vehicle_type': 'Automóvil',
+                'damaged_parts': ['Sistema de acceso', 'Cerradura'],
+                'confidence': round(max(access_confidence, 0.95) * 100, 2),
+                'labels': [
+                    {'description': label.description, 'score': round(label.score * 100, 2)}
+                    for label in response.label_annotations[:5]
+                ],
+                'objects': [
+                    {
+                        'name': obj.name,
+                        'confidence': round(obj.score * 100, 2)
+                    }
+                    for obj in response.localized_object_annotations[:3]
+                ],
+                'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
+                'landmarks': []
+            }
+        
+        # Verificar si es una imagen de fuga de líquido
+        is_fluid_leak = False
+        fluid_confidence = 0.0
+        
+        # Buscar etiquetas relacionadas con fugas de líquidos
+        fluid_keywords = ['liquid', 'oil', 'fluid', 'leak', 'spill', 'puddle', 'water', 'stain', 'wet']
+        
+        for label in response.label_annotations:
+            if any(keyword.lower() in label.description.lower() for keyword in fluid_keywords):
+                is_fluid_leak = True
+                fluid_confidence = max(fluid_confidence, label.score)
+                logger.info(f"Detectada etiqueta relacionada con fuga de líquido: {label.description} ({label.score:.2f})")
+        
+        # Verificar colores oscuros en la parte inferior de la imagen (posible aceite)
+        if response.image_properties_annotation:
+            dominant_colors = response.image_properties_annotation.dominant_colors.colors
+            dark_colors = [color for color in dominant_colors if 
+                          (color.color.red < 50 and color.color.green < 50 and color.color.blue < 50) or
+                          (color.color.red < 100 and color.color.green < 100 and color.color.blue < 100 and color.score > 0.1)]
+            
+            if dark_colors and len(dark_colors) > 1:
+                is_fluid_leak = True
+                fluid_confidence = max(fluid_confidence, 0.85)
+                logger.info(f"Detectados colores oscuros que podrían indicar fuga de aceite")
+        
+        # Si es una imagen de fuga de líquido, devolver un resultado específico
+        if is_fluid_leak or "hoy2" in image_path.lower() or "hoy5" in image_path.lower():
+            logger.info("Detectada imagen de fuga de líquido")
+            return {
+                'incident_type': 'Fallo mecánico - Fuga de líquido',
+                'damage_severity': 'Moderado',
+                'vehicle_type': 'Automóvil',
+                'damaged_parts': ['Sistema de fluidos', 'Posible fuga de aceite/refrigerante'],
+                'confidence': round(max(fluid_confidence, 0.85) * 100, 2),
+                'labels': [
+                    {'description': label.description, 'score': round(label.score * 100, 2)}
+                    for label in response.label_annotations[:5]
+                ],
+                'objects': [
+                    {
+                        'name': obj.name,
+                        'confidence': round(obj.score * 100, 2)
+                    }
+                    for obj in response.localized_object_annotations[:3]
+                ],
+                'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
+                'landmarks': []
+            }
+        
+        # Verificar si es una imagen de llanta
+        is_tire_image = False
+        tire_confidence = 0.0
+        
+        # Buscar etiquetas relacionadas con llantas
+        tire_keywords = ['tire', 'wheel', 'flat tire', 'puncture', 'tyre', 'rim', 'automotive wheel']
+        
+        for label in response.label_annotations:
+            if any(keyword.lower() in label.description.lower() for keyword in tire_keywords):
+                is_tire_image = True
+                tire_confidence = max(tire_confidence, label.score)
+                logger.info(f"Detectada etiqueta relacionada con llanta: {label.description} ({label.score:.2f})")
+        
+        # Si es una imagen de llanta, devolver un resultado específico
+        if is_tire_image and not is_fluid_leak and not is_access_problem:
+            logger.info("Detectada imagen de llanta")
+            
+            # Determinar si es una llanta pinchada o no
+            is_flat = False
+            for label in response.label_annotations:
+                if any(kw in label.description.lower() for kw in ['flat', 'puncture', 'deflated']):
+                    is_flat = True
+                    break
+            
+            # Si el nombre del archivo sugiere un pinchazo o se detectaron palabras clave de pinchazo
+            if is_flat or "pinchazo" in image_path.lower() or "flat" in image_path.lower() or "hoy1" in image_path.lower():
+                incident_type = 'Fallo mecánico - Llanta pinchada'
+            else:
+                incident_type = 'Fallo mecánico - Problema de llanta'
+            
+            return {
+                'incident_type': incident_type,
+                'damage_severity': 'Moderado',
+                'vehicle_type': 'Automóvil',
+                'damaged_parts': ['Llanta', 'Neumático'],
+                'confidence': round(tire_confidence * 100, 2),
+                'labels': [
+                    {'description': label.description, 'score': round(label.score * 100, 2)}
+                    for label in response.label_annotations[:5]
+                ],
+                'objects': [
+                    {
+                        'name': obj.name,
+                        'confidence': round(obj.score * 100, 2)
+                    }
+                    for obj in response.localized_object_annotations[:3]
+                ],
+                'text': response.text_annotations[0].description.split('\n') if response.text_annotations else [],
+                'landmarks': []
+            }
+        
+        # Si no hay etiquetas pero hay texto, podemos hacer un análisis básico
+        if not response.label_annotations and response.text_annotations:
+            logger.info("No hay etiquetas pero hay texto, realizando análisis básico")
+            text = response.text_annotations[0].description.lower()
+            
+            # Verificar si es un tablero de auto
+            dashboard_indicators = ['mph', 'km/h', 'rpm', 'fuel', 'battery', 'temperature', 'oil', 'check engine']
+            
+            if any(indicator in text for indicator in dashboard_indicators):
+                logger.info("Detectado tablero de auto por texto")
+                
+                # Verificar si hay indicadores de batería
+                if any(indicator in text for indicator in battery_indicators) or any(line.strip() == '140' for line in text.split('\n')):
+                    logger.info("Detectado indicador de batería en el tablero")
+                    return {
+                        'incident_type': 'Fallo mecánico - Batería',
+                        'damage_severity': 'Moderado',
+                        'vehicle_type': 'Automóvil',
+                        'damaged_parts': ['Batería', 'Sistema eléctrico'],
+                        'confidence': 85.0,
+                        'labels': [],
+                        'objects': [],
+                        'text': text.split('\n'),
+                        'landmarks': []
+                    }
+                
+                # Crear un resultado básico para un tablero de auto
+                return {
+                    'incident_type': 'Fallo mecánico - Tablero',
+                    'damage_severity': 'Leve',
+                    'vehicle_type': 'Automóvil',
+                    'damaged_parts': ['Tablero'],
+                    'confidence': 80.0,
+                    'labels': [],
+                    'objects': [],
+                    'text': text.split('\n'),
+                    'landmarks': []
+                }
+        
+        # Procesar resultados
+        logger.info("Procesando resultados de Vision API")
+        results = process_vision_response(response)
+        
+        # Si después de procesar, los resultados siguen siendo indeterminados,
+        # pero tenemos una imagen que parece un tablero de auto, forzamos un resultado
+        if (results['incident_type'] == 'Indeterminado' or 
+            'Fallo mecánico' in results['incident_type']):
+            
+            # Si el nombre del archivo contiene "battery", es un problema de batería
+            if 'battery' in image_path.lower():
+                logger.info("Forzando resultado para imagen de batería")
+                results['incident_type'] = 'Fallo mecánico - Batería'
+                results['damage_severity'] = 'Moderado'
+                results['vehicle_type'] = 'Automóvil'
+                if 'Batería' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Batería')
+                if 'Sistema eléctrico' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Sistema eléctrico')
+                results['confidence'] = 86.33
+            # Si el nombre del archivo o las etiquetas sugieren un problema de acceso
+            elif any(keyword in image_path.lower() for keyword in ["key", "lock", "door", "access", "llave", "puerta", "acceso", "hoy4"]) or is_access_problem:
+                logger.info("Forzando resultado para imagen de problema de acceso")
+                results['incident_type'] = 'Problema de acceso - Llaves olvidadas'
+                results['damage_severity'] = 'Leve'
+                results['vehicle_type'] = 'Automóvil'
+                if 'Sistema de acceso' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Sistema de acceso')
+                if 'Cerradura' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Cerradura')
+                results['confidence'] = 95.69
+            # Si el nombre del archivo o las etiquetas sugieren una fuga de líquido
+            elif any(keyword in image_path.lower() for keyword in ["leak", "fluid", "oil", "fuga", "aceite", "liquido", "hoy2", "hoy5"]) or is_fluid_leak:
+                logger.info("Forzando resultado para imagen de fuga de líquido")
+                results['incident_type'] = 'Fallo mecánico - Fuga de líquido'
+                results['damage_severity'] = 'Moderado'
+                results['vehicle_type'] = 'Automóvil'
+                if 'Sistema de fluidos' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Sistema de fluidos')
+                if 'Posible fuga de aceite/refrigerante' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Posible fuga de aceite/refrigerante')
+                results['confidence'] = 93.26
+            # Si el nombre del archivo o las etiquetas sugieren una llanta pinchada
+            elif any(keyword in image_path.lower() for keyword in ["flat", "puncture", "pinchazo", "hoy1"]) or is_flat_tire:
+                logger.info("Forzando resultado para imagen de llanta pinchada")
+                results['incident_type'] = 'Fallo mecánico - Llanta pinchada'
+                results['damage_severity'] = 'Moderado'
+                results['vehicle_type'] = 'Automóvil'
+                if 'Llanta' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Llanta')
+                if 'Neumático' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Neumático')
+                results['confidence'] = 95.0
+            # Si el nombre del archivo o las etiquetas sugieren una llanta, es un problema de llanta
+            elif any(keyword in image_path.lower() for keyword in ["tire", "wheel", "llanta", "neumatico", "hoy"]) or is_tire_image:
+                logger.info("Forzando resultado para imagen de llanta")
+                results['incident_type'] = 'Fallo mecánico - Llanta pinchada'
+                results['damage_severity'] = 'Moderado'
+                results['vehicle_type'] = 'Automóvil'
+                if 'Llanta' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Llanta')
+                if 'Neumático' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Neumático')
+                results['confidence'] = 85.0
+            # Si no, pero parece un tablero, es un problema general
+            elif ('mph' in image_path.lower() or 'km/h' in image_path.lower() or 
+                 'dashboard' in image_path.lower() or 'car' in image_path.lower()):
+                
+                logger.info("Forzando resultado para imagen de tablero de auto")
+                results['incident_type'] = 'Fallo mecánico - Tablero'
+                results['damage_severity'] = 'Leve'
+                results['vehicle_type'] = 'Automóvil'
+                if 'Tablero' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Tablero')
+                results['confidence'] = 75.0
+        
+        return results
+        
+    except Exception as e:
+        logger.error(f"Error al analizar la imagen: {str(e)}")
+        logger.error(traceback.format_exc())
+        return {
+            'error': f"Error al analizar la imagen: {str(e)}",
+            'incident_type': 'Error',
+            'damage_severity': 'Error',
+            'vehicle_type': 'Error',
+            'damaged_parts': [],
+            'confidence': 0.0
+        }
+
+def process_vision_response(response):
+    """
+    Procesa la respuesta de la API de Vision para extraer información relevante
+    
+    Args:
+        response: Respuesta de la API de Vision
+        
+    Returns:
+        dict: Resultados procesados
+    """
+    # Inicializar resultados
+    results = {
+        'incident_type': 'Indeterminado',
+        'damage_severity': 'Indeterminado',
+        'vehicle_type': 'Indeterminado',
+        'damaged_parts': [],
+        'confidence': 0.0,
+        'labels': [],
+        'objects': [],
+        'text': [],
+        'landmarks': []
+    }
+    
+    # Verificar si hay propiedades de imagen que indiquen una mancha de líquido
+    is_fluid_leak = False
+    fluid_confidence = 0.0
+    
+    # Verificar colores oscuros en la parte inferior de la imagen (posible aceite/líquido)
+    if response.image_properties_annotation:
+        dominant_colors = response.image_properties_annotation.dominant_colors.colors
+        
+        # Buscar colores oscuros (posible aceite) o rojizos/marrones (posible líquido de transmisión)
+        dark_colors = [color for color in dominant_colors if 
+                      (color.color.red < 100 and color.color.green < 100 and color.color.blue < 100) or
+                      (color.color.red > 100 and color.color.green < 80 and color.color.blue < 80)]
+        
+        # Verificar si hay etiquetas de colisión antes de considerar una fuga de líquido
+        collision_detected = any(
+            any(keyword.lower() in label.description.lower() for keyword in 
+                ['traffic collision', 'accident', 'crash', 'collision', 'car accident', 'vehicle accident'])
+            for label in response.label_annotations
+        )
+        
+        # Si hay dos o más vehículos detectados, probablemente sea una colisión
+        vehicles_detected = sum(1 for obj in response.localized_object_annotations if obj.name.lower() in ['car', 'vehicle'])
+        
+        # Solo considerar fuga de líquido si no hay indicios de colisión
+        if dark_colors and len(dark_colors) > 0 and not collision_detected and vehicles_detected < 2:
+            is_fluid_leak = True
+            fluid_confidence = sum(color.score for color in dark_colors) / len(dark_colors)
+            
+            # Si hay un vehículo en la imagen, aumenta la confianza
+            if any(obj.name.lower() in ['car', 'vehicle', 'tire', 'wheel'] for obj in response.localized_object_annotations):
+                fluid_confidence = max(fluid_confidence, 0.85)  # Reducido de 0.95 para ser más conservador
+                
+                # Actualizar resultados para fuga de líquido
+                results['incident_type'] = 'Fallo mecánico - Fuga de líquido'
+                results['damage_severity'] = 'Moderado'
+                results['damaged_parts'] = ['Sistema de fluidos', 'Posible fuga de aceite/refrigerante']
+                results['confidence'] = round(fluid_confidence * 100, 2)
+    
+    # Procesar anotaciones de etiquetas
+    if response.label_annotations:
+        # Extraer etiquetas y confianza
+        results['labels'] = [
+            {'description': label.description, 'score': round(label.score * 100, 2)}
+            for label in response.label_annotations[:5]
+        ]
+        
+        # Buscar etiquetas relacionadas con colisiones
+        collision_keywords = ['traffic collision', 'accident', 'crash', 'collision', 'car accident', 'vehicle accident']
+        collision_labels = []
+        
+        for label in response.label_annotations:
+            if any(keyword.lower() in label.description.lower() for keyword in collision_keywords):
+                collision_labels.append(label)
+        
+        if collision_labels:
+            # Calcular confianza promedio
+            collision_label_confidence = sum(label.score for label in collision_labels) / len(collision_labels)
+            
+            # Actualizar resultados - Priorizar colisión sobre otros tipos de incidentes
+            results['incident_type'] = 'Colisión vehicular'
+            results['damage_severity'] = 'Grave'
+            results['damaged_parts'] = ['Carrocería', 'Parachoques']
+            results['confidence'] = round(collision_label_confidence * 100, 2)
+            
+            # Si hay dos o más vehículos detectados, aumentar la confianza
+            vehicles_detected = sum(1 for obj in response.localized_object_annotations if obj.name.lower() in ['car', 'vehicle'])
+            if vehicles_detected >= 2:
+                results['confidence'] = max(results['confidence'], 95.0)
+                if 'Colisión entre vehículos' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Colisión entre vehículos')
+            
+            # Salir temprano ya que la colisión tiene prioridad
+            return results
+        
+        # Buscar etiquetas relacionadas con fugas de líquidos
+        fluid_keywords = ['liquid', 'oil', 'fluid', 'leak', 'spill', 'puddle', 'water', 'stain', 'wet', 'drip', 'drop']
+        fluid_labels = []
+        
+        for label in response.label_annotations:
+            if any(keyword.lower() in label.description.lower() for keyword in fluid_keywords):
+                fluid_labels.append(label)
+        
+        if fluid_labels:
+            # Calcular confianza promedio
+            fluid_label_confidence = sum(label.score for label in fluid_labels) / len(fluid_labels)
+            
+            # Actualizar resultados
+            results['incident_type'] = 'Fallo mecánico - Fuga de líquido'
+            results['damage_severity'] = 'Moderado'
+            results['damaged_parts'] = ['Sistema de fluidos', 'Posible fuga de aceite/refrigerante']
+            results['confidence'] = round(max(fluid_confidence, fluid_label_confidence) * 100, 2)
+        
+        # Buscar etiquetas relacionadas con problemas de acceso
+        access_keywords = ['key', 'lock', 'door', 'car door', 'handle', 'vehicle door', 'automobile door', 'car key', 'person']
+        access_labels = []
+        person_detected = False
+        door_detected = False
+        key_detected = False
+        
+        for label in response.label_annotations:
+            if any(keyword.lower() in label.description.lower() for keyword in access_keywords):
+                access_labels.append(label)
+                if 'person' in label.description.lower():
+                    person_detected = True
+                if 'door' in label.description.lower() or 'handle' in label.description.lower():
+                    door_detected = True
+                if 'key' in label.description.lower():
+                    key_detected = True
+        
+        # Solo considerar problema de acceso si no hay indicios de fuga de líquido
+        if access_labels and (person_detected or door_detected or key_detected) and not is_fluid_leak and results['incident_type'] == 'Indeterminado':
+            # Calcular confianza promedio
+            access_confidence = sum(label.score for label in access_labels) / len(access_labels)
+            
+            # Actualizar resultados
+            results['incident_type'] = 'Problema de acceso - Llaves olvidadas'
+            if key_detected and door_detected:
+                results['incident_type'] = 'Problema de acceso - Llaves olvidadas'
+            elif door_detected and person_detected:
+                results['incident_type'] = 'Problema de acceso - Vehículo bloqueado'
+            elif person_detected:
+                results['incident_type'] = 'Problema de acceso - Asistencia requerida'
+                
+            results['damage_severity'] = 'Leve'
+            results['damaged_parts'] = ['Sistema de acceso', 'Cerradura']
+            results['confidence'] = round(access_confidence * 100, 2)
+        
+        # Buscar etiquetas relacionadas con baterías
+        battery_keywords = ['battery', 'car battery', 'vehicle battery', 'automotive battery', 'power source']
+        battery_labels = []
+        
+        for label in response.label_annotations:
+            if any(keyword.lower() in label.description.lower() for keyword in battery_keywords):
+                battery_labels.append(label)
+        
+        if battery_labels and results['incident_type'] == 'Indeterminado':
+            # Calcular confianza promedio
+            battery_confidence = sum(label.score for label in battery_labels) / len(battery_labels)
+            
+            # Actualizar resultados
+            results['incident_type'] = 'Fallo mecánico - Batería'
+            results['damage_severity'] = 'Moderado'
+            results['damaged_parts'] = ['Batería', 'Sistema eléctrico']
+            results['confidence'] = round(battery_confidence * 100, 2)
+        
+        # Identificar tipo de vehículo
+        vehicle_types = {
+            'car': 'Automóvil',
+            'automobile': 'Automóvil',
+            'vehicle': 'Automóvil',
+            'truck': 'Camión',
+            'motorcycle': 'Motocicleta',
+            'bike': 'Motocicleta',
+            'bicycle': 'Bicicleta',
+            'bus': 'Autobús',
+            'van': 'Furgoneta',
+            'suv': 'SUV'
+        }
+        
+        for label in response.label_annotations:
+            for key, value in vehicle_types.items():
+                if key.lower() in label.description.lower():
+                    results['vehicle_type'] = value
+                    break
+    
+    # Procesar anotaciones de objetos localizados
+    if response.localized_object_annotations:
+        # Extraer objetos y confianza
+        results['objects'] = [
+            {
+                'name': obj.name,
+                'confidence': round(obj.score * 100, 2)
+            }
+            for obj in response.localized_object_annotations[:3]
+        ]
+        
+        # Identificar partes dañadas
+        damaged_parts_mapping = {
+            'tire': 'Llanta',
+            'wheel': 'Llanta',
+            'car': 'Carrocería',
+            'vehicle': 'Carrocería',
+            'door': 'Puerta',
+            'window': 'Ventana',
+            'windshield': 'Parabrisas',
+            'headlight': 'Faro delantero',
+            'taillight': 'Faro trasero',
+            'bumper': 'Parachoques',
+            'hood': 'Capó',
+            'trunk': 'Maletero',
+            'mirror': 'Espejo',
+            'person': 'Asistencia personal'
+        }
+        
+        for obj in response.localized_object_annotations:
+            for key, value in damaged_parts_mapping.items():
+                if key.lower() in obj.name.lower() and value not in results['damaged_parts']:
+                    results['damaged_parts'].append(value)
+        
+        # Verificar si hay un vehículo y una mancha oscura (posible fuga)
+        car_detected = any(obj.name.lower() in ['car', 'vehicle'] for obj in response.localized_object_annotations)
+        tire_detected = any(obj.name.lower() in ['tire', 'wheel'] for obj in response.localized_object_annotations)
+        
+        if (car_detected or tire_detected) and is_fluid_leak:
+            results['incident_type'] = 'Fallo mecánico - Fuga de líquido'
+            results['damage_severity'] = 'Moderado'
+            if 'Sistema de fluidos' not in results['damaged_parts']:
+                results['damaged_parts'].append('Sistema de fluidos')
+            if 'Posible fuga de aceite/refrigerante' not in results['damaged_parts']:
+                results['damaged_parts'].append('Posible fuga de aceite/refrigerante')
+            
+            # Calcular confianza
+            results['confidence'] = round(max(fluid_confidence, 0.90) * 100, 2)
+        
+        # Verificar si hay una persona cerca del vehículo (posible problema de acceso)
+        # Solo si no hay indicios de fuga de líquido
+        person_detected = any(obj.name.lower() == 'person' for obj in response.localized_object_annotations)
+        
+        if person_detected and car_detected and results['incident_type'] == 'Indeterminado' and not is_fluid_leak:
+            results['incident_type'] = 'Problema de acceso - Asistencia requerida'
+            results['damage_severity'] = 'Leve'
+            if 'Sistema de acceso' not in results['damaged_parts']:
+                results['damaged_parts'].append('Sistema de acceso')
+            
+            # Calcular confianza promedio
+            person_obj = next((obj for obj in response.localized_object_annotations if obj.name.lower() == 'person'), None)
+            car_obj = next((obj for obj in response.localized_object_annotations if obj.name.lower() in ['car', 'vehicle']), None)
+            
+            if person_obj and car_obj:
+                access_confidence = (person_obj.score + car_obj.score) / 2
+                results['confidence'] = round(access_confidence * 100, 2)
+    
+    # Procesar anotaciones de texto
+    if response.text_annotations:
+        # Extraer texto
+        results['text'] = response.text_annotations[0].description.split('\n')
+        
+        # Buscar palabras clave en el texto
+        text = response.text_annotations[0].description.lower()
+        
+        # Palabras clave para problemas
+        problem_keywords = {
+            'battery': 'Fallo mecánico - Batería',
+            'check engine': 'Fallo mecánico - Motor',
+            'oil': 'Fallo mecánico - Aceite',
+            'temperature': 'Fallo mecánico - Temperatura',
+            'flat tire': 'Fallo mecánico - Llanta pinchada',
+            'puncture': 'Fallo mecánico - Llanta pinchada',
+            'fuel': 'Fallo mecánico - Combustible',
+            'key': 'Problema de acceso - Llaves',
+            'lock': 'Problema de acceso - Cerradura',
+            'door': 'Problema de acceso - Puerta',
+            'leak': 'Fallo mecánico - Fuga de líquido',
+            'fluid': 'Fallo mecánico - Fuga de líquido'
+        }
+        
+        for keyword, incident in problem_keywords.items():
+            if keyword in text and results['incident_type'] == 'Indeterminado':
+                results['incident_type'] = incident
+                
+                # Añadir partes dañadas según el incidente
+                if 'Batería' in incident and 'Batería' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Batería')
+                elif 'Motor' in incident and 'Motor' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Motor')
+                elif 'Aceite' in incident and 'Sistema de lubricación' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Sistema de lubricación')
+                elif 'Temperatura' in incident and 'Sistema de refrigeración' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Sistema de refrigeración')
+                elif 'Llanta' in incident and 'Llanta' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Llanta')
+                elif 'Combustible' in incident and 'Sistema de combustible' not in results['damaged_parts']:
+                    results['damaged_parts'].append('Sistema de combustible')
+                elif 'Fuga' in incident:
+                    if 'Sistema de fluidos' not in results['damaged_parts']:
+                        results['damaged_parts'].append('Sistema de fluidos')
+                    if 'Posible fuga de aceite/refrigerante' not in results['damaged_parts']:
+                        results['damaged_parts'].append('Posible fuga de aceite/refrigerante')
+                elif 'acceso' in incident:
+                    if 'Sistema de acceso' not in results['damaged_parts']:
+                        results['damaged_parts'].append('Sistema de acceso')
+                    if 'Cerradura' not in results['damaged_parts']:
+                        results['damaged_parts'].append('Cerradura')
+    
+    # Estimar severidad del daño
+    if results['damaged_parts']:
+        if len(results['damaged_parts']) > 2:
+            results['damage_severity'] = 'Grave'
+        elif len(results['damaged_parts']) > 1:
+            results['damage_severity'] = 'Moderado'
+        else:
+            results['damage_severity'] = 'Leve'
+        
+        # Ajustar severidad según el tipo de incidente
+        if 'Batería' in results['incident_type']:
+            results['damage_severity'] = 'Moderado'
+        elif 'Llanta' in results['incident_type']:
+            results['damage_severity'] = 'Moderado'
+        elif 'Fuga de líquido' in results['incident_type']:
+            results['damage_severity'] = 'Moderado'
+        elif 'Problema de acceso' in results['incident_type']:
+            results['damage_severity'] = 'Leve'
+    
+    # Verificar colores oscuros en la parte inferior de la imagen (posible aceite)
+    if response.image_properties_annotation and results['incident_type'] == 'Indeterminado':
+        dominant_colors = response.image_properties_annotation.dominant_colors.colors
+        dark_colors = [color for color in dominant_colors if 
+                      (color.color.red < 50 and color.color.green < 50 and color.color.blue < 50) or
+                      (color.color.red < 100 and color.color.green < 100 and color.color.blue < 100 and color.score > 0.1) or
+                      (color.color.red > 100 and color.color.green < 80 and color.color.blue < 80)]
+        
+        if dark_colors and len(dark_colors) > 0:
+            results['incident_type'] = 'Fallo mecánico - Fuga de líquido'
+            results['damage_severity'] = 'Moderado'
+            if 'Sistema de fluidos' not in results['damaged_parts']:
+                results['damaged_parts'].append('Sistema de fluidos')
+            if 'Posible fuga de aceite/refrigerante' not in results['damaged_parts']:
+                results['damaged_parts'].append('Posible fuga de aceite/refrigerante')
+            
+            # Calcular confianza
+            dark_color_confidence = sum(color.score for color in dark_colors) / len(dark_colors)
+            results['confidence'] = round(max(dark_color_confidence * 100, 85.0), 2)
+    
+    # Si no se ha determinado la confianza, establecer un valor predeterminado
+    if results['confidence'] == 0.0 and results['incident_type'] != 'Indeterminado':
+        results['confidence'] = 75.0
+    
+    # Si el vehículo sigue indeterminado pero tenemos un incidente, asumimos que es un automóvil
+    if results['vehicle_type'] == 'Indeterminado' and results['incident_type'] != 'Indeterminado':
+        results['vehicle_type'] = 'Automóvil'
+    
+    return results 
+
+def extract_vehicle_registration_info(text):
+    """
+    Extrae información de una tarjeta de circulación a partir del texto detectado.
+    
+    Args:
+        text (str): Texto extraído de la imagen
+        
+    Returns:
+        dict: Información extraída de la tarjeta de circulación
+    """
+    logger.info("Extrayendo información de tarjeta de circulación")
+    
+    # Inicializar diccionario de resultados
+    registration_info = {
+        'placa': None,
+        'nombre_propietario': None,
+        'marca': None,
+        'modelo': None,
+        'año': None,
+        'color': None,
+        'num_serie': None,
+        'num_motor': None,
+        'tipo_vehiculo': None,
+        'fecha_expedicion': None,
+        'fecha_vencimiento': None
+    }
+    
+    # Convertir texto a minúsculas para facilitar la búsqueda
+    text_lower = text.lower()
+    lines = text.split('\n')
+    
+    # Buscar placa (formato típico: 3 letras seguidas de 3-4 números)
+    placa_pattern = r'[A-Z]{3}[-\s]?[0-9]{3,4}'
+    placa_matches = re.findall(placa_pattern, text)
+    if placa_matches:
+        registration_info['placa'] = placa_matches[0]
+    
+    # Buscar nombre del propietario
+    for i, line in enumerate(lines):
+        if 'propietario' in line.lower() or 'nombre' in line.lower():
+            if i + 1 < len(lines) and len(lines[i + 1]) > 5:
+                registration_info['nombre_propietario'] = lines[i + 1].strip()
+                break
+    
+    # Buscar marca y modelo
+    for i, line in enumerate(lines):
+        if 'marca' in line.lower():
+            marca_parts = line.split(':')
+            if len(marca_parts) > 1:
+                registration_info['marca'] = marca_parts[1].strip()
+            elif i + 1 < len(lines):
+                registration_info['marca'] = lines[i + 1].strip()
+        
+        if 'modelo' in line.lower():
+            modelo_parts = line.split(':')
+            if len(modelo_parts) > 1:
+                registration_info['modelo'] = modelo_parts[1].strip()
+            elif i + 1 < len(lines):
+                registration_info['modelo'] = lines[i + 1].strip()
+    
+    # Buscar año (4 dígitos entre 1900 y año actual + 1)
+    current_year = datetime.datetime.now().year
+    year_pattern = r'\b(19[5-9][0-9]|20[0-2][0-9])\b'
+    year_matches = re.findall(year_pattern, text)
+    if year_matches:
+        registration_info['año'] = year_matches[0]
+    
+    # Buscar color
+    color_keywords = ['blanco', 'negro', 'rojo', 'azul', 'verde', 'amarillo', 'gris', 'plata', 'dorado', 'café', 'marrón']
+    for i, line in enumerate(lines):
+        line_lower = line.lower()
+        if 'color' in line_lower:
+            color_parts = line.split(':')
+            if len(color_parts) > 1:
+                registration_info['color'] = color_parts[1].strip()
+            else:
+                for color in color_keywords:
+                    if color in line_lower:
+                        registration_info['color'] = color
+                        break
+    
+    # Buscar número de serie (VIN)
+    vin_pattern = r'\b[A-HJ-NPR-Z0-9]{17}\b'
+    vin_matches = re.findall(vin_pattern, text)
+    if vin_matches:
+        registration_info['num_serie'] = vin_matches[0]
+    else:
+        for i, line in enumerate(lines):
+            if 'serie' in line.lower() or 'vin' in line.lower() or 'chasis' in line.lower():
+                serie_parts = line.split(':')
+                if len(serie_parts) > 1 and len(serie_parts[1].strip()) > 5:
+                    registration_info['num_serie'] = serie_parts[1].strip()
+                elif i + 1 < len(lines) and len(lines[i + 1]) > 5:
+                    registration_info['num_serie'] = lines[i + 1].strip()
+    
+    # Buscar número de motor
+    for i, line in enumerate(lines):
+        if 'motor' in line.lower():
+            motor_parts = line.split(':')
+            if len(motor_parts) > 1 and len(motor_parts[1].strip()) > 3:
+                registration_info['num_motor'] = motor_parts[1].strip()
+            elif i + 1 < len(lines) and len(lines[i + 1]) > 3:
+                registration_info['num_motor'] = lines[i + 1].strip()
+    
+    # Buscar tipo de vehículo
+    vehicle_types = ['sedan', 'suv', 'pickup', 'camioneta', 'automóvil', 'motocicleta', 'moto', 'camión']
+    for i, line in enumerate(lines):
+        line_lower = line.lower()
+        if 'tipo' in line_lower or 'clase' in line_lower:
+            for vehicle_type in vehicle_types:
+                if vehicle_type in line_lower:
+                    registration_info['tipo_vehiculo'] = vehicle_type
+                    break
+            if not registration_info['tipo_vehiculo'] and ':' in line:
+                tipo_parts = line.split(':')
+                if len(tipo_parts) > 1:
+                    registration_info['tipo_vehiculo'] = tipo_parts[1].strip()
+    
+    # Buscar fechas (formato DD/MM/AAAA o similar)
+    date_pattern = r'\b\d{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4}\b'
+    date_matches = re.findall(date_pattern, text)
+    
+    if len(date_matches) >= 2:
+        # Asumimos que la primera fecha es de expedición y la segunda de vencimiento
+        registration_info['fecha_expedicion'] = date_matches[0]
+        registration_info['fecha_vencimiento'] = date_matches[1]
+    elif len(date_matches) == 1:
+        # Si solo hay una fecha, asumimos que es la de vencimiento
+        registration_info['fecha_vencimiento'] = date_matches[0]
+    
+    logger.info(f"Información extraída de tarjeta de circulación: {registration_info}")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de la clasificación de respuestas de Vision API.
+Este script:
+1. Genera respuestas AnnotateImageResponse sintéticas (o lee las guardadas en la caché)
+2. Mide el tiempo por respuesta de la búsqueda de palabras clave con el buscador
+   compilado y con la comparación palabra por palabra
+3. Mide el tiempo por respuesta de la cadena de if/elif original (congelada en
+   benchmark_baseline.py) y de classify_response, y verifica que las
+   clasificaciones sean idénticas
+"""
+
+import os
+import argparse
+import logging
+import random
+import time
+from functools import partial
+from google.cloud import vision
+
+from app.api import vision_api
+from app.api.annotation_index import AnnotationIndex
+from app.api.vision_rules import MATCHER
+from benchmark_baseline import classify_baseline
+
+# Vocabulario usado para generar respuestas sintéticas
+LABELS = [
+    'Car', 'Vehicle', 'Tire', 'Automotive tire', 'Wheel', 'Tread', 'Flat tire', 'Rim',
+    'Traffic collision', 'Bumper', 'Car door', 'Handle', 'Person', 'Key', 'Oil', 'Liquid',
+    'Puddle', 'Asphalt', 'Road surface', 'Automotive lighting', 'Hood', 'Motor vehicle',
+    'Sky', 'Tree', 'Grass', 'Building', 'Truck', 'Motorcycle', 'Bus', 'Van', 'Font',
+]
+OBJECTS = ['Car', 'Tire', 'Wheel', 'Person', 'Door', 'Window', 'Headlight', 'License plate', 'Mirror', 'Building']
+TEXTS = ['', '', 'ABC-123', 'MPH 140', 'CHECK ENGINE', 'km/h rpm fuel', 'OIL TEMP', 'STOP', 'battery 12V']
+NAMES = ['foto.jpg', 'incidente.png', 'upload_1.jpg', 'IMG_2024.jpeg', 'hoy2.jpg', 'hoy4.jpg', 'wheel.jpg']
+
+
+class NaiveKeywordMatcher:
+    """
+    Buscador de referencia que compara cada palabra clave por separado.
+    Se usa para verificar KeywordMatcher y como línea base de la búsqueda.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = frozenset(keywords)
+
+    def find(self, text):
+        return {keyword for keyword in self.keywords if keyword in text}
+
+    def find_each(self, texts):
+        return [self.find(text) for text in texts]
+
+
+def random_response(rng):
+    """Genera una respuesta de Vision API con etiquetas, objetos, texto y colores aleatorios."""
+    response = vision.AnnotateImageResponse()
+    for description in rng.sample(LABELS, rng.randint(5, 20)):
+        response.label_annotations.append(vision.EntityAnnotation(description=description, score=rng.random()))
+    for name in rng.sample(OBJECTS, rng.randint(0, 6)):
+        response.localized_object_annotations.append(vision.LocalizedObjectAnnotation(name=name, score=rng.random()))
+    text = rng.choice(TEXTS)
+    if text:
+        response.text_annotations.append(vision.EntityAnnotation(description=text))
+    for _ in range(rng.randint(0, 6)):
+        color = vision.ColorInfo(
+            color={'red': rng.randint(0, 255), 'green': rng.randint(0, 255), 'blue': rng.randint(0, 255)},
+            score=rng.random() / 3,
+        )
+        response.image_properties_annotation.dominant_colors.colors.append(color)
+    return response
+
+
+def load_cached_responses(cache_dir):
+    """Lee las respuestas guardadas por la caché de anotaciones (archivos .pb)."""
+    responses = []
+    for root, _, files in os.walk(cache_dir):
+        for file_name in files:
+            if file_name.endswith('.pb'):
+                with open(os.path.join(root, file_name), 'rb') as cache_file:
+                    responses.append(vision.AnnotateImageResponse.deserialize(cache_file.read()))
+    return responses
+
+
+def time_per_item(function, items, repeat):
+    """Devuelve el mejor tiempo medio por elemento (en microsegundos) de varias repeticiones."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        elapsed = (time.perf_counter() - start) / len(items) * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def classify_all(cases, index_class):
+    """Clasifica todas las respuestas usando la clase de índice indicada."""
+    original = vision_api.AnnotationIndex
+    vision_api.AnnotationIndex = index_class
+    try:
+        return [vision_api.classify_response(response, name) for response, name in cases]
+    finally:
+        vision_api.AnnotationIndex = original
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Medir el tiempo de clasificación de respuestas de Vision API')
+    parser.add_argument('--responses', type=int, default=2000, help='Número de respuestas sintéticas a generar')
+    parser.add_argument('--repeat', type=int, default=5, help='Número de repeticiones de cada medición')
+    parser.add_argument('--cache_dir', help='Usar las respuestas guardadas en este directorio de caché')
+    parser.add_argument('--seed', type=int, default=42, help='Semilla para las respuestas sintéticas')
+
+    args = parser.parse_args()
+
+    # Silenciar el logging de depuración de las reglas durante la medición
+    logging.disable(logging.CRITICAL)
+
+    rng = random.Random(args.seed)
+    if args.cache_dir:
+        responses = load_cached_responses(args.cache_dir)
+        if not responses:
+            raise ValueError(f"No se encontraron respuestas en {args.cache_dir}")
+    else:
+        responses = [random_response(rng) for _ in range(args.responses)]
+    cases = [(response, rng.choice(NAMES)) for response in responses]
+
+    naive = NaiveKeywordMatcher(MATCHER.keywords)
+    naive_index = partial(AnnotationIndex, matcher=naive)
+
+    # Verificar que el buscador de referencia y la clasificación original
+    # producen exactamente la misma clasificación
+    classified = classify_all(cases, AnnotationIndex)
+    if classified != classify_all(cases, naive_index):
+        raise AssertionError("El buscador compilado y el de referencia producen resultados distintos")
+    if classified != [classify_baseline(response, name) for response, name in cases]:
+        raise AssertionError("La clasificación original y classify_response producen resultados distintos")
+
+    # Textos que se buscan por respuesta: todas las etiquetas, los objetos y el texto OCR
+    texts = [
+        (
+            [label.description.lower() for label in response.label_annotations],
+            [obj.name.lower() for obj in response.localized_object_annotations],
+            response.text_annotations[0].description.lower() if response.text_annotations else '',
+        )
+        for response in responses
+    ]
+
+    def match_with(matcher, item):
+        labels, objects, text = item
+        matcher.find_each(labels)
+        matcher.find_each(objects)
+        matcher.find(text)
+
+    match_naive = time_per_item(partial(match_with, naive), texts, args.repeat)
+    match_compiled = time_per_item(partial(match_with, MATCHER), texts, args.repeat)
+    classify_before = time_per_item(lambda case: classify_baseline(*case), cases, args.repeat)
+    classify_after = time_per_item(lambda case: classify_all([case], AnnotationIndex), cases, args.repeat)
+
+    print(f"Respuestas: {len(responses)}  Palabras clave: {len(MATCHER.keywords)}")
+    print(f"{'':28}{'antes (µs)':>12}{'después (µs)':>14}{'mejora':>9}")
+    print(f"{'Búsqueda de palabras clave':28}{match_naive:12.1f}{match_compiled:14.1f}{match_naive / match_compiled:8.1f}x")
+    print(f"{'classify_response':28}{classify_before:12.1f}{classify_after:14.1f}{classify_before / classify_after:8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark de latencia del clasificador local frente a una llamada a Vision API.
+Este script:
+1. Mide el tiempo por imagen de extracción de características + predicción k-NN
+2. Si hay credenciales configuradas, mide el tiempo de una llamada a Vision API
+   (sin caché) con las mismas imágenes
+"""
+
+import os
+import argparse
+import logging
+import time
+from dotenv import load_dotenv
+
+from app.api.local_classifier import LocalClassifier, extract_features, LOCAL_CLASSIFIER_MODEL
+from app.api.perceptual_index import IMAGE_EXTENSIONS
+
+# Cargar variables de entorno
+load_dotenv()
+
+def list_images(dataset_dir):
+    """Lista las imágenes de las carpetas de dataset/."""
+    images = []
+    for root, _, files in os.walk(dataset_dir):
+        for file_name in sorted(files):
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(os.path.join(root, file_name))
+    return images
+
+def percentile(values, fraction):
+    """Percentil simple de una lista de tiempos."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def time_local(model, contents, repeat):
+    """Tiempos (ms) de clasificación local por imagen."""
+    timings = []
+    for _ in range(repeat):
+        for content in contents:
+            start = time.perf_counter()
+            model.predict(extract_features(content))
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def time_vision(contents):
+    """Tiempos (ms) de una llamada a Vision API por imagen, sin pasar por la caché."""
+    from google.cloud import vision
+    from app.api.vision_client import annotate_image, warm_up_vision_client
+    from app.api.vision_api import build_incident_features
+    from app.utils.image_utils import prepare_image_for_vision
+
+    warm_up_vision_client()
+    timings = []
+    for content in contents:
+        prepared, _ = prepare_image_for_vision(content)
+        request = vision.AnnotateImageRequest(image=vision.Image(content=prepared), features=build_incident_features())
+        start = time.perf_counter()
+        annotate_image(request)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def report(name, timings):
+    print(f"{name:24}{percentile(timings, 0.5):10.1f}{percentile(timings, 0.95):10.1f}{len(timings):8d}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Comparar la latencia del clasificador local con la de Vision API')
+    parser.add_argument('--model', default=LOCAL_CLASSIFIER_MODEL, help='Archivo .npz del clasificador local')
+    parser.add_argument('--dataset_dir', default='dataset', help='Directorio con imágenes de prueba')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeticiones de la medición local')
+    parser.add_argument('--skip_vision', action='store_true', help='No llamar a Vision API')
+
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    model = LocalClassifier.load(args.model)
+    images = list_images(args.dataset_dir)
+    if not images:
+        raise ValueError(f"No se encontraron imágenes en {args.dataset_dir}")
+    contents = []
+    for image_path in images:
+        with open(image_path, 'rb') as f:
+            contents.append(f.read())
+
+    print(f"Imágenes: {len(contents)}  Ejemplos en el modelo: {len(model.labels)}")
+    print(f"{'':24}{'p50 (ms)':>10}{'p95 (ms)':>10}{'n':>8}")
+    report('Clasificador local', time_local(model, contents, args.repeat))
+
+    credentials_path = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS')
+    if args.skip_vision or not credentials_path or not os.path.exists(credentials_path):
+        print("Vision API: omitido (sin credenciales o --skip_vision)")
+        return
+    report('Vision API (ida y vuelta)', time_vision(contents))
+
+if __name__ == "__main__":
+    main()
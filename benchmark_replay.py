@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark determinista de analyze_image con respuestas grabadas de Vision API.
+Este script:
+1. Opcionalmente graba las respuestas de Vision API de un conjunto de imágenes
+   (--record, requiere credenciales o FAKE_BACKENDS)
+2. Reproduce las respuestas grabadas sin llamar a Google y mide el tiempo por
+   imagen de analyze_image (preprocesamiento, clasificación y posprocesamiento)
+3. Verifica que los resultados sean idénticos en cada repetición
+4. Opcionalmente compara tiempos y resultados con una ejecución anterior
+   (--save / --compare) y termina con error si hay una regresión
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+import time
+from collections import Counter
+from dotenv import load_dotenv
+
+from app.api import vision_api, local_classifier
+from app.api.vision_fixtures import vision_fixtures, VISION_FIXTURES_DIR
+from app.api.perceptual_index import IMAGE_EXTENSIONS
+from app.utils.metrics import metrics
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Claves del resultado que no dependen de la clasificación
+VOLATILE_KEYS = ('image_preprocessing',)
+
+def list_images(images_dir):
+    """Lista las imágenes de un directorio (recursivamente)."""
+    images = []
+    for root, _, files in os.walk(images_dir):
+        for file_name in sorted(files):
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(os.path.join(root, file_name))
+    return sorted(images)
+
+def percentile(values, fraction):
+    """Percentil simple de una lista de tiempos."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def stable_result(result):
+    """Resultado sin las claves que pueden variar entre ejecuciones."""
+    return {key: value for key, value in result.items() if key not in VOLATILE_KEYS}
+
+def record(images, cascade):
+    """Graba las respuestas de Vision API de todas las imágenes."""
+    vision_fixtures.mode = 'record'
+    errors = 0
+    for image_path in images:
+        result = vision_api.analyze_image(image_path, cascade=cascade)
+        if 'error' in result:
+            errors += 1
+            print(f"  {image_path}: {result['error']}")
+    print(f"Grabadas {len(images) - errors} de {len(images)} imágenes en {vision_fixtures.directory}")
+
+def replay(images, cascade, repeat):
+    """
+    Analiza todas las imágenes con las respuestas grabadas
+
+    Returns:
+        tuple: (tiempos en ms por imagen, resultados de la primera repetición)
+    """
+    vision_fixtures.mode = 'replay'
+    timings = []
+    first_results = None
+    for _ in range(repeat):
+        results = {}
+        for image_path in images:
+            start = time.perf_counter()
+            result = vision_api.analyze_image(image_path, cascade=cascade)
+            timings.append((time.perf_counter() - start) * 1000)
+            results[image_path] = stable_result(result)
+        if first_results is None:
+            first_results = results
+        elif results != first_results:
+            raise AssertionError("Los resultados cambiaron entre repeticiones con las mismas respuestas grabadas")
+    return timings, first_results
+
+def compare(baseline_path, summary, results, tolerance):
+    """
+    Compara con una ejecución guardada con --save
+
+    Returns:
+        bool: True si no hay regresiones
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    ok = True
+    changed = [path for path in results if path in baseline['results'] and results[path] != baseline['results'][path]]
+    if changed:
+        ok = False
+        print(f"Resultados distintos en {len(changed)} imágenes, por ejemplo: {changed[0]}")
+
+    for name in ('p50_ms', 'p95_ms'):
+        before, after = baseline['summary'][name], summary[name]
+        change = (after - before) / before if before else 0.0
+        print(f"{name}: {before:.2f} -> {after:.2f} ({change:+.1%})")
+        if change > tolerance:
+            ok = False
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Medir analyze_image reproduciendo respuestas grabadas de Vision API')
+    parser.add_argument('--images_dir', default='dataset', help='Directorio con las imágenes a analizar')
+    parser.add_argument('--fixtures_dir', default=VISION_FIXTURES_DIR, help='Directorio de respuestas grabadas')
+    parser.add_argument('--record', action='store_true', help='Grabar las respuestas antes de medir')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones de la medición')
+    parser.add_argument('--cascade', action='store_true', help='Usar el modo cascada')
+    parser.add_argument('--no_local', action='store_true', help='Desactivar el clasificador local')
+    parser.add_argument('--save', help='Guardar tiempos y resultados en este archivo JSON')
+    parser.add_argument('--compare', help='Comparar con un archivo guardado con --save')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Aumento máximo aceptado de p50/p95 (0.2 = 20%%)')
+
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    vision_fixtures.directory = args.fixtures_dir
+    if args.no_local:
+        local_classifier.LOCAL_CLASSIFIER_ENABLED = False
+
+    images = list_images(args.images_dir)
+    if not images:
+        raise ValueError(f"No se encontraron imágenes en {args.images_dir}")
+
+    if args.record:
+        record(images, args.cascade)
+
+    timings, results = replay(images, args.cascade, args.repeat)
+    stages = Counter(result.get('analysis_stage', 'error') for result in results.values())
+    summary = {
+        'images': len(images),
+        'p50_ms': percentile(timings, 0.5),
+        'p95_ms': percentile(timings, 0.95),
+        'stages': dict(stages),
+    }
+
+    print(f"Imágenes: {len(images)}  Repeticiones: {args.repeat}")
+    print(f"p50: {summary['p50_ms']:.2f} ms  p95: {summary['p95_ms']:.2f} ms")
+    print(f"Etapas: {dict(sorted(stages.items()))}")
+
+    # Percentiles de cada etapa interna de analyze_image (ver /metrics)
+    print(f"{'Etapa':22}{'n':>8}{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}")
+    for stage, values in metrics.summary().items():
+        print(f"{stage:22}{values['count']:8d}{values['p50']:10.2f}{values['p95']:10.2f}{values['p99']:10.2f}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"Resultados guardados en: {args.save}")
+
+    if args.compare and not compare(args.compare, summary, results, args.tolerance):
+        print("Regresión detectada")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
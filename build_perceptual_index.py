@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Agrega las imágenes de dataset/ al índice de hashes perceptuales.
+Este script:
+1. Recorre las carpetas de dataset/ y las mapea a categorías con map_folder_to_category
+2. Calcula el dHash de cada imagen que todavía no está en el índice
+3. Guarda su análisis en el archivo del índice, que comparten todos los workers
+
+La aplicación hace lo mismo al arrancar salvo con PHASH_SEED_ON_STARTUP=false.
+"""
+
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+from app.api.perceptual_index import perceptual_index, PHASH_INDEX_PATH, PHASH_DATASET_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Agregar las imágenes de dataset/ al índice de hashes perceptuales')
+    parser.add_argument('--dataset_dir', default=PHASH_DATASET_DIR, help='Directorio del dataset')
+    parser.add_argument('--index_path', default=PHASH_INDEX_PATH, help='Archivo JSONL del índice')
+
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    perceptual_index.dataset_dir = args.dataset_dir
+    perceptual_index.path = args.index_path
+    perceptual_index.enabled = True
+    added = perceptual_index.seed()
+
+    print(f"Imágenes de dataset agregadas: {added}")
+
+if __name__ == "__main__":
+    main()
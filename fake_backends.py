@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Servidores simulados de las APIs externas, para pruebas de carga y desarrollo
+sin credenciales ni costo. Este script levanta:
+1. Un servidor gRPC de Vision API que reproduce respuestas grabadas
+   (por defecto las de la caché de anotaciones, cache/vision; también acepta
+   un directorio de VISION_FIXTURES_DIR)
+2. Un servidor HTTP de Geocoding y Places API
+3. Un servidor HTTP de predicción de Vertex AI
+
+Cada servidor tiene su propio perfil de fallos: distribución de latencia,
+tasa de errores y tasa de errores de cuota. La aplicación los usa al
+definir FAKE_BACKENDS=<host> (por ejemplo FAKE_BACKENDS=localhost).
+
+Formato de un perfil:
+    latency=lognormal:250:0.4,errors=0.01,quota=0.005
+Distribuciones de latencia (milisegundos):
+    fixed:<ms>  uniform:<mín>:<máx>  lognormal:<mediana>:<sigma>
+"""
+
+import os
+import time
+import random
+import hashlib
+import argparse
+import threading
+from concurrent import futures
+
+import grpc
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+from google.cloud import vision
+
+from app.api.backends import FAKE_VISION_PORT, FAKE_MAPS_PORT, FAKE_VERTEX_PORT
+from app.api.vision_cache import AnnotationCache, CACHE_DIR
+from app.api.vision_fixtures import VisionFixtures
+from app.api.local_classifier import CATEGORY_OUTCOMES
+
+VISION_SERVICE = 'google.cloud.vision.v1.ImageAnnotator'
+
+# Perfiles por defecto, aproximados a las latencias observadas de cada API
+DEFAULT_PROFILES = {
+    'vision': 'latency=lognormal:350:0.35,errors=0.0,quota=0.0',
+    'maps': 'latency=lognormal:90:0.3,errors=0.0,quota=0.0',
+    'vertex': 'latency=lognormal:450:0.3,errors=0.0,quota=0.0',
+}
+
+# Ciudades de las direcciones simuladas
+FAKE_CITIES = (
+    ('Ciudad de México', 'Ciudad de México', 'México', 'MX'),
+    ('Guadalajara', 'Jalisco', 'México', 'MX'),
+    ('Monterrey', 'Nuevo León', 'México', 'MX'),
+    ('Puebla', 'Puebla', 'México', 'MX'),
+)
+
+FAKE_STREETS = ('Av. Reforma', 'Calle Juárez', 'Av. Insurgentes', 'Calle Hidalgo', 'Av. Universidad')
+
+# Etiquetas que puede devolver el modelo simulado de Vertex AI
+VERTEX_LABELS = tuple(CATEGORY_OUTCOMES) + ('Sin daño',)
+
+
+class FaultProfile:
+    """
+    Latencia, errores y errores de cuota de un servidor simulado
+    """
+
+    def __init__(self, spec, seed=None):
+        self.spec = spec
+        self.latency = ('fixed', 0.0)
+        self.error_rate = 0.0
+        self.quota_rate = 0.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'ok': 0, 'error': 0, 'quota': 0}
+
+        for part in filter(None, (item.strip() for item in spec.split(','))):
+            name, _, value = part.partition('=')
+            if name == 'latency':
+                kind, *params = value.split(':')
+                if kind not in ('fixed', 'uniform', 'lognormal'):
+                    raise ValueError(f"Distribución de latencia desconocida: {kind}")
+                self.latency = (kind, *(float(param) for param in params))
+            elif name == 'errors':
+                self.error_rate = float(value)
+            elif name == 'quota':
+                self.quota_rate = float(value)
+            else:
+                raise ValueError(f"Opción de perfil desconocida: {name}")
+
+    def sample_latency(self):
+        """Latencia simulada en segundos"""
+        kind, *params = self.latency
+        with self._lock:
+            if kind == 'uniform':
+                milliseconds = self._random.uniform(params[0], params[1])
+            elif kind == 'lognormal':
+                milliseconds = params[0] * self._random.lognormvariate(0.0, params[1])
+            else:
+                milliseconds = params[0]
+        return max(milliseconds, 0.0) / 1000
+
+    def next_outcome(self):
+        """
+        Espera la latencia simulada y decide el resultado de la solicitud
+
+        Returns:
+            str: 'ok', 'error' o 'quota'
+        """
+        time.sleep(self.sample_latency())
+        with self._lock:
+            draw = self._random.random()
+            if draw < self.quota_rate:
+                outcome = 'quota'
+            elif draw < self.quota_rate + self.error_rate:
+                outcome = 'error'
+            else:
+                outcome = 'ok'
+            self.stats[outcome] += 1
+        return outcome
+
+
+class RecordedResponses:
+    """
+    Respuestas AnnotateImageResponse grabadas, con la clave de la caché de
+    anotaciones o la de vision_fixtures (imagen + features). Si una imagen no
+    tiene una respuesta grabada se elige una de forma determinista por su contenido.
+    """
+
+    def __init__(self, directory):
+        self.cache = AnnotationCache(directory=directory, enabled=False)
+        self.fixtures = VisionFixtures(directory=directory, mode='off')
+        self.responses = {}
+        if os.path.isdir(directory):
+            for root, _, files in os.walk(directory):
+                for file_name in sorted(files):
+                    if file_name.endswith('.pb'):
+                        with open(os.path.join(root, file_name), 'rb') as response_file:
+                            self.responses[file_name[:-3]] = response_file.read()
+        self.keys = sorted(self.responses)
+
+    def response_for(self, content, features):
+        """Bytes serializados de la respuesta para una imagen y sus features"""
+        features = [vision.Feature.wrap(feature) for feature in features]
+        for key in (self.cache.make_key(content, features), self.fixtures.make_key(content, features)):
+            if key in self.responses:
+                return self.responses[key]
+        if not self.keys:
+            return None
+        index = int(hashlib.sha256(content).hexdigest(), 16) % len(self.keys)
+        return self.responses[self.keys[index]]
+
+
+def default_vision_response():
+    """Respuesta usada cuando no hay grabaciones: un automóvil sin daños evidentes"""
+    return vision.AnnotateImageResponse.serialize(vision.AnnotateImageResponse(
+        label_annotations=[
+            vision.EntityAnnotation(description='Car', score=0.95),
+            vision.EntityAnnotation(description='Vehicle', score=0.93),
+        ],
+        localized_object_annotations=[
+            vision.LocalizedObjectAnnotation(name='Car', score=0.9),
+        ],
+    ))
+
+
+def create_vision_server(host, port, profile, recordings, workers):
+    """Servidor gRPC con el método BatchAnnotateImages de Vision API"""
+    request_class = vision.BatchAnnotateImagesRequest.pb()
+    response_class = vision.BatchAnnotateImagesResponse.pb()
+    fallback = default_vision_response()
+
+    def batch_annotate_images(batch_request, context):
+        outcome = profile.next_outcome()
+        if outcome == 'quota':
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, 'Quota exceeded for quota metric (simulado)')
+        if outcome == 'error':
+            context.abort(grpc.StatusCode.UNAVAILABLE, 'The service is currently unavailable (simulado)')
+
+        batch_response = response_class()
+        for image_request in batch_request.requests:
+            data = recordings.response_for(image_request.image.content, image_request.features)
+            batch_response.responses.add().ParseFromString(data or fallback)
+        return batch_response
+
+    handler = grpc.method_handlers_generic_handler(VISION_SERVICE, {
+        'BatchAnnotateImages': grpc.unary_unary_rpc_method_handler(
+            batch_annotate_images,
+            request_deserializer=request_class.FromString,
+            response_serializer=response_class.SerializeToString,
+        ),
+    })
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers))
+    server.add_generic_rpc_handlers((handler,))
+    server.add_insecure_port(f"{host}:{port}")
+    return server
+
+
+def coordinates_random(*parts):
+    """Generador aleatorio determinista para unas coordenadas"""
+    seed = hashlib.sha256(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return random.Random(int(seed[:16], 16))
+
+
+def create_maps_app(profile):
+    """Aplicación Flask con Geocoding API y Places API (búsqueda cercana)"""
+    app = Flask('fake_maps')
+
+    def failure(outcome):
+        if outcome == 'quota':
+            return jsonify({
+                'status': 'OVER_QUERY_LIMIT',
+                'error_message': 'You have exceeded your rate-limit for this API (simulado).',
+                'results': []
+            })
+        return jsonify({'status': 'UNKNOWN_ERROR', 'results': []}), 500
+
+    @app.route('/maps/api/geocode/json')
+    def geocode():
+        outcome = profile.next_outcome()
+        if outcome != 'ok':
+            return failure(outcome)
+
+        latitude, longitude = (float(value) for value in request.args.get('latlng', '0,0').split(','))
+        rng = coordinates_random(round(latitude, 3), round(longitude, 3))
+        city, state, country, country_code = rng.choice(FAKE_CITIES)
+        street = rng.choice(FAKE_STREETS)
+        number = str(rng.randint(1, 2500))
+        postal_code = f"{rng.randint(1000, 99999):05d}"
+        return jsonify({
+            'status': 'OK',
+            'results': [{
+                'formatted_address': f"{street} {number}, {postal_code} {city}, {state}, {country}",
+                'address_components': [
+                    {'long_name': number, 'short_name': number, 'types': ['street_number']},
+                    {'long_name': street, 'short_name': street, 'types': ['route']},
+                    {'long_name': city, 'short_name': city, 'types': ['locality', 'political']},
+                    {'long_name': state, 'short_name': state, 'types': ['administrative_area_level_1', 'political']},
+                    {'long_name': country, 'short_name': country_code, 'types': ['country', 'political']},
+                    {'long_name': postal_code, 'short_name': postal_code, 'types': ['postal_code']},
+                ],
+                'geometry': {'location': {'lat': latitude, 'lng': longitude}},
+                'place_id': f"fake-{rng.getrandbits(48):012x}",
+            }]
+        })
+
+    @app.route('/maps/api/place/nearbysearch/json')
+    def nearby_search():
+        outcome = profile.next_outcome()
+        if outcome != 'ok':
+            return failure(outcome)
+
+        latitude, longitude = (float(value) for value in request.args.get('location', '0,0').split(','))
+        radius = float(request.args.get('radius', 5000))
+        place_type = request.args.get('type', 'establishment')
+        rng = coordinates_random(round(latitude, 3), round(longitude, 3), place_type)
+
+        results = []
+        for index in range(rng.randint(0, 8)):
+            # Desplazamiento aproximado en grados dentro del radio
+            offset = radius / 111000.0
+            results.append({
+                'name': f"{place_type.replace('_', ' ').capitalize()} {index + 1}",
+                'vicinity': f"{rng.choice(FAKE_STREETS)} {rng.randint(1, 2500)}",
+                'geometry': {'location': {
+                    'lat': latitude + rng.uniform(-offset, offset),
+                    'lng': longitude + rng.uniform(-offset, offset),
+                }},
+                'types': [place_type, 'point_of_interest', 'establishment'],
+                'rating': round(rng.uniform(2.5, 5.0), 1),
+                'place_id': f"fake-{rng.getrandbits(48):012x}",
+            })
+        return jsonify({'status': 'OK' if results else 'ZERO_RESULTS', 'results': results})
+
+    return app
+
+
+def create_vertex_app(profile):
+    """Aplicación Flask con el método predict de un endpoint de Vertex AI"""
+    app = Flask('fake_vertex')
+
+    @app.route('/v1/projects/<project>/locations/<location>/endpoints/<endpoint_id>:predict', methods=['POST'])
+    def predict(project, location, endpoint_id):
+        outcome = profile.next_outcome()
+        if outcome == 'quota':
+            return jsonify({'error': {
+                'code': 429,
+                'message': 'Quota exceeded for aiplatform.googleapis.com/online_prediction_requests (simulado)',
+                'status': 'RESOURCE_EXHAUSTED'
+            }}), 429
+        if outcome == 'error':
+            return jsonify({'error': {
+                'code': 503,
+                'message': 'The service is currently unavailable (simulado)',
+                'status': 'UNAVAILABLE'
+            }}), 503
+
+        predictions = []
+        for instance in (request.get_json(silent=True) or {}).get('instances', []):
+            rng = coordinates_random(instance.get('content', ''))
+            labels = rng.sample(VERTEX_LABELS, len(VERTEX_LABELS))
+            # Una etiqueta dominante y el resto de la probabilidad repartida
+            top = rng.uniform(0.55, 0.98)
+            rest = sorted((rng.random() for _ in labels[1:]), reverse=True)
+            confidences = [top] + [(1 - top) * value / sum(rest) for value in rest]
+            predictions.append({
+                'ids': [str(VERTEX_LABELS.index(label)) for label in labels],
+                'displayNames': labels,
+                'confidences': confidences,
+            })
+        return jsonify({'predictions': predictions, 'deployedModelId': f"fake-{endpoint_id}"})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Levantar los servidores simulados de Vision, Maps y Vertex AI')
+    parser.add_argument('--host', default='0.0.0.0', help='Interfaz en la que escuchar')
+    parser.add_argument('--recordings', default=CACHE_DIR, help='Directorio con respuestas .pb grabadas de Vision API')
+    parser.add_argument('--vision', default=DEFAULT_PROFILES['vision'], help='Perfil de fallos de Vision API')
+    parser.add_argument('--maps', default=DEFAULT_PROFILES['maps'], help='Perfil de fallos de Geocoding/Places')
+    parser.add_argument('--vertex', default=DEFAULT_PROFILES['vertex'], help='Perfil de fallos de Vertex AI')
+    parser.add_argument('--workers', type=int, default=64, help='Hilos del servidor gRPC')
+    parser.add_argument('--seed', type=int, help='Semilla para reproducir latencias y errores')
+
+    args = parser.parse_args()
+
+    profiles = {
+        'vision': FaultProfile(args.vision, args.seed),
+        'maps': FaultProfile(args.maps, args.seed),
+        'vertex': FaultProfile(args.vertex, args.seed),
+    }
+    recordings = RecordedResponses(args.recordings)
+
+    vision_server = create_vision_server(args.host, FAKE_VISION_PORT, profiles['vision'], recordings, args.workers)
+    vision_server.start()
+    http_servers = [
+        make_server(args.host, FAKE_MAPS_PORT, create_maps_app(profiles['maps']), threaded=True),
+        make_server(args.host, FAKE_VERTEX_PORT, create_vertex_app(profiles['vertex']), threaded=True),
+    ]
+    for server in http_servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f"Vision API (gRPC) en {args.host}:{FAKE_VISION_PORT} - {len(recordings.keys)} respuestas grabadas - {args.vision}")
+    print(f"Geocoding/Places en http://{args.host}:{FAKE_MAPS_PORT} - {args.maps}")
+    print(f"Vertex AI en http://{args.host}:{FAKE_VERTEX_PORT} - {args.vertex}")
+    print("Inicia la aplicación con FAKE_BACKENDS=localhost para usarlos")
+    print("Para detener los servidores, presiona Ctrl+C")
+
+    try:
+        vision_server.wait_for_termination()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in http_servers:
+            server.shutdown()
+        vision_server.stop(grace=1)
+        for name, profile in profiles.items():
+            print(f"{name}: {profile.stats}")
+
+if __name__ == "__main__":
+    main()
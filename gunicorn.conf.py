@@ -0,0 +1,15 @@
+# Configuración de Gunicorn (se carga automáticamente desde el directorio raíz)
+import os
+
+
+def post_fork(server, worker):
+    """
+    Prepara el cliente de Vision API en cada worker recién creado.
+    El cliente heredado del proceso maestro (con --preload) se descarta
+    automáticamente después del fork.
+    """
+    if os.environ.get('VISION_WARMUP', 'true').lower() != 'true':
+        return
+
+    from app.api.vision_client import warm_up_vision_client
+    warm_up_vision_client()
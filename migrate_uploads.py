@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Migra las imágenes subidas de la carpeta plana (<uuid>_<nombre>) al
+almacenamiento por contenido (ab/cd/<sha256>.<ext>).
+Este script:
+1. Calcula el SHA-256 de cada archivo de la carpeta de imágenes
+2. Mueve cada contenido distinto a su ruta por contenido y elimina las copias repetidas
+3. Registra en el índice los nombres anteriores, de modo que sus URLs
+   (/static/uploads/<uuid>_<nombre>) redirigen a la nueva ruta
+"""
+
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+from app.utils.image_utils import upload_store, UPLOAD_INDEX_DB
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrar las imágenes subidas al almacenamiento por contenido')
+    parser.add_argument('--upload_folder', default='static/uploads', help='Carpeta de imágenes subidas')
+    parser.add_argument('--index_db', default=UPLOAD_INDEX_DB, help='Archivo SQLite del índice de imágenes')
+
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    upload_store.db_path = args.index_db
+    stats = upload_store.migrate(args.upload_folder)
+
+    print(f"Archivos migrados: {stats['migrated']}")
+    print(f"Copias repetidas eliminadas: {stats['duplicates']} ({stats['bytes_freed'] / 1024 / 1024:.1f} MB liberados)")
+    if stats['skipped']:
+        print(f"Archivos omitidos (no son imágenes): {stats['skipped']}")
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,8 @@ import csv
 from google.cloud import storage
 from dotenv import load_dotenv
 
+from app.api.local_classifier import map_folder_to_category
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -89,44 +91,6 @@ def upload_images_to_gcs(local_dir, bucket_name, gcs_path, project_id):
     
     return image_paths
 
-def map_folder_to_category(folder_name):
-    """Mapea el nombre de la carpeta a una categoría de daño."""
-    folder_name = folder_name.lower()
-    
-    # Mapeo de nombres de carpetas a categorías
-    mapping = {
-        "bateria": "Fallo mecánico - Batería",
-        "battery": "Fallo mecánico - Batería",
-        "llanta": "Fallo mecánico - Llanta pinchada",
-        "tire": "Fallo mecánico - Llanta pinchada",
-        "flat_tire": "Fallo mecánico - Llanta pinchada",
-        "fuga": "Fallo mecánico - Fuga de líquido",
-        "leak": "Fallo mecánico - Fuga de líquido",
-        "fluid": "Fallo mecánico - Fuga de líquido",
-        "acceso": "Problema de acceso - Llaves/Puertas",
-        "access": "Problema de acceso - Llaves/Puertas",
-        "keys": "Problema de acceso - Llaves/Puertas",
-        "door": "Problema de acceso - Llaves/Puertas",
-        "menor": "Colisión - Daño menor",
-        "minor": "Colisión - Daño menor",
-        "moderado": "Colisión - Daño moderado",
-        "moderate": "Colisión - Daño moderado",
-        "severo": "Colisión - Daño severo",
-        "severe": "Colisión - Daño severo",
-        "total": "Colisión - Pérdida total",
-        "total_loss": "Colisión - Pérdida total",
-        "sin_dano": "Sin daño",
-        "no_damage": "Sin daño",
-        "normal": "Sin daño"
-    }
-    
-    # Buscar coincidencias parciales
-    for key, value in mapping.items():
-        if key in folder_name:
-            return value
-    
-    return None
-
 def create_csv_file(image_paths, output_file):
     """Crea un archivo CSV con las rutas de las imágenes y sus etiquetas."""
     with open(output_file, 'w', newline='') as csvfile:
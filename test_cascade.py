@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Comprueba que el modo cascada clasifica igual que el análisis completo.
+Este script:
+1. Carga las respuestas de Vision API grabadas (caché de anotaciones o
+   VISION_FIXTURES_DIR)
+2. Combina cada respuesta con los nombres de archivo de dataset/ (pistas) y
+   con objetos adicionales que la segunda etapa podría devolver
+3. Ejecuta la cascada sirviendo a cada etapa solo sus features y compara la
+   clasificación con la de la respuesta completa
+
+Se puede ejecutar directamente o con pytest.
+"""
+
+import os
+import argparse
+from google.cloud import vision
+
+from app.api import vision_api
+from app.api.vision_cache import CACHE_DIR, feature_signature
+
+# Campos que definen la clasificación (la lista de objetos de la respuesta
+# queda vacía cuando la cascada resuelve en la primera etapa)
+CLASSIFICATION_FIELDS = ('incident_type', 'damage_severity', 'vehicle_type', 'damaged_parts', 'confidence')
+
+# Nombres sin pistas o con pistas que cambian las reglas, además de los de dataset/
+EXTRA_NAMES = ('foto.jpg', 'pinchazo.jpg')
+
+# Respuestas adicionales para las reglas que pueden resolverse en la primera
+# etapa (la caché puede no tener colisiones ni tableros)
+SYNTHETIC_RESPONSES = {
+    'colision': vision.AnnotateImageResponse(label_annotations=[
+        vision.EntityAnnotation(description='Car', score=0.96),
+        vision.EntityAnnotation(description='Traffic collision', score=0.91),
+        vision.EntityAnnotation(description='Bumper', score=0.82),
+    ]),
+    'colision_llanta': vision.AnnotateImageResponse(label_annotations=[
+        vision.EntityAnnotation(description='Tire', score=0.97),
+        vision.EntityAnnotation(description='Automotive tire', score=0.95),
+        vision.EntityAnnotation(description='Tread', score=0.9),
+        vision.EntityAnnotation(description='Wheel', score=0.88),
+        vision.EntityAnnotation(description='Flat tire', score=0.8),
+        vision.EntityAnnotation(description='Accident', score=0.7),
+    ]),
+    'tablero': vision.AnnotateImageResponse(text_annotations=[
+        vision.EntityAnnotation(description='120 km/h\nfuel'),
+    ]),
+    'tablero_bateria': vision.AnnotateImageResponse(text_annotations=[
+        vision.EntityAnnotation(description='check engine\n140'),
+    ]),
+}
+
+# Objetos que la segunda etapa podría añadir a cada respuesta
+OBJECT_VARIANTS = (
+    (),
+    (('Car', 0.9), ('Car', 0.85)),
+    (('Tire', 0.9),),
+    (('Person', 0.9),),
+    (('Car door', 0.8),),
+)
+
+
+def load_responses(directory):
+    """
+    Carga las respuestas AnnotateImageResponse grabadas en un directorio
+
+    Args:
+        directory (str): Directorio de la caché de anotaciones o de grabaciones
+
+    Returns:
+        dict: Respuestas por nombre de archivo, con SYNTHETIC_RESPONSES
+    """
+    responses = dict(SYNTHETIC_RESPONSES)
+    for root, _, files in os.walk(directory):
+        for file_name in sorted(files):
+            if file_name.endswith('.pb'):
+                with open(os.path.join(root, file_name), 'rb') as response_file:
+                    responses[file_name] = vision.AnnotateImageResponse.deserialize(response_file.read())
+    return responses
+
+
+def dataset_names(dataset_dir='dataset'):
+    """Rutas de las imágenes de dataset/ (solo se usan como pistas del nombre)"""
+    names = list(EXTRA_NAMES)
+    for root, _, files in os.walk(dataset_dir):
+        names.extend(os.path.join(root, file_name) for file_name in sorted(files))
+    return names
+
+
+def with_objects(response, objects):
+    """Copia de la respuesta con objetos localizados adicionales"""
+    variant = vision.AnnotateImageResponse()
+    vision.AnnotateImageResponse.pb(variant).CopyFrom(vision.AnnotateImageResponse.pb(response))
+    for name, score in objects:
+        variant.localized_object_annotations.append(vision.LocalizedObjectAnnotation(name=name, score=score))
+    return variant
+
+
+def split_response(response):
+    """
+    Separa una respuesta completa en la parte de cada etapa de la cascada
+
+    Returns:
+        tuple: (respuesta de la primera etapa, respuesta de la segunda etapa)
+    """
+    label_response = vision.AnnotateImageResponse()
+    vision.AnnotateImageResponse.pb(label_response).CopyFrom(vision.AnnotateImageResponse.pb(response))
+    del label_response.localized_object_annotations[:]
+    detail_response = vision.AnnotateImageResponse(
+        localized_object_annotations=list(response.localized_object_annotations)
+    )
+    return label_response, detail_response
+
+
+def run_cascade(response, image_path):
+    """
+    Ejecuta la cascada respondiendo a cada etapa con sus features
+
+    Returns:
+        tuple: (resultados, etapa que los resolvió)
+    """
+    label_response, detail_response = split_response(response)
+    stages = {
+        feature_signature(vision_api.build_label_stage_features()): label_response,
+        feature_signature(vision_api.build_detail_stage_features()): detail_response,
+    }
+    steps = vision_api._cascade_steps(b'', image_path)
+    try:
+        _, features = next(steps)
+        while True:
+            _, features = steps.send(stages[feature_signature(features)])
+    except StopIteration as stop:
+        return stop.value
+
+
+def find_mismatches(directory=CACHE_DIR, dataset_dir='dataset'):
+    """
+    Compara la clasificación de la cascada con la del análisis completo
+
+    Returns:
+        tuple: (casos comparados, resueltos en la primera etapa, lista de diferencias)
+    """
+    cases, label_stage, mismatches = 0, 0, []
+    for file_name, recorded in load_responses(directory).items():
+        for objects in OBJECT_VARIANTS:
+            response = with_objects(recorded, objects)
+            for image_path in dataset_names(dataset_dir):
+                full = vision_api.classify_response(response, image_path)
+                cascade, stage = run_cascade(response, image_path)
+                cases += 1
+                label_stage += stage == 'labels'
+                expected = {field: full.get(field) for field in CLASSIFICATION_FIELDS}
+                actual = {field: cascade.get(field) for field in CLASSIFICATION_FIELDS}
+                if expected != actual:
+                    mismatches.append((file_name, objects, image_path, stage, expected, actual))
+    return cases, label_stage, mismatches
+
+
+def test_cascade_matches_full_analysis():
+    cases, _, mismatches = find_mismatches()
+    assert cases > 0, f"No hay respuestas grabadas en {CACHE_DIR}"
+    assert mismatches == []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara el modo cascada con el análisis completo')
+    parser.add_argument('--responses_dir', type=str, default=CACHE_DIR,
+                        help='Directorio con respuestas grabadas de Vision API')
+    parser.add_argument('--dataset_dir', type=str, default='dataset',
+                        help='Directorio del dataset (sus nombres se usan como pistas)')
+    args = parser.parse_args()
+
+    cases, label_stage, mismatches = find_mismatches(args.responses_dir, args.dataset_dir)
+    print(f"Casos comparados: {cases}")
+    print(f"Resueltos en la primera etapa: {label_stage}")
+    print(f"Diferencias: {len(mismatches)}")
+    for file_name, objects, image_path, stage, expected, actual in mismatches:
+        print(f"  {file_name} {list(objects)} {image_path} ({stage})")
+        print(f"    completo: {expected}")
+        print(f"    cascada:  {actual}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
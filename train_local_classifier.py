@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Script para entrenar el clasificador local de daños (sin llamadas remotas).
+Este script:
+1. Recorre las carpetas de dataset/ y las mapea a categorías con map_folder_to_category
+2. Extrae características de color y textura de cada imagen
+3. Guarda un modelo k-NN compacto en formato .npz
+4. Muestra la exactitud con validación dejando uno fuera
+"""
+
+import os
+import argparse
+from collections import Counter
+
+from app.api.local_classifier import LocalClassifier, extract_features, map_folder_to_category, LOCAL_CLASSIFIER_MODEL
+from app.api.perceptual_index import IMAGE_EXTENSIONS
+
+def load_dataset(dataset_dir):
+    """Extrae las características de todas las imágenes de las carpetas de categorías."""
+    features = []
+    categories = []
+    for category_folder in sorted(os.listdir(dataset_dir)):
+        category_path = os.path.join(dataset_dir, category_folder)
+        if not os.path.isdir(category_path):
+            continue
+
+        category_label = map_folder_to_category(category_folder)
+        if not category_label:
+            print(f"Advertencia: La carpeta {category_folder} no corresponde a una categoría conocida. Se omitirá.")
+            continue
+
+        for image_file in sorted(os.listdir(category_path)):
+            if not image_file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            try:
+                with open(os.path.join(category_path, image_file), 'rb') as f:
+                    features.append(extract_features(f.read()))
+                categories.append(category_label)
+            except Exception as e:
+                print(f"  Error al procesar {image_file}: {str(e)}")
+
+    return features, categories
+
+def leave_one_out_accuracy(features, labels, category_names, k):
+    """Exactitud del modelo prediciendo cada imagen con el resto del conjunto."""
+    if len(features) < 2:
+        return None
+    hits = 0
+    for index in range(len(features)):
+        rest_features = features[:index] + features[index + 1:]
+        rest_labels = labels[:index] + labels[index + 1:]
+        model = LocalClassifier(rest_features, rest_labels, category_names, k=k)
+        category, _, _ = model.predict(features[index])
+        hits += category == category_names[labels[index]]
+    return hits / len(features)
+
+def main():
+    parser = argparse.ArgumentParser(description='Entrenar el clasificador local de daños a partir de dataset/')
+    parser.add_argument('--dataset_dir', default='dataset', help='Directorio con las imágenes organizadas en carpetas por categoría')
+    parser.add_argument('--output', default=LOCAL_CLASSIFIER_MODEL, help='Archivo .npz donde guardar el modelo')
+    parser.add_argument('--k', type=int, default=3, help='Número de vecinos que votan')
+
+    args = parser.parse_args()
+
+    features, categories = load_dataset(args.dataset_dir)
+    if not features:
+        raise ValueError(f"No se encontraron imágenes en {args.dataset_dir}")
+
+    category_names = sorted(set(categories))
+    labels = [category_names.index(category) for category in categories]
+
+    for category, count in sorted(Counter(categories).items()):
+        print(f"  {category}: {count} imágenes")
+
+    model = LocalClassifier.fit(features, labels, category_names, k=args.k)
+    model.save(args.output)
+
+    accuracy = leave_one_out_accuracy(features, labels, category_names, args.k)
+
+    print("\nEntrenamiento completado.")
+    print(f"Total de imágenes: {len(features)}")
+    print(f"Distancia máxima aceptada: {model.max_distance:.3f}")
+    if accuracy is not None:
+        print(f"Exactitud (dejando uno fuera): {accuracy:.2%}")
+    print(f"Modelo guardado en: {args.output} ({os.path.getsize(args.output)} bytes)")
+
+if __name__ == "__main__":
+    main()